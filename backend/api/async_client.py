@@ -0,0 +1,287 @@
+"""
+Asynchronous client for the Knowledge Base API
+
+Built for ingestion scripts that fan out thousands of calls: one pooled
+httpx connection pool with keep-alive, a semaphore bounding the requests in
+flight, and retries with jittered exponential backoff on 429, 5xx and
+connection failures. Errors are raised as the typed exceptions in
+``backend.api.errors`` instead of being printed.
+
+    async with AsyncAPIClient("http://localhost:8000", concurrency=64) as client:
+        versions = await client.get_document_versions_many(doc_ids)
+"""
+
+import asyncio
+import json
+import os
+import random
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, TypeVar, Union
+
+import httpx
+
+from backend.api.errors import APIConnectionError, APIError, error_for_status
+from backend.models import (
+    Document, DocumentList, DocumentVersion, DocumentVersionList, IngestionBatch, KnowledgeBase,
+    KnowledgeBaseList, KnowledgeBaseVersion, KnowledgeBaseVersionList, Project, ProjectList,
+    CreateKbVersionRequest, ChunkingMethod, EmbeddingProvider, EmbeddingModel,
+)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+# Requests in flight at once, and connections kept in the pool
+DEFAULT_CONCURRENCY = 32
+
+# Attempts after the first one for retryable failures
+DEFAULT_MAX_RETRIES = 4
+
+# Backoff before retry n is uniform in [0, min(BACKOFF_MAX, BACKOFF_BASE * 2**n)]
+DEFAULT_BACKOFF_BASE = 0.2
+DEFAULT_BACKOFF_MAX = 10.0
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Methods that are safe to repeat after a response was lost or failed
+IDEMPOTENT_METHODS = {"GET", "HEAD", "PUT", "DELETE", "OPTIONS"}
+
+
+class AsyncAPIClient:
+    """Pooled, concurrency-limited asyncio client for the RAG Knowledge Base API"""
+
+    def __init__(self, base_url: str = "http://localhost:8000", concurrency: int = DEFAULT_CONCURRENCY,
+                 max_retries: int = DEFAULT_MAX_RETRIES, backoff_base: float = DEFAULT_BACKOFF_BASE,
+                 backoff_max: float = DEFAULT_BACKOFF_MAX, timeout: float = 30.0,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.base_url = base_url.rstrip('/')
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+            transport=transport,
+        )
+
+    async def __aenter__(self) -> "AsyncAPIClient":
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+    async def aclose(self):
+        await self._client.aclose()
+
+    def _backoff(self, attempt: int, response: Optional[httpx.Response] = None) -> float:
+        """Seconds to wait before retry ``attempt``, honouring Retry-After"""
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            if retry_after:
+                try:
+                    return min(self.backoff_max, max(0.0, float(retry_after)))
+                except ValueError:
+                    pass
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    async def _request(self, method: str, path: str, **kwargs) -> Any:
+        """Send a request, retrying retryable failures, and return the decoded JSON body"""
+        url = f"{self.base_url}{path}"
+        idempotent = method in IDEMPOTENT_METHODS
+        attempt = 0
+        while True:
+            response = None
+            try:
+                async with self._semaphore:
+                    response = await self._client.request(method, path, **kwargs)
+            except httpx.TransportError as e:
+                # A request that never connected was not seen by the server
+                if attempt >= self.max_retries or not (idempotent or isinstance(e, httpx.ConnectError)):
+                    raise APIConnectionError(f"{method} {url} failed: {e!r}", method, url) from e
+            else:
+                if response.status_code < 400:
+                    return response.json() if response.content else None
+                # 429 and 503 are refused before any work is done, so even POSTs can be repeated
+                retryable = response.status_code in RETRYABLE_STATUS_CODES and (
+                    idempotent or response.status_code in (429, 503))
+                if attempt >= self.max_retries or not retryable:
+                    raise error_for_status(response.status_code, _error_detail(response), method, url)
+            await asyncio.sleep(self._backoff(attempt, response))
+            attempt += 1
+
+    async def map_concurrently(self, func: Callable[[T], Awaitable[R]], items: Iterable[T],
+                               return_exceptions: bool = False) -> List[Union[R, APIError]]:
+        """Run ``func`` over ``items`` concurrently and return the results in order.
+
+        Concurrency is bounded by the client; with ``return_exceptions`` failed
+        items hold their APIError instead of failing the whole batch.
+        """
+        return await asyncio.gather(*(func(item) for item in items), return_exceptions=return_exceptions)
+
+    async def _map_by_id(self, func: Callable[[str], Awaitable[R]], ids: Iterable[str],
+                         return_exceptions: bool) -> Dict[str, Union[R, APIError]]:
+        ids = list(dict.fromkeys(ids))
+        return dict(zip(ids, await self.map_concurrently(func, ids, return_exceptions)))
+
+    # Project endpoints
+    async def get_projects(self) -> List[Project]:
+        return ProjectList(**await self._request("GET", "/api/projects")).projects
+
+    async def get_project(self, project_id: str) -> Project:
+        return Project(**await self._request("GET", f"/api/projects/{project_id}"))
+
+    async def create_project(self, name: str, description: Optional[str] = None) -> Project:
+        response = await self._request("POST", "/api/projects", json={"name": name, "description": description})
+        return Project(**response)
+
+    # Knowledge Base endpoints
+    async def get_knowledge_bases(self, project_id: str) -> List[KnowledgeBase]:
+        response = await self._request("GET", f"/api/projects/{project_id}/knowledge-bases")
+        return KnowledgeBaseList(**response).knowledge_bases
+
+    async def get_knowledge_base(self, kb_id: str) -> KnowledgeBase:
+        return KnowledgeBase(**await self._request("GET", f"/api/knowledge-bases/{kb_id}"))
+
+    async def create_knowledge_base(self, project_id: str, name: str, description: Optional[str] = None) -> KnowledgeBase:
+        response = await self._request("POST", f"/api/projects/{project_id}/knowledge-bases",
+                                       json={"name": name, "description": description})
+        return KnowledgeBase(**response)
+
+    # Knowledge Base Version endpoints
+    async def get_kb_versions(self, kb_id: str, include_archived: bool = False) -> List[KnowledgeBaseVersion]:
+        response = await self._request("GET", f"/api/knowledge-bases/{kb_id}/versions",
+                                       params={"include_archived": include_archived})
+        return KnowledgeBaseVersionList(**response).versions
+
+    async def create_kb_version(self, kb_id: str, version_data: dict) -> KnowledgeBaseVersion:
+        request_data = CreateKbVersionRequest(**version_data)
+        response = await self._request("POST", f"/api/knowledge-bases/{kb_id}/versions",
+                                       json=request_data.model_dump())
+        return KnowledgeBaseVersion(**response)
+
+    async def publish_kb_version(self, kb_id: str, version_id: str) -> KnowledgeBaseVersion:
+        response = await self._request("PUT", f"/api/knowledge-bases/{kb_id}/versions/{version_id}/publish")
+        return KnowledgeBaseVersion(**response)
+
+    async def archive_kb_version(self, kb_id: str, version_id: str) -> KnowledgeBaseVersion:
+        response = await self._request("PUT", f"/api/knowledge-bases/{kb_id}/versions/{version_id}/archive")
+        return KnowledgeBaseVersion(**response)
+
+    async def set_primary_kb_version(self, kb_id: str, version_id: str) -> KnowledgeBaseVersion:
+        response = await self._request("PUT", f"/api/knowledge-bases/{kb_id}/versions/{version_id}/set-primary")
+        return KnowledgeBaseVersion(**response)
+
+    async def get_kb_version_documents(self, version_id: str) -> List[Document]:
+        response = await self._request("GET", f"/api/kb-versions/{version_id}/documents")
+        return [Document(**doc) for doc in response]
+
+    # Document endpoints
+    async def get_documents(self, project_id: str) -> List[Document]:
+        response = await self._request("GET", f"/api/projects/{project_id}/documents")
+        return [Document(**doc) for doc in response]
+
+    async def get_documents_by_kb(self, kb_id: str) -> List[Document]:
+        response = await self._request("GET", f"/api/knowledge-bases/{kb_id}/documents")
+        return DocumentList(**response).documents
+
+    async def get_document(self, doc_id: str) -> Document:
+        return Document(**await self._request("GET", f"/api/documents/{doc_id}"))
+
+    async def upload_document(self, kb_id: str, file_path: str, name: str, description: Optional[str] = None,
+                              chunking_method: ChunkingMethod = ChunkingMethod.FIXED_SIZE,
+                              embedding_provider: EmbeddingProvider = EmbeddingProvider.OPENAI,
+                              embedding_model: EmbeddingModel = EmbeddingModel.TEXT_EMBEDDING_ADA_002,
+                              chunk_size: int = 1000, chunk_overlap: int = 200) -> Document:
+        content = await asyncio.to_thread(Path(file_path).read_bytes)
+        data = {
+            'name': name,
+            'description': description or '',
+            'chunking_method': chunking_method.value,
+            'embedding_provider': embedding_provider.value,
+            'embedding_model': embedding_model.value,
+            'chunk_size': str(chunk_size),
+            'chunk_overlap': str(chunk_overlap),
+        }
+        response = await self._request("POST", f"/api/knowledge-bases/{kb_id}/documents/upload",
+                                       files={'file': (os.path.basename(file_path), content)}, data=data)
+        return Document(**response)
+
+    async def create_document_from_url(self, kb_id: str, url: str, name: Optional[str] = None,
+                                       description: Optional[str] = None) -> Document:
+        response = await self._request("POST", f"/api/knowledge-bases/{kb_id}/documents/from-url",
+                                       json={"url": url, "name": name, "description": description})
+        return Document(**response)
+
+    async def bulk_upload_urls(self, kb_id: str, urls: Iterable[Union[str, Dict[str, Any]]]) -> IngestionBatch:
+        """Ingest many URLs in one request as an NDJSON manifest"""
+        body = b"".join(json.dumps({"url": u} if isinstance(u, str) else u).encode() + b"\n" for u in urls)
+        response = await self._request("POST", f"/api/knowledge-bases/{kb_id}/documents/bulk", content=body,
+                                       headers={"Content-Type": "application/x-ndjson"})
+        return IngestionBatch(**response)
+
+    async def get_ingestion_batch(self, batch_id: str) -> IngestionBatch:
+        return IngestionBatch(**await self._request("GET", f"/api/ingestion-batches/{batch_id}"))
+
+    # Document Version endpoints
+    async def get_document_versions(self, doc_id: str, include_archived: bool = False) -> List[DocumentVersion]:
+        response = await self._request("GET", f"/api/documents/{doc_id}/versions",
+                                       params={"include_archived": include_archived})
+        return DocumentVersionList(**response).document_versions
+
+    async def get_document_version(self, version_id: str) -> DocumentVersion:
+        return DocumentVersion(**await self._request("GET", f"/api/document-versions/{version_id}"))
+
+    async def create_document_version(self, doc_id: str, version_name: Optional[str] = None,
+                                      change_description: Optional[str] = None) -> DocumentVersion:
+        response = await self._request("POST", f"/api/documents/{doc_id}/versions", json={
+            "version_name": version_name or "",
+            "change_description": change_description or "",
+        })
+        return DocumentVersion(**response)
+
+    async def archive_document_version(self, doc_id: str, version_id: str, reason: str) -> DocumentVersion:
+        response = await self._request("PUT", f"/api/documents/{doc_id}/versions/{version_id}/archive",
+                                       json={"reason": reason})
+        return DocumentVersion(**response)
+
+    async def health_check(self) -> bool:
+        try:
+            await self._request("GET", "/api/health")
+        except APIError:
+            return False
+        return True
+
+    # Batch helpers
+    async def get_documents_many(self, doc_ids: Iterable[str],
+                                 return_exceptions: bool = False) -> Dict[str, Union[Document, APIError]]:
+        """Fetch many documents concurrently, keyed by id"""
+        return await self._map_by_id(self.get_document, doc_ids, return_exceptions)
+
+    async def get_document_versions_many(self, doc_ids: Iterable[str], return_exceptions: bool = False
+                                         ) -> Dict[str, Union[List[DocumentVersion], APIError]]:
+        """Fetch the versions of many documents concurrently, keyed by document id"""
+        return await self._map_by_id(self.get_document_versions, doc_ids, return_exceptions)
+
+    async def get_kb_versions_many(self, kb_ids: Iterable[str], return_exceptions: bool = False
+                                   ) -> Dict[str, Union[List[KnowledgeBaseVersion], APIError]]:
+        """Fetch the versions of many knowledge bases concurrently, keyed by KB id"""
+        return await self._map_by_id(self.get_kb_versions, kb_ids, return_exceptions)
+
+    async def get_documents_by_kb_many(self, kb_ids: Iterable[str], return_exceptions: bool = False
+                                       ) -> Dict[str, Union[List[Document], APIError]]:
+        """Fetch the documents of many knowledge bases concurrently, keyed by KB id"""
+        return await self._map_by_id(self.get_documents_by_kb, kb_ids, return_exceptions)
+
+    async def upload_documents(self, kb_id: str, file_paths: Iterable[str],
+                               return_exceptions: bool = False) -> List[Union[Document, APIError]]:
+        """Upload many files concurrently, named after their file names"""
+        return await self.map_concurrently(
+            lambda path: self.upload_document(kb_id, path, os.path.basename(path)), file_paths, return_exceptions)
+
+
+def _error_detail(response: httpx.Response) -> Any:
+    try:
+        return response.json().get("detail", response.text)
+    except (ValueError, AttributeError):
+        return response.text
@@ -1,44 +1,63 @@
+import json
+import mimetypes
+import os
+import uuid
+from collections import OrderedDict
 import requests
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Iterable, Iterator, Union
 from backend.models import (
     Project, KnowledgeBase, KnowledgeBaseVersion, Document, DocumentVersion,
     ProjectList, KnowledgeBaseList, DocumentList, DocumentVersionList, 
     KnowledgeBaseVersionList, ProcessingStatus, CreateKnowledgeBaseRequest,
-    CreateVersionRequest, User, UserRole, AccessLevel, ChunkingMethod,
+    CreateKbVersionRequest, IngestionBatch, User, UserRole, AccessLevel, ChunkingMethod,
     EmbeddingProvider, EmbeddingModel
 )
 
 
+# Number of GET responses kept for revalidation with ETags
+RESPONSE_CACHE_SIZE = 1024
+
+
 class APIClient:
     """Client for communicating with the RAG Knowledge Base API"""
     
     def __init__(self, base_url: str = "http://localhost:8000"):
         self.base_url = base_url.rstrip('/')
         self.session = requests.Session()
+        # (url, params) -> (etag, body) of the latest GET responses
+        self._response_cache: "OrderedDict[tuple, tuple]" = OrderedDict()
     
     def _make_request(self, method: str, endpoint: str, **kwargs):
-        """Make a request to the API"""
+        """Make a request to the API, revalidating cached GET responses"""
         url = f"{self.base_url}{endpoint}"
+        cache_key = None
+        cached = None
+        if method == "GET":
+            cache_key = (url, json.dumps(kwargs.get("params"), sort_keys=True, default=str))
+            cached = self._response_cache.get(cache_key)
+            if cached:
+                kwargs["headers"] = {**kwargs.get("headers", {}), "If-None-Match": cached[0]}
         try:
             response = self.session.request(method, url, **kwargs)
+            if response.status_code == 304 and cached:
+                self._response_cache.move_to_end(cache_key)
+                return json.loads(cached[1])
             response.raise_for_status()
+            etag = response.headers.get("ETag")
+            if cache_key and etag:
+                self._response_cache[cache_key] = (etag, response.content)
+                self._response_cache.move_to_end(cache_key)
+                if len(self._response_cache) > RESPONSE_CACHE_SIZE:
+                    self._response_cache.popitem(last=False)
             return response.json()
         except requests.exceptions.RequestException as e:
             print(f"API request failed: {e}")
             return None
     
-    # User endpoints
-    def get_users(self) -> Optional[List[User]]:
-        """Get all users"""
-        response = self._make_request("GET", "/users")
-        if response:
-            return [User(**user) for user in response.get("users", [])]
-        return None
-    
     # Project endpoints
     def get_projects(self) -> Optional[List[Project]]:
         """Get all projects"""
-        response = self._make_request("GET", "/projects")
+        response = self._make_request("GET", "/api/projects")
         if response:
             project_list = ProjectList(**response)
             return project_list.projects
@@ -46,15 +65,22 @@ class APIClient:
     
     def get_project(self, project_id: str) -> Optional[Project]:
         """Get a specific project"""
-        response = self._make_request("GET", f"/projects/{project_id}")
+        response = self._make_request("GET", f"/api/projects/{project_id}")
         if response:
             return Project(**response)
         return None
-    
+
+    def create_project(self, name: str, description: Optional[str] = None) -> Optional[Project]:
+        """Create a new project"""
+        response = self._make_request("POST", "/api/projects", json={"name": name, "description": description})
+        if response:
+            return Project(**response)
+        return None
+
     # Knowledge Base endpoints
     def get_knowledge_bases(self, project_id: str) -> Optional[List[KnowledgeBase]]:
         """Get knowledge bases for a project"""
-        response = self._make_request("GET", f"/projects/{project_id}/knowledge-bases")
+        response = self._make_request("GET", f"/api/projects/{project_id}/knowledge-bases")
         if response:
             kb_list = KnowledgeBaseList(**response)
             return kb_list.knowledge_bases
@@ -62,7 +88,7 @@ class APIClient:
     
     def get_knowledge_base(self, kb_id: str) -> Optional[KnowledgeBase]:
         """Get a specific knowledge base"""
-        response = self._make_request("GET", f"/knowledge-bases/{kb_id}")
+        response = self._make_request("GET", f"/api/knowledge-bases/{kb_id}")
         if response:
             return KnowledgeBase(**response)
         return None
@@ -74,57 +100,62 @@ class APIClient:
             description=description,
             access_level=access_level
         )
-        response = self._make_request("POST", f"/projects/{project_id}/knowledge-bases", json=request_data.dict())
+        response = self._make_request("POST", f"/api/projects/{project_id}/knowledge-bases", json=request_data.dict())
         if response:
             return KnowledgeBase(**response)
         return None
     
-    def set_primary_knowledge_base(self, kb_id: str) -> bool:
-        """Set a knowledge base as primary"""
-        response = self._make_request("PUT", f"/knowledge-bases/{kb_id}/primary")
-        return response is not None
-    
     # Knowledge Base Version endpoints
-    def get_kb_versions(self, kb_id: str) -> Optional[List[KnowledgeBaseVersion]]:
-        """Get versions for a knowledge base"""
-        response = self._make_request("GET", f"/knowledge-bases/{kb_id}/versions")
+    def get_kb_versions(self, kb_id: str, include_archived: bool = False) -> Optional[List[KnowledgeBaseVersion]]:
+        """Get versions for a knowledge base, with archived ones if asked"""
+        response = self._make_request("GET", f"/api/knowledge-bases/{kb_id}/versions",
+                                      params={"include_archived": include_archived})
         if response:
             version_list = KnowledgeBaseVersionList(**response)
             return version_list.versions
         return None
     
-    def get_kb_version(self, kb_id: str, version_id: str) -> Optional[KnowledgeBaseVersion]:
-        """Get a specific knowledge base version"""
-        response = self._make_request("GET", f"/knowledge-bases/{kb_id}/versions/{version_id}")
+    def create_kb_version(self, kb_id: str, version_data: dict) -> Optional[KnowledgeBaseVersion]:
+        """Create a new knowledge base version"""
+        request_data = CreateKbVersionRequest(**version_data)
+        response = self._make_request("POST", f"/api/knowledge-bases/{kb_id}/versions", json=request_data.dict())
         if response:
             return KnowledgeBaseVersion(**response)
         return None
     
-    def create_kb_version(self, kb_id: str, version_data: dict) -> Optional[KnowledgeBaseVersion]:
-        """Create a new knowledge base version"""
-        request_data = CreateVersionRequest(**version_data)
-        response = self._make_request("POST", f"/knowledge-bases/{kb_id}/versions", json=request_data.dict())
+    def archive_kb_version(self, kb_id: str, version_id: str) -> Optional[KnowledgeBaseVersion]:
+        """Archive a knowledge base version"""
+        response = self._make_request("PUT", f"/api/knowledge-bases/{kb_id}/versions/{version_id}/archive")
         if response:
             return KnowledgeBaseVersion(**response)
         return None
     
-    def deprecate_kb_version(self, kb_id: str, version_id: str) -> bool:
-        """Deprecate a knowledge base version"""
-        response = self._make_request("PUT", f"/knowledge-bases/{kb_id}/versions/{version_id}/deprecate")
-        return response is not None
+    def publish_kb_version(self, kb_id: str, version_id: str) -> Optional[KnowledgeBaseVersion]:
+        """Publish a draft knowledge base version"""
+        response = self._make_request("PUT", f"/api/knowledge-bases/{kb_id}/versions/{version_id}/publish")
+        if response:
+            return KnowledgeBaseVersion(**response)
+        return None
+    
+    def set_primary_kb_version(self, kb_id: str, version_id: str) -> Optional[KnowledgeBaseVersion]:
+        """Make a published version the primary version of its knowledge base"""
+        response = self._make_request("PUT", f"/api/knowledge-bases/{kb_id}/versions/{version_id}/set-primary")
+        if response:
+            return KnowledgeBaseVersion(**response)
+        return None
     
     # Document endpoints
     def get_documents(self, project_id: str) -> Optional[List[Document]]:
         """Get documents for a project"""
-        response = self._make_request("GET", f"/projects/{project_id}/documents")
-        if response:
-            doc_list = DocumentList(**response)
-            return doc_list.documents
+        response = self._make_request("GET", f"/api/projects/{project_id}/documents")
+        if response is not None:
+            # The endpoint returns a bare list
+            return [Document(**doc) for doc in response]
         return None
     
     def get_documents_by_kb(self, kb_id: str) -> Optional[List[Document]]:
         """Get documents for a knowledge base"""
-        response = self._make_request("GET", f"/knowledge-bases/{kb_id}/documents")
+        response = self._make_request("GET", f"/api/knowledge-bases/{kb_id}/documents")
         if response:
             doc_list = DocumentList(**response)
             return doc_list.documents
@@ -132,7 +163,7 @@ class APIClient:
     
     def get_document(self, doc_id: str) -> Optional[Document]:
         """Get a specific document"""
-        response = self._make_request("GET", f"/documents/{doc_id}")
+        response = self._make_request("GET", f"/api/documents/{doc_id}")
         if response:
             return Document(**response)
         return None
@@ -155,45 +186,104 @@ class APIClient:
                     'chunk_size': chunk_size,
                     'chunk_overlap': chunk_overlap
                 }
-                response = self._make_request("POST", f"/knowledge-bases/{kb_id}/documents/upload", 
+                response = self._make_request("POST", f"/api/knowledge-bases/{kb_id}/documents/upload", 
                                             files=files, data=data)
                 return response
         except Exception as e:
             print(f"Upload failed: {e}")
             return None
     
-    def get_document_versions(self, doc_id: str) -> Optional[List[DocumentVersion]]:
-        """Get versions for a document"""
-        response = self._make_request("GET", f"/documents/{doc_id}/versions")
+    def bulk_upload(self, kb_id: str, file_paths: Optional[Iterable[str]] = None,
+                    urls: Optional[Iterable[Union[str, Dict[str, Any]]]] = None,
+                    description: Optional[str] = None) -> Optional[IngestionBatch]:
+        """Ingest many files or URLs in one request, streaming the request body"""
+        if (file_paths is None) == (urls is None):
+            raise ValueError("Pass either file_paths or urls")
+        if file_paths is not None:
+            boundary = uuid.uuid4().hex
+            body = self._iter_multipart(file_paths, boundary, description)
+            headers = {"Content-Type": f"multipart/form-data; boundary={boundary}"}
+        else:
+            body = self._iter_ndjson(urls)
+            headers = {"Content-Type": "application/x-ndjson"}
+        response = self._make_request("POST", f"/api/knowledge-bases/{kb_id}/documents/bulk",
+                                      data=body, headers=headers)
+        if response:
+            return IngestionBatch(**response)
+        return None
+
+    def get_ingestion_batch(self, batch_id: str) -> Optional[IngestionBatch]:
+        """Get the aggregate progress of an ingestion batch"""
+        response = self._make_request("GET", f"/api/ingestion-batches/{batch_id}")
+        if response:
+            return IngestionBatch(**response)
+        return None
+
+    @staticmethod
+    def _iter_multipart(file_paths: Iterable[str], boundary: str, description: Optional[str],
+                        chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+        """Yield a multipart body one file chunk at a time"""
+        if description:
+            yield (f'--{boundary}\r\nContent-Disposition: form-data; name="description"\r\n\r\n'
+                   f'{description}\r\n').encode()
+        for path in file_paths:
+            file_name = os.path.basename(path)
+            content_type = mimetypes.guess_type(file_name)[0] or "application/octet-stream"
+            yield (f'--{boundary}\r\nContent-Disposition: form-data; name="files"; filename="{file_name}"\r\n'
+                   f'Content-Type: {content_type}\r\n\r\n').encode()
+            with open(path, 'rb') as f:
+                while chunk := f.read(chunk_size):
+                    yield chunk
+            yield b'\r\n'
+        yield f'--{boundary}--\r\n'.encode()
+
+    @staticmethod
+    def _iter_ndjson(urls: Iterable[Union[str, Dict[str, Any]]]) -> Iterator[bytes]:
+        """Yield an NDJSON manifest with one URL entry per line"""
+        for entry in urls:
+            item = {"url": entry} if isinstance(entry, str) else entry
+            yield json.dumps(item).encode() + b'\n'
+
+    def get_document_versions(self, doc_id: str, include_archived: bool = False) -> Optional[List[DocumentVersion]]:
+        """Get versions for a document, with archived ones if asked"""
+        response = self._make_request("GET", f"/api/documents/{doc_id}/versions",
+                                      params={"include_archived": include_archived})
         if response:
             version_list = DocumentVersionList(**response)
             return version_list.document_versions
         return None
     
-    def get_document_version(self, doc_id: str, version_id: str) -> Optional[DocumentVersion]:
-        """Get a specific document version"""
-        response = self._make_request("GET", f"/documents/{doc_id}/versions/{version_id}")
+    def create_document_version(self, doc_id: str, version_name: Optional[str] = None,
+                                change_description: Optional[str] = None) -> Optional[DocumentVersion]:
+        """Create a new version of a document and start processing it"""
+        response = self._make_request("POST", f"/api/documents/{doc_id}/versions", json={
+            "version_name": version_name or "",
+            "change_description": change_description or "",
+        })
         if response:
             return DocumentVersion(**response)
         return None
     
-    def deprecate_document_version(self, doc_id: str, version_id: str) -> bool:
-        """Deprecate a document version"""
-        response = self._make_request("PUT", f"/documents/{doc_id}/versions/{version_id}/deprecate")
-        return response is not None
+    def get_document_version(self, version_id: str) -> Optional[DocumentVersion]:
+        """Get a specific document version"""
+        response = self._make_request("GET", f"/api/document-versions/{version_id}")
+        if response:
+            return DocumentVersion(**response)
+        return None
     
-    def get_document_status(self, doc_id: str) -> Optional[ProcessingStatus]:
-        """Get document processing status"""
-        response = self._make_request("GET", f"/documents/{doc_id}/status")
+    def archive_document_version(self, doc_id: str, version_id: str, reason: str) -> Optional[DocumentVersion]:
+        """Archive a document version"""
+        response = self._make_request("PUT", f"/api/documents/{doc_id}/versions/{version_id}/archive",
+                                      json={"reason": reason})
         if response:
-            return ProcessingStatus(**response)
+            return DocumentVersion(**response)
         return None
     
     def health_check(self) -> bool:
         """Check if the API is healthy"""
-        response = self._make_request("GET", "/health")
+        response = self._make_request("GET", "/api/health")
         return response is not None
 
 
 # Global API client instance
-api_client = APIClient() 
\ No newline at end of file
+api_client = APIClient() 
\ No newline at end of file
@@ -0,0 +1,74 @@
+"""
+Exceptions raised by the async API client
+
+Every failure is an APIError. Responses with an error status raise an
+APIStatusError subclass chosen by status code, and requests that never got
+a response raise APIConnectionError.
+"""
+
+from typing import Any, Dict, Optional, Type
+
+
+class APIError(Exception):
+    """Base class for API client errors"""
+
+    def __init__(self, message: str, method: Optional[str] = None, url: Optional[str] = None):
+        super().__init__(message)
+        self.method = method
+        self.url = url
+
+
+class APIConnectionError(APIError):
+    """The request could not be sent or no response arrived"""
+
+
+class APIStatusError(APIError):
+    """The API answered with an error status"""
+
+    def __init__(self, status_code: int, detail: Any, method: Optional[str] = None, url: Optional[str] = None):
+        super().__init__(f"{method} {url} failed with {status_code}: {detail}", method, url)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class BadRequestError(APIStatusError):
+    """400: the request was rejected"""
+
+
+class NotFoundError(APIStatusError):
+    """404: the resource does not exist"""
+
+
+class ConflictError(APIStatusError):
+    """409: the request conflicts with the current state"""
+
+
+class ValidationError(APIStatusError):
+    """422: the request body or parameters failed validation"""
+
+
+class RateLimitError(APIStatusError):
+    """429: too many requests"""
+
+
+class ServerError(APIStatusError):
+    """5xx: the server failed to handle the request"""
+
+
+_ERRORS_BY_STATUS: Dict[int, Type[APIStatusError]] = {
+    400: BadRequestError,
+    404: NotFoundError,
+    409: ConflictError,
+    422: ValidationError,
+    429: RateLimitError,
+}
+
+
+def error_for_status(status_code: int, detail: Any, method: Optional[str] = None,
+                     url: Optional[str] = None) -> APIStatusError:
+    """Build the exception matching an error status code"""
+    if status_code >= 500:
+        error_class = ServerError
+    else:
+        error_class = _ERRORS_BY_STATUS.get(status_code, APIStatusError)
+    return error_class(status_code, detail, method, url)
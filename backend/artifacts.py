@@ -0,0 +1,300 @@
+"""
+Processing artifacts of document versions
+
+Each processed version keeps its cleaned text, its chunk table (spans into
+the text, see backend/chunk_store.py), their MinHash signatures and one
+embedding matrix per embedding model under
+``<data_dir>/artifacts/<version_id>/``.
+Files are written to a temporary name and renamed, so a reader in another
+worker never sees a partial artifact.
+
+Chunk tables are cached with their text memory-mapped, so a chunk's text is
+read from the page cache when it is served.
+
+Artifacts of archived versions are frozen into one compressed archive in the
+cold store; reads fall back to it when the version has no hot directory.
+Freezing holds a file lock shared by every worker of the data directory, so
+a version is archived by one process and its hot copy is only removed once
+the archive is complete.
+"""
+
+import fcntl
+import io
+import json
+import mmap
+import os
+import shutil
+import tarfile
+import threading
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import BinaryIO, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from .models import Chunk, EmbeddingModel
+from .chunk_store import ChunkTable, encode_table, parse_chunk_id
+from .embeddings import DEFAULT_EMBEDDING_MODEL
+from .storage import storage, DOCUMENT_VERSIONS
+
+TEXT_FILE = "text.txt"
+CHUNK_TABLE_FILE = "chunks.npy"
+# Chunks with copies of their text, written before chunk tables
+LEGACY_CHUNKS_FILE = "chunks.json"
+SIGNATURES_FILE = "minhash.npy"
+# Held while freezing, in the cold store's directory
+FREEZE_LOCK_FILE = "freeze.lock"
+
+# Chunk tables kept open, each with its text mapped
+CHUNK_TABLE_CACHE_SIZE = 256
+
+
+def _write_atomic(path: Path, data: bytes):
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+class ArtifactStore:
+    def __init__(self, root: Path, cold_root: Path):
+        self.root = Path(root)
+        self.cold_root = Path(cold_root)
+        # Tables by version, with the identity of the file they were read from
+        self._tables: "OrderedDict[str, Tuple[Optional[Tuple[int, int]], ChunkTable]]" = OrderedDict()
+        self._tables_lock = threading.Lock()
+        # flock does not exclude threads sharing the descriptor
+        self._freeze_lock = threading.Lock()
+
+    def version_dir(self, version_id: str) -> Path:
+        return self.root / version_id
+
+    def cold_path(self, version_id: str) -> Path:
+        return self.cold_root / f"{version_id}.tar.gz"
+
+    def _read(self, version_id: str, name: str) -> bytes:
+        """Contents of an artifact, hot or frozen. Raises FileNotFoundError."""
+        try:
+            return self._path(version_id, name).read_bytes()
+        except FileNotFoundError:
+            pass
+        try:
+            with tarfile.open(self.cold_path(version_id), "r:gz") as archive:
+                member = archive.extractfile(name)
+                return member.read()
+        except KeyError:
+            raise FileNotFoundError(name)
+
+    def _path(self, version_id: str, name: str, create: bool = False) -> Path:
+        directory = self.version_dir(version_id)
+        if create:
+            directory.mkdir(parents=True, exist_ok=True)
+        return directory / name
+
+    @staticmethod
+    def _embeddings_name(model: Optional[EmbeddingModel]) -> str:
+        return f"embeddings.{(model or DEFAULT_EMBEDDING_MODEL).value}.npy"
+
+    def write_text(self, version_id: str, data: bytes):
+        _write_atomic(self._path(version_id, TEXT_FILE, create=True), data)
+
+    @contextmanager
+    def text_writer(self, version_id: str) -> Iterator[BinaryIO]:
+        """File to stream a version's text into; it replaces the text when the block exits."""
+        path = self._path(version_id, TEXT_FILE, create=True)
+        tmp = path.with_name(path.name + ".tmp")
+        try:
+            with open(tmp, "wb") as f:
+                yield f
+            os.replace(tmp, path)
+        finally:
+            tmp.unlink(missing_ok=True)
+
+    def open_text(self, version_id: str) -> BinaryIO:
+        """The version's text for incremental reads. Raises FileNotFoundError."""
+        try:
+            return open(self._path(version_id, TEXT_FILE), "rb")
+        except FileNotFoundError:
+            return io.BytesIO(self._read(version_id, TEXT_FILE))
+
+    def read_text(self, version_id: str) -> Optional[bytes]:
+        try:
+            return self._read(version_id, TEXT_FILE)
+        except FileNotFoundError:
+            return None
+
+    def write_chunks(self, version_id: str, chunks: List[Chunk]):
+        """Save the chunk table of the version; the chunks' spans must be into its current text."""
+        self._write_array(version_id, CHUNK_TABLE_FILE, encode_table(chunks))
+        self._path(version_id, LEGACY_CHUNKS_FILE).unlink(missing_ok=True)
+        self._forget_table(version_id)
+
+    def _forget_table(self, version_id: str):
+        with self._tables_lock:
+            self._tables.pop(version_id, None)
+
+    def _map_text(self, version_id: str):
+        """The version's text, memory-mapped when it is hot."""
+        try:
+            with open(self._path(version_id, TEXT_FILE), "rb") as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    return b""
+                return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            return self._read(version_id, TEXT_FILE)
+
+    def _load_table(self, version_id: str) -> Optional[ChunkTable]:
+        try:
+            rows = np.load(io.BytesIO(self._read(version_id, CHUNK_TABLE_FILE)))
+        except FileNotFoundError:
+            try:
+                legacy = [Chunk(**item) for item in json.loads(self._read(version_id, LEGACY_CHUNKS_FILE))]
+            except FileNotFoundError:
+                return None
+            rows = encode_table(legacy)
+        try:
+            text = self._map_text(version_id)
+        except FileNotFoundError:
+            return None
+        return ChunkTable(version_id, rows, text)
+
+    def _table_identity(self, version_id: str) -> Optional[Tuple[int, int]]:
+        # Hot files are replaced when a version is processed again; frozen ones never change
+        for name in (CHUNK_TABLE_FILE, LEGACY_CHUNKS_FILE):
+            try:
+                stat = self._path(version_id, name).stat()
+                return stat.st_ino, stat.st_mtime_ns
+            except FileNotFoundError:
+                continue
+        return None
+
+    def chunk_table(self, version_id: str) -> Optional[ChunkTable]:
+        """The version's chunk table, or None if it has no chunks."""
+        identity = self._table_identity(version_id)
+        with self._tables_lock:
+            cached = self._tables.get(version_id)
+            if cached is not None and cached[0] == identity:
+                self._tables.move_to_end(version_id)
+                return cached[1]
+        table = self._load_table(version_id)
+        if table is None:
+            return None
+        with self._tables_lock:
+            self._tables[version_id] = (identity, table)
+            self._tables.move_to_end(version_id)
+            # An evicted table's mapping is closed once nothing uses it any more
+            while len(self._tables) > CHUNK_TABLE_CACHE_SIZE:
+                self._tables.popitem(last=False)
+        return table
+
+    def read_chunks(self, version_id: str) -> Optional[List[Chunk]]:
+        table = self.chunk_table(version_id)
+        return table.chunks() if table is not None else None
+
+    def get_chunk(self, chunk_id: str) -> Optional[Chunk]:
+        """A chunk by its ``"<document_version_id>:<index>"`` id."""
+        version_id, index = parse_chunk_id(chunk_id)
+        table = self.chunk_table(version_id)
+        if table is None or index >= len(table):
+            return None
+        return table.chunk(index)
+
+    def _write_array(self, version_id: str, name: str, array: np.ndarray):
+        path = self._path(version_id, name, create=True)
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "wb") as f:
+            np.save(f, array)
+        os.replace(tmp, path)
+
+    def write_embeddings(self, version_id: str, model: Optional[EmbeddingModel], vectors: np.ndarray):
+        self._write_array(version_id, self._embeddings_name(model), vectors)
+
+    def read_embeddings(self, version_id: str, model: Optional[EmbeddingModel]) -> Optional[np.ndarray]:
+        try:
+            return np.load(io.BytesIO(self._read(version_id, self._embeddings_name(model))))
+        except FileNotFoundError:
+            return None
+
+    def write_signatures(self, version_id: str, signatures: np.ndarray):
+        self._write_array(version_id, SIGNATURES_FILE, signatures)
+
+    def read_signatures(self, version_id: str) -> Optional[np.ndarray]:
+        try:
+            return np.load(io.BytesIO(self._read(version_id, SIGNATURES_FILE)))
+        except FileNotFoundError:
+            return None
+
+    def size(self, version_id: str) -> int:
+        directory = self.version_dir(version_id)
+        if not directory.exists():
+            cold = self.cold_path(version_id)
+            return cold.stat().st_size if cold.exists() else 0
+        return sum(path.stat().st_size for path in directory.iterdir() if path.is_file())
+
+    @contextmanager
+    def _freezing(self):
+        """Exclusive lock over freezing, across the threads and processes sharing the cold store."""
+        self.cold_root.mkdir(parents=True, exist_ok=True)
+        with self._freeze_lock:
+            fd = os.open(self.cold_root / FREEZE_LOCK_FILE, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                yield
+            finally:
+                os.close(fd)
+
+    def freeze(self, version_id: str):
+        """Move a version's artifacts into a compressed archive in the cold store."""
+        with self._freezing():
+            self._freeze(version_id)
+
+    def _freeze(self, version_id: str):
+        # Another worker may have frozen it while this one waited for the lock
+        directory = self.version_dir(version_id)
+        if not directory.exists():
+            return
+        target = self.cold_path(version_id)
+        # Left by a worker that stopped while freezing
+        for stale in self.cold_root.glob(f"{target.name}.*.tmp"):
+            stale.unlink(missing_ok=True)
+        tmp = target.with_name(f"{target.name}.{os.getpid()}.{uuid.uuid4().hex}.tmp")
+        try:
+            with tarfile.open(tmp, "w:gz") as archive:
+                for path in sorted(directory.iterdir()):
+                    if path.is_file() and not path.name.endswith(".tmp"):
+                        archive.add(path, arcname=path.name)
+            # The archive is in place before the hot copy goes, so readers always find one
+            os.replace(tmp, target)
+        finally:
+            tmp.unlink(missing_ok=True)
+        shutil.rmtree(directory, ignore_errors=True)
+        self._forget_table(version_id)
+
+    def freeze_archived(self):
+        """Freeze the artifacts of every archived version that still has hot ones.
+
+        Workers starting together run this one after another; the first
+        freezes everything and the others find nothing left to do.
+        """
+        if not self.root.exists():
+            return
+        with self._freezing():
+            for directory in list(self.root.iterdir()):
+                if directory.is_dir() and storage.cold.contains(DOCUMENT_VERSIONS, directory.name):
+                    self._freeze(directory.name)
+
+    def delete(self, version_id: str):
+        # Under the freeze lock, so a freeze running meanwhile cannot archive it again
+        with self._freezing():
+            shutil.rmtree(self.version_dir(version_id), ignore_errors=True)
+            self.cold_path(version_id).unlink(missing_ok=True)
+        self._forget_table(version_id)
+
+
+# Create a global artifact store instance
+artifact_store = ArtifactStore(storage.data_dir / "artifacts", storage.cold.root / "artifacts")
+
+def get_artifact_store() -> ArtifactStore:
+    return artifact_store
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Embedding dispatch against a rate-limited provider
+
+Starts the mock provider (backend/benchmarks/mock_provider.py) and embeds
+the same synthetic chunks twice: with fixed batches sent one at a time and
+retried after 429s, and with the embedding dispatcher, whose limits are set
+just below the mock's. Reports throughput, requests, 429s and the final
+batch size:
+
+    python -m backend.benchmarks.embed_bench --texts 2000 --rpm 600 --tpm 600000
+"""
+
+import argparse
+import json
+import platform
+import random
+import subprocess
+import time
+from typing import Dict
+
+import numpy as np
+import requests
+
+from backend.benchmarks.mock_provider import MockConfig, MockProviderServer
+from backend.embedding_dispatch import (
+    AdaptiveBatchSize, EmbeddingDispatcher, EmbeddingRequestError, HttpEmbeddingClient, ProviderLimits,
+)
+from backend.embeddings import embed_texts
+from backend.models import EmbeddingModel, EmbeddingProvider
+
+WORDS = (
+    "knowledge base document version chunk embedding search index retrieval query answer "
+    "context model vector project storage pipeline extract clean token segment parallel"
+).split()
+
+MODEL = EmbeddingModel.TEXT_EMBEDDING_3_SMALL
+# Share of the provider's limits the dispatcher is configured with
+LIMIT_HEADROOM = 0.9
+
+
+def make_texts(count: int, chars: int, seed: int):
+    rng = random.Random(seed)
+    texts = []
+    for _ in range(count):
+        words = []
+        while sum(len(w) + 1 for w in words) < chars:
+            words.append(rng.choice(WORDS))
+        texts.append(" ".join(words))
+    return texts
+
+
+def run_mode(url: str, texts, dispatcher: EmbeddingDispatcher) -> Dict[str, float]:
+    before = requests.get(url + "/stats").json()
+    start = time.perf_counter()
+    failed = False
+    try:
+        vectors = dispatcher.embed(texts, MODEL, EmbeddingProvider.OPENAI)
+    except EmbeddingRequestError:
+        failed = True
+    seconds = time.perf_counter() - start
+    after = requests.get(url + "/stats").json()
+    result = {
+        "seconds": round(seconds, 3),
+        "texts_per_second": round(len(texts) / seconds, 1),
+        "requests": after["requests"] - before["requests"],
+        "rate_limited": after["rate_limited"] - before["rate_limited"],
+        "errors": after["errors"] - before["errors"],
+        "final_batch_size": dispatcher.lane(EmbeddingProvider.OPENAI, MODEL).batch_size.size,
+        "failed": failed,
+    }
+    if not failed:
+        result["matches_local"] = bool(np.allclose(vectors, embed_texts(texts, MODEL), atol=1e-6))
+    return result
+
+
+def run(config: MockConfig, count: int, chars: int, fixed_batch_size: int, concurrency: int,
+        target_latency: float, seed: int) -> Dict[str, Dict[str, float]]:
+    texts = make_texts(count, chars, seed)
+    results = {}
+    with MockProviderServer(config, seed=seed) as server:
+        client = HttpEmbeddingClient(server.url)
+        fixed = EmbeddingDispatcher(
+            client, {EmbeddingProvider.OPENAI: ProviderLimits(None, None, 1)},
+            lambda: AdaptiveBatchSize(fixed_batch_size, fixed_batch_size, fixed_batch_size),
+        )
+        results["fixed"] = run_mode(server.url, texts, fixed)
+        # Let the mock's buckets refill
+        time.sleep(60 / config.requests_per_minute + 1)
+        limits = ProviderLimits(config.requests_per_minute * LIMIT_HEADROOM,
+                                config.tokens_per_minute * LIMIT_HEADROOM, concurrency)
+        adaptive = EmbeddingDispatcher(
+            client, {EmbeddingProvider.OPENAI: limits}, lambda: AdaptiveBatchSize(target_latency=target_latency)
+        )
+        results["dispatcher"] = run_mode(server.url, texts, adaptive)
+    return results
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ""
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--texts", type=int, default=2000, help="Chunks to embed")
+    parser.add_argument("--chars", type=int, default=400, help="Characters per chunk")
+    parser.add_argument("--rpm", type=float, default=600, help="Mock requests per minute")
+    parser.add_argument("--tpm", type=float, default=600_000, help="Mock tokens per minute")
+    parser.add_argument("--error-rate", type=float, default=0.02, help="Share of mock requests failing")
+    parser.add_argument("--fixed-batch-size", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=4, help="Requests the dispatcher keeps in flight")
+    parser.add_argument("--target-latency", type=float, default=0.5, help="Dispatcher target seconds per request")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", dest="json_path", help="Write results to this file")
+    args = parser.parse_args(argv)
+    config = MockConfig(requests_per_minute=args.rpm, tokens_per_minute=args.tpm, error_rate=args.error_rate)
+
+    results = run(config, args.texts, args.chars, args.fixed_batch_size, args.concurrency, args.target_latency,
+                  args.seed)
+
+    print(f"{'mode':<12}{'seconds':>10}{'texts/s':>10}{'requests':>10}{'429s':>8}{'errors':>8}{'batch':>8}")
+    for mode, result in results.items():
+        print(f"{mode:<12}{result['seconds']:>10.2f}{result['texts_per_second']:>10.1f}{result['requests']:>10}"
+              f"{result['rate_limited']:>8}{result['errors']:>8}{result['final_batch_size']:>8}"
+              + ("  FAILED" if result["failed"] else ""))
+
+    if args.json_path:
+        report = {
+            "meta": {
+                "commit": _git_commit(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "seed": args.seed,
+                "texts": args.texts,
+                "chars": args.chars,
+                "mock": vars(config),
+            },
+            "results": results,
+        }
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
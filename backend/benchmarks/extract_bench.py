@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Throughput benchmark for text extraction
+
+Generates a synthetic document in each supported format and times
+extracting and cleaning it, first in a single process and then with the
+file split into segments extracted in parallel. Results are reported in MB
+of input per second:
+
+    python -m backend.benchmarks.extract_bench --size-mb 16 --json extract.json
+"""
+
+import argparse
+import csv
+import io
+import json
+import platform
+import random
+import subprocess
+import time
+from typing import Callable, Dict
+
+from backend.extractors import EXTRACT_WORKERS, SEGMENT_SIZE, extract_segments, get_extractor
+from backend.pipeline import TextCleaner
+
+WORDS = (
+    "knowledge base document version chunk embedding search index retrieval query answer "
+    "context model vector project storage pipeline extract clean token segment parallel"
+).split()
+
+
+def _sentence(rng: random.Random) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 18))).capitalize() + "."
+
+
+def _paragraph(rng: random.Random) -> str:
+    return " ".join(_sentence(rng) for _ in range(rng.randint(2, 6)))
+
+
+def _text(rng: random.Random, size: int) -> str:
+    parts, total = [], 0
+    while total < size:
+        parts.append(_paragraph(rng))
+        total += len(parts[-1]) + 2
+    return "\n\n".join(parts)
+
+
+def _markdown(rng: random.Random, size: int) -> str:
+    parts, total = [], 0
+    while total < size:
+        kind = rng.random()
+        if kind < 0.1:
+            part = f"## {_sentence(rng)}"
+        elif kind < 0.2:
+            part = "\n".join(f"- **{rng.choice(WORDS)}**: {_sentence(rng)}" for _ in range(4))
+        elif kind < 0.25:
+            part = "```python\nfor chunk in chunks:\n    index(chunk)\n```"
+        else:
+            part = f"{_paragraph(rng)} See [the {rng.choice(WORDS)} docs](https://example.com/{rng.choice(WORDS)})."
+        parts.append(part)
+        total += len(part) + 2
+    return "\n\n".join(parts)
+
+
+def _html(rng: random.Random, size: int) -> str:
+    parts, total = ["<html><head><title>Benchmark</title><style>p { margin: 0 }</style></head><body>"], 0
+    while total < size:
+        kind = rng.random()
+        if kind < 0.1:
+            part = f"<h2>{_sentence(rng)}</h2>"
+        elif kind < 0.2:
+            part = "<ul>" + "".join(f"<li>{_sentence(rng)}</li>" for _ in range(4)) + "</ul>"
+        elif kind < 0.25:
+            part = "<script>window.analytics = {enabled: true};</script>"
+        else:
+            part = f"<p>{_paragraph(rng)} <a href=\"/{rng.choice(WORDS)}\">{rng.choice(WORDS)}</a></p>"
+        parts.append(part)
+        total += len(part) + 1
+    parts.append("</body></html>")
+    return "\n".join(parts)
+
+
+def _csv(rng: random.Random, size: int) -> str:
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(["id", "title", "category", "score", "description"])
+    row = 0
+    while out.tell() < size:
+        writer.writerow([row, _sentence(rng), rng.choice(WORDS), rng.randint(0, 100), _paragraph(rng)])
+        row += 1
+    return out.getvalue()
+
+
+def _record(rng: random.Random, i: int) -> dict:
+    return {
+        "id": i,
+        "title": _sentence(rng),
+        "tags": [rng.choice(WORDS) for _ in range(3)],
+        "body": {"summary": _sentence(rng), "text": _paragraph(rng)},
+    }
+
+
+def _json(rng: random.Random, size: int) -> str:
+    records, total = [], 0
+    while total < size:
+        records.append(_record(rng, len(records)))
+        total += len(json.dumps(records[-1])) + 2
+    return json.dumps({"records": records})
+
+
+def _jsonl(rng: random.Random, size: int) -> str:
+    lines, total = [], 0
+    while total < size:
+        lines.append(json.dumps(_record(rng, len(lines))))
+        total += len(lines[-1]) + 1
+    return "\n".join(lines) + "\n"
+
+
+GENERATORS: Dict[str, Callable[[random.Random, int], str]] = {
+    "text/plain": _text,
+    "text/markdown": _markdown,
+    "text/html": _html,
+    "text/csv": _csv,
+    "application/json": _json,
+    "application/x-ndjson": _jsonl,
+}
+
+
+def extract_and_clean(data: bytes, mime_type: str, workers: int, segment_size: int) -> int:
+    cleaner = TextCleaner()
+    written = 0
+    for segment in extract_segments(data, get_extractor(mime_type), segment_size, workers):
+        written += len(cleaner.feed(segment))
+    return written + len(cleaner.close())
+
+
+def measure(data: bytes, mime_type: str, workers: int, segment_size: int, repeat: int) -> Dict[str, float]:
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = extract_and_clean(data, mime_type, workers, segment_size)
+        durations.append(time.perf_counter() - start)
+    best = min(durations)
+    return {"seconds": round(best, 4), "mb_per_second": round(len(data) / best / 1e6, 2), "chars_out": out}
+
+
+def run(size: int, seed: int, workers: int, segment_size: int, repeat: int) -> Dict[str, Dict[str, float]]:
+    results: Dict[str, Dict[str, float]] = {}
+    # Start the worker processes before timing
+    extract_and_clean(_text(random.Random(seed), 2 * segment_size).encode(), "text/plain", workers, segment_size)
+    for mime_type, generator in GENERATORS.items():
+        data = generator(random.Random(seed), size).encode("utf-8")
+        sequential = measure(data, mime_type, 1, segment_size, repeat)
+        parallel = measure(data, mime_type, workers, segment_size, repeat)
+        results[mime_type] = {
+            "bytes": len(data),
+            "sequential_mb_per_second": sequential["mb_per_second"],
+            "parallel_mb_per_second": parallel["mb_per_second"],
+            "speedup": round(sequential["seconds"] / parallel["seconds"], 2),
+            "chars_out": parallel["chars_out"],
+        }
+    return results
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ""
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=float, default=16, help="Size of each generated document")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=EXTRACT_WORKERS, help="Processes used for parallel runs")
+    parser.add_argument("--segment-mb", type=float, default=SEGMENT_SIZE / (1 << 20), help="Size of parallel segments")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement; the fastest is reported")
+    parser.add_argument("--json", dest="json_path", help="Write results to this file")
+    args = parser.parse_args(argv)
+    segment_size = int(args.segment_mb * (1 << 20))
+
+    results = run(int(args.size_mb * (1 << 20)), args.seed, args.workers, segment_size, args.repeat)
+
+    print(f"{'format':<24}{'MB':>8}{'seq MB/s':>12}{'par MB/s':>12}{'speedup':>10}")
+    for mime_type, result in results.items():
+        print(f"{mime_type:<24}{result['bytes'] / 1e6:>8.1f}{result['sequential_mb_per_second']:>12.1f}"
+              f"{result['parallel_mb_per_second']:>12.1f}{result['speedup']:>10.2f}")
+
+    if args.json_path:
+        report = {
+            "meta": {
+                "commit": _git_commit(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "seed": args.seed,
+                "workers": args.workers,
+                "segment_size": segment_size,
+            },
+            "results": results,
+        }
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""
+Deterministic synthetic data for benchmarks
+
+Fills a Storage with projects, knowledge bases, documents, document versions,
+knowledge base versions and completed embedding migrations. Ids, names and timestamps all come from one
+seeded random generator, so the same shape and seed produce identical data
+across runs and commits.
+
+    python -m backend.benchmarks.generator --data-dir /tmp/kb-data --documents-per-kb 500
+"""
+
+import argparse
+import random
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from pydantic import BaseModel, Field
+
+from backend.models import (
+    ChunkingMethod, Document, DocumentStatus, DocumentVersion, EmbeddingMigration, EmbeddingModel,
+    EmbeddingProvider, KnowledgeBase, KnowledgeBaseVersion, MigrationStatus, Project, ProjectUser, User, UserRole,
+)
+from backend.storage import Storage
+
+# Fixed origin for generated timestamps
+EPOCH = datetime(2024, 1, 1)
+
+
+class DatasetShape(BaseModel):
+    projects: int = 2
+    knowledge_bases_per_project: int = 3
+    documents_per_kb: int = 100
+    versions_per_document: int = 3
+    kb_versions_per_kb: int = 5
+    # Share of a KB's documents included in each of its versions
+    kb_version_coverage: float = 0.8
+    # Share of non-latest document versions that are archived
+    archived_version_ratio: float = 0.3
+
+
+class GeneratedDataset(BaseModel):
+    user_id: str
+    project_ids: List[str] = Field(default_factory=list)
+    knowledge_base_ids: List[str] = Field(default_factory=list)
+    document_ids: List[str] = Field(default_factory=list)
+    document_version_ids: List[str] = Field(default_factory=list)
+    kb_version_ids: List[str] = Field(default_factory=list)
+    # KB id -> ids of its published versions, oldest first
+    published_kb_versions: Dict[str, List[str]] = Field(default_factory=dict)
+    embedding_migration_ids: List[str] = Field(default_factory=list)
+
+
+def generate(storage: Storage, shape: DatasetShape, seed: int = 0) -> GeneratedDataset:
+    """Add a dataset of the given shape to ``storage`` with a single save."""
+    rng = random.Random(seed)
+    clock = _Clock(rng)
+
+    def new_id() -> str:
+        return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+    with storage.transaction():
+        user = User(id=new_id(), username=f"bench-{seed}", email=f"bench-{seed}@example.com",
+                    full_name="Benchmark User", created_at=clock.now(), updated_at=clock.now())
+        storage.add_user(user)
+        dataset = GeneratedDataset(user_id=user.id)
+
+        for p in range(shape.projects):
+            project = Project(
+                id=new_id(), name=f"Project {p}", description=f"Synthetic project {p}", created_by=user.id,
+                users={user.id: ProjectUser(user_id=user.id, role=UserRole.ADMIN, joined_at=clock.now())},
+                created_at=clock.now(), updated_at=clock.now()
+            )
+            storage.add_project(project)
+            dataset.project_ids.append(project.id)
+
+            for k in range(shape.knowledge_bases_per_project):
+                kb = KnowledgeBase(id=new_id(), name=f"KB {p}.{k}", description="Synthetic knowledge base",
+                                   project_id=project.id, created_by=user.id,
+                                   created_at=clock.now(), updated_at=clock.now())
+                storage.add_knowledge_base(kb)
+                dataset.knowledge_base_ids.append(kb.id)
+                versions_by_doc = _generate_documents(storage, shape, rng, clock, new_id, kb, user.id, dataset)
+                _generate_kb_versions(storage, shape, rng, clock, new_id, kb, user.id, versions_by_doc, dataset)
+
+        # Drawn last, so the records generated before migrations existed stay the same
+        for kb_id, published in dataset.published_kb_versions.items():
+            if published:
+                _generate_migration(storage, clock, new_id, storage.get_version_by_id(published[0]), user.id, dataset)
+    return dataset
+
+
+class _Clock:
+    """Strictly increasing timestamps with random gaps."""
+
+    def __init__(self, rng: random.Random):
+        self._rng = rng
+        self._current = EPOCH
+
+    def now(self) -> datetime:
+        self._current += timedelta(seconds=self._rng.randint(1, 600))
+        return self._current
+
+
+def _generate_documents(storage, shape, rng, clock, new_id, kb, user_id, dataset) -> Dict[str, List[str]]:
+    versions_by_doc: Dict[str, List[str]] = {}
+    for d in range(shape.documents_per_kb):
+        created_at = clock.now()
+        doc = Document(
+            id=new_id(), name=f"document-{d}.pdf", description=f"Synthetic document {d}",
+            knowledge_base_id=kb.id, status=DocumentStatus.COMPLETED, created_by=user_id,
+            created_at=created_at, updated_at=created_at
+        )
+        storage.add_document(doc)
+        dataset.document_ids.append(doc.id)
+        versions_by_doc[doc.id] = []
+        for v in range(shape.versions_per_document):
+            is_latest = v == shape.versions_per_document - 1
+            archived = not is_latest and rng.random() < shape.archived_version_ratio
+            created_at = clock.now()
+            version = DocumentVersion(
+                id=new_id(), document_id=doc.id, version_number=str(v + 1),
+                version_name="Initial version" if v == 0 else f"Revision {v + 1}",
+                status=DocumentStatus.COMPLETED, processing_progress=100.0,
+                chunk_count=rng.randint(10, 400), embedding_count=0,
+                chunking_method=rng.choice(list(ChunkingMethod)),
+                embedding_provider=EmbeddingProvider.OPENAI,
+                embedding_model=rng.choice([EmbeddingModel.TEXT_EMBEDDING_ADA_002, EmbeddingModel.TEXT_EMBEDDING_3_SMALL]),
+                chunk_size=1000, chunk_overlap=200,
+                file_name=f"document-{d}-v{v + 1}.pdf", file_size=rng.randint(10_000, 5_000_000),
+                mime_type="application/pdf",
+                is_archived=archived, archive_reason="Superseded" if archived else None,
+                archived_at=created_at if archived else None, archived_by=user_id if archived else None,
+                created_by=user_id, created_at=created_at, updated_at=created_at
+            )
+            version.embedding_count = version.chunk_count
+            storage.add_document_version(version)
+            dataset.document_version_ids.append(version.id)
+            versions_by_doc[doc.id].append(version.id)
+    return versions_by_doc
+
+
+def _generate_kb_versions(storage, shape, rng, clock, new_id, kb, user_id, versions_by_doc, dataset):
+    doc_ids = list(versions_by_doc)
+    versions = []
+    for i in range(shape.kb_versions_per_kb):
+        # Later KB versions tend to pick later document versions, like real releases
+        progress = (i + 1) / shape.kb_versions_per_kb
+        selected = rng.sample(doc_ids, int(len(doc_ids) * shape.kb_version_coverage))
+        document_version_ids = []
+        for doc_id in selected:
+            doc_versions = versions_by_doc[doc_id]
+            latest_allowed = max(0, round(progress * len(doc_versions)) - 1)
+            document_version_ids.append(doc_versions[rng.randint(0, latest_allowed)])
+
+        is_last = i == shape.kb_versions_per_kb - 1
+        status = "draft" if is_last and i > 0 else ("archived" if i < shape.kb_versions_per_kb - 3 else "published")
+        created_at = clock.now()
+        version = KnowledgeBaseVersion(
+            id=new_id(), knowledge_base_id=kb.id, version_number=f"1.{i}.0", version_name=f"Release {i + 1}",
+            release_notes=f"Synthetic release {i + 1}", status=status,
+            access_level=rng.choice(["private", "protected", "public"]),
+            document_version_ids=document_version_ids, created_by=user_id, created_at=created_at,
+            published_by=user_id if status != "draft" else None,
+            published_at=created_at if status != "draft" else None,
+            archived_by=user_id if status == "archived" else None,
+            archived_at=created_at if status == "archived" else None,
+        )
+        versions.append(version)
+
+    published = [v for v in versions if v.status == "published"]
+    if published:
+        published[-1].is_primary = True
+    for version in versions:
+        storage.add_kb_version(version)
+        dataset.kb_version_ids.append(version.id)
+    dataset.published_kb_versions[kb.id] = [v.id for v in published]
+
+
+def _generate_migration(storage, clock, new_id, kb_version, user_id, dataset):
+    created_at = clock.now()
+    completed_at = clock.now()
+    migration = EmbeddingMigration(
+        id=new_id(), knowledge_base_id=kb_version.knowledge_base_id, knowledge_base_version_id=kb_version.id,
+        target_provider=EmbeddingProvider.OPENAI, target_model=EmbeddingModel.TEXT_EMBEDDING_3_LARGE,
+        status=MigrationStatus.COMPLETED, document_version_ids=list(kb_version.document_version_ids),
+        migrated_version_ids=list(kb_version.document_version_ids), progress=100.0,
+        created_by=user_id, created_at=created_at, updated_at=completed_at, completed_at=completed_at,
+    )
+    storage.put_embedding_migration(migration)
+    dataset.embedding_migration_ids.append(migration.id)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-dir", required=True, help="Storage directory to fill")
+    parser.add_argument("--seed", type=int, default=0)
+    for name, field in DatasetShape.model_fields.items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=field.annotation, default=field.default)
+    args = parser.parse_args(argv)
+    shape = DatasetShape(**{name: getattr(args, name) for name in DatasetShape.model_fields})
+    dataset = generate(Storage(data_dir=args.data_dir), shape, seed=args.seed)
+    print(f"Generated {len(dataset.document_ids)} documents, {len(dataset.document_version_ids)} document versions "
+          f"and {len(dataset.kb_version_ids)} KB versions in {args.data_dir}")
+
+
+if __name__ == "__main__":
+    main()
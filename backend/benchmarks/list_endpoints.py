@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Requests/sec of the hot list endpoints with and without the encoded record cache
+
+The "before" numbers come from routes that return pydantic models through
+``response_model``, which is how the list endpoints used to respond. The
+"after" numbers hit the real routes in backend.main, which assemble the body
+from cached fragments. Conditional requests are not used so both paths do
+the full lookup and encoding work.
+
+    python -m backend.benchmarks.list_endpoints --rows 10000
+"""
+
+import argparse
+import json
+import tempfile
+import time
+import uuid
+from datetime import datetime
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import backend.main as app_module
+from backend.models import (
+    Document, DocumentList, DocumentStatus, DocumentVersion, DocumentVersionList,
+    KnowledgeBase, KnowledgeBaseVersion, KnowledgeBaseVersionList, Project,
+)
+from backend.storage import Storage
+
+
+def build_storage(data_dir: str, rows: int) -> dict:
+    """Fill a storage with ``rows`` documents, document versions and KB versions."""
+    storage = Storage(data_dir=data_dir)
+    now = datetime.now()
+    with storage.transaction():
+        project = Project(name="Bench", created_by="bench")
+        storage.add_project(project)
+        kb = KnowledgeBase(name="Bench KB", project_id=project.id, created_by="bench")
+        storage.add_knowledge_base(kb)
+        doc_ids = []
+        for i in range(rows):
+            doc = Document(
+                id=str(uuid.uuid4()), name=f"Document {i}", description="Benchmark document",
+                knowledge_base_id=kb.id, status=DocumentStatus.COMPLETED, created_by="bench",
+                created_at=now, updated_at=now
+            )
+            storage.add_document(doc)
+            doc_ids.append(doc.id)
+        target_doc = doc_ids[0]
+        for i in range(rows):
+            storage.add_document_version(DocumentVersion(
+                document_id=target_doc, version_number=str(i + 1), status=DocumentStatus.COMPLETED,
+                chunk_count=150, file_name=f"file-{i}.txt", created_by="bench"
+            ))
+        for i in range(rows):
+            storage.add_kb_version(KnowledgeBaseVersion(
+                knowledge_base_id=kb.id, version_number=f"1.0.{i}", status="published",
+                access_level="private", document_version_ids=[], created_by="bench"
+            ))
+    return {"storage": storage, "kb_id": kb.id, "doc_id": target_doc}
+
+
+def build_baseline_app(storage: Storage) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/api/knowledge-bases/{kb_id}/versions", response_model=KnowledgeBaseVersionList)
+    def get_kb_versions(kb_id: str):
+        return KnowledgeBaseVersionList(versions=storage.get_versions_by_kb(kb_id))
+
+    @app.get("/api/knowledge-bases/{kb_id}/documents", response_model=DocumentList)
+    def get_documents_in_kb(kb_id: str):
+        return DocumentList(documents=storage.get_documents_by_kb(kb_id))
+
+    @app.get("/api/documents/{doc_id}/versions", response_model=DocumentVersionList)
+    def get_document_versions(doc_id: str):
+        return DocumentVersionList(document_versions=storage.get_document_versions_by_document(doc_id))
+
+    return app
+
+
+def measure(client: TestClient, path: str, duration: float) -> dict:
+    client.get(path)  # warm up caches on both paths
+    count = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration:
+        response = client.get(path)
+        response.raise_for_status()
+        count += 1
+    elapsed = time.perf_counter() - start
+    return {"requests": count, "seconds": round(elapsed, 3), "rps": round(count / elapsed, 2)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10000, help="Rows in each list")
+    parser.add_argument("--duration", type=float, default=5.0, help="Seconds spent on each endpoint and mode")
+    parser.add_argument("--json", dest="json_path", help="Also write results to this file")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        fixture = build_storage(data_dir, args.rows)
+        storage = fixture["storage"]
+        app_module.storage = storage
+        before = TestClient(build_baseline_app(storage))
+        after = TestClient(app_module.app)
+        paths = {
+            "get_kb_versions": f"/api/knowledge-bases/{fixture['kb_id']}/versions",
+            "get_documents_in_kb": f"/api/knowledge-bases/{fixture['kb_id']}/documents",
+            "get_document_versions": f"/api/documents/{fixture['doc_id']}/versions",
+        }
+        results = {}
+        for name, path in paths.items():
+            if json.loads(before.get(path).content) != json.loads(after.get(path).content):
+                raise SystemExit(f"{name}: cached response differs from response_model output")
+            results[name] = {
+                "before": measure(before, path, args.duration),
+                "after": measure(after, path, args.duration),
+            }
+            results[name]["speedup"] = round(results[name]["after"]["rps"] / results[name]["before"]["rps"], 2)
+
+    print(f"{'endpoint':<24}{'before rps':>12}{'after rps':>12}{'speedup':>10}")
+    for name, result in results.items():
+        print(f"{name:<24}{result['before']['rps']:>12}{result['after']['rps']:>12}{result['speedup']:>9}x")
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({"rows": args.rows, "results": results}, f, indent=2, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
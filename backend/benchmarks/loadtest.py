@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""
+HTTP load generator for the Knowledge Base API
+
+Drives a running server (e.g. ``poe backend``) through APIClient with a
+weighted mix of reads, writes and uploads. Runs either closed-loop with a
+fixed number of concurrent workers, or open-loop at a target request rate.
+In open-loop mode latency is measured from each request's scheduled start,
+so queueing inside the harness shows up as latency instead of hiding it.
+
+Reports p50/p95/p99/max latency, a latency histogram, error rate and
+throughput per operation. The JSON report is sorted and rounded so two runs
+can be diffed directly, or compared with --compare.
+
+    python -m backend.benchmarks.loadtest --concurrency 16 --duration 30 --json run.json
+    python -m backend.benchmarks.loadtest --rps 200 --duration 30 --compare run.json
+"""
+
+import argparse
+import json
+import os
+import queue
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from backend.api.client import APIClient
+from backend.telemetry import percentile
+
+DEFAULT_MIX = (
+    "list_knowledge_bases=25,list_documents=25,list_kb_versions=15,list_document_versions=15,"
+    "create_document_version=8,publish_kb_version=4,set_primary_kb_version=4,upload_document=4"
+)
+
+# Upper bounds of the latency histogram buckets, in milliseconds
+HISTOGRAM_BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000]
+
+
+class RecordingClient(APIClient):
+    """APIClient that remembers the status of the last response."""
+
+    def __init__(self, base_url: str):
+        super().__init__(base_url)
+        self.last_status: Optional[int] = None
+        self.session.hooks["response"].append(self._record_status)
+
+    def _record_status(self, response, *args, **kwargs):
+        self.last_status = response.status_code
+
+    def _make_request(self, method: str, endpoint: str, **kwargs):
+        self.last_status = None
+        return super()._make_request(method, endpoint, **kwargs)
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, Dict[str, int]] = {}
+
+    def record(self, operation: str, latency_s: float, error: Optional[str]):
+        with self._lock:
+            self.latencies.setdefault(operation, []).append(latency_s)
+            if error:
+                errors = self.errors.setdefault(operation, {})
+                errors[error] = errors.get(error, 0) + 1
+
+    def report(self, elapsed: float) -> Dict[str, dict]:
+        operations = {}
+        for operation, samples in sorted(self.latencies.items()):
+            samples_ms = sorted(s * 1000 for s in samples)
+            errors = self.errors.get(operation, {})
+            error_count = sum(errors.values())
+            histogram = {}
+            position = 0
+            for bound in HISTOGRAM_BUCKETS_MS:
+                count = 0
+                while position < len(samples_ms) and samples_ms[position] <= bound:
+                    count += 1
+                    position += 1
+                histogram[f"le_{bound}ms"] = count
+            histogram["le_inf"] = len(samples_ms) - position
+            operations[operation] = {
+                "requests": len(samples_ms),
+                "errors": error_count,
+                "error_rate": round(error_count / len(samples_ms), 4),
+                "error_kinds": dict(sorted(errors.items())),
+                "throughput_rps": round(len(samples_ms) / elapsed, 2),
+                "p50_ms": round(percentile(samples_ms, 0.50), 1),
+                "p95_ms": round(percentile(samples_ms, 0.95), 1),
+                "p99_ms": round(percentile(samples_ms, 0.99), 1),
+                "max_ms": round(samples_ms[-1], 1),
+                "mean_ms": round(statistics.fmean(samples_ms), 1),
+                "histogram": histogram,
+            }
+        return operations
+
+
+class Workload:
+    """Targets shared by the workers and the operations they can run."""
+
+    def __init__(self, base_url: str, project_id: Optional[str], upload_size: int, seed: int):
+        self.base_url = base_url
+        self._lock = threading.Lock()
+        self._rng = random.Random(seed)
+        setup = RecordingClient(base_url)
+        if not setup.health_check():
+            raise SystemExit(f"API at {base_url} is not reachable")
+        projects = setup.get_projects() or []
+        if project_id is None:
+            if not projects:
+                raise SystemExit("No project to run against")
+            project_id = projects[0].id
+        self.project_id = project_id
+        kb = setup.create_knowledge_base(project_id, f"loadtest-{int(time.time())}", "Load test", "private")
+        if not kb:
+            raise SystemExit("Could not create the load test knowledge base")
+        self.kb_id = kb.id
+
+        fd, self.upload_path = tempfile.mkstemp(prefix="loadtest-", suffix=".txt")
+        with os.fdopen(fd, "wb") as f:
+            f.write(b"Load test document content.\n" * max(1, upload_size // 28))
+
+        self.doc_ids: List[str] = []
+        for i in range(5):
+            doc = setup.upload_document(self.kb_id, self.upload_path, f"seed-{i}")
+            if doc:
+                self.doc_ids.append(doc["id"])
+        if not self.doc_ids:
+            raise SystemExit("Could not upload seed documents")
+        # Two published versions for set-primary to alternate between
+        self.published_version_ids: List[str] = []
+        for _ in range(2):
+            version = self._create_draft(setup)
+            if version and setup.publish_kb_version(self.kb_id, version.id):
+                self.published_version_ids.append(version.id)
+
+    def _create_draft(self, client: APIClient):
+        doc_version_ids = []
+        for doc_id in self.doc_ids[:20]:
+            versions = client.get_document_versions(doc_id) or []
+            if versions:
+                doc_version_ids.append(versions[-1].id)
+        return client.create_kb_version(self.kb_id, {"version_bump": "patch", "document_version_ids": doc_version_ids})
+
+    def _pick(self, values: List[str]) -> str:
+        with self._lock:
+            return self._rng.choice(values)
+
+    def operations(self) -> Dict[str, Callable[[RecordingClient], object]]:
+        def upload(client):
+            doc = client.upload_document(self.kb_id, self.upload_path, "loadtest upload")
+            if doc:
+                with self._lock:
+                    self.doc_ids.append(doc["id"])
+            return doc
+
+        def publish(client):
+            version = client.create_kb_version(self.kb_id, {"version_bump": "patch"})
+            return version and client.publish_kb_version(self.kb_id, version.id)
+
+        return {
+            "list_knowledge_bases": lambda client: client.get_knowledge_bases(self.project_id),
+            "list_documents": lambda client: client.get_documents_by_kb(self.kb_id),
+            "list_kb_versions": lambda client: client.get_kb_versions(self.kb_id),
+            "list_document_versions": lambda client: client.get_document_versions(self._pick(self.doc_ids)),
+            "create_document_version": lambda client: client.create_document_version(
+                self._pick(self.doc_ids), "loadtest", "Created by the load test"),
+            "publish_kb_version": publish,
+            "set_primary_kb_version": lambda client: client.set_primary_kb_version(
+                self.kb_id, self._pick(self.published_version_ids)),
+            "upload_document": upload,
+        }
+
+    def cleanup(self):
+        os.unlink(self.upload_path)
+
+
+def parse_mix(mix: str, known: List[str]) -> Dict[str, float]:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in known:
+            raise SystemExit(f"Unknown operation '{name}'. Known operations: {', '.join(known)}")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+def run(workload: Workload, weights: Dict[str, float], concurrency: int, duration: float,
+        rps: Optional[float], seed: int) -> Dict[str, object]:
+    recorder = Recorder()
+    operations = workload.operations()
+    names = list(weights)
+    weight_values = list(weights.values())
+    deadline = time.perf_counter() + duration
+    # Open loop: a pacer enqueues scheduled start times; closed loop: workers go back to back
+    schedule: "Optional[queue.Queue]" = queue.Queue() if rps else None
+
+    def worker(worker_seed: int):
+        client = RecordingClient(workload.base_url)
+        rng = random.Random(worker_seed)
+        while True:
+            if schedule is not None:
+                scheduled = schedule.get()
+                if scheduled is None:
+                    return
+            else:
+                scheduled = time.perf_counter()
+                if scheduled >= deadline:
+                    return
+            operation = rng.choices(names, weights=weight_values)[0]
+            error = None
+            try:
+                result = operations[operation](client)
+                if client.last_status is None:
+                    error = "connection"
+                elif client.last_status >= 400:
+                    error = str(client.last_status)
+                elif result is None:
+                    error = "empty"
+            except Exception as e:  # keep the worker alive and count the failure
+                error = type(e).__name__
+            recorder.record(operation, time.perf_counter() - scheduled, error)
+
+    threads = [threading.Thread(target=worker, args=(seed + i,), daemon=True) for i in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    if schedule is not None:
+        interval = 1.0 / rps
+        next_start = start
+        while next_start < deadline:
+            now = time.perf_counter()
+            if next_start > now:
+                time.sleep(next_start - now)
+            schedule.put(next_start)
+            next_start += interval
+        for _ in threads:
+            schedule.put(None)
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    operations_report = recorder.report(elapsed)
+    total = sum(op["requests"] for op in operations_report.values())
+    errors = sum(op["errors"] for op in operations_report.values())
+    return {
+        "config": {
+            "concurrency": concurrency,
+            "duration_s": duration,
+            "target_rps": rps,
+            "mix": weights,
+            "seed": seed,
+        },
+        "summary": {
+            "requests": total,
+            "errors": errors,
+            "error_rate": round(errors / total, 4) if total else 0.0,
+            "throughput_rps": round(total / elapsed, 2),
+        },
+        "operations": operations_report,
+    }
+
+
+def print_report(report: Dict[str, object], baseline: Optional[Dict[str, object]] = None):
+    header = f"{'operation':<26}{'reqs':>8}{'rps':>9}{'err%':>7}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}"
+    if baseline:
+        header += f"{'p99 vs base':>13}"
+    print(header)
+    for name, op in report["operations"].items():
+        line = (f"{name:<26}{op['requests']:>8}{op['throughput_rps']:>9}{op['error_rate'] * 100:>6.1f}%"
+                f"{op['p50_ms']:>9}{op['p95_ms']:>9}{op['p99_ms']:>9}{op['max_ms']:>9}")
+        base = baseline["operations"].get(name) if baseline else None
+        if base and base["p99_ms"]:
+            line += f"{op['p99_ms'] / base['p99_ms']:>12.2f}x"
+        print(line)
+    summary = report["summary"]
+    print(f"\nTotal: {summary['requests']} requests, {summary['throughput_rps']} req/s, "
+          f"{summary['error_rate'] * 100:.2f}% errors")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--project-id", help="Project to create the load test KB in (default: first project)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Worker threads")
+    parser.add_argument("--rps", type=float, help="Target request rate; omit to run closed-loop")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to run")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Comma-separated operation=weight pairs")
+    parser.add_argument("--upload-size", type=int, default=64 * 1024, help="Bytes per uploaded document")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", dest="json_path", help="Write the report to this file")
+    parser.add_argument("--compare", help="Previous report to compare p99 latencies against")
+    args = parser.parse_args(argv)
+
+    workload = Workload(args.base_url, args.project_id, args.upload_size, args.seed)
+    try:
+        weights = parse_mix(args.mix, list(workload.operations()))
+        report = run(workload, weights, args.concurrency, args.duration, args.rps, args.seed)
+    finally:
+        workload.cleanup()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    if report["summary"]["requests"] == 0:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
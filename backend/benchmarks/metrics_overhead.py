@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Overhead of the metrics instrumentation
+
+Times Storage lookups through the instrumented methods and through the
+original functions they wrap, plus the bare metric primitives. Exits with a
+non-zero status when the added cost per call exceeds the budget, so it can
+gate changes to backend/metrics.py:
+
+    python -m backend.benchmarks.metrics_overhead --budget-us 3
+"""
+
+import argparse
+import json
+import sys
+import tempfile
+import time
+from typing import Callable, Dict
+
+from backend.benchmarks.generator import DatasetShape, generate
+from backend.metrics import MetricsRegistry
+from backend.storage import Storage
+
+
+def per_call_ns(func: Callable[[], object], calls: int, repeats: int) -> float:
+    """Best-of-``repeats`` average nanoseconds per call."""
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter_ns()
+        for _ in range(calls):
+            func()
+        best = min(best, (time.perf_counter_ns() - start) / calls)
+    return best
+
+
+def run(calls: int, repeats: int) -> Dict[str, Dict[str, float]]:
+    results = {}
+    with tempfile.TemporaryDirectory() as data_dir:
+        storage = Storage(data_dir=data_dir)
+        dataset = generate(storage, DatasetShape(projects=1, knowledge_bases_per_project=2, documents_per_kb=50))
+        doc_id = dataset.document_ids[0]
+        kb_id = dataset.knowledge_base_ids[0]
+        cases = {
+            "get_document_by_id": (
+                lambda: storage.get_document_by_id(doc_id),
+                lambda: Storage.get_document_by_id.__wrapped__(storage, doc_id),
+            ),
+            "get_documents_by_kb": (
+                lambda: storage.get_documents_by_kb(kb_id),
+                lambda: Storage.get_documents_by_kb.__wrapped__(storage, kb_id),
+            ),
+        }
+        for name, (instrumented, bare) in cases.items():
+            with_metrics = per_call_ns(instrumented, calls, repeats)
+            without_metrics = per_call_ns(bare, calls, repeats)
+            results[name] = {
+                "instrumented_ns": round(with_metrics, 1),
+                "bare_ns": round(without_metrics, 1),
+                "overhead_ns": round(with_metrics - without_metrics, 1),
+            }
+
+    registry = MetricsRegistry()
+    histogram = registry.histogram("bench_seconds", "bench", ("method",)).labels("x")
+    counter = registry.counter("bench_total", "bench", ("method",)).labels("x")
+    results["histogram_observe"] = {"overhead_ns": round(per_call_ns(lambda: histogram.observe(0.0001), calls, repeats), 1)}
+    results["counter_inc"] = {"overhead_ns": round(per_call_ns(lambda: counter.inc(), calls, repeats), 1)}
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=20000)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--budget-us", type=float, default=3.0, help="Maximum overhead per instrumented call")
+    parser.add_argument("--json", dest="json_path", help="Write results to this file")
+    args = parser.parse_args(argv)
+
+    results = run(args.calls, args.repeats)
+    over_budget = []
+    print(f"{'case':<24}{'overhead ns':>14}")
+    for name, result in results.items():
+        print(f"{name:<24}{result['overhead_ns']:>14}")
+        if "instrumented_ns" in result and result["overhead_ns"] > args.budget_us * 1000:
+            over_budget.append(name)
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({"budget_us": args.budget_us, "results": results}, f, indent=2, sort_keys=True)
+    if over_budget:
+        print(f"Instrumentation overhead above {args.budget_us}µs: {', '.join(over_budget)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
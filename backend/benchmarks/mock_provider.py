@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Mock embedding provider
+
+Serves an OpenAI-style ``POST /v1/embeddings`` with the local embeddings of
+backend/embeddings.py, so the embedding dispatcher can be exercised without
+network access. Like a real provider it enforces request and token rate
+limits (429 with Retry-After), takes longer for larger batches and when
+many requests run at once, and can fail a share of requests with 500.
+``GET /stats`` reports what it served:
+
+    python -m backend.benchmarks.mock_provider --port 8900 --error-rate 0.05
+    KB_EMBEDDING_ENDPOINT=http://127.0.0.1:8900 poe backend
+"""
+
+import argparse
+import math
+import random
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import List, Optional
+
+import uvicorn
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+from backend.embedding_dispatch import TokenBucket, estimate_tokens
+from backend.embeddings import embed_texts
+from backend.models import EmbeddingModel
+
+
+@dataclass
+class MockConfig:
+    # The dispatcher's default OpenAI limits
+    requests_per_minute: float = 3000
+    tokens_per_minute: float = 1_000_000
+    base_latency_ms: float = 50
+    per_text_latency_ms: float = 1
+    # Requests beyond this many at once each add overload_latency_ms
+    overload_concurrency: int = 4
+    overload_latency_ms: float = 100
+    error_rate: float = 0.0
+    max_batch_size: int = 2048
+
+
+@dataclass
+class MockStats:
+    requests: int = 0
+    rate_limited: int = 0
+    errors: int = 0
+    texts: int = 0
+    max_concurrency: int = 0
+
+
+class EmbeddingRequest(BaseModel):
+    model: str
+    input: List[str]
+
+
+def create_app(config: Optional[MockConfig] = None, seed: int = 0) -> FastAPI:
+    config = config or MockConfig()
+    app = FastAPI(title="Mock embedding provider")
+    requests_bucket = TokenBucket(config.requests_per_minute / 60, max(1.0, config.requests_per_minute / 60))
+    tokens_bucket = TokenBucket(config.tokens_per_minute / 60, config.tokens_per_minute / 60)
+    stats = MockStats()
+    lock = threading.Lock()
+    rng = random.Random(seed)
+    active = 0
+
+    def _rate_limited(retry_after: float) -> JSONResponse:
+        with lock:
+            stats.rate_limited += 1
+        return JSONResponse(
+            {"error": {"message": "Rate limit exceeded", "type": "rate_limit_exceeded"}},
+            status_code=429, headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+
+    @app.post("/v1/embeddings")
+    def embeddings(request: EmbeddingRequest):
+        nonlocal active
+        with lock:
+            stats.requests += 1
+        try:
+            model = EmbeddingModel(request.model)
+        except ValueError:
+            return JSONResponse({"error": {"message": f"Unknown model {request.model}"}}, status_code=400)
+        if len(request.input) > config.max_batch_size:
+            return JSONResponse({"error": {"message": "Too many inputs"}}, status_code=400)
+        retry_after = requests_bucket.try_take(1)
+        if retry_after:
+            return _rate_limited(retry_after)
+        retry_after = tokens_bucket.try_take(estimate_tokens(request.input))
+        if retry_after:
+            return _rate_limited(retry_after)
+
+        with lock:
+            active += 1
+            stats.max_concurrency = max(stats.max_concurrency, active)
+            overload = max(0, active - config.overload_concurrency)
+            failed = rng.random() < config.error_rate
+        try:
+            latency_ms = (config.base_latency_ms + config.per_text_latency_ms * len(request.input)
+                          + config.overload_latency_ms * overload)
+            time.sleep(latency_ms / 1000)
+            if failed:
+                with lock:
+                    stats.errors += 1
+                return JSONResponse({"error": {"message": "Internal error"}}, status_code=500)
+            vectors = embed_texts(request.input, model)
+        finally:
+            with lock:
+                active -= 1
+        with lock:
+            stats.texts += len(request.input)
+        return {
+            "object": "list",
+            "model": model.value,
+            "data": [{"object": "embedding", "index": i, "embedding": vector.tolist()} for i, vector in enumerate(vectors)],
+        }
+
+    @app.get("/stats")
+    def get_stats():
+        with lock:
+            return asdict(stats)
+
+    return app
+
+
+class MockProviderServer:
+    """Runs the mock provider on a background thread, for benchmarks."""
+
+    def __init__(self, config: Optional[MockConfig] = None, port: int = 0, seed: int = 0):
+        self.server = uvicorn.Server(uvicorn.Config(create_app(config, seed), host="127.0.0.1", port=port,
+                                                    log_level="warning"))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    @property
+    def url(self) -> str:
+        sock = self.server.servers[0].sockets[0]
+        return f"http://127.0.0.1:{sock.getsockname()[1]}"
+
+    def __enter__(self) -> "MockProviderServer":
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--rpm", type=float, default=MockConfig.requests_per_minute, help="Requests per minute")
+    parser.add_argument("--tpm", type=float, default=MockConfig.tokens_per_minute, help="Tokens per minute")
+    parser.add_argument("--latency-ms", type=float, default=MockConfig.base_latency_ms, help="Latency per request")
+    parser.add_argument("--per-text-ms", type=float, default=MockConfig.per_text_latency_ms,
+                        help="Added latency per input text")
+    parser.add_argument("--overload-concurrency", type=int, default=MockConfig.overload_concurrency)
+    parser.add_argument("--overload-ms", type=float, default=MockConfig.overload_latency_ms,
+                        help="Added latency per request beyond --overload-concurrency")
+    parser.add_argument("--error-rate", type=float, default=MockConfig.error_rate, help="Share of requests failing")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    config = MockConfig(
+        requests_per_minute=args.rpm,
+        tokens_per_minute=args.tpm,
+        base_latency_ms=args.latency_ms,
+        per_text_latency_ms=args.per_text_ms,
+        overload_concurrency=args.overload_concurrency,
+        overload_latency_ms=args.overload_ms,
+        error_rate=args.error_rate,
+    )
+    uvicorn.run(create_app(config, args.seed), host="127.0.0.1", port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Latency of re-ranking search candidates
+
+Builds synthetic candidates with normalized vectors and times MMR alone,
+MMR with a per-document cap and MMR after the lexical cross-scorer. Exits
+with a non-zero status when the p95 of any case exceeds the budget, so it
+can gate changes to backend/rerank.py:
+
+    python -m backend.benchmarks.rerank_bench --candidates 200 --budget-ms 5
+"""
+
+import argparse
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from backend.embeddings import EMBEDDING_DIMENSIONS
+from backend.models import EmbeddingModel, RerankOptions, SearchResult
+from backend.rerank import Candidate, rerank
+
+WORDS = (
+    "knowledge base document version chunk embedding search index retrieval query answer "
+    "context model vector project storage pipeline extract clean token segment parallel"
+).split()
+
+
+def make_candidates(count: int, documents: int, seed: int) -> List[Candidate]:
+    rng = random.Random(seed)
+    vectors = np.random.default_rng(seed).standard_normal((count, EMBEDDING_DIMENSIONS)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    scores = sorted((rng.random() for _ in range(count)), reverse=True)
+    candidates = []
+    for i, (vector, score) in enumerate(zip(vectors, scores)):
+        result = SearchResult(
+            knowledge_base_id="kb",
+            knowledge_base_version_id="kbv",
+            document_id=f"doc-{rng.randrange(documents)}",
+            document_version_id="dv",
+            chunk_index=i,
+            score=score,
+            text=" ".join(rng.choice(WORDS) for _ in range(rng.randint(40, 120))),
+            start=0,
+            end=0,
+        )
+        candidates.append(Candidate(result, vector, EmbeddingModel.TEXT_EMBEDDING_3_SMALL))
+    return candidates
+
+
+def measure(candidates: List[Candidate], query: str, top_k: int, options: RerankOptions,
+            repeat: int) -> Dict[str, float]:
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rerank(query, candidates, top_k, options)
+        durations.append((time.perf_counter() - start) * 1000)
+    return {
+        "p50_ms": round(float(np.percentile(durations, 50)), 3),
+        "p95_ms": round(float(np.percentile(durations, 95)), 3),
+    }
+
+
+def run(count: int, top_k: int, documents: int, seed: int, repeat: int) -> Dict[str, Dict[str, float]]:
+    candidates = make_candidates(count, documents, seed)
+    query = "search index retrieval of document chunks"
+    # No budget here: the point is to measure how long each case takes
+    cases = {
+        "mmr": RerankOptions(candidates=count, budget_ms=10000),
+        "mmr_capped": RerankOptions(candidates=count, max_per_document=2, budget_ms=10000),
+        "mmr_lexical": RerankOptions(candidates=count, cross_scorer="lexical", budget_ms=10000),
+    }
+    return {name: measure(candidates, query, top_k, options, repeat) for name, options in cases.items()}
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ""
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--candidates", type=int, default=200, help="Candidates re-ranked per query")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--documents", type=int, default=20, help="Documents the candidates are spread over")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=200, help="Runs per case")
+    parser.add_argument("--budget-ms", type=float, default=5.0, help="Maximum p95 latency per case")
+    parser.add_argument("--json", dest="json_path", help="Write results to this file")
+    args = parser.parse_args(argv)
+
+    results = run(args.candidates, args.top_k, args.documents, args.seed, args.repeat)
+    over_budget = []
+    print(f"{'case':<16}{'p50 ms':>10}{'p95 ms':>10}")
+    for name, result in results.items():
+        print(f"{name:<16}{result['p50_ms']:>10.3f}{result['p95_ms']:>10.3f}")
+        if result["p95_ms"] > args.budget_ms:
+            over_budget.append(name)
+    if args.json_path:
+        report = {
+            "meta": {
+                "commit": _git_commit(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "seed": args.seed,
+                "candidates": args.candidates,
+                "top_k": args.top_k,
+            },
+            "budget_ms": args.budget_ms,
+            "results": results,
+        }
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    if over_budget:
+        print(f"Re-ranking p95 above {args.budget_ms}ms: {', '.join(over_budget)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for Storage
+
+Generates a deterministic dataset, then times loading and saving the data
+files, every public get_* lookup, create_kb_version and
+set_primary_kb_version. Results are written as JSON (ns per call) so runs
+from different commits can be compared:
+
+    python -m backend.benchmarks.storage_bench --json before.json
+    python -m backend.benchmarks.storage_bench --json after.json --compare before.json
+"""
+
+import argparse
+import itertools
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+from backend.benchmarks.generator import DatasetShape, GeneratedDataset, generate
+from backend.storage import Storage
+
+# Lookups deliberately left out of the suite
+SKIPPED_LOOKUPS = {"get_ingestion_batch"}
+
+
+def time_calls(func: Callable[[], object], min_time: float, min_calls: int, max_calls: int) -> Dict[str, float]:
+    """Call ``func`` repeatedly and summarise the per-call durations."""
+    samples: List[int] = []
+    deadline = time.perf_counter() + min_time
+    while len(samples) < max_calls and (len(samples) < min_calls or time.perf_counter() < deadline):
+        start = time.perf_counter_ns()
+        func()
+        samples.append(time.perf_counter_ns() - start)
+    samples.sort()
+    return {
+        "calls": len(samples),
+        "min_ns": samples[0],
+        "median_ns": statistics.median(samples),
+        "p95_ns": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+        "mean_ns": round(statistics.fmean(samples), 1),
+    }
+
+
+def cycle(values: List[str]) -> Callable[[], str]:
+    iterator = itertools.cycle(values)
+    return lambda: next(iterator)
+
+
+def build_cases(storage: Storage, dataset: GeneratedDataset) -> Dict[str, Callable[[], object]]:
+    project_id = cycle(dataset.project_ids)
+    kb_id = cycle(dataset.knowledge_base_ids)
+    kb_version_id = cycle(dataset.kb_version_ids)
+    doc_id = cycle(dataset.document_ids)
+    doc_version_id = cycle(dataset.document_version_ids)
+    migration_id = cycle(dataset.embedding_migration_ids)
+    return {
+        "get_all_users": lambda: storage.get_all_users(),
+        "get_all_projects": lambda: storage.get_all_projects(),
+        "get_project_by_id": lambda: storage.get_project_by_id(project_id()),
+        "get_knowledge_bases_by_project": lambda: storage.get_knowledge_bases_by_project(project_id()),
+        "get_knowledge_base_by_id": lambda: storage.get_knowledge_base_by_id(kb_id()),
+        "get_versions_by_kb": lambda: storage.get_versions_by_kb(kb_id()),
+        "get_version_by_id": lambda: storage.get_version_by_id(kb_version_id()),
+        "get_documents_for_kb_version": lambda: storage.get_documents_for_kb_version(kb_version_id()),
+        "get_documents_by_kb": lambda: storage.get_documents_by_kb(kb_id()),
+        "get_documents_by_project": lambda: storage.get_documents_by_project(project_id()),
+        "get_document_by_id": lambda: storage.get_document_by_id(doc_id()),
+        "get_document": lambda: storage.get_document(doc_id()),
+        "get_document_versions_by_document": lambda: storage.get_document_versions_by_document(doc_id()),
+        "get_document_version_by_id": lambda: storage.get_document_version_by_id(doc_version_id()),
+        "get_embedding_migration": lambda: storage.get_embedding_migration(migration_id()),
+        "get_embedding_migrations_by_kb": lambda: storage.get_embedding_migrations_by_kb(kb_id()),
+        "get_embedding_migrations_by_project": lambda: storage.get_embedding_migrations_by_project(project_id()),
+    }
+
+
+def run(shape: DatasetShape, seed: int, min_time: float, write_calls: int) -> Dict[str, Dict[str, float]]:
+    results: Dict[str, Dict[str, float]] = {}
+    with tempfile.TemporaryDirectory() as data_dir:
+        storage = Storage(data_dir=data_dir)
+        dataset = generate(storage, shape, seed=seed)
+
+        results["load"] = time_calls(lambda: Storage(data_dir=data_dir), min_time, 3, 50)
+        results["save"] = time_calls(storage._save_all, min_time, 3, 50)
+
+        cases = build_cases(storage, dataset)
+        missing = {
+            name for name in dir(Storage)
+            if name.startswith("get_") and name != "get_storage" and name not in cases and name not in SKIPPED_LOOKUPS
+        }
+        if missing:
+            raise SystemExit(f"Storage lookups without a benchmark: {', '.join(sorted(missing))}")
+        for name, case in cases.items():
+            results[name] = time_calls(case, min_time, 100, 1_000_000)
+
+        # Writes save the data files on every call, so they get a fixed budget
+        kb_id = cycle(dataset.knowledge_base_ids)
+        results["create_kb_version"] = time_calls(
+            lambda: storage.create_kb_version(kb_id(), dataset.user_id, "patch", document_version_ids=[]),
+            0, write_calls, write_calls
+        )
+        primary_pairs = cycle([
+            (kb, version_id)
+            for kb, versions in dataset.published_kb_versions.items()
+            for version_id in versions
+        ])
+
+        def set_primary():
+            kb, version_id = primary_pairs()
+            storage.set_primary_kb_version(kb, version_id, dataset.user_id)
+
+        results["set_primary_kb_version"] = time_calls(set_primary, 0, write_calls, write_calls)
+    return results
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]], threshold: float) -> List[str]:
+    """Print median ratios against a baseline and return the regressed benchmarks."""
+    regressions = []
+    print(f"\n{'benchmark':<36}{'baseline':>14}{'current':>14}{'ratio':>8}")
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        ratio = result["median_ns"] / baseline[name]["median_ns"]
+        flag = ""
+        if ratio > 1 + threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<36}{baseline[name]['median_ns']:>14.0f}{result['median_ns']:>14.0f}{ratio:>8.2f}{flag}")
+    return regressions
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ""
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--min-time", type=float, default=0.5, help="Seconds spent on each read benchmark")
+    parser.add_argument("--write-calls", type=int, default=20, help="Calls made by each write benchmark")
+    parser.add_argument("--json", dest="json_path", help="Write results to this file")
+    parser.add_argument("--compare", help="Baseline results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Relative median slowdown reported as a regression")
+    for name, field in DatasetShape.model_fields.items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=field.annotation, default=field.default)
+    args = parser.parse_args(argv)
+    shape = DatasetShape(**{name: getattr(args, name) for name in DatasetShape.model_fields})
+
+    results = run(shape, args.seed, args.min_time, args.write_calls)
+
+    print(f"{'benchmark':<36}{'calls':>10}{'median ns':>14}{'p95 ns':>14}")
+    for name, result in results.items():
+        print(f"{name:<36}{result['calls']:>10}{result['median_ns']:>14.0f}{result['p95_ns']:>14.0f}")
+
+    if args.json_path:
+        report = {
+            "meta": {
+                "commit": _git_commit(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "seed": args.seed,
+                "shape": shape.model_dump(),
+            },
+            "results": results,
+        }
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
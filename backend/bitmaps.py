@@ -0,0 +1,98 @@
+"""
+Row sets for filtering search candidates
+
+A RowSet is a set of row numbers of a search index, stored like a roaring
+bitmap container: a sorted array of rows while it is sparse, a packed
+bitset once it holds more than one row in DENSE_FRACTION of the index.
+Search indexes precompute one set per metadata value, so a filter is a few
+unions and intersections of precomputed sets.
+"""
+
+from typing import Iterable, Optional
+
+import numpy as np
+
+# Above this fraction of the rows a set is stored as a bitset (4 bytes per
+# row in an array against 1 bit per row of the index)
+DENSE_FRACTION = 1 / 32
+
+
+class RowSet:
+    __slots__ = ("size", "rows", "bits", "count")
+
+    def __init__(self, size: int, rows: Optional[np.ndarray] = None, bits: Optional[np.ndarray] = None,
+                 count: Optional[int] = None):
+        self.size = size
+        self.rows = rows  # Sorted uint32 rows, or None when dense
+        self.bits = bits  # Packed bits, or None when sparse
+        if count is None:
+            count = len(rows) if rows is not None else int(np.unpackbits(bits, count=size).sum())
+        self.count = count
+
+    @classmethod
+    def from_rows(cls, size: int, rows: np.ndarray) -> "RowSet":
+        """Set of the given sorted, distinct rows."""
+        rows = np.asarray(rows, dtype=np.uint32)
+        if len(rows) > size * DENSE_FRACTION:
+            mask = np.zeros(size, dtype=bool)
+            mask[rows] = True
+            return cls(size, bits=np.packbits(mask), count=len(rows))
+        return cls(size, rows=rows)
+
+    @classmethod
+    def from_range(cls, size: int, start: int, end: int) -> "RowSet":
+        return cls.from_rows(size, np.arange(start, end, dtype=np.uint32))
+
+    @classmethod
+    def from_mask(cls, mask: np.ndarray) -> "RowSet":
+        return cls.from_rows(len(mask), np.flatnonzero(mask))
+
+    @classmethod
+    def union_all(cls, size: int, sets: Iterable["RowSet"]) -> "RowSet":
+        sets = list(sets)
+        if not sets:
+            return cls(size, rows=np.empty(0, dtype=np.uint32))
+        if all(s.rows is not None for s in sets):
+            return cls.from_rows(size, np.unique(np.concatenate([s.rows for s in sets])))
+        mask = np.zeros(size, dtype=bool)
+        for s in sets:
+            if s.rows is not None:
+                mask[s.rows] = True
+            else:
+                mask |= s.mask()
+        return cls.from_mask(mask)
+
+    def __len__(self) -> int:
+        return self.count
+
+    @property
+    def fraction(self) -> float:
+        return self.count / self.size if self.size else 0.0
+
+    def mask(self) -> np.ndarray:
+        if self.bits is not None:
+            return np.unpackbits(self.bits, count=self.size).astype(bool)
+        mask = np.zeros(self.size, dtype=bool)
+        mask[self.rows] = True
+        return mask
+
+    def to_rows(self) -> np.ndarray:
+        return self.rows if self.rows is not None else np.flatnonzero(self.mask()).astype(np.uint32)
+
+    def contains(self, rows: np.ndarray) -> np.ndarray:
+        """Membership of each of ``rows``."""
+        rows = np.asarray(rows, dtype=np.int64)
+        if self.bits is not None:
+            return ((self.bits[rows >> 3] >> (7 - (rows & 7))) & 1).astype(bool)
+        positions = np.searchsorted(self.rows, rows)
+        found = positions < len(self.rows)
+        found[found] = self.rows[positions[found]] == rows[found]
+        return found
+
+    def __and__(self, other: "RowSet") -> "RowSet":
+        if self.rows is not None and other.rows is not None:
+            return RowSet.from_rows(self.size, np.intersect1d(self.rows, other.rows, assume_unique=True))
+        if self.rows is not None or other.rows is not None:
+            sparse, dense = (self, other) if self.rows is not None else (other, self)
+            return RowSet.from_rows(self.size, sparse.rows[dense.contains(sparse.rows)])
+        return RowSet.from_mask(np.unpackbits(self.bits & other.bits, count=self.size).astype(bool))
@@ -0,0 +1,305 @@
+"""
+Knowledge base version bundles
+
+A published knowledge base version can be shipped as one immutable file
+holding everything a search of it needs:
+
+- a manifest with the version, the metadata of its document versions and
+  the ids of those that had completed processing when it was exported;
+- per embedding model, the chunk table and the embedding matrix;
+- the cleaned text the chunk tables point into;
+- a lexical index with the number of chunks each term occurs in.
+
+Query nodes (backend/query_node.py) memory-map bundles and search them
+without storage lookups. Arrays are NumPy views of the mapping, so loading a
+bundle copies nothing.
+
+The file starts with a HEADER (magic, offset and length of the manifest and
+its BLAKE2b digest). The sections follow, each aligned to SECTION_ALIGNMENT
+bytes, and the JSON manifest comes last. It lists every section with its
+offset, dtype, shape and digest. Opening a bundle checks the manifest's
+digest and, unless told not to, every section's.
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import struct
+import uuid
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from .models import DocumentVersion, EmbeddingModel, KnowledgeBaseVersion
+from .chunk_store import TABLE_FIELDS, ChunkTable
+from .embeddings import tokenize
+
+MAGIC = b"KBBUNDL1"
+FORMAT_VERSION = 2
+HEADER = struct.Struct("<8sQQ32s")
+SECTION_ALIGNMENT = 64
+BUNDLE_SUFFIX = ".kbv"
+
+TEXT_SECTION = "text"
+LEXICON_TERMS_SECTION = "lexicon/terms"
+LEXICON_COUNTS_SECTION = "lexicon/counts"
+
+
+class BundleError(Exception):
+    """A bundle is malformed or fails its checksum"""
+
+
+def _digest(data) -> bytes:
+    return hashlib.blake2b(data, digest_size=32).digest()
+
+
+def term_key(term: str) -> int:
+    return int.from_bytes(hashlib.blake2b(term.encode(), digest_size=8).digest(), "little")
+
+
+class Lexicon:
+    """Chunks each term occurs in, by 64-bit term hash, over a whole knowledge base version."""
+
+    def __init__(self, terms: np.ndarray, counts: np.ndarray, size: int):
+        self.terms = terms  # Sorted
+        self.counts = counts
+        self.size = size  # Chunks counted
+
+    @classmethod
+    def build(cls, texts: Iterable[str]) -> "Lexicon":
+        counts: Counter = Counter()
+        size = 0
+        for text in texts:
+            counts.update({term_key(term) for term in tokenize(text)})
+            size += 1
+        terms = np.fromiter(counts.keys(), dtype=np.uint64, count=len(counts))
+        order = np.argsort(terms)
+        return cls(terms[order], np.fromiter(counts.values(), dtype=np.uint32, count=len(counts))[order], size)
+
+    def document_frequencies(self, terms: Iterable[str]) -> Dict[str, int]:
+        terms = list(terms)
+        if not terms or not len(self.terms):
+            return dict.fromkeys(terms, 0)
+        keys = np.array([term_key(term) for term in terms], dtype=np.uint64)
+        positions = np.minimum(np.searchsorted(self.terms, keys), len(self.terms) - 1)
+        found = self.terms[positions] == keys
+        return {term: int(self.counts[p]) if f else 0 for term, p, f in zip(terms, positions, found)}
+
+
+class BundleEntry:
+    """A document version as exported: its metadata, chunk table and embeddings."""
+
+    __slots__ = ("version", "document_name", "model", "table", "vectors")
+
+    def __init__(self, version: DocumentVersion, document_name: Optional[str], model: EmbeddingModel,
+                 table: ChunkTable, vectors: np.ndarray):
+        self.version = version
+        self.document_name = document_name
+        self.model = model
+        self.table = table
+        self.vectors = vectors
+
+
+class _SectionWriter:
+    def __init__(self, f: BinaryIO):
+        self.f = f
+        self.sections: Dict[str, dict] = {}
+
+    def write(self, name: str, data, dtype: Optional[np.dtype] = None, shape: Tuple[int, ...] = ()):
+        position = self.f.tell()
+        offset = -(-position // SECTION_ALIGNMENT) * SECTION_ALIGNMENT
+        self.f.write(b"\0" * (offset - position))
+        view = memoryview(data).cast("B")
+        self.f.write(view)
+        self.sections[name] = {
+            "offset": offset,
+            "length": len(view),
+            "dtype": np.lib.format.dtype_to_descr(dtype) if dtype is not None else None,
+            "shape": list(shape),
+            "digest": _digest(view).hex(),
+        }
+
+    def array(self, name: str, array: np.ndarray):
+        array = np.ascontiguousarray(array)
+        self.write(name, array.view(np.uint8).reshape(-1) if array.size else b"", array.dtype, array.shape)
+
+
+def _common_rows(tables: List[ChunkTable]) -> np.ndarray:
+    """Rows of the tables concatenated, with the widest duplicate version id."""
+    width = max([table.rows.dtype["duplicate_version"].itemsize for table in tables] + [1])
+    dtype = np.dtype(TABLE_FIELDS + [("duplicate_version", f"S{width}")])
+    rows = np.zeros(sum(len(table) for table in tables), dtype=dtype)
+    offset = 0
+    for table in tables:
+        for name in dtype.names:
+            rows[name][offset:offset + len(table)] = table.rows[name]
+        offset += len(table)
+    return rows
+
+
+def write_bundle(path: Path, kb_version: KnowledgeBaseVersion, embedding_model: Optional[EmbeddingModel],
+                 entries: List[BundleEntry], document_version_ids: Optional[List[str]] = None) -> Tuple[int, str]:
+    """Write a bundle of ``entries`` to ``path`` atomically; returns its size and checksum.
+
+    ``embedding_model`` is the model the entries were chosen for (see
+    search.indexed_entries) and ``document_version_ids`` the completed
+    document versions they were read from, the entries' own by default.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.{uuid.uuid4().hex}.tmp")
+    if document_version_ids is None:
+        document_version_ids = [entry.version.id for entry in entries]
+    groups: Dict[EmbeddingModel, List[BundleEntry]] = {}
+    for entry in entries:
+        groups.setdefault(entry.model, []).append(entry)
+    documents = []
+    text_offset = 0
+    try:
+        with open(tmp, "wb") as f:
+            f.write(b"\0" * HEADER.size)
+            writer = _SectionWriter(f)
+            texts = [entry.table.buffer for group in groups.values() for entry in group]
+            writer.write(TEXT_SECTION, b"".join(texts))
+            for model, group in groups.items():
+                row = 0
+                for entry in group:
+                    version = entry.version
+                    documents.append({
+                        "id": version.id,
+                        "document_id": version.document_id,
+                        "document_name": entry.document_name,
+                        "chunking_method": version.chunking_method.value if version.chunking_method else None,
+                        "created_at": version.created_at.timestamp(),
+                        "model": model.value,
+                        "rows": [row, row + len(entry.table)],
+                        "text": [text_offset, text_offset + len(entry.table.buffer)],
+                    })
+                    row += len(entry.table)
+                    text_offset += len(entry.table.buffer)
+                writer.array(f"{model.value}/chunks", _common_rows([entry.table for entry in group]))
+                writer.array(f"{model.value}/vectors", np.concatenate([entry.vectors for entry in group]))
+            lexicon = Lexicon.build(entry.table.text(index) for entry in entries for index in range(len(entry.table)))
+            writer.array(LEXICON_TERMS_SECTION, lexicon.terms)
+            writer.array(LEXICON_COUNTS_SECTION, lexicon.counts)
+            manifest = json.dumps({
+                "format": FORMAT_VERSION,
+                "created_at": datetime.now().isoformat(),
+                "knowledge_base_version": kb_version.model_dump(mode="json"),
+                "embedding_model": embedding_model.value if embedding_model else None,
+                "models": [model.value for model in groups],
+                "document_version_ids": document_version_ids,
+                "documents": documents,
+                "chunk_count": lexicon.size,
+                "sections": writer.sections,
+            }).encode()
+            manifest_offset = f.tell()
+            f.write(manifest)
+            checksum = _digest(manifest)
+            f.seek(0)
+            f.write(HEADER.pack(MAGIC, manifest_offset, len(manifest), checksum))
+            size = manifest_offset + len(manifest)
+        os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
+    return size, checksum.hex()
+
+
+class Bundle:
+    """A memory-mapped bundle; arrays and text are read-only views of the file."""
+
+    def __init__(self, path: Path, verify: bool = True):
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            try:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise BundleError(f"{self.path} is empty")
+        try:
+            self._open(verify)
+        except Exception:
+            self._map.close()
+            raise
+
+    def _open(self, verify: bool):
+        if len(self._map) < HEADER.size:
+            raise BundleError(f"{self.path} is too short")
+        magic, offset, length, checksum = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise BundleError(f"{self.path} is not a knowledge base bundle")
+        manifest = self._map[offset:offset + length]
+        if len(manifest) != length or _digest(manifest) != checksum:
+            raise BundleError(f"{self.path}: manifest checksum mismatch")
+        self.checksum = checksum.hex()
+        self.manifest = json.loads(manifest)
+        if self.manifest["format"] != FORMAT_VERSION:
+            raise BundleError(f"{self.path}: unsupported format {self.manifest['format']}")
+        with memoryview(self._map) as view:
+            for name, section in self.manifest["sections"].items():
+                end = section["offset"] + section["length"]
+                if end > offset:
+                    raise BundleError(f"{self.path}: section {name} out of bounds")
+                if verify and _digest(view[section["offset"]:end]).hex() != section["digest"]:
+                    raise BundleError(f"{self.path}: section {name} checksum mismatch")
+        self.kb_version = KnowledgeBaseVersion(**self.manifest["knowledge_base_version"])
+        model = self.manifest["embedding_model"]
+        self.embedding_model = EmbeddingModel(model) if model else None
+        self.documents: List[dict] = self.manifest["documents"]
+        self.document_version_ids: List[str] = self.manifest["document_version_ids"]
+        self.models = [EmbeddingModel(m) for m in self.manifest["models"]]
+        text = self.manifest["sections"][TEXT_SECTION]
+        self.text = memoryview(self._map)[text["offset"]:text["offset"] + text["length"]]
+        self.lexicon = Lexicon(self.array(LEXICON_TERMS_SECTION), self.array(LEXICON_COUNTS_SECTION),
+                               self.manifest["chunk_count"])
+
+    def array(self, name: str) -> np.ndarray:
+        section = self.manifest["sections"][name]
+        dtype = np.lib.format.descr_to_dtype(section["dtype"])
+        shape = tuple(section["shape"])
+        return np.frombuffer(self._map, dtype=dtype, count=int(np.prod(shape)), offset=section["offset"]).reshape(shape)
+
+    def vectors(self, model: EmbeddingModel) -> np.ndarray:
+        return self.array(f"{model.value}/vectors")
+
+    def chunk_rows(self, model: EmbeddingModel) -> np.ndarray:
+        return self.array(f"{model.value}/chunks")
+
+    def chunk_table(self, document: dict) -> ChunkTable:
+        """Chunk table of one document version of the manifest, over the bundle's text."""
+        start, end = document["rows"]
+        text_start, text_end = document["text"]
+        rows = self.chunk_rows(EmbeddingModel(document["model"]))[start:end]
+        return ChunkTable(document["id"], rows, self.text[text_start:text_end])
+
+
+class BundleStore:
+    """Bundles of published knowledge base versions, one file each."""
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+
+    def path(self, kb_version_id: str) -> Path:
+        return self.root / f"{kb_version_id}{BUNDLE_SUFFIX}"
+
+    def exists(self, kb_version_id: str) -> bool:
+        return self.path(kb_version_id).exists()
+
+    def open(self, kb_version_id: str, verify: bool = True) -> Optional[Bundle]:
+        """The version's bundle, or None if it has none. Raises BundleError."""
+        try:
+            return Bundle(self.path(kb_version_id), verify)
+        except FileNotFoundError:
+            return None
+
+    def delete(self, kb_version_id: str):
+        self.path(kb_version_id).unlink(missing_ok=True)
+
+    def size(self, kb_version_id: str) -> int:
+        try:
+            return self.path(kb_version_id).stat().st_size
+        except FileNotFoundError:
+            return 0
@@ -0,0 +1,140 @@
+"""
+Append-only change log shared by the Storage of several processes
+
+When the server runs with several workers, each process keeps its own
+in-memory copy of the data. Writers take an exclusive file lock, catch up
+with the log, apply their change and append the changed records as NDJSON
+lines; every process tails the log and applies its peers' records, so reads
+stay local and lag writes by at most a polling interval.
+
+The first line of the log is a header with a generation id and the revision
+the log starts from. Compaction writes the data files, then atomically
+replaces the log with an empty one of a new generation; followers notice the
+new inode and reload the data files.
+
+Entries name the project of project-sharded records, so a process that has
+not loaded a project's shard can skip them and replay them from the log
+when it loads the shard.
+"""
+
+import fcntl
+import json
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from pydantic_core import to_json
+
+
+class ChangeLog:
+    def __init__(self, path: Path, lock_path: Path):
+        self.path = Path(path)
+        self._lock_fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        # The process's lock holders nest; the file lock is taken by the outermost
+        self._lock_depth = 0
+        self._read_fd: Optional[int] = None
+        self._append_fd: Optional[int] = None
+        self._inode: Optional[int] = None
+        self._offset = 0
+        self._header_size = 0
+        self.generation = ""
+        self.base_seq = 0
+
+    def lock(self):
+        if self._lock_depth == 0:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+        self._lock_depth += 1
+
+    def unlock(self):
+        self._lock_depth -= 1
+        if self._lock_depth == 0:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    @contextmanager
+    def locked(self):
+        self.lock()
+        try:
+            yield self
+        finally:
+            self.unlock()
+
+    def open(self):
+        """Attach to the log, creating it if needed. Call with the lock held."""
+        if not self.path.exists():
+            self._create(uuid.uuid4().hex[:8], 0)
+        self._attach()
+
+    def _create(self, generation: str, base_seq: int):
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp, "wb") as f:
+            f.write(json.dumps({"generation": generation, "base_seq": base_seq}).encode() + b"\n")
+        os.replace(tmp, self.path)
+
+    def _attach(self):
+        self.close()
+        self._read_fd = os.open(self.path, os.O_RDONLY)
+        self._append_fd = os.open(self.path, os.O_WRONLY | os.O_APPEND)
+        self._inode = os.fstat(self._read_fd).st_ino
+        with open(self.path, "rb") as f:
+            header_line = f.readline()
+        header = json.loads(header_line)
+        self.generation = header["generation"]
+        self.base_seq = header["base_seq"]
+        self._offset = self._header_size = len(header_line)
+
+    def close(self):
+        for fd in (self._read_fd, self._append_fd):
+            if fd is not None:
+                os.close(fd)
+        self._read_fd = self._append_fd = None
+
+    def rotated(self) -> bool:
+        """Whether the log was replaced since this process attached to it."""
+        try:
+            return os.stat(self.path).st_ino != self._inode
+        except FileNotFoundError:
+            return True
+
+    def read_new(self) -> List[Dict[str, Any]]:
+        """Complete entries appended since the last read."""
+        size = os.fstat(self._read_fd).st_size
+        if size <= self._offset:
+            return []
+        data = os.pread(self._read_fd, size - self._offset, self._offset)
+        # A line without its newline is still being written
+        end = data.rfind(b"\n") + 1
+        self._offset += end
+        return [json.loads(line) for line in data[:end].splitlines() if line]
+
+    def read_consumed(self) -> List[Dict[str, Any]]:
+        """Entries from the start of the log up to the last one read, to replay them."""
+        data = os.pread(self._read_fd, self._offset - self._header_size, self._header_size)
+        return [json.loads(line) for line in data.splitlines() if line]
+
+    def append(self, lines: List[bytes]):
+        """Append entries. Call with the lock held, after reading every entry."""
+        data = b"".join(lines)
+        view = memoryview(data)
+        while view:
+            written = os.write(self._append_fd, view)
+            view = view[written:]
+        self._offset += len(data)
+
+    @property
+    def size(self) -> int:
+        return self._offset
+
+    def rotate(self, base_seq: int) -> str:
+        """Replace the log with an empty one of a new generation. Call with the lock held."""
+        self._create(uuid.uuid4().hex[:8], base_seq)
+        self._attach()
+        return self.generation
+
+    @staticmethod
+    def entry(seq: int, collection: str, item: Any, project_id: Optional[str] = None, removed: bool = False) -> bytes:
+        """Log line of a changed record, or of a record removed for good with ``removed``."""
+        return b'{"seq":%d,"t":%.6f,"c":"%s","p":%s,"r":%s%s}\n' % (
+            seq, time.time(), collection.encode(), to_json(project_id), to_json(item), b',"d":1' if removed else b"")
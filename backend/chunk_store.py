@@ -0,0 +1,108 @@
+"""
+Chunk tables
+
+A version's chunks are stored as spans into its cleaned text instead of as
+copies of it, which with overlapping chunks would take 1.2-2x the text
+again. The chunk table has one fixed-size row per chunk: the byte offsets of
+its span, its content hash and the chunk it nearly duplicates, if any. A
+chunk is found by its index in O(1), and its text is a slice of the
+memory-mapped text artifact, copied only when it is decoded.
+
+Tables are saved as ``.npy`` files of TABLE_FIELDS rows, with the width of
+the duplicate's version id chosen per table. Versions processed before
+chunk tables existed keep their ``chunks.json``; see
+ArtifactStore.chunk_table.
+"""
+
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .models import Chunk
+
+TABLE_FIELDS = [
+    ("start", "<i8"),
+    ("end", "<i8"),
+    ("hash", "u1", (16,)),  # Raw digest of chunking.chunk_hash
+    ("duplicate_row", "<i4"),  # -1 unless the chunk nearly duplicates another one
+]
+
+
+def encode_table(chunks: List[Chunk]) -> np.ndarray:
+    """Chunk table rows of ``chunks``, ordered by index."""
+    chunks = sorted(chunks, key=lambda c: c.index)
+    duplicates = [parse_chunk_id(c.duplicate_of) if c.duplicate_of else ("", -1) for c in chunks]
+    width = max([len(version_id) for version_id, _ in duplicates] + [1])
+    rows = np.zeros(len(chunks), dtype=TABLE_FIELDS + [("duplicate_version", f"S{width}")])
+    for row, (chunk, (version_id, duplicate_row)) in enumerate(zip(chunks, duplicates)):
+        rows[row] = (chunk.start, chunk.end, np.frombuffer(bytes.fromhex(chunk.hash), dtype=np.uint8), duplicate_row, version_id.encode())
+    return rows
+
+
+class ChunkTable:
+    """Chunks of one version over its text, which may be memory-mapped."""
+
+    def __init__(self, version_id: str, rows: np.ndarray, text):
+        self.version_id = version_id
+        self.rows = rows
+        self._text = memoryview(text)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    @property
+    def buffer(self) -> memoryview:
+        """The text the chunks are spans of."""
+        return self._text
+
+    @property
+    def starts(self) -> np.ndarray:
+        return self.rows["start"]
+
+    @property
+    def ends(self) -> np.ndarray:
+        return self.rows["end"]
+
+    def data(self, index: int) -> memoryview:
+        """Bytes of a chunk, without copying."""
+        row = self.rows[index]
+        return self._text[int(row["start"]):int(row["end"])]
+
+    def text(self, index: int) -> str:
+        return str(self.data(index), "utf-8", errors="replace")
+
+    def hash(self, index: int) -> str:
+        return self.rows[index]["hash"].tobytes().hex()
+
+    def hashes(self) -> List[str]:
+        return [digest.tobytes().hex() for digest in self.rows["hash"]]
+
+    def duplicate_of(self, index: int) -> Optional[str]:
+        row = self.rows[index]
+        if row["duplicate_row"] < 0:
+            return None
+        return f"{row['duplicate_version'].decode()}:{int(row['duplicate_row'])}"
+
+    def duplicates(self) -> Dict[int, str]:
+        """``duplicate_of`` of the chunks that have one, by index."""
+        return {int(index): self.duplicate_of(int(index)) for index in np.flatnonzero(self.rows["duplicate_row"] >= 0)}
+
+    def chunk(self, index: int) -> Chunk:
+        row = self.rows[index]
+        return Chunk(index=index, hash=self.hash(index), start=int(row["start"]), end=int(row["end"]),
+                     text=self.text(index), duplicate_of=self.duplicate_of(index))
+
+    def chunks(self) -> List[Chunk]:
+        return [self.chunk(index) for index in range(len(self.rows))]
+
+    def span(self, index: int) -> Tuple[int, int]:
+        row = self.rows[index]
+        return int(row["start"]), int(row["end"])
+
+
+def parse_chunk_id(chunk_id: str) -> Tuple[str, int]:
+    """Version id and index of a ``"<document_version_id>:<index>"`` chunk id."""
+    version_id, _, index = chunk_id.rpartition(":")
+    if not version_id or not index.isdigit():
+        raise ValueError(f"Invalid chunk id {chunk_id!r}")
+    return version_id, int(index)
@@ -0,0 +1,159 @@
+"""
+Content-defined chunking
+
+Chunk boundaries are placed where a rolling hash of the preceding bytes hits
+a bit pattern, so they depend only on nearby content. After an edit the
+boundaries resynchronise within a chunk or two, and every chunk outside the
+edited region comes out byte-identical to the previous version's, which lets
+reprocessing match them by hash and carry their embeddings over.
+
+Boundaries are only placed after whitespace so chunks never split words. The
+hash is a windowed sum of a random byte table, computed with cumulative sums
+over a whole buffer at once; long texts are chunked block by block.
+"""
+
+import hashlib
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+# Bytes covered by the rolling hash
+HASH_WINDOW = 32
+
+# Chunks are kept between these fractions of the target size
+MIN_SIZE_RATIO = 0.25
+MAX_SIZE_RATIO = 2.0
+
+_WHITESPACE = np.array([ord(" "), ord("\n"), ord("\t")], dtype=np.uint8)
+
+# Fixed random table so boundaries are stable across processes and releases
+_GEAR = np.random.default_rng(0x6b62).integers(0, 2 ** 32, size=256, dtype=np.uint64)
+
+
+def chunk_hash(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def whitespace_count(data: bytes) -> int:
+    return data.count(b" ") + data.count(b"\n") + data.count(b"\t")
+
+
+def _boundary_mask(target_size: int, whitespace_ratio: float) -> int:
+    # Expected gap between candidates, so boundaries land near the target size
+    spacing = max(1.0, (target_size * (1 - MIN_SIZE_RATIO)) * max(whitespace_ratio, 1.0 / target_size))
+    return (1 << max(0, int(round(np.log2(spacing))))) - 1
+
+
+def _boundary_candidates(data: np.ndarray, whitespace: np.ndarray, mask: int) -> np.ndarray:
+    """Positions just after whitespace whose rolling hash matches the boundary mask."""
+    sums = np.concatenate((np.zeros(1, dtype=np.uint64), np.cumsum(_GEAR[data], dtype=np.uint64)))
+    # Hash of the HASH_WINDOW bytes ending at each position
+    ends = np.arange(1, len(data) + 1)
+    window = sums[ends] - sums[np.maximum(ends - HASH_WINDOW, 0)]
+    matches = ((window >> np.uint64(7)) & np.uint64(mask)) == 0
+    return np.flatnonzero(matches & whitespace) + 1
+
+
+def _char_start(data: bytes, position: int) -> int:
+    # Step back over UTF-8 continuation bytes
+    while 0 < position < len(data) and (data[position] & 0xC0) == 0x80:
+        position -= 1
+    return position
+
+
+class _Cutter:
+    """Boundary search over one buffer; positions are offsets into it."""
+
+    def __init__(self, data: bytes, target_size: int, whitespace_ratio: float):
+        self.data = data
+        self.min_size = int(target_size * MIN_SIZE_RATIO)
+        self.max_size = int(target_size * MAX_SIZE_RATIO)
+        array = np.frombuffer(data, dtype=np.uint8)
+        whitespace = np.isin(array, _WHITESPACE)
+        self.candidates = _boundary_candidates(array, whitespace, _boundary_mask(target_size, whitespace_ratio))
+        self.whitespace_positions = np.flatnonzero(whitespace) + 1
+
+    def cut(self, start: int) -> int:
+        """End of the chunk starting at ``start``, which must be over ``max_size`` from the end."""
+        candidates = self.candidates
+        index = int(np.searchsorted(candidates, start + self.min_size, side="left"))
+        if index < len(candidates) and candidates[index] <= start + self.max_size:
+            return int(candidates[index])
+        # No content boundary in range: cut at the last whitespace before the limit
+        w = int(np.searchsorted(self.whitespace_positions, start + self.max_size, side="right")) - 1
+        if w >= 0 and self.whitespace_positions[w] > start + self.min_size:
+            return int(self.whitespace_positions[w])
+        cut = _char_start(self.data, start + self.max_size)
+        return cut if cut > start else start + self.max_size
+
+    def span_start(self, start: int, overlap: int) -> int:
+        """Start of the span of the chunk at ``start``, reaching back ``overlap`` bytes to a word."""
+        if not overlap or start == 0:
+            return start
+        span_start = max(0, start - overlap)
+        w = int(np.searchsorted(self.whitespace_positions, span_start, side="left"))
+        if w < len(self.whitespace_positions) and self.whitespace_positions[w] < start:
+            return int(self.whitespace_positions[w])
+        return _char_start(self.data, span_start)
+
+
+def content_defined_spans(data: bytes, target_size: int = 1000, overlap: int = 0,
+                          whitespace_ratio: Optional[float] = None) -> List[Tuple[int, int]]:
+    """Split UTF-8 text into ``(start, end)`` byte spans.
+
+    Spans start ``overlap`` bytes before their boundary (rounded to the next
+    word) so neighbouring chunks share context. ``whitespace_ratio`` tunes
+    how often boundaries are placed and defaults to the ratio in ``data``.
+    """
+    if not data:
+        return []
+    target_size = max(16, target_size)
+    if whitespace_ratio is None:
+        whitespace_ratio = whitespace_count(data) / len(data)
+    cutter = _Cutter(data, target_size, whitespace_ratio)
+
+    boundaries = [0]
+    while len(data) - boundaries[-1] > cutter.max_size:
+        boundaries.append(cutter.cut(boundaries[-1]))
+    boundaries.append(len(data))
+    return [(cutter.span_start(start, overlap), end) for start, end in zip(boundaries, boundaries[1:])]
+
+
+def iter_spans(blocks: Iterable[bytes], whitespace_ratio: float, target_size: int = 1000,
+               overlap: int = 0) -> Iterator[Tuple[int, int, bytes]]:
+    """``content_defined_spans`` over text read in blocks, with each span's bytes.
+
+    Only the current chunk and the context it needs stay in memory. Given the
+    whitespace ratio of the whole text, the spans are the same as those of
+    ``content_defined_spans`` over the joined blocks.
+    """
+    target_size = max(16, target_size)
+    max_size = int(target_size * MAX_SIZE_RATIO)
+    # Bytes kept before the current boundary for the hash window, the
+    # overlap and a UTF-8 character cut by either
+    keep = max(HASH_WINDOW, overlap) + 4
+    buffer = b""
+    base = 0  # Offset of the buffer in the text
+    start = 0  # Start of the current chunk
+    blocks = iter(blocks)
+    while True:
+        block = next(blocks, None)
+        if block is not None:
+            buffer += block
+            if base + len(buffer) - start <= max_size:
+                continue
+        cutter = _Cutter(buffer, target_size, whitespace_ratio)
+        end = base + len(buffer)
+        while end - start > max_size:
+            cut = base + cutter.cut(start - base)
+            span_start = base + cutter.span_start(start - base, overlap)
+            yield span_start, cut, buffer[span_start - base:cut - base]
+            start = cut
+        if block is None:
+            if end > start:
+                span_start = base + cutter.span_start(start - base, overlap)
+                yield span_start, end, buffer[span_start - base:]
+            return
+        trim = max(base, start - keep)
+        buffer = buffer[trim - base:]
+        base = trim
@@ -0,0 +1,294 @@
+"""
+Garbage collection of unreferenced document versions
+
+Archiving a document version moves its record to the cold store and its
+artifacts into a compressed archive (backend/tiering.py,
+ArtifactStore.freeze), but keeps them, and the uploaded file, forever. The
+collector removes the archived versions no knowledge base version
+references, once they have been archived for longer than the retention
+window.
+
+A collection is a mark-and-sweep over storage:
+
+1. Mark: the document versions referenced by the ``document_version_ids``
+   of every knowledge base version, archived ones included.
+2. Sweep: every archived document version, document by document. One that
+   is not marked, is not the base a pending version of its document is
+   diffed against, and was archived before the retention window is
+   collected: its record, uploaded file and artifacts (text, chunk table,
+   embeddings and signatures, hot or frozen).
+3. Orphans: artifact and file directories of versions that have no record
+   at all, left older than the retention window.
+
+The work is split into steps of one knowledge base, document or directory,
+run on a background thread in slices of at most GC_SLICE_SECONDS with
+GC_SLICE_PAUSE_SECONDS between them, so a collection never holds a storage
+lock for more than one purge and never competes with requests for long.
+Since storage changes between slices, knowledge base versions written after
+the mark are caught by a write barrier (Storage.begin_collection), and a
+version is only purged if, inside the purge's transaction, it is still
+archived and not referenced through the barrier.
+
+A dry run takes the same steps and lists what would be removed and its
+size without removing anything. Collections run on request and, when
+KB_GC_INTERVAL_HOURS is set, periodically with the default retention. Of
+the processes sharing the data directory, only one runs the schedule, and a
+collection is refused while another process runs one.
+"""
+
+import fcntl
+import logging
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+from .models import CollectedItem, CollectionStatus, DocumentStatus, DocumentVersion, GarbageCollection
+from .storage import storage
+from .artifacts import artifact_store
+from .metrics import registry
+
+# Longest run of collection steps between pauses
+GC_SLICE_SECONDS = 0.005
+GC_SLICE_PAUSE_SECONDS = 0.05
+
+# Archived versions are kept at least this long unless a collection asks otherwise
+DEFAULT_RETENTION_DAYS = 30
+
+# Finished collections kept for GET /api/admin/gc
+GC_HISTORY_SIZE = 20
+
+INTERVAL_ENV = "KB_GC_INTERVAL_HOURS"
+
+# Held by the process running a collection, in the data directory
+GC_LOCK_FILE = "gc.lock"
+
+logger = logging.getLogger(__name__)
+
+GC_COLLECTED = registry.counter(
+    "kb_gc_collected_total", "Document versions and orphaned directories removed by garbage collection", ("kind",))
+GC_RECLAIMED_BYTES = registry.counter(
+    "kb_gc_reclaimed_bytes_total", "Bytes of records, files and artifacts removed by garbage collection")
+GC_SLICE_DURATION = registry.histogram(
+    "kb_gc_slice_duration_seconds", "Duration of garbage collection slices",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0))
+
+# Versions still being processed may read their base version's artifacts
+_IN_PROGRESS = (DocumentStatus.PENDING, DocumentStatus.PROCESSING)
+
+
+class CollectionError(Exception):
+    """A collection cannot be started or changed in its current state"""
+
+
+def _tree_size(path: Path) -> int:
+    if path.is_file():
+        return path.stat().st_size
+    if not path.is_dir():
+        return 0
+    return sum(child.stat().st_size for child in path.rglob("*") if child.is_file())
+
+
+def _older_than(path: Path, cutoff: datetime) -> bool:
+    try:
+        return datetime.fromtimestamp(path.stat().st_mtime) < cutoff
+    except FileNotFoundError:
+        return False
+
+
+class GarbageCollector:
+    def __init__(self):
+        self._runs: "OrderedDict[str, GarbageCollection]" = OrderedDict()
+        self._current: Optional[GarbageCollection] = None
+        self._cancelled = False
+        self._lock = threading.Lock()
+        # Lock file of the running collection, shared with other processes
+        self._lock_fd: Optional[int] = None
+
+    def start(self, dry_run: bool = False, retention_days: float = DEFAULT_RETENTION_DAYS) -> GarbageCollection:
+        """Start a collection on a background thread; one runs at a time."""
+        with self._lock:
+            if self._current is not None:
+                raise CollectionError(f"Collection {self._current.id} is still running")
+            fd = os.open(storage.data_dir / GC_LOCK_FILE, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                raise CollectionError("A collection is running in another process")
+            self._lock_fd = fd
+            run = self._current = GarbageCollection(dry_run=dry_run, retention_days=retention_days)
+            self._cancelled = False
+            self._runs[run.id] = run
+            while len(self._runs) > GC_HISTORY_SIZE:
+                self._runs.popitem(last=False)
+        threading.Thread(target=self._run, args=(run,), name=f"gc-{run.id}", daemon=True).start()
+        return run
+
+    def cancel(self, collection_id: str) -> GarbageCollection:
+        with self._lock:
+            run = self._runs.get(collection_id)
+            if run is None:
+                raise KeyError(collection_id)
+            if run is not self._current:
+                raise CollectionError(f"A {run.status.value} collection cannot be cancelled")
+            self._cancelled = True
+            return run
+
+    def get(self, collection_id: str) -> Optional[GarbageCollection]:
+        return self._runs.get(collection_id)
+
+    def list(self) -> List[GarbageCollection]:
+        return list(reversed(self._runs.values()))
+
+    def _run(self, run: GarbageCollection):
+        if not run.dry_run:
+            storage.begin_collection()
+        steps = self._steps(run)
+        try:
+            finished = False
+            while not finished and not self._cancelled:
+                start = time.perf_counter()
+                try:
+                    while time.perf_counter() - start < GC_SLICE_SECONDS:
+                        next(steps)
+                except StopIteration:
+                    finished = True
+                elapsed = time.perf_counter() - start
+                GC_SLICE_DURATION.observe(elapsed)
+                run.slices += 1
+                run.max_slice_ms = max(run.max_slice_ms, elapsed * 1000)
+                if not finished:
+                    time.sleep(GC_SLICE_PAUSE_SECONDS)
+            run.status = CollectionStatus.COMPLETED if finished else CollectionStatus.CANCELLED
+        except Exception as e:
+            run.status = CollectionStatus.FAILED
+            run.error_message = str(e)
+            logger.exception("Garbage collection %s failed", run.id)
+        finally:
+            if not run.dry_run:
+                storage.end_collection()
+            run.completed_at = datetime.now()
+            with self._lock:
+                self._current = None
+                os.close(self._lock_fd)
+                self._lock_fd = None
+
+    def _steps(self, run: GarbageCollection) -> Iterator[None]:
+        cutoff = datetime.now() - timedelta(days=run.retention_days)
+        projects = storage.get_all_projects()
+
+        referenced = set()
+        for project in projects:
+            for kb in storage.get_knowledge_bases_by_project(project.id):
+                for kb_version in storage.get_versions_by_kb(kb.id, include_archived=True):
+                    referenced.update(kb_version.document_version_ids)
+                yield
+        run.referenced_versions = len(referenced)
+
+        run.phase = "sweep"
+        known = set()
+        for project in projects:
+            for kb in storage.get_knowledge_bases_by_project(project.id):
+                for doc in storage.get_documents_by_kb(kb.id):
+                    versions = storage.get_document_versions_by_document(doc.id, include_archived=True)
+                    known.update(version.id for version in versions)
+                    bases = {version.base_version_id for version in versions if version.status in _IN_PROGRESS}
+                    for version in versions:
+                        if not version.is_archived:
+                            continue
+                        run.scanned_versions += 1
+                        if version.id in referenced or version.id in bases:
+                            continue
+                        if (version.archived_at or version.updated_at) > cutoff:
+                            run.retained_versions += 1
+                            continue
+                        self._collect_version(run, version)
+                    yield
+
+        run.phase = "orphans"
+        directories = [
+            (path.name, path) for root in (artifact_store.root, storage.files_dir) if root.exists()
+            for path in root.iterdir() if path.is_dir()
+        ]
+        if artifact_store.cold_root.exists():
+            directories.extend((path.name[:-len(".tar.gz")], path) for path in artifact_store.cold_root.glob("*.tar.gz"))
+        for version_id, path in directories:
+            # Versions created since the sweep have a record by now
+            if (version_id not in known and _older_than(path, cutoff)
+                    and storage.get_document_version_by_id(version_id) is None):
+                self._collect_orphan(run, version_id, path)
+            yield
+        run.phase = "done"
+
+    def _collect_version(self, run: GarbageCollection, version: DocumentVersion):
+        item = CollectedItem(
+            kind="document_version",
+            id=version.id,
+            document_id=version.document_id,
+            archived_at=version.archived_at,
+            record_bytes=len(version.model_dump_json()),
+            file_bytes=_tree_size(storage.files_dir / version.id),
+            artifact_bytes=artifact_store.size(version.id),
+        )
+        if not run.dry_run:
+            try:
+                purged = storage.purge_document_version(version.id)
+            except ValueError as e:
+                logger.warning("Failed to collect document version %s: %s", version.id, e)
+                return
+            if purged is None:
+                # Referenced or restored since it was swept
+                return
+            artifact_store.delete(version.id)
+            shutil.rmtree(storage.files_dir / version.id, ignore_errors=True)
+        self._record(run, item)
+
+    def _collect_orphan(self, run: GarbageCollection, version_id: str, path: Path):
+        artifacts = path.parent != storage.files_dir
+        size = _tree_size(path)
+        item = CollectedItem(
+            kind="artifacts" if artifacts else "files", id=version_id,
+            artifact_bytes=size if artifacts else 0, file_bytes=0 if artifacts else size,
+        )
+        if not run.dry_run:
+            if artifacts:
+                artifact_store.delete(version_id)
+            else:
+                shutil.rmtree(path, ignore_errors=True)
+        self._record(run, item)
+
+    @staticmethod
+    def _record(run: GarbageCollection, item: CollectedItem):
+        size = item.record_bytes + item.file_bytes + item.artifact_bytes
+        run.collected.append(item)
+        run.collected_count += 1
+        run.reclaimed_bytes += size
+        if not run.dry_run:
+            GC_COLLECTED.labels(item.kind).inc()
+            GC_RECLAIMED_BYTES.inc(size)
+
+    def run_periodically(self, interval_seconds: float):
+        while True:
+            time.sleep(interval_seconds)
+            # Taken over by another process once the one running it exits
+            if not storage.claim("gc-schedule"):
+                continue
+            try:
+                self.start()
+            except CollectionError as e:
+                logger.info("Skipped scheduled garbage collection: %s", e)
+
+
+# Create a global garbage collector instance
+garbage_collector = GarbageCollector()
+
+if os.environ.get(INTERVAL_ENV):
+    threading.Thread(
+        target=garbage_collector.run_periodically, args=(float(os.environ[INTERVAL_ENV]) * 3600,),
+        name="gc-schedule", daemon=True,
+    ).start()
@@ -1,12 +1,27 @@
 from .models import (
     Project, KnowledgeBase, KnowledgeBaseVersion, Document, DocumentVersion, 
-    User, VersionStatus, DocumentStatus, AccessLevel
+    User, VersionStatus, DocumentStatus, AccessLevel, ProcessingStage, ProgressEvent, ProfileMode, JobPriority
 )
-from .storage import storage
+from .storage import storage, DOCUMENT_VERSIONS
+from .events import event_bus, DOCUMENT_SCOPE, KNOWLEDGE_BASE_SCOPE
+from .metrics import track_job
+from .telemetry import pipeline_telemetry
+from .profiling import profiled
+from .artifacts import artifact_store
+from .dedup import duplicate_detector, signatures
+from .scheduler import Job, processing_scheduler
+from .search import refresh_bundles
+from . import pipeline
 from datetime import datetime
 from typing import List, Optional
+import logging
+import threading
+import time
+import functools
 import uuid
 
+logger = logging.getLogger(__name__)
+
 # Helper function to get the current user (mocked for now)
 def _get_current_user_id() -> str:
     users = storage.get_all_users()
@@ -147,6 +162,8 @@ def archive_document_version_with_reason(version_id: str, reason: str) -> bool:
         version.archived_at = datetime.now()
         version.archived_by = user_id
         storage.update_document_version(version)
+        # Compress the version's artifacts without holding up the request
+        _freeze_in_background(version_id)
         return True
     return False
 
@@ -155,29 +172,203 @@ def get_all_users() -> List[User]:
     return storage.get_all_users()
 
 # Processing functions
-def process_document(doc_id: str, version_id: str):
-    from time import sleep
-    from .models import ProcessingStage
-    
+
+def _progress_event(version: DocumentVersion) -> ProgressEvent:
+    doc = storage.get_document_by_id(version.document_id)
+    kb = storage.get_knowledge_base_by_id(doc.knowledge_base_id) if doc else None
+    queued = processing_scheduler.queue_status(version.id) if version.status == DocumentStatus.PENDING else None
+    return ProgressEvent(
+        document_id=version.document_id,
+        document_version_id=version.id,
+        knowledge_base_id=kb.id if kb else None,
+        project_id=kb.project_id if kb else None,
+        status=version.status,
+        processing_stage=version.processing_stage,
+        processing_progress=version.processing_progress,
+        error_message=version.error_message,
+        queue_position=queued.queue_position if queued else None,
+        estimated_wait_seconds=queued.estimated_wait_seconds if queued else None,
+    )
+
+def publish_progress(version: DocumentVersion):
+    event_bus.publish(_progress_event(version))
+
+def _publish_peer_progress(collection: str, item):
+    # Versions processed by other server processes reach this process's streams through storage
+    if collection == DOCUMENT_VERSIONS:
+        publish_progress(item)
+
+storage.add_change_listener(_publish_peer_progress)
+
+def _freeze_in_background(version_id: Optional[str] = None):
+    """Move one version's artifacts, or those of every archived version, to the cold store."""
+    def run():
+        try:
+            if version_id is None:
+                artifact_store.freeze_archived()
+            else:
+                artifact_store.freeze(version_id)
+        except Exception:
+            logger.exception("Failed to move artifacts of %s to the cold store", version_id or "archived versions")
+    threading.Thread(target=run, name="artifact-tiering", daemon=True).start()
+
+# Artifacts of versions archived while the server was down move to the cold store
+_freeze_in_background()
+
+def report_progress(version: DocumentVersion, stage: ProcessingStage, progress: float):
+    """Update progress in memory and notify subscribers.
+
+    The data files are only written when the stage changes; progress within a
+    stage is served from memory and the event bus.
+    """
+    stage_changed = version.processing_stage != stage
+    version.processing_stage = stage
+    version.processing_progress = progress
+    version.updated_at = datetime.now()
+    storage.update_document_version(version, persist=stage_changed)
+    publish_progress(version)
+
+def get_active_progress_events(scope: str, scope_id: str) -> List[ProgressEvent]:
+    """Snapshot of the versions still pending or processing in a scope."""
+    if scope == DOCUMENT_SCOPE:
+        doc_ids = [scope_id]
+    elif scope == KNOWLEDGE_BASE_SCOPE:
+        doc_ids = [doc.id for doc in storage.get_documents_by_kb(scope_id)]
+    else:
+        doc_ids = [doc.id for doc in storage.get_documents_by_project(scope_id)]
+    return [
+        _progress_event(version)
+        for doc_id in doc_ids
+        for version in storage.get_document_versions_by_document(doc_id)
+        if version.status in (DocumentStatus.PENDING, DocumentStatus.PROCESSING)
+    ]
+
+def process_document(doc_id: str, version_id: str, enqueued_at: Optional[float] = None,
+                     profile: Optional[ProfileMode] = None):
+    """Process one document version.
+
+    ``enqueued_at`` (unix time) measures its queue wait; ``profile`` saves a
+    profile of this run.
+    """
+    with track_job("process_document"):
+        if profile is None:
+            _process_document(doc_id, version_id, enqueued_at)
+        else:
+            with profiled(profile, "job", f"process_document {version_id}"):
+                _process_document(doc_id, version_id, enqueued_at)
+
+def _process_document(doc_id: str, version_id: str, enqueued_at: Optional[float] = None):
     version = storage.get_document_version_by_id(version_id)
     if not version:
         return
+    doc = storage.get_document_by_id(doc_id)
+    kb_id = doc.knowledge_base_id if doc else None
+    if enqueued_at is not None:
+        pipeline_telemetry.record_queue_wait(kb_id, max(0.0, time.time() - enqueued_at))
 
-    stages = [
-        (ProcessingStage.DOWNLOAD, 25),
-        (ProcessingStage.EXTRACT, 50),
-        (ProcessingStage.CLEAN, 75),
-        (ProcessingStage.CHUNK, 90),
-        (ProcessingStage.EMBED, 100)
-    ]
-
+    base = pipeline.previous_completed_version(version)
+    kb = storage.get_knowledge_base_by_id(kb_id) if kb_id else None
+    if kb and kb.embedding_model and version.embedding_model is None:
+        # The knowledge base moved to another model, so new versions follow it
+        version.embedding_model = kb.embedding_model
+        version.embedding_provider = kb.embedding_provider
+    pipeline.inherit_settings(version, base)
+    version.base_version_id = base.id if base else None
     version.status = DocumentStatus.PROCESSING
-    for stage, progress in stages:
-        version.processing_stage = stage
-        version.processing_progress = progress
+    version.error_message = None
+    try:
+        with pipeline_telemetry.stage(version, kb_id, ProcessingStage.DOWNLOAD) as span:
+            report_progress(version, ProcessingStage.DOWNLOAD, 0)
+            raw = pipeline.download(version)
+            span.bytes_out = len(raw)
+        # Extraction streams into cleaning, so the two stages run together
+        # and each records the time spent on its side
+        with pipeline_telemetry.stage(version, kb_id, ProcessingStage.EXTRACT) as extract_span, \
+                pipeline_telemetry.stage(version, kb_id, ProcessingStage.CLEAN) as clean_span:
+            report_progress(version, ProcessingStage.EXTRACT, 25)
+            started = time.perf_counter()
+            segments = pipeline.extract(version, raw)
+            extract_span.bytes_in = len(raw)
+            written, extracting = pipeline.write_clean_text(version.id, segments)
+            extract_span.duration_seconds = extracting
+            clean_span.duration_seconds = time.perf_counter() - started - extracting
+            clean_span.bytes_out = written
+            report_progress(version, ProcessingStage.CLEAN, 50)
+        with pipeline_telemetry.stage(version, kb_id, ProcessingStage.CHUNK) as span:
+            report_progress(version, ProcessingStage.CHUNK, 75)
+            chunks = pipeline.chunk_text(version.id, version.chunk_size, version.chunk_overlap)
+            chunk_signatures = signatures([c.text for c in chunks])
+            duplicate = duplicate_detector.find(kb_id, version, chunks, chunk_signatures) if kb_id else None
+            artifact_store.write_chunks(version.id, chunks)
+            artifact_store.write_signatures(version.id, chunk_signatures)
+            version.chunk_count = span.chunk_count = len(chunks)
+            version.duplicate_of_document_id = duplicate.document_id if duplicate else None
+            version.duplicate_similarity = duplicate.similarity if duplicate else None
+            version.duplicate_chunk_count = sum(1 for c in chunks if c.duplicate_of)
+        with pipeline_telemetry.stage(version, kb_id, ProcessingStage.EMBED) as span:
+            report_progress(version, ProcessingStage.EMBED, 90)
+            reusable = pipeline.reusable_embeddings(version, base)
+            carried = sum(1 for c in chunks if c.hash in reusable)
+            if kb and kb.skip_duplicate_embeddings and version.duplicate_chunk_count:
+                reusable = {**duplicate_detector.duplicate_vectors(chunks, version), **reusable}
+            vectors, reused = pipeline.embed_changed(
+                chunks, version, reusable,
+                lambda done: report_progress(version, ProcessingStage.EMBED, 90 + 10 * done),
+            )
+            artifact_store.write_embeddings(version.id, version.embedding_model, vectors)
+            span.embedding_count = len(chunks) - reused
+            version.embedding_count = len(chunks)
+            version.reused_chunk_count = carried
+            version.chunk_reuse_ratio = carried / len(chunks) if chunks else 0.0
+    except Exception as e:
+        version.status = DocumentStatus.FAILED
+        version.error_message = str(e)
+        version.updated_at = datetime.now()
         storage.update_document_version(version)
-        sleep(2)
+        publish_progress(version)
+        if not isinstance(e, pipeline.ProcessingError):
+            raise
+        return
 
     version.status = DocumentStatus.COMPLETED
-    version.chunk_count = 150
-    storage.update_document_version(version) 
\ No newline at end of file
+    version.processing_progress = 100
+    version.updated_at = datetime.now()
+    storage.update_document_version(version)
+    publish_progress(version)
+    if kb_id:
+        duplicate_detector.add(kb_id, version, chunk_signatures)
+    # Versions published before this one completed
+    refresh_bundles(version)
+    pipeline_telemetry.record_completion(kb_id, version.chunk_count)
+
+def start_processing(doc_id: str, version_id: str, profile: Optional[ProfileMode] = None,
+                     priority: JobPriority = JobPriority.INTERACTIVE, enqueued_at: Optional[float] = None):
+    """Queue a version for processing; see backend/scheduler.py."""
+    doc = storage.get_document_by_id(doc_id)
+    kb = storage.get_knowledge_base_by_id(doc.knowledge_base_id) if doc else None
+    project = storage.get_project_by_id(kb.project_id) if kb else None
+    enqueued_at = enqueued_at if enqueued_at is not None else time.time()
+    job = Job(
+        version_id=version_id,
+        project_id=project.id if project else "",
+        priority=priority,
+        run=functools.partial(process_document, doc_id, version_id, enqueued_at, profile),
+        enqueued_at=enqueued_at,
+    )
+    if project:
+        processing_scheduler.submit(job, project.processing_weight, project.max_concurrent_jobs)
+    else:
+        processing_scheduler.submit(job)
+
+def process_batch(batch_id: str):
+    batch = storage.get_ingestion_batch(batch_id)
+    if not batch:
+        return
+    enqueued_at = time.time()
+    for version_id in batch.document_version_ids:
+        version = storage.get_document_version_by_id(version_id)
+        if version:
+            start_processing(version.document_id, version.id, priority=JobPriority.BULK, enqueued_at=enqueued_at)
+
+def start_batch_processing(batch_id: str):
+    process_batch(batch_id)
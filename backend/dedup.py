@@ -0,0 +1,335 @@
+"""
+Near-duplicate detection within a knowledge base
+
+Every chunk gets a MinHash signature over its word shingles during the
+CHUNK stage, and a document's signature is the element-wise minimum of its
+chunks' (the MinHash of the union of their shingles). Signatures are kept
+with the version's artifacts.
+
+Each knowledge base has an LSH index over the signatures of its documents'
+latest completed versions and of their chunks: signatures are cut into bands
+and items sharing any band land in the same bucket, so a lookup only compares
+against the few items in matching buckets rather than the whole knowledge
+base. Candidates are confirmed by the fraction of equal signature positions,
+an estimate of the Jaccard similarity of the shingle sets.
+"""
+
+import hashlib
+import threading
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Hashable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from .models import Chunk, DocumentStatus, DocumentVersion
+from .storage import storage, DOCUMENT_VERSIONS
+from .artifacts import artifact_store
+from .embeddings import tokenize
+
+NUM_PERMUTATIONS = 128
+# 16 bands of 8 rows: pairs above about 0.7 similarity share a band with
+# high probability, pairs below 0.5 rarely do
+BAND_ROWS = 8
+
+# Words per shingle
+SHINGLE_WORDS = 5
+
+# Estimated Jaccard similarity at which documents and chunks are flagged
+DOCUMENT_THRESHOLD = 0.8
+CHUNK_THRESHOLD = 0.9
+
+# Largest 32-bit prime; the permutations are (a * x + b) mod p with a, b and
+# x reduced below p, so a * x + b < p * p stays within 64 bits. The reduction
+# leaves the coefficients drawn here unchanged, keeping stored signatures valid.
+_PRIME = np.uint64(4294967291)
+_rng = np.random.default_rng(0x6d68)
+_A = _rng.integers(1, 2 ** 32 - 1, size=NUM_PERMUTATIONS, dtype=np.uint64) % _PRIME
+_B = _rng.integers(0, 2 ** 32 - 1, size=NUM_PERMUTATIONS, dtype=np.uint64) % _PRIME
+
+# Signature of a text without shingles; never matches anything
+_EMPTY = np.uint32(0xFFFFFFFF)
+
+# Shingles hashed against all permutations at once
+_BLOCK_SHINGLES = 8192
+
+# Chunk signature matrices of indexed versions kept in memory
+SIGNATURE_CACHE_SIZE = 64
+
+
+def shingle_hashes(text: str) -> np.ndarray:
+    """32-bit hashes of the text's overlapping word shingles."""
+    tokens = tokenize(text)
+    if not tokens:
+        return np.empty(0, dtype=np.uint64)
+    hashes = np.fromiter((zlib.crc32(token.encode()) for token in tokens), dtype=np.uint64, count=len(tokens))
+    width = min(SHINGLE_WORDS, len(hashes))
+    shingles = np.zeros(len(hashes) - width + 1, dtype=np.uint64)
+    for offset in range(width):
+        shingles = (shingles * np.uint64(1000003) + hashes[offset:len(hashes) - width + 1 + offset]) & np.uint64(0xFFFFFFFF)
+    return shingles
+
+
+def signatures(texts: List[str]) -> np.ndarray:
+    """``(len(texts), NUM_PERMUTATIONS)`` uint32 MinHash signatures."""
+    result = np.full((len(texts), NUM_PERMUTATIONS), _EMPTY, dtype=np.uint32)
+    pending: List[Tuple[int, np.ndarray]] = []
+    size = 0
+
+    def flush():
+        rows = [row for row, _ in pending]
+        shingles = np.concatenate([s for _, s in pending])
+        starts = np.cumsum([0] + [len(s) for _, s in pending[:-1]])
+        hashed = ((shingles % _PRIME)[:, None] * _A + _B) % _PRIME
+        result[rows] = np.minimum.reduceat(hashed, starts, axis=0)
+        pending.clear()
+
+    for row, text in enumerate(texts):
+        shingles = shingle_hashes(text)
+        if not len(shingles):
+            continue
+        if size + len(shingles) > _BLOCK_SHINGLES and pending:
+            flush()
+            size = 0
+        pending.append((row, shingles))
+        size += len(shingles)
+    if pending:
+        flush()
+    return result
+
+
+def document_signature(chunk_signatures: np.ndarray) -> np.ndarray:
+    if not len(chunk_signatures):
+        return np.full(NUM_PERMUTATIONS, _EMPTY, dtype=np.uint32)
+    return chunk_signatures.min(axis=0)
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Estimated Jaccard similarity of the shingle sets behind two signatures."""
+    if a[0] == _EMPTY and (a == _EMPTY).all():
+        return 0.0
+    return float(np.count_nonzero(a == b)) / NUM_PERMUTATIONS
+
+
+class LshIndex:
+    """Banded LSH buckets mapping signature bands to the keys that have them."""
+
+    def __init__(self, rows: int = BAND_ROWS):
+        self.rows = rows
+        self.buckets: List[Dict[bytes, Set[Hashable]]] = [{} for _ in range(NUM_PERMUTATIONS // rows)]
+
+    def _bands(self, signature: np.ndarray):
+        for band, buckets in enumerate(self.buckets):
+            key = hashlib.blake2b(signature[band * self.rows:(band + 1) * self.rows].tobytes(), digest_size=8).digest()
+            yield buckets, key
+
+    def add(self, key: Hashable, signature: np.ndarray):
+        for buckets, band_key in self._bands(signature):
+            buckets.setdefault(band_key, set()).add(key)
+
+    def remove(self, key: Hashable, signature: np.ndarray):
+        for buckets, band_key in self._bands(signature):
+            bucket = buckets.get(band_key)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del buckets[band_key]
+
+    def candidates(self, signature: np.ndarray) -> Set[Hashable]:
+        found: Set[Hashable] = set()
+        for buckets, band_key in self._bands(signature):
+            found.update(buckets.get(band_key, ()))
+        return found
+
+
+@dataclass
+class DuplicateMatch:
+    document_id: str
+    document_version_id: str
+    similarity: float
+
+
+class DuplicateIndex:
+    """LSH indexes over the latest completed version of every document in one knowledge base."""
+
+    def __init__(self, kb_id: str):
+        self.kb_id = kb_id
+        self.lock = threading.Lock()
+        self.documents = LshIndex()
+        self.chunks = LshIndex()
+        # Indexed version and document signature of each document
+        self.versions: Dict[str, Tuple[str, np.ndarray]] = {}
+        self.built = False
+
+
+class DuplicateDetector:
+    def __init__(self):
+        self._indexes: Dict[str, DuplicateIndex] = {}
+        self._lock = threading.Lock()
+        self._signatures: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._signatures_lock = threading.Lock()
+
+    def _chunk_signatures(self, version_id: str) -> Optional[np.ndarray]:
+        with self._signatures_lock:
+            cached = self._signatures.get(version_id)
+            if cached is not None:
+                self._signatures.move_to_end(version_id)
+                return cached
+        loaded = artifact_store.read_signatures(version_id)
+        if loaded is not None:
+            self._remember(version_id, loaded)
+        return loaded
+
+    def _remember(self, version_id: str, chunk_signatures: np.ndarray):
+        with self._signatures_lock:
+            self._signatures[version_id] = chunk_signatures
+            self._signatures.move_to_end(version_id)
+            while len(self._signatures) > SIGNATURE_CACHE_SIZE:
+                self._signatures.popitem(last=False)
+
+    def _index(self, kb_id: str) -> DuplicateIndex:
+        with self._lock:
+            index = self._indexes.get(kb_id)
+            if index is None:
+                index = self._indexes[kb_id] = DuplicateIndex(kb_id)
+        return index
+
+    def _build(self, index: DuplicateIndex):
+        """Index every document's latest completed version on first use.
+
+        Called with the index lock held. Afterwards versions are added as they
+        complete, here or, through the change log, in other workers.
+        """
+        if index.built:
+            return
+        for doc in storage.get_documents_by_kb(index.kb_id):
+            completed = [
+                v for v in storage.get_document_versions_by_document(doc.id)
+                if v.status == DocumentStatus.COMPLETED
+            ]
+            latest = max(completed, key=lambda v: v.created_at, default=None)
+            chunk_signatures = self._chunk_signatures(latest.id) if latest else None
+            if chunk_signatures is not None:
+                self._add(index, doc.id, latest.id, chunk_signatures)
+        index.built = True
+
+    def _add(self, index: DuplicateIndex, doc_id: str, version_id: str, chunk_signatures: np.ndarray):
+        self._remove(index, doc_id)
+        signature = document_signature(chunk_signatures)
+        index.versions[doc_id] = (version_id, signature)
+        index.documents.add(doc_id, signature)
+        for row, chunk_signature in enumerate(chunk_signatures):
+            if chunk_signature[0] != _EMPTY:
+                index.chunks.add((version_id, row), chunk_signature)
+
+    def _remove(self, index: DuplicateIndex, doc_id: str):
+        indexed = index.versions.pop(doc_id, None)
+        if indexed is None:
+            return
+        version_id, signature = indexed
+        index.documents.remove(doc_id, signature)
+        chunk_signatures = self._chunk_signatures(version_id)
+        for row, chunk_signature in enumerate(chunk_signatures if chunk_signatures is not None else ()):
+            if chunk_signature[0] != _EMPTY:
+                index.chunks.remove((version_id, row), chunk_signature)
+
+    def find(self, kb_id: str, version: DocumentVersion, chunks: List[Chunk],
+             chunk_signatures: np.ndarray) -> Optional[DuplicateMatch]:
+        """Flag chunks that nearly duplicate chunks of other documents and return the closest duplicate document.
+
+        Sets ``duplicate_of`` on matching chunks. Other versions of the same
+        document are not duplicates.
+        """
+        index = self._index(kb_id)
+        with index.lock:
+            self._build(index)
+            signature = document_signature(chunk_signatures)
+            best: Optional[DuplicateMatch] = None
+            for doc_id in index.documents.candidates(signature):
+                if doc_id == version.document_id:
+                    continue
+                other_version_id, other = index.versions[doc_id]
+                score = similarity(signature, other)
+                if score >= DOCUMENT_THRESHOLD and (best is None or score > best.similarity):
+                    best = DuplicateMatch(doc_id, other_version_id, score)
+
+            own_versions = {version.id}
+            indexed = index.versions.get(version.document_id)
+            if indexed is not None:
+                own_versions.add(indexed[0])
+            for chunk, chunk_signature in zip(chunks, chunk_signatures):
+                chunk.duplicate_of = None
+                best_score = CHUNK_THRESHOLD
+                for other_version_id, row in index.chunks.candidates(chunk_signature):
+                    if other_version_id in own_versions:
+                        continue
+                    others = self._chunk_signatures(other_version_id)
+                    if others is None or row >= len(others):
+                        continue
+                    score = similarity(chunk_signature, others[row])
+                    if score >= best_score:
+                        best_score = score
+                        chunk.duplicate_of = f"{other_version_id}:{row}"
+        return best
+
+    def add(self, kb_id: str, version: DocumentVersion, chunk_signatures: Optional[np.ndarray] = None):
+        """Index a completed version in place of its document's previous one.
+
+        Does nothing until the knowledge base's index has been built.
+        """
+        with self._lock:
+            index = self._indexes.get(kb_id)
+        if chunk_signatures is not None:
+            self._remember(version.id, chunk_signatures)
+        if index is None:
+            return
+        with index.lock:
+            if not index.built:
+                return
+            indexed = index.versions.get(version.document_id)
+            if indexed is not None and indexed[0] == version.id:
+                return
+            if indexed is not None:
+                current = storage.get_document_version_by_id(indexed[0])
+                if current is not None and current.created_at > version.created_at:
+                    return
+            if chunk_signatures is None:
+                chunk_signatures = self._chunk_signatures(version.id)
+            if chunk_signatures is not None:
+                self._add(index, version.document_id, version.id, chunk_signatures)
+
+    def _on_change(self, collection: str, item):
+        # Versions completed by other workers
+        if collection == DOCUMENT_VERSIONS and item.status == DocumentStatus.COMPLETED:
+            doc = storage.get_document_by_id(item.document_id)
+            if doc is not None:
+                self.add(doc.knowledge_base_id, item)
+
+    def duplicate_vectors(self, chunks: List[Chunk], version: DocumentVersion) -> Dict[str, np.ndarray]:
+        """Embeddings of the chunks that ``chunks`` duplicate, by the duplicate chunk's hash.
+
+        Only vectors from the same embedding model are used.
+        """
+        by_version: Dict[str, List[Tuple[Chunk, int]]] = {}
+        for chunk in chunks:
+            if chunk.duplicate_of:
+                version_id, row = chunk.duplicate_of.rsplit(":", 1)
+                by_version.setdefault(version_id, []).append((chunk, int(row)))
+        vectors: Dict[str, np.ndarray] = {}
+        for version_id, matches in by_version.items():
+            other = storage.get_document_version_by_id(version_id)
+            if other is None or other.embedding_model != version.embedding_model:
+                continue
+            matrix = artifact_store.read_embeddings(version_id, other.embedding_model)
+            if matrix is None:
+                continue
+            for chunk, row in matches:
+                if row < len(matrix):
+                    vectors[chunk.hash] = matrix[row]
+        return vectors
+
+
+# Create a global duplicate detector instance
+duplicate_detector = DuplicateDetector()
+storage.add_change_listener(duplicate_detector._on_change)
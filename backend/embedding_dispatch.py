@@ -0,0 +1,375 @@
+"""
+Rate-limited dispatch of embedding requests
+
+Every (provider, model) pair has a lane: token buckets for the provider's
+request and token rate limits, a batch size that adapts to the provider
+and a small pool of threads that keeps several requests in flight. The
+lanes are shared by all documents being processed, so concurrent ingestion
+stays within the limits instead of running into 429 responses.
+
+The batch size grows additively while requests succeed within the target
+latency and is cut multiplicatively when latency climbs or requests fail.
+A rate-limited or failed batch is put back at the front of the queue (split
+if the batch size has shrunk) and retried with backoff, up to MAX_ATTEMPTS.
+A 429 response also pauses the lane's request bucket for its Retry-After.
+
+Without KB_EMBEDDING_ENDPOINT chunks are embedded in-process (see
+backend/embeddings.py) and no limits apply. With it, they are sent to an
+OpenAI-style ``POST {endpoint}/v1/embeddings``; for a local mock provider
+see backend/benchmarks/mock_provider.py.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import requests
+
+from .embeddings import DEFAULT_EMBEDDING_MODEL, EMBEDDING_DIMENSIONS, embed_texts
+from .metrics import registry
+from .models import EmbeddingModel, EmbeddingProvider
+
+ENDPOINT_ENV = "KB_EMBEDDING_ENDPOINT"
+
+# Attempts per batch before the embedding fails
+MAX_ATTEMPTS = 6
+# Backoff before a retry, doubled for every further attempt
+RETRY_BACKOFF_SECONDS = 0.25
+MAX_BACKOFF_SECONDS = 8.0
+# Retry-After assumed when a 429 response has none
+DEFAULT_RETRY_AFTER_SECONDS = 1.0
+REQUEST_TIMEOUT_SECONDS = 30
+
+# Batch size adaptation
+INITIAL_BATCH_SIZE = 16
+MIN_BATCH_SIZE = 1
+MAX_BATCH_SIZE = 256
+BATCH_SIZE_STEP = 8
+BATCH_SIZE_BACKOFF = 0.5
+TARGET_LATENCY_SECONDS = 2.0
+
+EMBED_REQUESTS = registry.counter(
+    "kb_embedding_requests_total", "Embedding requests by provider and outcome", ("provider", "outcome"))
+EMBED_REQUEST_DURATION = registry.histogram(
+    "kb_embedding_request_duration_seconds", "Duration of embedding requests", ("provider",))
+EMBED_THROTTLE_SECONDS = registry.counter(
+    "kb_embedding_throttle_seconds_total", "Time embedding requests waited for rate limits", ("provider",))
+EMBED_BATCH_SIZE = registry.gauge(
+    "kb_embedding_batch_size", "Current adaptive batch size", ("provider", "model"))
+
+MODEL_PROVIDERS: Dict[EmbeddingModel, EmbeddingProvider] = {
+    EmbeddingModel.TEXT_EMBEDDING_ADA_002: EmbeddingProvider.OPENAI,
+    EmbeddingModel.TEXT_EMBEDDING_3_SMALL: EmbeddingProvider.OPENAI,
+    EmbeddingModel.TEXT_EMBEDDING_3_LARGE: EmbeddingProvider.OPENAI,
+    EmbeddingModel.EMBED_ENGLISH_V3: EmbeddingProvider.COHERE,
+    EmbeddingModel.EMBED_MULTILINGUAL_V3: EmbeddingProvider.COHERE,
+    EmbeddingModel.SENTENCE_TRANSFORMERS: EmbeddingProvider.HUGGINGFACE,
+}
+
+
+@dataclass
+class ProviderLimits:
+    requests_per_minute: Optional[float] = None  # None for no limit
+    tokens_per_minute: Optional[float] = None
+    max_concurrency: int = 4
+
+
+# Conservative defaults; real limits depend on the account tier
+PROVIDER_LIMITS: Dict[EmbeddingProvider, ProviderLimits] = {
+    EmbeddingProvider.OPENAI: ProviderLimits(3000, 1_000_000, 8),
+    EmbeddingProvider.ANTHROPIC: ProviderLimits(1000, 400_000, 4),
+    EmbeddingProvider.COHERE: ProviderLimits(2000, 500_000, 4),
+    EmbeddingProvider.HUGGINGFACE: ProviderLimits(300, 200_000, 2),
+    EmbeddingProvider.LOCAL: ProviderLimits(None, None, 1),
+}
+UNLIMITED = ProviderLimits(None, None, 1)
+
+
+class EmbeddingRequestError(Exception):
+    """A failed embedding request worth retrying."""
+
+
+class RateLimitedError(EmbeddingRequestError):
+    def __init__(self, retry_after: float):
+        super().__init__(f"Rate limited, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+def estimate_tokens(texts: List[str]) -> int:
+    """Rough token count of texts, at about four characters per token."""
+    return sum(len(text) // 4 + 1 for text in texts)
+
+
+class TokenBucket:
+    """Tokens refill at ``rate`` per second up to ``capacity``.
+
+    Acquiring more tokens than are available reserves them (the bucket goes
+    negative) and sleeps until they would have refilled, so waiting callers
+    are served in the order they arrived.
+    """
+
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.clock = clock
+        self.updated = clock()
+        self.blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float) -> float:
+        """Take ``amount`` tokens; returns the seconds to wait before using them."""
+        with self._lock:
+            now = self.clock()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= amount
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            return max(wait, self.blocked_until - now)
+
+    def try_take(self, amount: float) -> float:
+        """Take ``amount`` tokens if available and return 0, else the seconds until they will be.
+
+        More than ``capacity`` is taken from a full bucket, leaving it negative.
+        """
+        with self._lock:
+            now = self.clock()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            needed = min(amount, self.capacity)
+            if self.tokens >= needed:
+                self.tokens -= amount
+                return 0.0
+            return (needed - self.tokens) / self.rate
+
+    def acquire(self, amount: float) -> float:
+        delay = self.reserve(amount)
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    def pause(self, seconds: float):
+        """Hand out nothing for ``seconds``, as after a 429."""
+        with self._lock:
+            now = self.clock()
+            self.blocked_until = max(self.blocked_until, now + seconds)
+            self.tokens = min(self.tokens, 0.0)
+            self.updated = now
+
+
+class AdaptiveBatchSize:
+    """Additive increase, multiplicative decrease of the texts per request."""
+
+    def __init__(self, initial: int = INITIAL_BATCH_SIZE, minimum: int = MIN_BATCH_SIZE,
+                 maximum: int = MAX_BATCH_SIZE, target_latency: float = TARGET_LATENCY_SECONDS):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_latency = target_latency
+        self._size = float(min(max(initial, minimum), maximum))
+        self._lock = threading.Lock()
+
+    @property
+    def size(self) -> int:
+        return int(self._size)
+
+    def record_success(self, batch_size: int, latency: float):
+        with self._lock:
+            if latency > self.target_latency:
+                self._size = max(self.minimum, self._size * BATCH_SIZE_BACKOFF)
+            elif batch_size >= self.size:
+                # Only full batches show that the current size is fine
+                self._size = min(self.maximum, self._size + BATCH_SIZE_STEP)
+
+    def record_failure(self):
+        with self._lock:
+            self._size = max(self.minimum, self._size * BATCH_SIZE_BACKOFF)
+
+
+class EmbeddingClient:
+    """Sends one embedding request; raises EmbeddingRequestError for retryable failures."""
+
+    rate_limited = True
+
+    def embed(self, texts: List[str], model: EmbeddingModel) -> np.ndarray:
+        raise NotImplementedError
+
+
+class LocalEmbeddingClient(EmbeddingClient):
+    rate_limited = False
+
+    def embed(self, texts: List[str], model: EmbeddingModel) -> np.ndarray:
+        return embed_texts(texts, model)
+
+
+class HttpEmbeddingClient(EmbeddingClient):
+    """Client of an OpenAI-style embeddings endpoint."""
+
+    def __init__(self, base_url: str, timeout: float = REQUEST_TIMEOUT_SECONDS):
+        self.url = base_url.rstrip("/") + "/v1/embeddings"
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _session(self) -> requests.Session:
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def embed(self, texts: List[str], model: EmbeddingModel) -> np.ndarray:
+        try:
+            response = self._session().post(self.url, json={"model": model.value, "input": texts}, timeout=self.timeout)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            raise EmbeddingRequestError(str(e)) from e
+        if response.status_code == 429:
+            try:
+                retry_after = float(response.headers.get("Retry-After", DEFAULT_RETRY_AFTER_SECONDS))
+            except ValueError:
+                retry_after = DEFAULT_RETRY_AFTER_SECONDS
+            raise RateLimitedError(retry_after)
+        if response.status_code >= 500:
+            raise EmbeddingRequestError(f"Embedding provider returned {response.status_code}")
+        response.raise_for_status()
+        data = sorted(response.json()["data"], key=lambda item: item["index"])
+        if len(data) != len(texts):
+            raise EmbeddingRequestError(f"Expected {len(texts)} embeddings, got {len(data)}")
+        return np.array([item["embedding"] for item in data], dtype=np.float32)
+
+
+class _Lane:
+    def __init__(self, provider: EmbeddingProvider, model: EmbeddingModel, client: EmbeddingClient,
+                 limits: ProviderLimits, batch_size: AdaptiveBatchSize):
+        self.provider = provider
+        self.model = model
+        self.client = client
+        self.limits = limits
+        self.batch_size = batch_size
+        self.request_bucket = self._bucket(limits.requests_per_minute)
+        self.token_bucket = self._bucket(limits.tokens_per_minute)
+        self.executor = ThreadPoolExecutor(max_workers=limits.max_concurrency,
+                                           thread_name_prefix=f"embed-{provider.value}")
+        self._requests = {outcome: EMBED_REQUESTS.labels(provider.value, outcome)
+                          for outcome in ("ok", "rate_limited", "error")}
+        self._duration = EMBED_REQUEST_DURATION.labels(provider.value)
+        self._throttled = EMBED_THROTTLE_SECONDS.labels(provider.value)
+        self._size_gauge = EMBED_BATCH_SIZE.labels(provider.value, model.value)
+        self._size_gauge.set(batch_size.size)
+
+    @staticmethod
+    def _bucket(per_minute: Optional[float]) -> Optional[TokenBucket]:
+        if per_minute is None:
+            return None
+        # Allow a burst of one second's worth
+        return TokenBucket(per_minute / 60, max(1.0, per_minute / 60))
+
+    def throttle(self, texts: List[str]):
+        waited = 0.0
+        if self.request_bucket:
+            waited += self.request_bucket.acquire(1)
+        if self.token_bucket:
+            waited += self.token_bucket.acquire(estimate_tokens(texts))
+        if waited:
+            self._throttled.inc(waited)
+
+    def send(self, texts: List[str], attempt: int) -> np.ndarray:
+        if attempt:
+            time.sleep(min(MAX_BACKOFF_SECONDS, RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1)))
+        self.throttle(texts)
+        start = time.perf_counter()
+        try:
+            vectors = self.client.embed(texts, self.model)
+        except RateLimitedError as e:
+            self._requests["rate_limited"].inc()
+            if self.request_bucket:
+                self.request_bucket.pause(e.retry_after)
+            self.batch_size.record_failure()
+            raise
+        except EmbeddingRequestError:
+            self._requests["error"].inc()
+            self.batch_size.record_failure()
+            raise
+        finally:
+            self._size_gauge.set(self.batch_size.size)
+        latency = time.perf_counter() - start
+        self._duration.observe(latency)
+        self._requests["ok"].inc()
+        self.batch_size.record_success(len(texts), latency)
+        self._size_gauge.set(self.batch_size.size)
+        return vectors
+
+
+class EmbeddingDispatcher:
+    def __init__(self, client: Optional[EmbeddingClient] = None,
+                 limits: Optional[Dict[EmbeddingProvider, ProviderLimits]] = None,
+                 batch_size: Callable[[], AdaptiveBatchSize] = AdaptiveBatchSize):
+        self.client = client or LocalEmbeddingClient()
+        self.limits = dict(PROVIDER_LIMITS if limits is None else limits)
+        self.batch_size = batch_size
+        self._lanes: Dict[Tuple[EmbeddingProvider, EmbeddingModel], _Lane] = {}
+        self._lock = threading.Lock()
+
+    def lane(self, provider: EmbeddingProvider, model: EmbeddingModel) -> _Lane:
+        key = (provider, model)
+        lane = self._lanes.get(key)
+        if lane is None:
+            with self._lock:
+                lane = self._lanes.get(key)
+                if lane is None:
+                    limits = self.limits.get(provider, UNLIMITED) if self.client.rate_limited else UNLIMITED
+                    lane = self._lanes[key] = _Lane(provider, model, self.client, limits, self.batch_size())
+        return lane
+
+    def embed(self, texts: List[str], model: Optional[EmbeddingModel] = None,
+              provider: Optional[EmbeddingProvider] = None,
+              on_progress: Optional[Callable[[float], None]] = None) -> np.ndarray:
+        """Embed texts into a ``(len(texts), EMBEDDING_DIMENSIONS)`` matrix.
+
+        ``on_progress`` gets the fraction of texts done after every batch.
+        """
+        model = model or DEFAULT_EMBEDDING_MODEL
+        lane = self.lane(provider or MODEL_PROVIDERS.get(model, EmbeddingProvider.LOCAL), model)
+        vectors = np.empty((len(texts), EMBEDDING_DIMENSIONS), dtype=np.float32)
+        # (start, end, attempt) ranges of texts still to send, cut into
+        # batches of the lane's current size as they are sent
+        pending = deque([(0, len(texts), 0)] if texts else [])
+        in_flight: Dict[Future, Tuple[int, int, int]] = {}
+        done = 0
+        try:
+            while pending or in_flight:
+                while pending and len(in_flight) < lane.limits.max_concurrency:
+                    start, end, attempt = pending.popleft()
+                    size = lane.batch_size.size
+                    if end - start > size:
+                        pending.appendleft((start + size, end, attempt))
+                        end = start + size
+                    in_flight[lane.executor.submit(lane.send, texts[start:end], attempt)] = (start, end, attempt)
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    start, end, attempt = in_flight.pop(future)
+                    try:
+                        vectors[start:end] = future.result()
+                    except EmbeddingRequestError:
+                        if attempt + 1 >= MAX_ATTEMPTS:
+                            raise
+                        pending.appendleft((start, end, attempt + 1))
+                        continue
+                    done += end - start
+                    if on_progress:
+                        on_progress(done / len(texts))
+        finally:
+            for future in in_flight:
+                future.cancel()
+        return vectors
+
+
+def _default_dispatcher() -> EmbeddingDispatcher:
+    endpoint = os.environ.get(ENDPOINT_ENV)
+    return EmbeddingDispatcher(HttpEmbeddingClient(endpoint) if endpoint else LocalEmbeddingClient())
+
+
+# Create a global embedding dispatcher instance
+embedding_dispatcher = _default_dispatcher()
@@ -0,0 +1,352 @@
+"""
+Re-embedding knowledge base versions with another embedding model
+
+A migration re-embeds every completed document version a knowledge base
+version references. The chunks stay as they are: each document version gets
+a second embedding matrix for the target model next to its current one (see
+backend/artifacts.py), so the old index keeps serving until the cutover.
+Vectors the previous version of the same document already has for the
+target model are reused by chunk hash, and versions that already have the
+target embeddings are skipped, so a migration continued after a restart
+only embeds what is missing.
+
+The work runs as re-index jobs on the processing scheduler, the lowest
+priority class, with at most MIGRATION_CONCURRENCY document versions of one
+migration queued at a time; the embedding dispatcher keeps the requests
+within the provider's rate limits. Pausing stops new jobs from being queued
+and the ones not started yet from running; resuming picks up where it
+stopped, also after a failure. Migrations are stored with their project's
+records; when the server starts, one of the processes sharing the data
+directory queues the remaining versions of the migrations left running and
+restores the dual reads of those waiting for their cutover.
+
+When every version is re-embedded the migration is ``ready``: the new index
+is loaded in the background and, with ``dual_read``, searches of the version
+are repeated on it and their overlap with the served results is recorded.
+The cutover switches the knowledge base version's search model and the
+knowledge base's model for new documents in one storage transaction, so
+every search after it uses the new index.
+
+The estimate counts the tokens of the chunks that need a new embedding when
+the migration is created, priced with PRICE_PER_MILLION_TOKENS.
+"""
+
+import logging
+import threading
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional, Set
+
+from .models import (
+    DocumentStatus, DocumentVersion, EmbeddingMigration, EmbeddingModel, EmbeddingProvider, JobPriority,
+    KnowledgeBase, KnowledgeBaseVersion, MigrationStatus, VersionStatus,
+)
+from .storage import storage
+from .artifacts import artifact_store
+from .embeddings import DEFAULT_EMBEDDING_MODEL
+from .embedding_dispatch import MODEL_PROVIDERS, estimate_tokens
+from .scheduler import Job, processing_scheduler
+from .search import export_bundle_in_background, search_service
+from .metrics import registry
+from . import pipeline
+
+logger = logging.getLogger(__name__)
+
+# Document versions of one migration queued or re-embedding at a time
+MIGRATION_CONCURRENCY = 2
+
+# Dual reads recorded between writes of the migration record
+DUAL_READ_SAVE_EVERY = 20
+
+# List prices in USD
+PRICE_PER_MILLION_TOKENS: Dict[EmbeddingModel, float] = {
+    EmbeddingModel.TEXT_EMBEDDING_ADA_002: 0.10,
+    EmbeddingModel.TEXT_EMBEDDING_3_SMALL: 0.02,
+    EmbeddingModel.TEXT_EMBEDDING_3_LARGE: 0.13,
+    EmbeddingModel.EMBED_ENGLISH_V3: 0.10,
+    EmbeddingModel.EMBED_MULTILINGUAL_V3: 0.10,
+    EmbeddingModel.SENTENCE_TRANSFORMERS: 0.0,
+}
+
+# Migrations waiting for their cutover or running
+ACTIVE_STATUSES = (MigrationStatus.PENDING, MigrationStatus.RUNNING, MigrationStatus.PAUSED,
+                   MigrationStatus.FAILED, MigrationStatus.READY)
+
+MIGRATION_CHUNKS = registry.counter(
+    "kb_embedding_migration_chunks_total", "Chunks given a new embedding by migrations (embedded, reused)",
+    ("source",))
+
+
+class MigrationError(Exception):
+    """A migration cannot be created or changed in its current state"""
+
+
+def _cost(tokens: int, model: EmbeddingModel) -> float:
+    return tokens * PRICE_PER_MILLION_TOKENS.get(model, 0.0) / 1_000_000
+
+
+def _has_embeddings(version: DocumentVersion, chunk_count: int, model: EmbeddingModel) -> bool:
+    if (version.embedding_model or DEFAULT_EMBEDDING_MODEL) == model:
+        return True
+    vectors = artifact_store.read_embeddings(version.id, model)
+    return vectors is not None and len(vectors) == chunk_count
+
+
+class EmbeddingMigrator:
+    def __init__(self, concurrency: int = MIGRATION_CONCURRENCY):
+        self.concurrency = concurrency
+        self._lock = threading.RLock()
+        # Document versions of each migration submitted to the scheduler and not finished
+        self._in_flight: Dict[str, Set[str]] = {}
+
+    def create(self, kb: KnowledgeBase, kb_version: KnowledgeBaseVersion, target_model: EmbeddingModel,
+               target_provider: Optional[EmbeddingProvider], created_by: str, dual_read: bool = True,
+               auto_cutover: bool = False, start: bool = True) -> EmbeddingMigration:
+        """Estimate a migration of ``kb_version`` to ``target_model`` and start it unless ``start`` is False."""
+        if kb_version.embedding_model == target_model:
+            raise MigrationError(f"The version is already searched with {target_model.value}")
+        with self._lock:
+            for other in storage.get_embedding_migrations_by_kb(kb.id):
+                if other.knowledge_base_version_id == kb_version.id and other.status in ACTIVE_STATUSES:
+                    raise MigrationError(f"Migration {other.id} of this version is {other.status.value}")
+            versions = [
+                version for version in (storage.get_document_version_by_id(v_id)
+                                        for v_id in kb_version.document_version_ids)
+                if version is not None and version.status == DocumentStatus.COMPLETED
+            ]
+            sources = Counter(version.embedding_model or DEFAULT_EMBEDDING_MODEL for version in versions)
+            migration = EmbeddingMigration(
+                knowledge_base_id=kb.id,
+                knowledge_base_version_id=kb_version.id,
+                source_model=kb_version.embedding_model or (next(iter(sources)) if len(sources) == 1 else None),
+                target_provider=target_provider or MODEL_PROVIDERS.get(target_model, EmbeddingProvider.LOCAL),
+                target_model=target_model,
+                dual_read=dual_read,
+                auto_cutover=auto_cutover,
+                document_version_ids=[version.id for version in versions],
+                created_by=created_by,
+            )
+            for version in versions:
+                chunks = artifact_store.read_chunks(version.id) or []
+                migration.total_chunks += len(chunks)
+                if _has_embeddings(version, len(chunks), target_model):
+                    continue
+                reusable = pipeline.reusable_embeddings(
+                    version, pipeline.previous_completed_version(version), target_model)
+                migration.estimated_tokens += estimate_tokens([c.text for c in chunks if c.hash not in reusable])
+            migration.estimated_cost_usd = _cost(migration.estimated_tokens, target_model)
+            storage.put_embedding_migration(migration)
+            if start:
+                self.resume(migration.id)
+            return migration
+
+    def _get(self, migration_id: str) -> EmbeddingMigration:
+        migration = storage.get_embedding_migration(migration_id)
+        if migration is None:
+            raise KeyError(migration_id)
+        return migration
+
+    def _save(self, migration: EmbeddingMigration):
+        migration.updated_at = datetime.now()
+        storage.put_embedding_migration(migration)
+
+    def pause(self, migration_id: str) -> EmbeddingMigration:
+        with self._lock:
+            migration = self._get(migration_id)
+            if migration.status not in (MigrationStatus.PENDING, MigrationStatus.RUNNING):
+                raise MigrationError(f"A {migration.status.value} migration cannot be paused")
+            migration.status = MigrationStatus.PAUSED
+            self._save(migration)
+            return migration
+
+    def resume(self, migration_id: str) -> EmbeddingMigration:
+        """Start a pending migration or continue a paused or failed one."""
+        with self._lock:
+            migration = self._get(migration_id)
+            if migration.status not in (MigrationStatus.PENDING, MigrationStatus.PAUSED, MigrationStatus.FAILED):
+                raise MigrationError(f"A {migration.status.value} migration cannot be resumed")
+            migration.status = MigrationStatus.RUNNING
+            migration.error_message = None
+            self._save(migration)
+            self._advance(migration)
+            return migration
+
+    def cancel(self, migration_id: str) -> EmbeddingMigration:
+        """Stop a migration before its cutover; the embeddings written so far stay for a later one."""
+        with self._lock:
+            migration = self._get(migration_id)
+            if migration.status not in ACTIVE_STATUSES:
+                raise MigrationError(f"A {migration.status.value} migration cannot be cancelled")
+            migration.status = MigrationStatus.CANCELLED
+            search_service.clear_dual_read(migration.knowledge_base_version_id)
+            self._save(migration)
+            return migration
+
+    def cut_over(self, migration_id: str) -> EmbeddingMigration:
+        """Search the knowledge base version with the new embeddings from now on."""
+        with self._lock:
+            migration = self._get(migration_id)
+            if migration.status != MigrationStatus.READY:
+                raise MigrationError(f"A {migration.status.value} migration cannot be cut over")
+            migration.status = MigrationStatus.COMPLETED
+            migration.completed_at = migration.updated_at = datetime.now()
+            try:
+                storage.cut_over_embedding_migration(migration)
+            except ValueError as e:
+                migration.status = MigrationStatus.READY
+                migration.completed_at = None
+                raise MigrationError(str(e))
+            search_service.clear_dual_read(migration.knowledge_base_version_id)
+            kb_version = storage.get_version_by_id(migration.knowledge_base_version_id)
+            if kb_version is not None and kb_version.status == VersionStatus.PUBLISHED:
+                # The old bundle holds the previous model's embeddings
+                export_bundle_in_background(kb_version)
+            return migration
+
+    def _advance(self, migration: EmbeddingMigration):
+        """Queue the next document versions of a running migration, or mark it ready when all are done."""
+        if migration.status != MigrationStatus.RUNNING:
+            return
+        in_flight = self._in_flight.setdefault(migration.id, set())
+        migrated = set(migration.migrated_version_ids)
+        remaining = [v_id for v_id in migration.document_version_ids if v_id not in migrated and v_id not in in_flight]
+        if not remaining and not in_flight:
+            del self._in_flight[migration.id]
+            self._ready(migration)
+            return
+        kb = storage.get_knowledge_base_by_id(migration.knowledge_base_id)
+        project = storage.get_project_by_id(kb.project_id) if kb else None
+        for version_id in remaining[:max(0, self.concurrency - len(in_flight))]:
+            in_flight.add(version_id)
+            job = Job(
+                version_id=f"migration:{migration.id}:{version_id}",
+                project_id=project.id if project else "",
+                priority=JobPriority.REINDEX,
+                run=lambda version_id=version_id: self._migrate_version(migration.id, version_id),
+            )
+            if project:
+                processing_scheduler.submit(job, project.processing_weight, project.max_concurrent_jobs)
+            else:
+                processing_scheduler.submit(job)
+
+    def _ready(self, migration: EmbeddingMigration):
+        migration.status = MigrationStatus.READY
+        migration.progress = 100.0
+        self._save(migration)
+        self._await_cutover(migration)
+
+    def _await_cutover(self, migration: EmbeddingMigration):
+        if migration.auto_cutover:
+            self.cut_over(migration.id)
+            return
+        kb_version = storage.get_version_by_id(migration.knowledge_base_version_id)
+        if kb_version is None:
+            return
+        if migration.dual_read:
+            search_service.set_dual_read(
+                kb_version.id, migration.target_model,
+                lambda overlap: self._record_dual_read(migration.id, overlap),
+            )
+        # Build the new index now, so neither dual reads nor the cutover wait for it
+        threading.Thread(target=search_service.indexes.get, args=(kb_version, migration.target_model),
+                         name="migration-index", daemon=True).start()
+
+    def _migrate_version(self, migration_id: str, version_id: str):
+        with self._lock:
+            migration = storage.get_embedding_migration(migration_id)
+            if migration is None or migration.status != MigrationStatus.RUNNING:
+                # Paused or cancelled while queued; resuming queues the version again
+                self._in_flight.get(migration_id, set()).discard(version_id)
+                return
+            target_model, target_provider = migration.target_model, migration.target_provider
+        embedded = reused = tokens = 0
+        try:
+            version = storage.get_document_version_by_id(version_id)
+            chunks = (artifact_store.read_chunks(version_id) or []) if version else []
+            if version is None or _has_embeddings(version, len(chunks), target_model):
+                reused = len(chunks)
+            else:
+                reusable = pipeline.reusable_embeddings(
+                    version, pipeline.previous_completed_version(version), target_model)
+                tokens = estimate_tokens([c.text for c in chunks if c.hash not in reusable])
+                target = version.model_copy(update={"embedding_model": target_model,
+                                                    "embedding_provider": target_provider})
+                vectors, reused = pipeline.embed_changed(chunks, target, reusable)
+                artifact_store.write_embeddings(version_id, target_model, vectors)
+                embedded = len(chunks) - reused
+        except Exception as e:
+            with self._lock:
+                self._in_flight.get(migration_id, set()).discard(version_id)
+                if migration.status == MigrationStatus.RUNNING:
+                    migration.status = MigrationStatus.FAILED
+                    migration.error_message = f"Document version {version_id}: {e}"
+                    self._save(migration)
+            return
+        MIGRATION_CHUNKS.labels("embedded").inc(embedded)
+        MIGRATION_CHUNKS.labels("reused").inc(reused)
+        with self._lock:
+            self._in_flight.get(migration_id, set()).discard(version_id)
+            migration.migrated_version_ids.append(version_id)
+            migration.embedded_chunks += embedded
+            migration.reused_chunks += reused
+            migration.tokens_used += tokens
+            migration.cost_usd = _cost(migration.tokens_used, target_model)
+            done = migration.embedded_chunks + migration.reused_chunks
+            if migration.total_chunks:
+                migration.progress = min(100.0, 100.0 * done / migration.total_chunks)
+            else:
+                migration.progress = 100.0 * len(migration.migrated_version_ids) / len(migration.document_version_ids)
+            self._save(migration)
+            self._advance(migration)
+
+    def _record_dual_read(self, migration_id: str, overlap: float):
+        with self._lock:
+            migration = storage.get_embedding_migration(migration_id)
+            if migration is None or migration.status != MigrationStatus.READY:
+                return
+            queries = migration.dual_read_queries + 1
+            mean = migration.dual_read_overlap or 0.0
+            migration.dual_read_overlap = mean + (overlap - mean) / queries
+            migration.dual_read_queries = queries
+            if queries % DUAL_READ_SAVE_EVERY == 1:
+                self._save(migration)
+
+    def by_knowledge_base(self, kb_id: str) -> List[EmbeddingMigration]:
+        return sorted(storage.get_embedding_migrations_by_kb(kb_id), key=lambda m: m.created_at, reverse=True)
+
+    def recover(self) -> int:
+        """Continue the migrations a previous run left running or waiting for their cutover; returns their number."""
+        recovered = 0
+        for project in storage.get_all_projects():
+            for migration in storage.get_embedding_migrations_by_project(project.id):
+                with self._lock:
+                    if migration.status == MigrationStatus.RUNNING and migration.id not in self._in_flight:
+                        self._advance(migration)
+                    elif migration.status == MigrationStatus.READY:
+                        self._await_cutover(migration)
+                    else:
+                        continue
+                recovered += 1
+        return recovered
+
+
+# Create a global embedding migrator instance
+embedding_migrator = EmbeddingMigrator()
+
+
+def _recover_in_background():
+    def run():
+        try:
+            recovered = embedding_migrator.recover()
+        except Exception:
+            logger.exception("Failed to resume embedding migrations")
+            return
+        if recovered:
+            logger.info("Resumed %d embedding migrations", recovered)
+
+    threading.Thread(target=run, name="migration-recovery", daemon=True).start()
+
+
+# Only one of the processes sharing the data directory picks them up
+if storage.claim("embedding-migrations"):
+    _recover_in_background()
@@ -0,0 +1,42 @@
+"""
+Local text embeddings
+
+Chunks are embedded with a feature-hashing model: every token is hashed to a
+signed dimension and the counts are L2-normalised. The model name seeds the
+hash, so vectors from different models are not comparable, as with real
+providers. It needs no network access and gives every pipeline stage real
+vectors to store, reuse and search.
+"""
+
+import re
+import zlib
+from typing import List, Optional
+
+import numpy as np
+
+from .models import EmbeddingModel
+
+EMBEDDING_DIMENSIONS = 256
+DEFAULT_EMBEDDING_MODEL = EmbeddingModel.TEXT_EMBEDDING_ADA_002
+
+_TOKEN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN.findall(text.lower())
+
+
+def embed_texts(texts: List[str], model: Optional[EmbeddingModel] = None) -> np.ndarray:
+    """Embed texts into a ``(len(texts), EMBEDDING_DIMENSIONS)`` float32 matrix."""
+    seed = zlib.crc32((model or DEFAULT_EMBEDDING_MODEL).value.encode())
+    vectors = np.zeros((len(texts), EMBEDDING_DIMENSIONS), dtype=np.float32)
+    for row, text in enumerate(texts):
+        tokens = tokenize(text)
+        if not tokens:
+            continue
+        hashes = np.fromiter((zlib.crc32(token.encode(), seed) for token in tokens), dtype=np.uint32, count=len(tokens))
+        signs = np.where(hashes & 0x80000000, -1.0, 1.0).astype(np.float32)
+        np.add.at(vectors[row], hashes % EMBEDDING_DIMENSIONS, signs)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    np.divide(vectors, norms, out=vectors, where=norms > 0)
+    return vectors
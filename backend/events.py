@@ -0,0 +1,92 @@
+"""
+In-memory event bus for document processing progress.
+
+Processing runs on background threads while SSE streams are served from the
+event loop, so publishing hands events over with ``call_soon_threadsafe``.
+Subscribers are indexed by scope so a publish only touches the streams that
+watch the document, its knowledge base or its project.
+"""
+
+import asyncio
+import threading
+from typing import Dict, List, Optional, Set, Tuple
+
+from .metrics import registry
+from .models import ProgressEvent
+
+# Scopes a subscriber can watch
+DOCUMENT_SCOPE = "document"
+KNOWLEDGE_BASE_SCOPE = "knowledge_base"
+PROJECT_SCOPE = "project"
+
+# Events kept per subscriber before the oldest ones are dropped. Progress
+# events are snapshots, so a slow client only loses intermediate values.
+MAX_PENDING_EVENTS = 1000
+
+
+class Subscription:
+    def __init__(self, scope: str, scope_id: str, loop: asyncio.AbstractEventLoop):
+        self.key = (scope, scope_id)
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=MAX_PENDING_EVENTS)
+
+    def _push(self, event: ProgressEvent):
+        # Runs on the subscriber's event loop
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[ProgressEvent]:
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class EventBus:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions: Dict[Tuple[str, str], Set[Subscription]] = {}
+
+    def subscribe(self, scope: str, scope_id: str, loop: Optional[asyncio.AbstractEventLoop] = None) -> Subscription:
+        subscription = Subscription(scope, scope_id, loop or asyncio.get_running_loop())
+        with self._lock:
+            self._subscriptions.setdefault(subscription.key, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.key)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.key]
+
+    def publish(self, event: ProgressEvent):
+        keys = [(DOCUMENT_SCOPE, event.document_id)]
+        if event.knowledge_base_id:
+            keys.append((KNOWLEDGE_BASE_SCOPE, event.knowledge_base_id))
+        if event.project_id:
+            keys.append((PROJECT_SCOPE, event.project_id))
+        with self._lock:
+            targets: List[Subscription] = [s for key in keys for s in self._subscriptions.get(key, ())]
+        for subscription in targets:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription._push, event)
+            except RuntimeError:
+                # The subscriber's loop is closed; it will unsubscribe itself
+                pass
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return sum(len(s) for s in self._subscriptions.values())
+
+
+# Create a global event bus instance
+event_bus = EventBus()
+
+registry.gauge("kb_sse_subscribers", "Open progress event streams",
+               callback=lambda: {(): event_bus.subscriber_count()})
+
+def get_event_bus() -> EventBus:
+    return event_bus
@@ -0,0 +1,424 @@
+"""
+Text extractors by MIME type
+
+An extractor turns the bytes of one file format into plain text for the
+cleaning and chunking stages. Extractors are registered per MIME type with
+``register_extractor``; plain text, Markdown, HTML, CSV/TSV, JSON and JSON
+Lines are built in.
+
+Files larger than ``SEGMENT_SIZE`` are cut by their extractor into segments
+at points where the format's state is reset (line, paragraph, record or
+block element boundaries), and the segments are extracted in parallel in a
+pool of processes. Their texts come back in order, so callers can stream
+them into the next stage as they arrive.
+
+This module is loaded by the pool's processes, so it must not import the
+rest of the backend.
+"""
+
+import csv
+import io
+import json
+import mimetypes
+import multiprocessing
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from html.parser import HTMLParser
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+# Files larger than this are split into segments extracted in parallel
+SEGMENT_SIZE = 2 * 1024 * 1024
+
+# Processes extracting segments, shared by all documents
+EXTRACT_WORKERS = min(4, os.cpu_count() or 1)
+
+# Declared types that say nothing about the format, so the file name decides
+GENERIC_MIME_TYPES = {"application/octet-stream", "binary/octet-stream", "text/plain"}
+
+# Extensions the standard mimetypes table does not know
+EXTENSION_MIME_TYPES = {
+    ".md": "text/markdown",
+    ".markdown": "text/markdown",
+    ".jsonl": "application/x-ndjson",
+    ".ndjson": "application/x-ndjson",
+}
+
+DEFAULT_MIME_TYPE = "text/plain"
+
+
+class ExtractionError(ValueError):
+    """A file could not be turned into text"""
+
+
+class Extractor:
+    """Base class of format extractors.
+
+    ``extract`` returns the text of a whole file or of one of the segments
+    ``split`` cut it into; the texts of the segments, concatenated, are the
+    text of the file. Extractors are sent to the worker processes, so they
+    must be picklable.
+    """
+
+    mime_types: tuple = ()
+
+    def extract(self, data: bytes) -> str:
+        raise NotImplementedError
+
+    def split(self, data: bytes, segment_size: int) -> List[bytes]:
+        return [data]
+
+
+def _decode(data: bytes) -> str:
+    return data.decode("utf-8-sig", errors="replace")
+
+
+def _split(data: bytes, segment_size: int, find_end: Callable[[bytes, int], int],
+           balanced: Callable[[bytes], bool] = lambda piece: True) -> List[bytes]:
+    """Cut ``data`` after roughly every ``segment_size`` bytes.
+
+    ``find_end(data, position)`` gives the first cut point after
+    ``position``, or -1; ``balanced(piece)`` rejects cuts that would leave
+    the format's state open at the end of a segment (an open quote or code
+    block), in which case the next cut point is tried.
+    """
+    segments = []
+    start = 0
+    while len(data) - start > segment_size:
+        cut = find_end(data, start + segment_size)
+        while cut > 0 and not balanced(data[start:cut]):
+            cut = find_end(data, cut)
+        if cut <= 0 or cut >= len(data):
+            break
+        segments.append(data[start:cut])
+        start = cut
+    segments.append(data[start:])
+    return segments
+
+
+def _after(separator: bytes) -> Callable[[bytes, int], int]:
+    def find_end(data: bytes, position: int) -> int:
+        index = data.find(separator, position)
+        return index + len(separator) if index >= 0 else -1
+    return find_end
+
+
+# Registry
+
+EXTRACTORS: Dict[str, Extractor] = {}
+
+
+def register_extractor(extractor: Extractor) -> Extractor:
+    """Use ``extractor`` for each of its MIME types, replacing any earlier one."""
+    for mime_type in extractor.mime_types:
+        EXTRACTORS[mime_type] = extractor
+    return extractor
+
+
+def get_extractor(mime_type: Optional[str]) -> Extractor:
+    mime_type = (mime_type or DEFAULT_MIME_TYPE).split(";")[0].strip().lower()
+    extractor = EXTRACTORS.get(mime_type)
+    if extractor is None and mime_type.endswith("+json"):
+        extractor = EXTRACTORS.get("application/json")
+    if extractor is None and mime_type.startswith("text/"):
+        extractor = EXTRACTORS.get(DEFAULT_MIME_TYPE)
+    if extractor is None:
+        raise ExtractionError(f"Unsupported content type {mime_type}")
+    return extractor
+
+
+def detect_mime_type(data: bytes, file_name: Optional[str] = None, declared: Optional[str] = None) -> str:
+    """MIME type of a file: the declared one if it is specific, else from the name or the content."""
+    declared = (declared or "").split(";")[0].strip().lower()
+    if declared and declared not in GENERIC_MIME_TYPES:
+        return declared
+    if file_name:
+        suffix = Path(file_name).suffix.lower()
+        guessed = EXTENSION_MIME_TYPES.get(suffix) or mimetypes.guess_type(file_name)[0]
+        if guessed:
+            return guessed
+    head = data[:512].lstrip().lower()
+    if head.startswith((b"<!doctype html", b"<html")):
+        return "text/html"
+    if head.startswith((b"{", b"[")):
+        try:
+            json.loads(data)
+            return "application/json"
+        except ValueError:
+            pass
+    return declared or DEFAULT_MIME_TYPE
+
+
+# Parallel extraction
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _executor() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Workers are started from a clean server process rather than
+            # forked from this one, which runs many threads
+            _pool = ProcessPoolExecutor(EXTRACT_WORKERS, mp_context=multiprocessing.get_context("forkserver"))
+        return _pool
+
+
+def extract_segments(data: bytes, extractor: Extractor, segment_size: int = SEGMENT_SIZE,
+                     workers: int = EXTRACT_WORKERS) -> Iterator[str]:
+    """Texts of the file's segments, in order, extracted in parallel when there are several."""
+    segments = extractor.split(data, segment_size) if len(data) > segment_size else [data]
+    if len(segments) == 1 or workers <= 1:
+        for segment in segments:
+            yield extractor.extract(segment)
+        return
+    yield from _executor().map(extractor.extract, segments)
+
+
+# Built-in extractors
+
+class PlainTextExtractor(Extractor):
+    mime_types = ("text/plain",)
+
+    def extract(self, data: bytes) -> str:
+        return _decode(data)
+
+    def split(self, data: bytes, segment_size: int) -> List[bytes]:
+        return _split(data, segment_size, _after(b"\n"))
+
+
+_FENCE = re.compile(r"^\s*(```|~~~)")
+_HEADING = re.compile(r"^\s{0,3}#{1,6}\s+")
+_CLOSING_HASHES = re.compile(r"\s+#+\s*$")
+_RULE = re.compile(r"^\s{0,3}([-*_=])(\s*\1){2,}\s*$")
+_QUOTE = re.compile(r"^\s{0,3}(>\s?)+")
+_LIST_MARKER = re.compile(r"^(\s*)([-*+]|\d+[.)])\s+")
+_LINK_DEFINITION = re.compile(r"^\s{0,3}\[[^\]]+\]:\s+\S+.*$")
+_TABLE_DIVIDER = re.compile(r"^\s*\|?\s*:?-+:?\s*(\|\s*:?-+:?\s*)*\|?\s*$")
+_INLINE = [
+    (re.compile(r"!\[([^\]]*)\]\([^)]*\)"), r"\1"),
+    (re.compile(r"\[([^\]]+)\]\([^)]*\)"), r"\1"),
+    (re.compile(r"\[([^\]]+)\]\[[^\]]*\]"), r"\1"),
+    (re.compile(r"<(https?://[^>\s]+)>"), r"\1"),
+    (re.compile(r"`([^`]+)`"), r"\1"),
+    (re.compile(r"(\*\*|__)(?=\S)(.+?)(?<=\S)\1"), r"\2"),
+    (re.compile(r"(?<![\w*])([*_])(?=\S)(.+?)(?<=\S)\1(?![\w*])"), r"\2"),
+    (re.compile(r"~~(.+?)~~"), r"\1"),
+    (re.compile(r"</?[A-Za-z][^>]*>"), ""),
+]
+
+
+class MarkdownExtractor(Extractor):
+    """Markdown without its markup: headings, lists and quotes become plain
+    lines, links keep their text and code blocks are kept verbatim."""
+
+    mime_types = ("text/markdown", "text/x-markdown")
+
+    def extract(self, data: bytes) -> str:
+        lines = []
+        in_code = False
+        for line in _decode(data).splitlines():
+            if _FENCE.match(line):
+                in_code = not in_code
+                continue
+            if in_code:
+                lines.append(line)
+                continue
+            if _RULE.match(line) or _LINK_DEFINITION.match(line) or _TABLE_DIVIDER.match(line) and "-" in line:
+                continue
+            line = _QUOTE.sub("", line)
+            if _HEADING.match(line):
+                line = _CLOSING_HASHES.sub("", _HEADING.sub("", line))
+            line = _LIST_MARKER.sub(r"\1", line)
+            for pattern, replacement in _INLINE:
+                line = pattern.sub(replacement, line)
+            if "|" in line:
+                line = " ".join(cell.strip() for cell in line.strip().strip("|").split("|"))
+            lines.append(line)
+        return "\n".join(lines) + "\n"
+
+    def split(self, data: bytes, segment_size: int) -> List[bytes]:
+        # Cut between paragraphs, never inside a fenced code block
+        return _split(data, segment_size, _after(b"\n\n"),
+                      lambda piece: (piece.count(b"```") + piece.count(b"~~~")) % 2 == 0)
+
+
+class _HtmlText(HTMLParser):
+    # Elements whose content is not text
+    SKIPPED = {"script", "style", "noscript", "template", "svg", "head"}
+    BLOCKS = {
+        "address", "article", "aside", "blockquote", "br", "dd", "div", "dl", "dt", "fieldset", "figcaption",
+        "figure", "footer", "form", "h1", "h2", "h3", "h4", "h5", "h6", "header", "hr", "li", "main", "nav",
+        "ol", "p", "pre", "section", "table", "td", "th", "title", "tr", "ul",
+    }
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts: List[str] = []
+        self._skipping = 0
+        self._pre = 0
+        self._title = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIPPED:
+            self._skipping += 1
+        elif tag == "body":
+            # The head may be left unclosed
+            self._skipping = 0
+        elif tag == "title":
+            self._title = True
+        if tag == "pre":
+            self._pre += 1
+        if tag in self.BLOCKS:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIPPED:
+            self._skipping = max(0, self._skipping - 1)
+        elif tag == "title":
+            self._title = False
+        if tag == "pre":
+            self._pre = max(0, self._pre - 1)
+        if tag in self.BLOCKS:
+            self.parts.append("\n")
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in self.BLOCKS:
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        # The title is the only text of the head worth keeping
+        if self._skipping and not self._title:
+            return
+        self.parts.append(data if self._pre else re.sub(r"\s+", " ", data))
+
+
+_HTML_BLOCK_END = re.compile(
+    rb"</(?:p|div|li|tr|table|section|article|h[1-6]|ul|ol|pre|blockquote|header|footer|main|nav|aside)\s*>",
+    re.IGNORECASE,
+)
+
+
+def _html_block_end(data: bytes, position: int) -> int:
+    match = _HTML_BLOCK_END.search(data, position)
+    return match.end() if match else -1
+
+
+def _html_balanced(piece: bytes) -> bool:
+    piece = piece.lower()
+    return (piece.count(b"<script") == piece.count(b"</script")
+            and piece.count(b"<style") == piece.count(b"</style")
+            and piece.count(b"<!--") == piece.count(b"-->")
+            and piece.count(b"<pre") == piece.count(b"</pre"))
+
+
+class HtmlExtractor(Extractor):
+    """Visible text of an HTML page, one line per block element."""
+
+    mime_types = ("text/html", "application/xhtml+xml")
+
+    def extract(self, data: bytes) -> str:
+        parser = _HtmlText()
+        parser.feed(_decode(data))
+        parser.close()
+        return "".join(parser.parts) + "\n"
+
+    def split(self, data: bytes, segment_size: int) -> List[bytes]:
+        return _split(data, segment_size, _html_block_end, _html_balanced)
+
+
+class CsvExtractor(Extractor):
+    """One line per row, each value labelled with its column header."""
+
+    mime_types = ("text/csv", "text/tab-separated-values")
+
+    def extract(self, data: bytes) -> str:
+        text = _decode(data)
+        header_line = text.split("\n", 1)[0]
+        try:
+            dialect = csv.Sniffer().sniff(header_line, delimiters=",;\t|")
+        except csv.Error:
+            dialect = csv.excel_tab if "\t" in header_line else csv.excel
+        rows = csv.reader(io.StringIO(text), dialect)
+        header = [name.strip() for name in next(rows, [])]
+        lines = []
+        for row in rows:
+            values = [
+                f"{header[i]}: {value.strip()}" if i < len(header) and header[i] else value.strip()
+                for i, value in enumerate(row) if value.strip()
+            ]
+            if values:
+                lines.append("; ".join(values))
+        return "\n".join(lines) + "\n" if lines else ""
+
+    def split(self, data: bytes, segment_size: int) -> List[bytes]:
+        # Rows may hold quoted line breaks, so a cut needs an even number of quotes before it
+        balanced = lambda piece: piece.count(b'"') % 2 == 0
+        header_end = _after(b"\n")(data, 0)
+        while header_end > 0 and not balanced(data[:header_end]):
+            header_end = _after(b"\n")(data, header_end)
+        if header_end <= 0:
+            return [data]
+        header = data[:header_end]
+        segments = _split(data[header_end:], segment_size, _after(b"\n"), balanced)
+        # Every segment gets the header so its values keep their labels
+        return [header + segment for segment in segments]
+
+
+def _flatten(value: Any, path: str, lines: List[str]):
+    if isinstance(value, dict):
+        for key, item in value.items():
+            _flatten(item, f"{path}.{key}" if path else str(key), lines)
+    elif isinstance(value, list):
+        for item in value:
+            if isinstance(item, (dict, list)) and lines and lines[-1]:
+                # Records of a list are separate paragraphs
+                lines.append("")
+            _flatten(item, path, lines)
+    elif value is not None and value != "":
+        text = value if isinstance(value, str) else json.dumps(value)
+        lines.append(f"{path}: {text}" if path else text)
+
+
+class JsonExtractor(Extractor):
+    """One ``path: value`` line per scalar, records of arrays as paragraphs."""
+
+    mime_types = ("application/json", "text/json")
+
+    def extract(self, data: bytes) -> str:
+        try:
+            document = json.loads(_decode(data))
+        except ValueError as e:
+            raise ExtractionError(f"Invalid JSON: {e}")
+        lines: List[str] = []
+        _flatten(document, "", lines)
+        return "\n".join(lines) + "\n" if lines else ""
+
+
+class JsonLinesExtractor(JsonExtractor):
+    mime_types = ("application/x-ndjson", "application/ndjson", "application/jsonl", "application/x-jsonlines")
+
+    def extract(self, data: bytes) -> str:
+        lines: List[str] = []
+        for line in _decode(data).splitlines():
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                raise ExtractionError(f"Invalid JSON line: {e}")
+            if lines:
+                lines.append("")
+            _flatten(record, "", lines)
+        return "\n".join(lines) + "\n\n" if lines else ""
+
+    def split(self, data: bytes, segment_size: int) -> List[bytes]:
+        return _split(data, segment_size, _after(b"\n"))
+
+
+for _extractor in (PlainTextExtractor(), MarkdownExtractor(), HtmlExtractor(), CsvExtractor(),
+                   JsonExtractor(), JsonLinesExtractor()):
+    register_extractor(_extractor)
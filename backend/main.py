@@ -1,25 +1,51 @@
 import os
+import json
 import uuid
+import time
 from datetime import datetime
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Depends, Request, Body
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Depends, Request, Response, Body
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, PlainTextResponse, FileResponse
 from typing import List, Optional
 from pydantic import BaseModel
-import threading
 
-from .storage import Storage, get_storage
+from .storage import (
+    Storage, get_storage, ALL, PROJECTS, KNOWLEDGE_BASES, KB_VERSIONS, DOCUMENTS, DOCUMENT_VERSIONS
+)
+from .serialization import encode_list, encode_object_with_list
 from .models import (
     Project, ProjectList, CreateProjectRequest,
     KnowledgeBase, KnowledgeBaseList, CreateKnowledgeBaseRequest,
     KnowledgeBaseVersion, KnowledgeBaseVersionList, CreateKbVersionRequest,
     Document, DocumentList, UploadDocumentRequest,
-    DocumentVersion, DocumentVersionList,
-    User,
+    DocumentVersion, DocumentVersionList, DocumentStatus,
+    User, IngestionBatch, BulkUrlItem,
+    ProcessingStage, StageEvent, PipelineTelemetry, ProfileMode, ProfileInfo, Chunk, ChunkList,
+    NearDuplicate, NearDuplicateList, SearchRequest, ProjectSearchRequest, SearchResponse, KnowledgeBaseSearchStatus,
+    QueueStatus, ProcessingQueueStats, ProjectProcessingSettings,
+    EmbeddingMigration, EmbeddingMigrationList, CreateEmbeddingMigrationRequest,
+    GarbageCollection, GarbageCollectionList, StartGarbageCollectionRequest,
+)
+from backend.data import start_processing, archive_document_version_with_reason, start_batch_processing, get_active_progress_events
+from backend.events import get_event_bus, DOCUMENT_SCOPE, KNOWLEDGE_BASE_SCOPE, PROJECT_SCOPE
+from backend.metrics import MetricsMiddleware, get_registry
+from backend.telemetry import get_pipeline_telemetry
+from backend.scheduler import processing_scheduler
+from backend.artifacts import artifact_store
+from backend.search import (
+    search_service, primary_version, access_allowed, bundle_store, export_bundle, export_bundle_in_background
 )
-from backend.data import process_document, archive_document_version_with_reason
+from backend.rerank import CROSS_SCORERS
+from backend.embedding_migrations import embedding_migrator, MigrationError
+from backend.collector import garbage_collector, CollectionError
+from backend.profiling import ProfilingRoute, get_profile_store, sample_all_threads, MAX_SAMPLING_SECONDS
 from backend.models import CreateDocumentVersionFromUrlRequest
+from backend.pipeline import check_source_url
 
 app = FastAPI(title="Knowledge Base API", version="1.0.0")
+# Routes profile a request when asked to with X-Profile or ?profile=
+app.router.route_class = ProfilingRoute
 
 # CORS middleware setup
 app.add_middleware(
@@ -29,8 +55,35 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
 
 storage = get_storage()
+event_bus = get_event_bus()
+
+# Seconds between SSE keep-alive comments on an idle stream
+SSE_KEEPALIVE_INTERVAL = 15
+
+def _not_modified(request: Request, response: Response, etag: str) -> Optional[Response]:
+    """Answer a conditional GET from its validator alone.
+
+    Callers check that the resource exists first: the validator of an
+    unknown id is as valid as any other.
+
+    Returns a 304 response when the client already holds ``etag``; otherwise
+    attaches the validator to ``response`` and returns None.
+    """
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        if etag in candidates:
+            return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
+
+def _encoded_response(response: Response, body: bytes) -> Response:
+    """Return pre-encoded JSON, keeping the headers set on ``response``."""
+    return Response(content=body, media_type="application/json", headers=dict(response.headers))
 
 # ========
 # API Routes
@@ -40,9 +93,97 @@ storage = get_storage()
 def health_check():
     return {"status": "ok"}
 
+@app.get("/api/metrics", response_class=PlainTextResponse, tags=["Monitoring"])
+def get_metrics():
+    return PlainTextResponse(get_registry().render(), media_type="text/plain; version=0.0.4")
+
+# Pipeline telemetry
+@app.get("/api/telemetry/pipeline", response_model=PipelineTelemetry, tags=["Monitoring"])
+def get_pipeline_telemetry_summary(window_seconds: Optional[float] = None):
+    if window_seconds is not None and window_seconds <= 0:
+        raise HTTPException(status_code=400, detail="window_seconds must be positive")
+    return get_pipeline_telemetry().summary(window_seconds=window_seconds)
+
+@app.get("/api/processing/queue", response_model=ProcessingQueueStats, tags=["Monitoring"])
+def get_processing_queue():
+    return processing_scheduler.stats()
+
+@app.get("/api/telemetry/pipeline/events", response_model=List[StageEvent], tags=["Monitoring"])
+def get_pipeline_stage_events(knowledge_base_id: Optional[str] = None, stage: Optional[ProcessingStage] = None,
+                              limit: int = 100):
+    return get_pipeline_telemetry().recent_events(knowledge_base_id, stage, max(1, min(limit, 1000)))
+
+@app.get("/api/knowledge-bases/{kb_id}/telemetry/pipeline", response_model=PipelineTelemetry, tags=["Monitoring"])
+def get_knowledge_base_pipeline_telemetry(kb_id: str, window_seconds: Optional[float] = None):
+    if not storage.get_knowledge_base_by_id(kb_id):
+        raise HTTPException(status_code=404, detail="Knowledge base not found")
+    if window_seconds is not None and window_seconds <= 0:
+        raise HTTPException(status_code=400, detail="window_seconds must be positive")
+    return get_pipeline_telemetry().summary(kb_id=kb_id, window_seconds=window_seconds)
+
+# Profiling
+@app.post("/api/admin/profiles/sample", response_model=ProfileInfo, status_code=201, tags=["Profiling"])
+def sample_threads(seconds: float = 5.0, interval_ms: float = 5.0):
+    if not 0 < seconds <= MAX_SAMPLING_SECONDS:
+        raise HTTPException(status_code=400, detail=f"seconds must be between 0 and {MAX_SAMPLING_SECONDS:g}")
+    if interval_ms < 1:
+        raise HTTPException(status_code=400, detail="interval_ms must be at least 1")
+    return sample_all_threads(seconds, interval_ms / 1000)
+
+@app.get("/api/admin/profiles", response_model=List[ProfileInfo], tags=["Profiling"])
+def list_profiles():
+    return get_profile_store().list()
+
+@app.get("/api/admin/profiles/{profile_id}", response_model=ProfileInfo, tags=["Profiling"])
+def get_profile(profile_id: str):
+    info = get_profile_store().get(profile_id)
+    if not info:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return info
+
+@app.get("/api/admin/profiles/{profile_id}/download", tags=["Profiling"])
+def download_profile(profile_id: str):
+    store = get_profile_store()
+    info = store.get(profile_id)
+    path = store.file_path(info) if info else None
+    if not path:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, filename=path.name, media_type="application/octet-stream")
+
+# Garbage collection
+@app.post("/api/admin/gc", response_model=GarbageCollection, status_code=202, tags=["Garbage Collection"])
+def start_garbage_collection(request: StartGarbageCollectionRequest = Body(default_factory=StartGarbageCollectionRequest)):
+    try:
+        return garbage_collector.start(request.dry_run, request.retention_days)
+    except CollectionError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@app.get("/api/admin/gc", response_model=GarbageCollectionList, tags=["Garbage Collection"])
+def list_garbage_collections():
+    return GarbageCollectionList(collections=garbage_collector.list())
+
+@app.get("/api/admin/gc/{collection_id}", response_model=GarbageCollection, tags=["Garbage Collection"])
+def get_garbage_collection(collection_id: str):
+    collection = garbage_collector.get(collection_id)
+    if not collection:
+        raise HTTPException(status_code=404, detail="Garbage collection not found")
+    return collection
+
+@app.put("/api/admin/gc/{collection_id}/cancel", response_model=GarbageCollection, tags=["Garbage Collection"])
+def cancel_garbage_collection(collection_id: str):
+    try:
+        return garbage_collector.cancel(collection_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Garbage collection not found")
+    except CollectionError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
 # Projects
 @app.get("/api/projects", response_model=ProjectList, tags=["Projects"])
-def get_projects():
+def get_projects(request: Request, response: Response):
+    not_modified = _not_modified(request, response, storage.etag((PROJECTS, ALL)))
+    if not_modified:
+        return not_modified
     projects = storage.get_all_projects()
     return ProjectList(projects=projects)
 
@@ -53,44 +194,128 @@ def create_project(project_data: CreateProjectRequest):
     return new_project
 
 @app.get("/api/projects/{project_id}", response_model=Project, tags=["Projects"])
-def get_project(project_id: str):
+def get_project(project_id: str, request: Request, response: Response):
     project = storage.get_project_by_id(project_id)
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
+    not_modified = _not_modified(request, response, storage.etag((PROJECTS, project_id)))
+    if not_modified:
+        return not_modified
+    return project
+
+@app.put("/api/projects/{project_id}/processing", response_model=Project, tags=["Projects"])
+def update_project_processing(project_id: str, settings: ProjectProcessingSettings):
+    project = storage.get_project_by_id(project_id)
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+    project.processing_weight = settings.processing_weight
+    project.max_concurrent_jobs = settings.max_concurrent_jobs
+    project.updated_at = datetime.now()
+    storage.update_project(project)
+    processing_scheduler.configure_project(project_id, settings.processing_weight, settings.max_concurrent_jobs)
     return project
 
 # Knowledge Bases
 @app.get("/api/projects/{project_id}/knowledge-bases", response_model=KnowledgeBaseList, tags=["Knowledge Bases"])
-def get_knowledge_bases_for_project(project_id: str):
+def get_knowledge_bases_for_project(project_id: str, request: Request, response: Response):
+    not_modified = _not_modified(request, response, storage.etag((KNOWLEDGE_BASES, project_id)))
+    if not_modified:
+        return not_modified
     kbs = storage.get_knowledge_bases_by_project(project_id)
     return KnowledgeBaseList(knowledge_bases=kbs)
 
 @app.post("/api/projects/{project_id}/knowledge-bases", response_model=KnowledgeBase, status_code=201, tags=["Knowledge Bases"])
 def create_knowledge_base(project_id: str, kb_data: CreateKnowledgeBaseRequest):
+    if not storage.get_project_by_id(project_id):
+        raise HTTPException(status_code=404, detail="Project not found")
     # In a real app, created_by would come from an auth system
     new_kb = storage.create_kb(
         project_id=project_id,
         name=kb_data.name,
         description=kb_data.description,
-        created_by="user1"
+        created_by="user1",
+        skip_duplicate_embeddings=kb_data.skip_duplicate_embeddings
     )
     return new_kb
 
 @app.get("/api/knowledge-bases/{kb_id}", response_model=KnowledgeBase, tags=["Knowledge Bases"])
-def get_knowledge_base(kb_id: str):
+def get_knowledge_base(kb_id: str, request: Request, response: Response):
     kb = storage.get_knowledge_base_by_id(kb_id)
     if not kb:
         raise HTTPException(status_code=404, detail="Knowledge Base not found")
+    not_modified = _not_modified(request, response, storage.etag((KNOWLEDGE_BASES, kb_id)))
+    if not_modified:
+        return not_modified
     return kb
 
+# Search
+def _check_rerank(request: SearchRequest):
+    if request.rerank and request.rerank.cross_scorer and request.rerank.cross_scorer not in CROSS_SCORERS:
+        raise HTTPException(status_code=400, detail=f"Unknown cross scorer {request.rerank.cross_scorer}")
+
+@app.post("/api/knowledge-bases/{kb_id}/search", response_model=SearchResponse, tags=["Search"])
+def search_knowledge_base(kb_id: str, request: SearchRequest):
+    if not storage.get_knowledge_base_by_id(kb_id):
+        raise HTTPException(status_code=404, detail="Knowledge Base not found")
+    kb_version = primary_version(kb_id)
+    if not kb_version:
+        raise HTTPException(status_code=400, detail="Knowledge Base has no primary version")
+    _check_rerank(request)
+    start = time.perf_counter()
+    allowed = access_allowed(kb_version, request.filters)
+    results, strategy, rerank_stats = [], None, None
+    if allowed:
+        results, strategy, rerank_stats = search_service.search_knowledge_base(
+            kb_version, request.query, request.top_k, request.collapse_duplicates, request.filters, request.rerank
+        )
+    duration_ms = (time.perf_counter() - start) * 1000
+    status = KnowledgeBaseSearchStatus(
+        knowledge_base_id=kb_id, knowledge_base_version_id=kb_version.id,
+        status="ok" if allowed else "excluded",
+        filter_strategy=strategy, result_count=len(results), duration_ms=duration_ms,
+    )
+    return SearchResponse(
+        query=request.query, results=results, knowledge_bases=[status], rerank=rerank_stats, duration_ms=duration_ms
+    )
+
+@app.post("/api/projects/{project_id}/search", response_model=SearchResponse, tags=["Search"])
+def search_project(project_id: str, request: ProjectSearchRequest):
+    if not storage.get_project_by_id(project_id):
+        raise HTTPException(status_code=404, detail="Project not found")
+    kbs = storage.get_knowledge_bases_by_project(project_id)
+    if request.knowledge_base_ids is not None:
+        wanted = set(request.knowledge_base_ids)
+        kbs = [kb for kb in kbs if kb.id in wanted]
+        if len(kbs) != len(wanted):
+            raise HTTPException(status_code=404, detail="Knowledge Base not found in this project")
+    _check_rerank(request)
+    start = time.perf_counter()
+    results, statuses, rerank_stats = search_service.search_project(
+        kbs, request.query, request.top_k, request.collapse_duplicates, request.timeout_seconds, request.filters,
+        request.rerank
+    )
+    return SearchResponse(
+        query=request.query,
+        results=results,
+        knowledge_bases=statuses,
+        partial=any(s.status in ("timeout", "error") for s in statuses),
+        rerank=rerank_stats,
+        duration_ms=(time.perf_counter() - start) * 1000,
+    )
+
 # KB Versions
 @app.get("/api/knowledge-bases/{kb_id}/versions", response_model=KnowledgeBaseVersionList, tags=["Versions"])
-def get_kb_versions(kb_id: str):
-    versions = storage.get_versions_by_kb(kb_id)
-    return KnowledgeBaseVersionList(versions=versions)
+def get_kb_versions(kb_id: str, request: Request, response: Response, include_archived: bool = False):
+    not_modified = _not_modified(request, response, storage.etag((KB_VERSIONS, kb_id)))
+    if not_modified:
+        return not_modified
+    versions = storage.get_versions_by_kb(kb_id, include_archived)
+    return _encoded_response(response, encode_object_with_list("versions", storage.encoded.encode_many(KB_VERSIONS, versions)))
 
 @app.post("/api/knowledge-bases/{kb_id}/versions", response_model=KnowledgeBaseVersion, tags=["Versions"])
 def create_kb_version(kb_id: str, request: CreateKbVersionRequest):
+    if not storage.get_knowledge_base_by_id(kb_id):
+        raise HTTPException(status_code=404, detail="Knowledge Base not found")
     # In a real app, user_id would come from an authentication dependency
     user_id = "user1" 
     try:
@@ -112,9 +337,10 @@ def publish_kb_version(kb_id: str, version_id: str):
     user_id = "user1" # Placeholder for auth
     try:
         updated_version = storage.publish_kb_version(kb_id=kb_id, version_id=version_id, user_id=user_id)
-        return updated_version
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
+    export_bundle_in_background(updated_version)
+    return updated_version
 
 @app.put("/api/knowledge-bases/{kb_id}/versions/{version_id}/archive", response_model=KnowledgeBaseVersion, tags=["Versions"])
 def archive_kb_version(kb_id: str, version_id: str):
@@ -131,31 +357,124 @@ def set_primary_kb_version(kb_id: str, version_id: str):
     user_id = "user1"
     try:
         updated_version = storage.set_primary_kb_version(kb_id=kb_id, version_id=version_id, user_id=user_id)
-        return updated_version
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
+    # Load the new primary's index before the first search needs it
+    search_service.warm(updated_version)
+    return updated_version
+
+@app.get("/api/kb-versions/{version_id}/bundle", response_class=FileResponse, tags=["Versions"])
+def download_kb_version_bundle(version_id: str):
+    version = storage.get_version_by_id(version_id)
+    if not version:
+        raise HTTPException(status_code=404, detail="Version not found")
+    if not version.bundle_checksum or not bundle_store.exists(version_id):
+        raise HTTPException(status_code=404, detail="Version has no bundle")
+    return FileResponse(
+        bundle_store.path(version_id), media_type="application/octet-stream",
+        filename=bundle_store.path(version_id).name, headers={"ETag": f'"{version.bundle_checksum}"'},
+    )
+
+@app.post("/api/kb-versions/{version_id}/bundle", response_model=KnowledgeBaseVersion, tags=["Versions"])
+def export_kb_version_bundle(version_id: str):
+    version = storage.get_version_by_id(version_id)
+    if not version:
+        raise HTTPException(status_code=404, detail="Version not found")
+    if version.status != "published":
+        raise HTTPException(status_code=400, detail="Only published versions can be exported")
+    return export_bundle(version)
 
 @app.get("/api/kb-versions/{version_id}/documents", response_model=List[Document], tags=["Versions"])
-def get_documents_for_kb_version(version_id: str):
+def get_documents_for_kb_version(version_id: str, request: Request, response: Response):
+    if not storage.get_version_by_id(version_id):
+        raise HTTPException(status_code=404, detail="Version not found")
+    not_modified = _not_modified(request, response, storage.etag((KB_VERSIONS, version_id), (DOCUMENTS, ALL)))
+    if not_modified:
+        return not_modified
     try:
         documents = storage.get_documents_for_kb_version(version_id)
-        return documents
+        return _encoded_response(response, encode_list(storage.encoded.encode_many(DOCUMENTS, documents)))
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
 
+# Embedding migrations
+@app.post("/api/knowledge-bases/{kb_id}/embedding-migrations", response_model=EmbeddingMigration, status_code=201, tags=["Embedding Migrations"])
+def create_embedding_migration(kb_id: str, request: CreateEmbeddingMigrationRequest):
+    kb = storage.get_knowledge_base_by_id(kb_id)
+    if not kb:
+        raise HTTPException(status_code=404, detail="Knowledge Base not found")
+    if request.knowledge_base_version_id:
+        kb_version = storage.get_version_by_id(request.knowledge_base_version_id)
+    else:
+        kb_version = primary_version(kb_id)
+    if not kb_version or kb_version.knowledge_base_id != kb_id:
+        raise HTTPException(status_code=404, detail="Version not found")
+    try:
+        return embedding_migrator.create(
+            kb, kb_version, request.target_model, request.target_provider, created_by="user1",
+            dual_read=request.dual_read, auto_cutover=request.auto_cutover, start=request.start,
+        )
+    except MigrationError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@app.get("/api/knowledge-bases/{kb_id}/embedding-migrations", response_model=EmbeddingMigrationList, tags=["Embedding Migrations"])
+def get_embedding_migrations(kb_id: str):
+    if not storage.get_knowledge_base_by_id(kb_id):
+        raise HTTPException(status_code=404, detail="Knowledge Base not found")
+    return EmbeddingMigrationList(migrations=embedding_migrator.by_knowledge_base(kb_id))
+
+@app.get("/api/embedding-migrations/{migration_id}", response_model=EmbeddingMigration, tags=["Embedding Migrations"])
+def get_embedding_migration(migration_id: str):
+    migration = storage.get_embedding_migration(migration_id)
+    if not migration:
+        raise HTTPException(status_code=404, detail="Embedding migration not found")
+    return migration
+
+def _change_migration(action, migration_id: str) -> EmbeddingMigration:
+    try:
+        return action(migration_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Embedding migration not found")
+    except MigrationError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@app.put("/api/embedding-migrations/{migration_id}/pause", response_model=EmbeddingMigration, tags=["Embedding Migrations"])
+def pause_embedding_migration(migration_id: str):
+    return _change_migration(embedding_migrator.pause, migration_id)
+
+@app.put("/api/embedding-migrations/{migration_id}/resume", response_model=EmbeddingMigration, tags=["Embedding Migrations"])
+def resume_embedding_migration(migration_id: str):
+    return _change_migration(embedding_migrator.resume, migration_id)
+
+@app.put("/api/embedding-migrations/{migration_id}/cutover", response_model=EmbeddingMigration, tags=["Embedding Migrations"])
+def cut_over_embedding_migration(migration_id: str):
+    return _change_migration(embedding_migrator.cut_over, migration_id)
+
+@app.put("/api/embedding-migrations/{migration_id}/cancel", response_model=EmbeddingMigration, tags=["Embedding Migrations"])
+def cancel_embedding_migration(migration_id: str):
+    return _change_migration(embedding_migrator.cancel, migration_id)
+
 # Documents
 @app.get("/api/knowledge-bases/{kb_id}/documents", response_model=DocumentList, tags=["Documents"])
-def get_documents_in_kb(kb_id: str):
+def get_documents_in_kb(kb_id: str, request: Request, response: Response):
+    not_modified = _not_modified(request, response, storage.etag((DOCUMENTS, kb_id)))
+    if not_modified:
+        return not_modified
     docs = storage.get_documents_by_kb(kb_id)
-    return DocumentList(documents=docs)
+    return _encoded_response(response, encode_object_with_list("documents", storage.encoded.encode_many(DOCUMENTS, docs)))
 
 @app.get("/api/documents/{doc_id}/versions", response_model=DocumentVersionList, tags=["Documents"])
-def get_document_versions(doc_id: str):
-    versions = storage.get_document_versions_by_document(doc_id)
-    return DocumentVersionList(document_versions=versions)
+def get_document_versions(doc_id: str, request: Request, response: Response, include_archived: bool = False):
+    not_modified = _not_modified(request, response, storage.etag((DOCUMENT_VERSIONS, doc_id)))
+    if not_modified:
+        return not_modified
+    versions = storage.get_document_versions_by_document(doc_id, include_archived)
+    return _encoded_response(response, encode_object_with_list("document_versions", storage.encoded.encode_many(DOCUMENT_VERSIONS, versions)))
 
 @app.post("/api/knowledge-bases/{kb_id}/documents", response_model=Document, status_code=201, tags=["Documents"])
 def create_document(kb_id: str, document_data: dict):
+    if not storage.get_knowledge_base_by_id(kb_id):
+        raise HTTPException(status_code=404, detail="Knowledge Base not found")
     # In a real app, created_by would come from an auth system
     new_doc = storage.create_document(
         kb_id=kb_id,
@@ -166,10 +485,16 @@ def create_document(kb_id: str, document_data: dict):
     return new_doc
 
 @app.post("/api/documents/{doc_id}/versions", response_model=DocumentVersion, status_code=201, tags=["Documents"])
-async def create_document_version(doc_id: str, request: Request):
-    # Accept both JSON and form data
+async def create_document_version(doc_id: str, request: Request, profile_processing: Optional[ProfileMode] = None):
+    if not storage.get_document_by_id(doc_id):
+        raise HTTPException(status_code=404, detail="Document not found")
+    # Accept both JSON and form data; a form may carry the new content as "file"
+    upload = None
     if request.headers.get("content-type", "").startswith("multipart/form-data"):
         form = await request.form()
+        upload = form.get("file")
+        if isinstance(upload, str):
+            upload = None
         version_name = form.get("version_name", "")
         if not isinstance(version_name, str):
             version_name = str(version_name) if version_name else ""
@@ -184,43 +509,114 @@ async def create_document_version(doc_id: str, request: Request):
         change_description = data.get("change_description", "")
         if not isinstance(change_description, str):
             change_description = str(change_description) if change_description else ""
+    # Storage writes and the file copy block, so they run off the event loop
+    new_version = await run_in_threadpool(_create_document_version, doc_id, version_name, change_description, upload)
+    # Trigger processing in background
+    start_processing(doc_id, new_version.id, profile_processing)
+    return new_version
+
+def _create_document_version(doc_id: str, version_name: str, change_description: str, upload) -> DocumentVersion:
     new_version = storage.create_document_version(
         doc_id=doc_id,
         version_name=version_name,
         change_description=change_description,
         created_by="user1"
     )
-    # Trigger processing in background
-    threading.Thread(target=process_document, args=(doc_id, new_version.id), daemon=True).start()
+    if upload is not None:
+        new_version.mime_type = upload.content_type
+        storage.save_version_file(new_version, upload.filename, upload.file)
+        storage.update_document_version(new_version)
     return new_version
 
 @app.get("/api/projects/{project_id}/documents", response_model=List[Document])
-def get_project_documents(project_id: str):
-    return storage.get_documents_by_project(project_id)
+def get_project_documents(project_id: str, request: Request, response: Response):
+    not_modified = _not_modified(request, response, storage.etag((DOCUMENTS, project_id)))
+    if not_modified:
+        return not_modified
+    docs = storage.get_documents_by_project(project_id)
+    return _encoded_response(response, encode_list(storage.encoded.encode_many(DOCUMENTS, docs)))
 
 @app.get("/api/projects/{project_id}/document-versions", tags=["Documents"])
-def get_all_document_versions(project_id: str):
+def get_all_document_versions(project_id: str, request: Request, response: Response, include_archived: bool = False):
+    not_modified = _not_modified(request, response, storage.etag((DOCUMENT_VERSIONS, project_id)))
+    if not_modified:
+        return not_modified
     documents = storage.get_documents_by_project(project_id)
     all_versions = []
     for doc in documents:
-        all_versions.extend(storage.get_document_versions_by_document(doc.id))
-    return {"document_versions": all_versions}
+        all_versions.extend(storage.get_document_versions_by_document(doc.id, include_archived))
+    return _encoded_response(response, encode_object_with_list("document_versions", storage.encoded.encode_many(DOCUMENT_VERSIONS, all_versions)))
 
 @app.get("/api/documents/{document_id}", response_model=Document)
-def get_document(document_id: str):
+def get_document(document_id: str, request: Request, response: Response):
     db_document = storage.get_document(document_id)
     if not db_document:
         raise HTTPException(status_code=404, detail="Document not found")
+    not_modified = _not_modified(request, response, storage.etag((DOCUMENTS, document_id)))
+    if not_modified:
+        return not_modified
     return db_document
 
 @app.get("/api/document-versions/{version_id}", response_model=DocumentVersion, tags=["Documents"])
-def get_document_version(version_id: str):
+def get_document_version(version_id: str, request: Request, response: Response):
     from backend.data import get_document_version_by_id
     version = get_document_version_by_id(version_id)
     if not version:
         raise HTTPException(status_code=404, detail="Document version not found")
+    not_modified = _not_modified(request, response, storage.etag((DOCUMENT_VERSIONS, version_id)))
+    if not_modified:
+        return not_modified
     return version
 
+@app.get("/api/document-versions/{version_id}/queue", response_model=QueueStatus, tags=["Documents"])
+def get_document_version_queue_status(version_id: str):
+    if not storage.get_document_version_by_id(version_id):
+        raise HTTPException(status_code=404, detail="Document version not found")
+    status = processing_scheduler.queue_status(version_id)
+    if not status:
+        raise HTTPException(status_code=404, detail="Document version is not queued for processing")
+    return status
+
+@app.get("/api/document-versions/{version_id}/chunks", response_model=ChunkList, tags=["Documents"])
+def get_document_version_chunks(version_id: str):
+    if not storage.get_document_version_by_id(version_id):
+        raise HTTPException(status_code=404, detail="Document version not found")
+    chunks = artifact_store.read_chunks(version_id)
+    return ChunkList(chunks=chunks or [])
+
+@app.get("/api/chunks/{chunk_id}", response_model=Chunk, tags=["Documents"])
+def get_chunk(chunk_id: str):
+    # Chunk ids are "<document_version_id>:<index>", as in a chunk's duplicate_of
+    try:
+        chunk = artifact_store.get_chunk(chunk_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not chunk:
+        raise HTTPException(status_code=404, detail="Chunk not found")
+    return chunk
+
+@app.get("/api/knowledge-bases/{kb_id}/duplicates", response_model=NearDuplicateList, tags=["Documents"])
+def get_near_duplicates(kb_id: str):
+    """Documents whose latest completed version nearly duplicates another document."""
+    if not storage.get_knowledge_base_by_id(kb_id):
+        raise HTTPException(status_code=404, detail="Knowledge Base not found")
+    duplicates = []
+    for doc in storage.get_documents_by_kb(kb_id):
+        completed = [
+            v for v in storage.get_document_versions_by_document(doc.id)
+            if v.status == DocumentStatus.COMPLETED
+        ]
+        latest = max(completed, key=lambda v: v.created_at, default=None)
+        if latest and latest.duplicate_of_document_id:
+            duplicates.append(NearDuplicate(
+                document_id=doc.id,
+                document_version_id=latest.id,
+                duplicate_of_document_id=latest.duplicate_of_document_id,
+                similarity=latest.duplicate_similarity,
+                duplicate_chunk_count=latest.duplicate_chunk_count,
+            ))
+    return NearDuplicateList(duplicates=duplicates)
+
 @app.post("/api/knowledge-bases/{kb_id}/documents/upload", response_model=Document, status_code=201, tags=["Documents"])
 def upload_document(
     kb_id: str,
@@ -232,7 +628,10 @@ def upload_document(
     embedding_model: str = Form('TEXT_EMBEDDING_ADA_002'),
     chunk_size: int = Form(1000),
     chunk_overlap: int = Form(200),
+    profile_processing: Optional[ProfileMode] = None,
 ):
+    if not storage.get_knowledge_base_by_id(kb_id):
+        raise HTTPException(status_code=404, detail="Knowledge Base not found")
     new_doc = storage.create_document(
         kb_id=kb_id,
         name=name,
@@ -244,19 +643,101 @@ def upload_document(
     versions = get_document_versions_by_document(new_doc.id)
     if versions:
         initial_version = versions[0]
-        # Set the file_name on the initial version
-        initial_version.file_name = file.filename
+        # Keep the uploaded content with the initial version
+        initial_version.chunk_size = chunk_size
+        initial_version.chunk_overlap = chunk_overlap
+        initial_version.mime_type = file.content_type
+        storage.save_version_file(initial_version, file.filename, file.file)
         storage.update_document_version(initial_version)
-        threading.Thread(target=process_document, args=(new_doc.id, initial_version.id), daemon=True).start()
+        start_processing(new_doc.id, initial_version.id, profile_processing)
     return new_doc
 
+# Upper bound on the number of parts accepted in one bulk multipart upload
+MAX_BULK_FILES = 10000
+
+@app.post("/api/knowledge-bases/{kb_id}/documents/bulk", response_model=IngestionBatch, status_code=202, tags=["Documents"])
+async def bulk_ingest_documents(kb_id: str, request: Request):
+    # Accept either a multipart batch of files or an NDJSON manifest of URLs
+    kb = storage.get_knowledge_base_by_id(kb_id)
+    if not kb:
+        raise HTTPException(status_code=404, detail="Knowledge Base not found")
+    content_type = request.headers.get("content-type", "")
+    uploads = []
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form(max_files=MAX_BULK_FILES)
+        description = form.get("description", "")
+        if not isinstance(description, str):
+            description = ""
+        uploads = [f for f in form.getlist("files") if not isinstance(f, str)]
+        items = [{"name": f.filename, "description": description, "file_name": f.filename} for f in uploads]
+    elif content_type.startswith(("application/x-ndjson", "application/ndjson")):
+        items = []
+        # Pieces of the line not terminated yet, joined once it is
+        partial = []
+        async for chunk in request.stream():
+            *lines, rest = chunk.split(b"\n")
+            if lines:
+                lines[0] = b"".join(partial + [lines[0]])
+                partial = []
+                items.extend(_parse_bulk_url_line(line) for line in lines if line.strip())
+            partial.append(rest)
+        last = b"".join(partial)
+        if last.strip():
+            items.append(_parse_bulk_url_line(last))
+    else:
+        raise HTTPException(status_code=415, detail="Expected multipart/form-data or application/x-ndjson")
+    if not items:
+        raise HTTPException(status_code=400, detail="The batch is empty")
+    # Records and uploaded files are written with blocking I/O
+    batch = await run_in_threadpool(_create_ingestion_batch, kb, items, uploads)
+    start_batch_processing(batch.id)
+    return batch
+
+def _create_ingestion_batch(kb: KnowledgeBase, items: List[dict], uploads: list) -> IngestionBatch:
+    with storage.transaction(kb.project_id):
+        created = storage.create_documents_bulk(kb_id=kb.id, items=items, created_by="user1")
+        for upload, (_, version) in zip(uploads, created):
+            version.mime_type = upload.content_type
+            storage.save_version_file(version, upload.filename, upload.file)
+        batch = IngestionBatch(
+            knowledge_base_id=kb.id,
+            document_ids=[doc.id for doc, _ in created],
+            document_version_ids=[version.id for _, version in created],
+            total=len(created),
+            created_by="user1"
+        )
+        storage.add_ingestion_batch(batch)
+    return batch
+
+def _parse_bulk_url_line(line: bytes) -> dict:
+    try:
+        item = BulkUrlItem(**json.loads(line))
+        check_source_url(item.url)
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid manifest line: {e}")
+    return {"name": item.name or item.url, "description": item.description or "", "source_url": item.url}
+
+@app.get("/api/ingestion-batches/{batch_id}", response_model=IngestionBatch, tags=["Documents"])
+def get_ingestion_batch(batch_id: str):
+    batch = storage.get_ingestion_batch(batch_id)
+    if not batch:
+        raise HTTPException(status_code=404, detail="Ingestion batch not found")
+    return batch
+
 class CreateDocumentFromUrlRequest(BaseModel):
     url: str
     name: str = None
     description: str = None
 
 @app.post("/api/knowledge-bases/{kb_id}/documents/from-url", response_model=Document, status_code=201, tags=["Documents"])
-def create_document_from_url(kb_id: str, request: CreateDocumentFromUrlRequest):
+def create_document_from_url(kb_id: str, request: CreateDocumentFromUrlRequest,
+                             profile_processing: Optional[ProfileMode] = None):
+    if not storage.get_knowledge_base_by_id(kb_id):
+        raise HTTPException(status_code=404, detail="Knowledge Base not found")
+    try:
+        check_source_url(request.url)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     new_doc = storage.create_document(
         kb_id=kb_id,
         name=request.name or request.url,
@@ -267,7 +748,7 @@ def create_document_from_url(kb_id: str, request: CreateDocumentFromUrlRequest):
     versions = get_document_versions_by_document(new_doc.id)
     if versions:
         initial_version = versions[0]
-        threading.Thread(target=process_document, args=(new_doc.id, initial_version.id), daemon=True).start()
+        start_processing(new_doc.id, initial_version.id, profile_processing)
     return new_doc
 
 @app.put("/api/documents/{doc_id}/versions/{version_id}/archive", response_model=DocumentVersion, tags=["Documents"])
@@ -281,7 +762,14 @@ def archive_document_version(doc_id: str, version_id: str, body: dict = Body(...
     return version
 
 @app.post("/api/documents/{doc_id}/versions/from-url", response_model=DocumentVersion, status_code=201, tags=["Documents"])
-def create_document_version_from_url(doc_id: str, request: CreateDocumentVersionFromUrlRequest):
+def create_document_version_from_url(doc_id: str, request: CreateDocumentVersionFromUrlRequest,
+                                     profile_processing: Optional[ProfileMode] = None):
+    if not storage.get_document_by_id(doc_id):
+        raise HTTPException(status_code=404, detail="Document not found")
+    try:
+        check_source_url(request.url)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     # Create a new document version for the given document using the provided URL
     new_version = storage.create_document_version(
         doc_id=doc_id,
@@ -291,7 +779,7 @@ def create_document_version_from_url(doc_id: str, request: CreateDocumentVersion
         source_url=request.url
     )
     # Trigger processing in background
-    threading.Thread(target=process_document, args=(doc_id, new_version.id), daemon=True).start()
+    start_processing(doc_id, new_version.id, profile_processing)
     return new_version
 
 @app.put("/api/knowledge-bases/{kb_id}/versions/{version_id}", response_model=KnowledgeBaseVersion, tags=["Versions"])
@@ -309,4 +797,45 @@ def update_kb_version(kb_id: str, version_id: str, request: CreateKbVersionReque
     version.document_version_ids = request.document_version_ids
     version.updated_at = datetime.now()
     storage.update_kb_version(version)
-    return version 
\ No newline at end of file
+    return version 
+
+# Processing events (server-sent events)
+async def _progress_event_stream(request: Request, scope: str, scope_id: str):
+    subscription = event_bus.subscribe(scope, scope_id)
+    try:
+        # Subscribe before taking the snapshot so no transition is missed
+        for event in get_active_progress_events(scope, scope_id):
+            yield f"event: progress\ndata: {event.model_dump_json()}\n\n"
+        while not await request.is_disconnected():
+            event = await subscription.get(timeout=SSE_KEEPALIVE_INTERVAL)
+            if event is None:
+                yield ": keep-alive\n\n"
+            else:
+                yield f"event: progress\ndata: {event.model_dump_json()}\n\n"
+    finally:
+        event_bus.unsubscribe(subscription)
+
+def _sse_response(request: Request, scope: str, scope_id: str) -> StreamingResponse:
+    return StreamingResponse(
+        _progress_event_stream(request, scope, scope_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/api/documents/{doc_id}/events", tags=["Events"])
+def stream_document_events(doc_id: str, request: Request):
+    if not storage.get_document_by_id(doc_id):
+        raise HTTPException(status_code=404, detail="Document not found")
+    return _sse_response(request, DOCUMENT_SCOPE, doc_id)
+
+@app.get("/api/knowledge-bases/{kb_id}/events", tags=["Events"])
+def stream_knowledge_base_events(kb_id: str, request: Request):
+    if not storage.get_knowledge_base_by_id(kb_id):
+        raise HTTPException(status_code=404, detail="Knowledge Base not found")
+    return _sse_response(request, KNOWLEDGE_BASE_SCOPE, kb_id)
+
+@app.get("/api/projects/{project_id}/events", tags=["Events"])
+def stream_project_events(project_id: str, request: Request):
+    if not storage.get_project_by_id(project_id):
+        raise HTTPException(status_code=404, detail="Project not found")
+    return _sse_response(request, PROJECT_SCOPE, project_id)
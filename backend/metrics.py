@@ -0,0 +1,366 @@
+"""
+Prometheus-style metrics
+
+A small in-process registry of counters, gauges and histograms rendered in
+the Prometheus text exposition format by ``GET /api/metrics``. Hot paths
+resolve their labelled child once and then only pay for a lock and a few
+additions per observation.
+"""
+
+import functools
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+# Latency buckets in seconds, from 10µs storage lookups to slow requests
+DURATION_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+        for name, value in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children: Dict[Tuple[str, ...], object] = {}
+
+    def labels(self, *values: str):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in sorted(self._children.items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+    def _render_child(self, values, child) -> Iterable[str]:
+        raise NotImplementedError
+
+
+class _Value:
+    __slots__ = ("value", "lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self.lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        with self.lock:
+            self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def _render_child(self, values, child):
+        yield f"{self.name}{_format_labels(self.labelnames, values)} {child.value}"
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 callback: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None):
+        super().__init__(name, documentation, labelnames)
+        # Callback gauges are computed at scrape time: {label values: value}
+        self._callback = callback
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        self.labels().dec(amount)
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+    def render(self) -> List[str]:
+        if self._callback is None:
+            return super().render()
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, value in sorted(self._callback().items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, values)} {value}")
+        return lines
+
+    def _render_child(self, values, child):
+        yield f"{self.name}{_format_labels(self.labelnames, values)} {child.value}"
+
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "lock")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        # One slot per bucket plus the +Inf bucket; counts are not cumulative
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def snapshot(self) -> Tuple[List[int], float]:
+        with self.lock:
+            return list(self.counts), self.sum
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DURATION_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def _render_child(self, values, child):
+        counts, total = child.snapshot()
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            labels = _format_labels(self.labelnames + ("le",), values + (le,))
+            yield f"{self.name}_bucket{labels} {cumulative}"
+        labels = _format_labels(self.labelnames, values)
+        yield f"{self.name}_sum{labels} {total}"
+        yield f"{self.name}_count{labels} {cumulative}"
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = (), callback=None) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, callback))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DURATION_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# Create a global registry instance
+registry = MetricsRegistry()
+
+def get_registry() -> MetricsRegistry:
+    return registry
+
+
+HTTP_REQUESTS = registry.counter(
+    "kb_http_requests_total", "HTTP requests by method, route template and status", ("method", "route", "status"))
+HTTP_REQUEST_DURATION = registry.histogram(
+    "kb_http_request_duration_seconds", "HTTP request latency", ("method", "route", "status"))
+HTTP_REQUESTS_IN_FLIGHT = registry.gauge("kb_http_requests_in_flight", "HTTP requests being served")
+
+STORAGE_FLUSH_DURATION = registry.histogram(
+    "kb_storage_flush_duration_seconds", "Time spent writing the data files; _count is the number of flushes")
+STORAGE_FLUSH_BYTES = registry.counter("kb_storage_flush_bytes_total", "Bytes written to the data files")
+STORAGE_CHANGES_APPLIED = registry.counter(
+    "kb_storage_changes_applied_total", "Change log entries from other processes applied to this one")
+STORAGE_REPLICATION_LAG = registry.histogram(
+    "kb_storage_replication_lag_seconds", "Age of the newest change log entry when it was applied")
+
+STORAGE_SHARD_LOADS = registry.counter(
+    "kb_storage_shard_loads_total", "Project shards loaded from the data files")
+STORAGE_SHARD_UNLOADS = registry.counter(
+    "kb_storage_shard_unloads_total", "Idle project shards dropped from memory")
+BACKGROUND_JOBS_IN_FLIGHT = registry.gauge(
+    "kb_background_jobs_in_flight", "Background jobs currently running", ("job",))
+
+
+class _CallStats:
+    """Duration histogram and row counters of one method, under a single lock."""
+
+    __slots__ = ("buckets", "counts", "sum", "rows_scanned", "rows_returned", "lock")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.rows_scanned = 0
+        self.rows_returned = 0
+        self.lock = threading.Lock()
+
+    def record(self, duration: float, scanned: int, returned: int):
+        index = bisect_left(self.buckets, duration)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += duration
+            self.rows_scanned += scanned
+            self.rows_returned += returned
+
+
+class CallMetrics:
+    """Per-method call metrics rendered as three metric families."""
+
+    def __init__(self, prefix: str, subject: str, buckets: Sequence[float] = DURATION_BUCKETS):
+        self.name = prefix
+        self.subject = subject
+        self.buckets = tuple(sorted(buckets))
+        self._methods: Dict[str, _CallStats] = {}
+
+    def method(self, name: str) -> _CallStats:
+        return self._methods.setdefault(name, _CallStats(self.buckets))
+
+    def render(self) -> List[str]:
+        duration = Histogram(f"{self.name}_call_duration_seconds",
+                             f"{self.subject} method latency; _count is the number of calls", ("method",), self.buckets)
+        scanned = [f"# HELP {self.name}_rows_scanned_total Records visited by {self.subject} methods",
+                   f"# TYPE {self.name}_rows_scanned_total counter"]
+        returned = [f"# HELP {self.name}_rows_returned_total Records returned by {self.subject} methods",
+                    f"# TYPE {self.name}_rows_returned_total counter"]
+        for method, stats in sorted(self._methods.items()):
+            child = duration.labels(method)
+            with stats.lock:
+                child.counts = list(stats.counts)
+                child.sum = stats.sum
+                scanned.append(f'{self.name}_rows_scanned_total{{method="{method}"}} {stats.rows_scanned}')
+                returned.append(f'{self.name}_rows_returned_total{{method="{method}"}} {stats.rows_returned}')
+        return duration.render() + scanned + returned
+
+
+STORAGE_CALLS = registry.register(CallMetrics("kb_storage", "Storage"))
+
+
+def instrument_methods(cls, scans: Dict[str, Union[Tuple[str, ...], Callable]], exclude: Iterable[str] = (),
+                       metrics: CallMetrics = STORAGE_CALLS):
+    """Time every public method of ``cls`` and count the rows it touches.
+
+    ``scans`` maps method names to the attributes holding the collections the
+    method iterates over, whose sizes are added to the rows scanned, or to a
+    function of ``(self, args, kwargs)`` returning the rows the call scans.
+    """
+    exclude = set(exclude)
+    for name, func in list(vars(cls).items()):
+        if name.startswith("_") or name in exclude or not callable(func) or isinstance(func, (staticmethod, classmethod, type)):
+            continue
+        scanned = scans.get(name)
+        if isinstance(scanned, tuple):
+            scanned = _attribute_sizes(scanned)
+        setattr(cls, name, _timed(func, metrics.method(name), scanned))
+    return cls
+
+
+def _attribute_sizes(attrs: Tuple[str, ...]) -> Callable:
+    return lambda obj, args, kwargs: sum(len(getattr(obj, attr)) for attr in attrs)
+
+
+def _timed(func: Callable, stats: _CallStats, scanned: Optional[Callable]) -> Callable:
+    perf_counter = time.perf_counter
+    record = stats.record
+
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        start = perf_counter()
+        result = func(self, *args, **kwargs)
+        elapsed = perf_counter() - start
+        rows = scanned(self, args, kwargs) if scanned else 0
+        record(elapsed, rows, len(result) if result.__class__ is list else (result is not None))
+        return result
+
+    return wrapper
+
+
+class track_job:
+    """Context manager counting a background job as in flight."""
+
+    def __init__(self, job: str):
+        self._gauge = BACKGROUND_JOBS_IN_FLIGHT.labels(job)
+
+    def __enter__(self):
+        self._gauge.inc()
+        return self
+
+    def __exit__(self, *exc):
+        self._gauge.dec()
+        return False
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording request counts and latency per route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = 500
+        in_flight = HTTP_REQUESTS_IN_FLIGHT.labels()
+        in_flight.inc()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_flight.dec()
+            route = scope.get("route")
+            labels = (scope["method"], getattr(route, "path", "unmatched"), str(status))
+            HTTP_REQUESTS.labels(*labels).inc()
+            HTTP_REQUEST_DURATION.labels(*labels).observe(time.perf_counter() - start)
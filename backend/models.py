@@ -51,6 +51,38 @@ class ProcessingStage(str, Enum):
     EMBED = "embed"
 
 
+class BatchStatus(str, Enum):
+    PENDING = "pending"
+    PROCESSING = "processing"
+    COMPLETED = "completed"
+    PARTIALLY_FAILED = "partially_failed"
+    FAILED = "failed"
+
+
+class MigrationStatus(str, Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    PAUSED = "paused"
+    READY = "ready"  # Everything re-embedded, waiting for the cutover
+    COMPLETED = "completed"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+class CollectionStatus(str, Enum):
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+class JobPriority(str, Enum):
+    # In scheduling order
+    INTERACTIVE = "interactive"
+    BULK = "bulk"
+    REINDEX = "reindex"
+
+
 class ChunkingMethod(str, Enum):
     FIXED_SIZE = "fixed_size"
     SEMANTIC = "semantic"
@@ -106,6 +138,8 @@ class Project(BaseModel):
     status: ProjectStatus = ProjectStatus.ACTIVE
     access_token: Optional[str] = None
     users: Dict[str, ProjectUser] = Field(default_factory=dict)
+    processing_weight: float = 1.0  # Share of the processing workers relative to other projects
+    max_concurrent_jobs: Optional[int] = None  # Documents processed at once; None for the default
     created_by: str
     created_at: datetime = Field(default_factory=datetime.now)
     updated_at: datetime = Field(default_factory=datetime.now)
@@ -142,6 +176,12 @@ class DocumentVersion(BaseModel):
     error_message: Optional[str] = None
     chunk_count: int = 0
     embedding_count: int = 0
+    reused_chunk_count: int = 0  # Chunks whose embeddings were carried over from the base version
+    chunk_reuse_ratio: float = 0.0  # reused_chunk_count / chunk_count
+    base_version_id: Optional[str] = None  # Previous completed version the chunks were diffed against
+    duplicate_of_document_id: Optional[str] = None  # Most similar near-duplicate document in the knowledge base
+    duplicate_similarity: Optional[float] = None  # Estimated Jaccard similarity to that document
+    duplicate_chunk_count: int = 0  # Chunks nearly identical to a chunk of another document
     chunking_method: Optional[ChunkingMethod] = None
     embedding_provider: Optional[EmbeddingProvider] = None
     embedding_model: Optional[EmbeddingModel] = None
@@ -166,6 +206,11 @@ class KnowledgeBase(BaseModel):
     name: str
     description: Optional[str] = None
     project_id: str
+    # Chunks that nearly duplicate another document's chunk reuse its embedding
+    skip_duplicate_embeddings: bool = False
+    # Model new document versions are embedded with, once a migration switched to it
+    embedding_provider: Optional[EmbeddingProvider] = None
+    embedding_model: Optional[EmbeddingModel] = None
     created_by: str
     created_at: datetime = Field(default_factory=datetime.now)
     updated_at: datetime = Field(default_factory=datetime.now)
@@ -181,6 +226,11 @@ class KnowledgeBaseVersion(BaseModel):
     access_level: Literal["private", "protected", "public"]
     is_primary: bool = False
     document_version_ids: List[str] = Field(default_factory=list)  # List of DocumentVersion IDs
+    # Model searched with, set by an embedding migration; each document version's own model otherwise
+    embedding_model: Optional[EmbeddingModel] = None
+    # Manifest checksum and size of the exported bundle (see backend/bundles.py)
+    bundle_checksum: Optional[str] = None
+    bundle_size: Optional[int] = None
     created_by: str
     created_at: datetime = Field(default_factory=datetime.now)
     updated_at: Optional[datetime] = None
@@ -190,6 +240,80 @@ class KnowledgeBaseVersion(BaseModel):
     archived_at: Optional[datetime] = None
 
 
+class IngestionBatch(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    knowledge_base_id: str
+    document_ids: List[str] = Field(default_factory=list)
+    document_version_ids: List[str] = Field(default_factory=list)
+    status: BatchStatus = BatchStatus.PENDING
+    total: int = 0
+    completed: int = 0
+    failed: int = 0
+    progress: float = 0.0  # Aggregate progress across all documents, 0-100
+    created_by: str
+    created_at: datetime = Field(default_factory=datetime.now)
+    updated_at: datetime = Field(default_factory=datetime.now)
+
+
+class EmbeddingMigration(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    knowledge_base_id: str
+    knowledge_base_version_id: str
+    source_model: Optional[EmbeddingModel] = None  # None when the versions use several models
+    target_provider: EmbeddingProvider
+    target_model: EmbeddingModel
+    status: MigrationStatus = MigrationStatus.PENDING
+    dual_read: bool = True  # Shadow searches on the new embeddings once they are ready
+    auto_cutover: bool = False
+    document_version_ids: List[str] = Field(default_factory=list)
+    migrated_version_ids: List[str] = Field(default_factory=list)
+    total_chunks: int = 0
+    embedded_chunks: int = 0
+    reused_chunks: int = 0  # Chunks whose new embedding came from an earlier version
+    progress: float = 0.0  # 0-100
+    estimated_tokens: int = 0
+    estimated_cost_usd: float = 0.0
+    tokens_used: int = 0
+    cost_usd: float = 0.0
+    dual_read_queries: int = 0
+    dual_read_overlap: Optional[float] = None  # Mean share of top results both embeddings agree on
+    error_message: Optional[str] = None
+    created_by: str
+    created_at: datetime = Field(default_factory=datetime.now)
+    updated_at: datetime = Field(default_factory=datetime.now)
+    completed_at: Optional[datetime] = None
+
+
+class CollectedItem(BaseModel):
+    # A collected document version, or artifacts or files left without a document version record
+    kind: Literal["document_version", "artifacts", "files"]
+    id: str  # Document version ID
+    document_id: Optional[str] = None
+    archived_at: Optional[datetime] = None
+    record_bytes: int = 0
+    file_bytes: int = 0
+    artifact_bytes: int = 0
+
+
+class GarbageCollection(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    dry_run: bool = False  # List what would be removed without removing it
+    retention_days: float  # Archived versions are kept at least this long
+    status: CollectionStatus = CollectionStatus.RUNNING
+    phase: Literal["mark", "sweep", "orphans", "done"] = "mark"
+    referenced_versions: int = 0  # Document versions some knowledge base version references
+    scanned_versions: int = 0  # Archived document versions examined
+    retained_versions: int = 0  # Unreferenced, but archived more recently than the retention window
+    collected: List[CollectedItem] = Field(default_factory=list)
+    collected_count: int = 0
+    reclaimed_bytes: int = 0  # Bytes that would be reclaimed in a dry run
+    slices: int = 0
+    max_slice_ms: float = 0.0
+    error_message: Optional[str] = None
+    started_at: datetime = Field(default_factory=datetime.now)
+    completed_at: Optional[datetime] = None
+
+
 # Response models
 class ProjectList(BaseModel):
     projects: List[Project]
@@ -207,10 +331,90 @@ class DocumentVersionList(BaseModel):
     document_versions: List[DocumentVersion]
 
 
+class Chunk(BaseModel):
+    index: int
+    hash: str  # Content hash, used to match unchanged chunks across versions
+    start: int  # Byte offsets into the cleaned text of the version
+    end: int
+    text: str
+    duplicate_of: Optional[str] = None  # "<document_version_id>:<index>" of a near-identical chunk in another document
+
+
+class ChunkList(BaseModel):
+    chunks: List[Chunk]
+
+
+class NearDuplicate(BaseModel):
+    document_id: str
+    document_version_id: str
+    duplicate_of_document_id: str
+    similarity: float
+    duplicate_chunk_count: int = 0
+
+
+class NearDuplicateList(BaseModel):
+    duplicates: List[NearDuplicate]
+
+
+class SearchResult(BaseModel):
+    knowledge_base_id: str
+    knowledge_base_version_id: str
+    document_id: str
+    document_version_id: str
+    chunk_index: int
+    score: float  # Cosine similarity to the query
+    cross_score: Optional[float] = None  # Score of the cross-scorer, when one re-ranked the results
+    text: str
+    start: int
+    end: int
+
+
+class KnowledgeBaseSearchStatus(BaseModel):
+    knowledge_base_id: str
+    knowledge_base_version_id: Optional[str] = None  # Primary version searched
+    status: Literal["ok", "no_primary_version", "excluded", "timeout", "error"]
+    filter_strategy: Optional[str] = None  # "prefilter", "postfilter" or "masked" when filters were applied
+    result_count: int = 0
+    duration_ms: float = 0.0
+    error_message: Optional[str] = None
+
+
+class RerankStats(BaseModel):
+    candidates: int = 0  # Candidates re-ranked
+    cross_scored: int = 0  # Candidates the cross-scorer scored within the budget
+    budget_exhausted: bool = False  # Re-ranking was cut short by the latency budget
+    duration_ms: float = 0.0
+
+
+class SearchResponse(BaseModel):
+    query: str
+    results: List[SearchResult]
+    knowledge_bases: List[KnowledgeBaseSearchStatus]
+    partial: bool = False  # Some knowledge bases timed out or failed
+    rerank: Optional[RerankStats] = None
+    duration_ms: float = 0.0
+
+
 class KnowledgeBaseVersionList(BaseModel):
     versions: List[KnowledgeBaseVersion]
 
 
+class BundleInfo(BaseModel):
+    knowledge_base_id: str
+    knowledge_base_version_id: str
+    version_number: str
+    embedding_model: Optional[EmbeddingModel] = None
+    document_count: int
+    chunk_count: int
+    size: int
+    checksum: str
+    is_primary: bool = False  # Answers the query node's searches of its knowledge base
+
+
+class BundleList(BaseModel):
+    bundles: List[BundleInfo]
+
+
 class ProcessingStatus(BaseModel):
     document_id: str
     status: DocumentStatus
@@ -219,9 +423,157 @@ class ProcessingStatus(BaseModel):
     error_message: Optional[str] = None
 
 
+class ProgressEvent(BaseModel):
+    document_id: str
+    document_version_id: str
+    knowledge_base_id: Optional[str] = None
+    project_id: Optional[str] = None
+    status: DocumentStatus
+    processing_stage: Optional[ProcessingStage] = None
+    processing_progress: float = 0.0
+    error_message: Optional[str] = None
+    queue_position: Optional[int] = None  # Jobs starting before this one, while pending
+    estimated_wait_seconds: Optional[float] = None
+    timestamp: datetime = Field(default_factory=datetime.now)
+
+
+class QueueStatus(BaseModel):
+    document_version_id: str
+    project_id: str
+    priority: JobPriority
+    queue_position: int  # Jobs expected to start before this one
+    estimated_wait_seconds: Optional[float] = None  # None until a job has finished
+    enqueued_at: datetime
+
+
+class ProjectQueueStats(BaseModel):
+    project_id: str
+    pending: Dict[JobPriority, int]
+    running: int
+    weight: float
+    max_concurrent_jobs: int
+
+
+class ProcessingQueueStats(BaseModel):
+    workers: int
+    interactive_reserved_workers: int
+    busy_workers: int
+    pending: Dict[JobPriority, int]
+    mean_job_seconds: Optional[float] = None
+    projects: List[ProjectQueueStats]
+
+
+class ProjectProcessingSettings(BaseModel):
+    processing_weight: float = Field(1.0, gt=0)
+    max_concurrent_jobs: Optional[int] = Field(None, ge=1)
+
+
+class StageEvent(BaseModel):
+    document_id: str
+    document_version_id: str
+    knowledge_base_id: Optional[str] = None
+    stage: ProcessingStage
+    started_at: datetime
+    duration_seconds: float
+    bytes_in: int = 0
+    bytes_out: int = 0
+    chunk_count: int = 0
+    embedding_count: int = 0
+    succeeded: bool = True
+    error_message: Optional[str] = None
+
+
+class StageSummary(BaseModel):
+    stage: ProcessingStage
+    executions: int = 0
+    failures: int = 0
+    total_seconds: float = 0.0
+    mean_seconds: float = 0.0
+    p50_seconds: float = 0.0
+    p95_seconds: float = 0.0
+    p99_seconds: float = 0.0
+    max_seconds: float = 0.0
+    bytes_in: int = 0
+    bytes_out: int = 0
+    chunk_count: int = 0
+    embedding_count: int = 0
+    # Buckets are upper bounds in seconds; counts are not cumulative
+    histogram: Dict[str, int] = {}
+
+
+class QueueWaitSummary(BaseModel):
+    jobs: int = 0
+    mean_seconds: float = 0.0
+    p50_seconds: float = 0.0
+    p95_seconds: float = 0.0
+    max_seconds: float = 0.0
+
+
+class KnowledgeBaseThroughput(BaseModel):
+    knowledge_base_id: str
+    window_seconds: float
+    documents_completed: int = 0
+    chunks_produced: int = 0
+    documents_per_minute: float = 0.0
+    chunks_per_second: float = 0.0
+    queue_wait: QueueWaitSummary = Field(default_factory=QueueWaitSummary)
+
+
+class PipelineTelemetry(BaseModel):
+    window_seconds: float
+    stages: List[StageSummary]
+    queue_wait: QueueWaitSummary
+    throughput: List[KnowledgeBaseThroughput]
+    # Stage with the largest total time in the window
+    bottleneck_stage: Optional[ProcessingStage] = None
+    generated_at: datetime = Field(default_factory=datetime.now)
+
+
+class ProfileMode(str, Enum):
+    CPROFILE = "cprofile"
+    SAMPLING = "sampling"
+
+
+class ProfileInfo(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    # What was profiled: "request", "job" or "threads"
+    target: str
+    mode: ProfileMode
+    label: str
+    started_at: datetime = Field(default_factory=datetime.now)
+    duration_seconds: float = 0.0
+    # Stack samples taken by the sampling profiler
+    sample_count: int = 0
+    file_name: Optional[str] = None
+    file_size: int = 0
+
+
 class CreateKnowledgeBaseRequest(BaseModel):
     name: str
     description: Optional[str] = None
+    skip_duplicate_embeddings: bool = False
+
+
+class CreateEmbeddingMigrationRequest(BaseModel):
+    target_model: EmbeddingModel
+    target_provider: Optional[EmbeddingProvider] = None  # The model's provider by default
+    knowledge_base_version_id: Optional[str] = None  # The primary version by default
+    dual_read: bool = True
+    auto_cutover: bool = False
+    start: bool = True  # False to only get the estimate until the migration is resumed
+
+
+class EmbeddingMigrationList(BaseModel):
+    migrations: List[EmbeddingMigration]
+
+
+class StartGarbageCollectionRequest(BaseModel):
+    dry_run: bool = False
+    retention_days: float = Field(30, ge=0)
+
+
+class GarbageCollectionList(BaseModel):
+    collections: List[GarbageCollection]
 
 
 class CreateProjectRequest(BaseModel):
@@ -263,6 +615,12 @@ class CreateDocumentFromUrlRequest(BaseModel):
     description: Optional[str] = None
 
 
+class BulkUrlItem(BaseModel):
+    url: str
+    name: Optional[str] = None
+    description: Optional[str] = None
+
+
 class CreateDocumentVersionFromUrlRequest(BaseModel):
     url: str
     change_description: Optional[str] = None
@@ -272,6 +630,38 @@ class ArchiveVersionRequest(BaseModel):
     reason: str
 
 
+class SearchFilter(BaseModel):
+    """Restricts results to chunks matching every given field; list fields match any of their values."""
+    document_ids: Optional[List[str]] = None
+    document_names: Optional[List[str]] = None
+    created_after: Optional[datetime] = None  # Creation time of the document version
+    created_before: Optional[datetime] = None
+    chunking_methods: Optional[List[ChunkingMethod]] = None
+    access_levels: Optional[List[Literal["private", "protected", "public"]]] = None  # Of the knowledge base version
+
+
+class RerankOptions(BaseModel):
+    candidates: int = Field(200, ge=1, le=1000)  # Candidates retrieved for re-ranking
+    mmr_lambda: float = Field(0.7, ge=0, le=1)  # 1 ranks by relevance only, 0 by diversity only
+    max_per_document: Optional[int] = Field(None, ge=1)
+    cross_scorer: Optional[str] = None  # Name of a registered cross-scorer, e.g. "lexical"
+    cross_weight: float = Field(0.5, ge=0, le=1)  # Share of the cross score in the relevance
+    budget_ms: float = Field(20.0, gt=0, le=10000)
+
+
+class SearchRequest(BaseModel):
+    query: str
+    top_k: int = Field(10, ge=1, le=100)
+    collapse_duplicates: bool = True  # Leave out chunks that nearly duplicate a better result
+    filters: Optional[SearchFilter] = None
+    rerank: Optional[RerankOptions] = None  # Diversify with MMR, cap results per document, cross-score
+
+
+class ProjectSearchRequest(SearchRequest):
+    knowledge_base_ids: Optional[List[str]] = None  # Defaults to every knowledge base of the project
+    timeout_seconds: float = Field(2.0, gt=0, le=30)  # Knowledge bases slower than this are left out
+
+
 class DocumentBase(BaseModel):
     name: str
     description: str | None = None
@@ -0,0 +1,271 @@
+"""
+Document processing stages
+
+The stages turn a version's file (or source URL) into cleaned text, chunks
+and embeddings. Text is extracted by the extractor of the file's MIME type
+(see backend/extractors.py), cleaned and written to the version's text
+artifact as it arrives, and the chunker reads it back block by block, so a
+large document is never held in memory as a whole. A new version is diffed against the previous completed
+version of the same document: chunk boundaries are content-defined, so
+chunks outside the edited regions hash the same as before and keep their
+embeddings, and only the changed chunks are embedded again.
+"""
+
+import io
+import re
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from .models import Chunk, DocumentVersion, DocumentStatus, EmbeddingModel
+from .storage import storage
+from .artifacts import artifact_store
+from .chunking import chunk_hash, iter_spans, whitespace_count
+from .embeddings import EMBEDDING_DIMENSIONS
+from .embedding_dispatch import embedding_dispatcher
+from .extractors import ExtractionError, detect_mime_type, extract_segments, get_extractor
+
+DEFAULT_CHUNK_SIZE = 1000
+DEFAULT_CHUNK_OVERLAP = 200
+
+DOWNLOAD_TIMEOUT_SECONDS = 30
+MAX_DOWNLOAD_BYTES = 100 * 1024 * 1024
+# Schemes a source URL may use; file:, ftp: and the like would read local
+# files or reach other services on the server's behalf
+SOURCE_URL_SCHEMES = ("http", "https")
+
+# Bytes of cleaned text the chunker reads at a time
+CHUNK_READ_SIZE = 1024 * 1024
+
+# Settings a new version takes over from the version before it
+INHERITED_SETTINGS = ("chunking_method", "embedding_provider", "embedding_model", "chunk_size", "chunk_overlap")
+
+_HORIZONTAL_SPACE = re.compile(r"[ \t\f\v ]+")
+
+
+class ProcessingError(Exception):
+    """A version's content could not be processed"""
+
+
+def check_source_url(url: str) -> str:
+    """Return ``url`` if it may be downloaded. Raises ValueError for other schemes."""
+    parsed = urllib.parse.urlparse(url)
+    if parsed.scheme.lower() not in SOURCE_URL_SCHEMES or not parsed.netloc:
+        raise ValueError(f"Only http and https URLs can be ingested: {url}")
+    return url
+
+
+class _SourceRedirectHandler(urllib.request.HTTPRedirectHandler):
+    # The default handler also follows redirects to ftp:
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        check_source_url(newurl)
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+
+_opener = urllib.request.build_opener(_SourceRedirectHandler)
+
+
+def previous_completed_version(version: DocumentVersion) -> Optional[DocumentVersion]:
+    """Latest completed version of the same document created before this one."""
+    candidates = [
+        v for v in storage.get_document_versions_by_document(version.document_id, include_archived=True)
+        if v.id != version.id and v.status == DocumentStatus.COMPLETED and v.created_at <= version.created_at
+    ]
+    return max(candidates, key=lambda v: v.created_at, default=None)
+
+
+def inherit_settings(version: DocumentVersion, previous: Optional[DocumentVersion]):
+    """Fill unset processing settings from the previous version, then defaults."""
+    if previous:
+        for name in INHERITED_SETTINGS:
+            if getattr(version, name) is None:
+                setattr(version, name, getattr(previous, name))
+    if version.chunk_size is None:
+        version.chunk_size = DEFAULT_CHUNK_SIZE
+    if version.chunk_overlap is None:
+        version.chunk_overlap = DEFAULT_CHUNK_OVERLAP
+
+
+def _content_version(version: DocumentVersion) -> Optional[DocumentVersion]:
+    # A version created without new content reprocesses the latest earlier file
+    if version.file_path or version.source_url:
+        return version
+    earlier = [
+        v for v in storage.get_document_versions_by_document(version.document_id, include_archived=True)
+        if v.id != version.id and v.file_path and v.created_at <= version.created_at
+    ]
+    return max(earlier, key=lambda v: v.created_at, default=None)
+
+
+def download(version: DocumentVersion) -> bytes:
+    """Bytes of the version's content, fetching and keeping its source URL if needed."""
+    source = _content_version(version)
+    if source is None:
+        raise ProcessingError("The version has no file or source URL")
+    if source.file_path:
+        try:
+            return Path(source.file_path).read_bytes()
+        except OSError as e:
+            raise ProcessingError(f"Could not read {source.file_name or source.file_path}: {e}")
+    try:
+        check_source_url(source.source_url)
+        with _opener.open(source.source_url, timeout=DOWNLOAD_TIMEOUT_SECONDS) as response:
+            data = response.read(MAX_DOWNLOAD_BYTES + 1)
+            if not version.mime_type:
+                version.mime_type = response.headers.get_content_type()
+    except (urllib.error.URLError, ValueError, OSError) as e:
+        raise ProcessingError(f"Could not download {source.source_url}: {e}")
+    if len(data) > MAX_DOWNLOAD_BYTES:
+        raise ProcessingError(f"{source.source_url} is larger than {MAX_DOWNLOAD_BYTES} bytes")
+    file_name = Path(urllib.parse.urlparse(source.source_url).path).name or "download"
+    storage.save_version_file(version, file_name, io.BytesIO(data))
+    return data
+
+
+def extract(version: DocumentVersion, data: bytes) -> Iterator[str]:
+    """Text of the version's content in segments, extracted by the extractor of its MIME type.
+
+    Sets the version's ``mime_type`` from the declared type, file name or content.
+    """
+    version.mime_type = detect_mime_type(data, version.file_name, version.mime_type)
+    try:
+        extractor = get_extractor(version.mime_type)
+    except ExtractionError as e:
+        raise ProcessingError(str(e))
+    return _processing_errors(extract_segments(data, extractor))
+
+
+def _processing_errors(segments: Iterator[str]) -> Iterator[str]:
+    try:
+        yield from segments
+    except ExtractionError as e:
+        raise ProcessingError(str(e))
+
+
+class TextCleaner:
+    """Normalise line endings and collapse runs of spaces and blank lines.
+
+    Text is fed in pieces; ``feed`` returns the cleaned text of the lines
+    completed so far and ``close`` the rest.
+    """
+
+    def __init__(self):
+        self._partial = ""
+        self._started = False
+        self._blank = False
+
+    def feed(self, text: str) -> str:
+        text = self._partial + text
+        # A trailing "\r" may be the first half of a "\r\n"
+        held = "\r" if text.endswith("\r") else ""
+        lines = text[:len(text) - len(held)].replace("\r\n", "\n").replace("\r", "\n").split("\n")
+        self._partial = lines.pop() + held
+        return self._clean_lines(lines)
+
+    def close(self) -> str:
+        lines = self._partial.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+        self._partial = ""
+        return self._clean_lines(lines)
+
+    def _clean_lines(self, lines: List[str]) -> str:
+        out = []
+        for line in lines:
+            line = _HORIZONTAL_SPACE.sub(" ", line).strip()
+            if not line:
+                self._blank = self._started
+                continue
+            if self._started:
+                out.append("\n\n" if self._blank else "\n")
+            out.append(line)
+            self._started = True
+            self._blank = False
+        return "".join(out)
+
+
+def clean(text: str) -> str:
+    cleaner = TextCleaner()
+    return cleaner.feed(text) + cleaner.close()
+
+
+def write_clean_text(version_id: str, segments: Iterable[str]) -> Tuple[int, float]:
+    """Clean text as it is extracted and stream it into the version's text artifact.
+
+    Returns the bytes written and the seconds spent waiting for segments.
+    """
+    cleaner = TextCleaner()
+    written = 0
+    waited = 0.0
+    segments = iter(segments)
+    with artifact_store.text_writer(version_id) as f:
+        while True:
+            start = time.perf_counter()
+            segment = next(segments, None)
+            waited += time.perf_counter() - start
+            if segment is None:
+                break
+            written += f.write(cleaner.feed(segment).encode("utf-8"))
+        written += f.write(cleaner.close().encode("utf-8"))
+    return written, waited
+
+
+def chunk_text(version_id: str, chunk_size: int, chunk_overlap: int) -> List[Chunk]:
+    """Split the version's cleaned text into content-defined chunks, reading it in blocks."""
+    with artifact_store.open_text(version_id) as f:
+        size = whitespace = 0
+        for block in iter(lambda: f.read(CHUNK_READ_SIZE), b""):
+            size += len(block)
+            whitespace += whitespace_count(block)
+        if not size:
+            return []
+        f.seek(0)
+        spans = iter_spans(iter(lambda: f.read(CHUNK_READ_SIZE), b""), whitespace / size, chunk_size, chunk_overlap)
+        return [
+            Chunk(index=i, hash=chunk_hash(data), start=start, end=end, text=data.decode("utf-8", errors="replace"))
+            for i, (start, end, data) in enumerate(spans)
+        ]
+
+
+def reusable_embeddings(version: DocumentVersion, base: Optional[DocumentVersion],
+                        model: Optional[EmbeddingModel] = None) -> Dict[str, np.ndarray]:
+    """Embeddings of the base version's chunks by chunk hash.
+
+    Vectors are only reusable when they come from the same embedding model:
+    ``model``, the version's own by default. The base version may have them
+    from its own processing or from an embedding migration.
+    """
+    if base is None:
+        return {}
+    table = artifact_store.chunk_table(base.id)
+    vectors = artifact_store.read_embeddings(base.id, model or version.embedding_model)
+    if table is None or vectors is None or len(vectors) != len(table):
+        return {}
+    return dict(zip(table.hashes(), vectors))
+
+
+def embed_changed(chunks: List[Chunk], version: DocumentVersion, reusable: Dict[str, np.ndarray],
+                  on_progress: Optional[Callable[[float], None]] = None) -> Tuple[np.ndarray, int]:
+    """Embeddings of all chunks, computing only those without a reusable vector.
+
+    Returns the matrix and the number of reused rows. ``on_progress`` gets the
+    fraction of the new embeddings done after every batch. Requests go
+    through the embedding dispatcher, which batches them within the
+    provider's rate limits.
+    """
+    vectors = np.empty((len(chunks), EMBEDDING_DIMENSIONS), dtype=np.float32)
+    missing = []
+    for c in chunks:
+        vector = reusable.get(c.hash)
+        if vector is None:
+            missing.append(c)
+        else:
+            vectors[c.index] = vector
+    if missing:
+        vectors[[c.index for c in missing]] = embedding_dispatcher.embed(
+            [c.text for c in missing], version.embedding_model, version.embedding_provider, on_progress
+        )
+    return vectors, len(chunks) - len(missing)
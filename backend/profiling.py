@@ -0,0 +1,268 @@
+"""
+On-demand profiling
+
+Profiles are only taken when asked for, so nothing is hooked into the
+interpreter otherwise:
+
+- a single request, with the ``X-Profile`` header or ``?profile=`` query
+  flag set to ``cprofile`` or ``sampling`` (``1`` means cprofile);
+- a single ``process_document`` run, started with a profile mode;
+- every thread for a fixed time, through the admin endpoint.
+
+cProfile runs are saved as ``.pstats`` files (load with ``pstats`` or
+snakeviz); sampling runs as collapsed stacks for flamegraph.pl or
+speedscope. Only the most recent profiles are kept.
+"""
+
+import cProfile
+import functools
+import inspect
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Set
+
+from fastapi.routing import APIRoute
+
+from .models import ProfileInfo, ProfileMode
+
+PROFILE_HEADER = "x-profile"
+PROFILE_QUERY_PARAM = "profile"
+
+# Seconds between stack samples taken by the sampling profiler
+SAMPLING_INTERVAL_SECONDS = 0.005
+
+# Longest whole-process sampling run the admin endpoint accepts
+MAX_SAMPLING_SECONDS = 60.0
+
+# Profiles kept on disk; the oldest are deleted first
+MAX_STORED_PROFILES = 200
+
+_FLAG_MODES = {
+    "1": ProfileMode.CPROFILE, "true": ProfileMode.CPROFILE,
+    ProfileMode.CPROFILE.value: ProfileMode.CPROFILE, ProfileMode.SAMPLING.value: ProfileMode.SAMPLING,
+}
+
+
+class SamplingProfiler:
+    """Periodically records the Python stacks of a set of threads.
+
+    With no ``thread_ids`` every thread but the sampler itself is sampled and
+    each stack is rooted at its thread name.
+    """
+
+    def __init__(self, thread_ids: Optional[Set[int]] = None, interval: float = SAMPLING_INTERVAL_SECONDS):
+        self.thread_ids = thread_ids
+        self.interval = interval
+        self.samples = 0
+        self.stacks: Counter = Counter()
+        self._labels: Dict[object, str] = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _frame_label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = f"{code.co_qualname} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+            self._labels[code] = label
+        return label
+
+    def _run(self):
+        own_id = threading.get_ident()
+        thread_names: Dict[int, str] = {}
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id or (self.thread_ids is not None and thread_id not in self.thread_ids):
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(self._frame_label(frame.f_code))
+                    frame = frame.f_back
+                if self.thread_ids is None:
+                    if thread_id not in thread_names:
+                        thread_names = {t.ident: t.name for t in threading.enumerate()}
+                    stack.append(f"thread:{thread_names.get(thread_id, thread_id)}")
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(self.stacks.items()))
+
+
+class ProfileStore:
+    """Profile files and their metadata under one directory."""
+
+    def __init__(self, directory: str = "backend/data/profiles", max_profiles: int = MAX_STORED_PROFILES):
+        self.directory = Path(directory)
+        self.max_profiles = max_profiles
+        self._lock = threading.Lock()
+
+    def _meta_path(self, profile_id: str) -> Path:
+        return self.directory / f"{profile_id}.json"
+
+    def save(self, info: ProfileInfo, suffix: str, write: Callable[[Path], None]) -> ProfileInfo:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / f"{info.id}{suffix}"
+        write(path)
+        info.file_name = path.name
+        info.file_size = path.stat().st_size
+        with self._lock:
+            self._meta_path(info.id).write_text(info.model_dump_json())
+            self._prune()
+        return info
+
+    def _prune(self):
+        metas = sorted(self.directory.glob("*.json"), key=lambda p: p.stat().st_mtime)
+        for meta in metas[:max(0, len(metas) - self.max_profiles)]:
+            for path in self.directory.glob(f"{meta.stem}.*"):
+                path.unlink(missing_ok=True)
+
+    def list(self) -> List[ProfileInfo]:
+        if not self.directory.exists():
+            return []
+        profiles = []
+        for meta in self.directory.glob("*.json"):
+            try:
+                profiles.append(ProfileInfo(**json.loads(meta.read_text())))
+            except (OSError, ValueError):
+                continue
+        return sorted(profiles, key=lambda p: p.started_at, reverse=True)
+
+    def get(self, profile_id: str) -> Optional[ProfileInfo]:
+        # Ids are generated uuids; anything else cannot name a stored profile
+        if not profile_id.replace("-", "").isalnum():
+            return None
+        try:
+            return ProfileInfo(**json.loads(self._meta_path(profile_id).read_text()))
+        except (OSError, ValueError):
+            return None
+
+    def file_path(self, info: ProfileInfo) -> Optional[Path]:
+        if not info.file_name:
+            return None
+        path = self.directory / info.file_name
+        return path if path.exists() else None
+
+
+# Create a global profile store instance
+profile_store = ProfileStore()
+
+def get_profile_store() -> ProfileStore:
+    return profile_store
+
+
+@contextmanager
+def profiled(mode: ProfileMode, target: str, label: str) -> Iterator[ProfileInfo]:
+    """Profile the current thread for the duration of the block and save the result."""
+    info = ProfileInfo(target=target, mode=mode, label=label)
+    start = time.perf_counter()
+    if mode == ProfileMode.CPROFILE:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    else:
+        sampler = SamplingProfiler({threading.get_ident()})
+        sampler.start()
+    try:
+        yield info
+    finally:
+        info.duration_seconds = time.perf_counter() - start
+        if mode == ProfileMode.CPROFILE:
+            profiler.disable()
+            profile_store.save(info, ".pstats", lambda path: profiler.dump_stats(str(path)))
+        else:
+            sampler.stop()
+            info.sample_count = sampler.samples
+            profile_store.save(info, ".collapsed", lambda path: path.write_text(sampler.collapsed()))
+
+
+def sample_all_threads(seconds: float, interval: float = SAMPLING_INTERVAL_SECONDS) -> ProfileInfo:
+    """Sample every thread for ``seconds`` and save the collapsed stacks."""
+    info = ProfileInfo(target="threads", mode=ProfileMode.SAMPLING, label=f"all threads for {seconds:g}s")
+    sampler = SamplingProfiler(interval=interval)
+    start = time.perf_counter()
+    sampler.start()
+    time.sleep(seconds)
+    sampler.stop()
+    info.duration_seconds = time.perf_counter() - start
+    info.sample_count = sampler.samples
+    return profile_store.save(info, ".collapsed", lambda path: path.write_text(sampler.collapsed()))
+
+
+class _RequestProfile:
+    __slots__ = ("mode", "label", "info")
+
+    def __init__(self, mode: ProfileMode, label: str):
+        self.mode = mode
+        self.label = label
+        self.info: Optional[ProfileInfo] = None
+
+
+# Set by ProfilingRoute for the requests that asked to be profiled. Context
+# variables follow the endpoint into the threadpool.
+_request_profile: ContextVar[Optional[_RequestProfile]] = ContextVar("request_profile", default=None)
+
+
+def _profiled_endpoint(endpoint: Callable) -> Callable:
+    # The endpoint itself is profiled, on whichever thread it runs
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            request_profile = _request_profile.get()
+            if request_profile is None:
+                return await endpoint(*args, **kwargs)
+            with profiled(request_profile.mode, "request", request_profile.label) as info:
+                request_profile.info = info
+                return await endpoint(*args, **kwargs)
+    else:
+        @functools.wraps(endpoint)
+        def wrapper(*args, **kwargs):
+            request_profile = _request_profile.get()
+            if request_profile is None:
+                return endpoint(*args, **kwargs)
+            with profiled(request_profile.mode, "request", request_profile.label) as info:
+                request_profile.info = info
+                return endpoint(*args, **kwargs)
+    return wrapper
+
+
+class ProfilingRoute(APIRoute):
+    """Route that profiles a request when its profile flag is set.
+
+    Unflagged requests pay for one header and one query lookup.
+    """
+
+    def __init__(self, path: str, endpoint: Callable, **kwargs):
+        super().__init__(path, _profiled_endpoint(endpoint), **kwargs)
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def route_handler(request):
+            flag = request.headers.get(PROFILE_HEADER) or request.query_params.get(PROFILE_QUERY_PARAM)
+            mode = _FLAG_MODES.get(flag.lower()) if flag else None
+            if mode is None:
+                return await handler(request)
+            request_profile = _RequestProfile(mode, f"{request.method} {self.path}")
+            token = _request_profile.set(request_profile)
+            try:
+                response = await handler(request)
+            finally:
+                _request_profile.reset(token)
+            if request_profile.info is not None:
+                response.headers["X-Profile-Id"] = request_profile.info.id
+            return response
+
+        return route_handler
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Query node
+
+Serves searches of knowledge bases from bundles (backend/bundles.py) alone,
+without storage or the document versions' artifacts. Bundles copied into the
+node's directory, or downloaded from ``GET /api/kb-versions/{id}/bundle`` of
+the backend, are memory-mapped and verified once when loaded; pages of the
+file are shared with every other process mapping it.
+
+Each knowledge base has one primary bundle that answers its searches: the
+loaded version with the highest version number, until the primary is set
+explicitly. Switching the primary to another loaded bundle is a single
+reference swap, so searches already running finish on the bundle they
+started with and none see a half-loaded index:
+
+    python -m backend.query_node --bundles backend/data/bundles --port 8100
+"""
+
+import argparse
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+import uvicorn
+from fastapi import FastAPI, HTTPException
+
+from backend.bundles import BUNDLE_SUFFIX, BundleError, BundleStore
+from backend.models import BundleInfo, BundleList, KnowledgeBaseSearchStatus, SearchRequest, SearchResponse
+from backend.rerank import CROSS_SCORERS
+from backend.search_index import KnowledgeBaseIndex, access_allowed, search_index
+
+DEFAULT_BUNDLES_DIR = "backend/data/bundles"
+
+logger = logging.getLogger(__name__)
+
+
+def _version_key(index: KnowledgeBaseIndex) -> List[int]:
+    return [int(part) for part in index.kb_version.version_number.split(".")]
+
+
+class QueryNode:
+    def __init__(self, root: Path, verify: bool = True):
+        self.store = BundleStore(root)
+        self.verify = verify
+        self._indexes: Dict[str, KnowledgeBaseIndex] = {}  # By knowledge base version
+        self._primary: Dict[str, KnowledgeBaseIndex] = {}  # By knowledge base
+        # Knowledge bases whose primary was set explicitly; loading others leaves it
+        self._pinned: Set[str] = set()
+        self._lock = threading.Lock()
+
+    def load(self, kb_version_id: str) -> KnowledgeBaseIndex:
+        """Map, verify and index a bundle of the node's directory. Raises KeyError and BundleError."""
+        bundle = self.store.open(kb_version_id, self.verify)
+        if bundle is None:
+            raise KeyError(kb_version_id)
+        index = KnowledgeBaseIndex.from_bundle(bundle)
+        kb_id = index.kb_version.knowledge_base_id
+        with self._lock:
+            self._indexes[kb_version_id] = index
+            current = self._primary.get(kb_id)
+            if kb_id not in self._pinned and (current is None or _version_key(index) > _version_key(current)):
+                self._primary[kb_id] = index
+        return index
+
+    def scan(self) -> List[str]:
+        """Load the bundles of the directory not loaded yet; returns their version ids."""
+        loaded = []
+        for path in sorted(self.store.root.glob(f"*{BUNDLE_SUFFIX}")):
+            kb_version_id = path.name[:-len(BUNDLE_SUFFIX)]
+            if kb_version_id in self._indexes:
+                continue
+            try:
+                self.load(kb_version_id)
+                loaded.append(kb_version_id)
+            except (BundleError, OSError, ValueError) as e:
+                logger.warning("Failed to load bundle %s: %s", path.name, e)
+        return loaded
+
+    def set_primary(self, kb_id: str, kb_version_id: str) -> KnowledgeBaseIndex:
+        """Answer the knowledge base's searches from another bundle, loading it first if needed."""
+        index = self._indexes.get(kb_version_id) or self.load(kb_version_id)
+        if index.kb_version.knowledge_base_id != kb_id:
+            raise ValueError(f"Version {kb_version_id} is not a version of knowledge base {kb_id}")
+        with self._lock:
+            self._pinned.add(kb_id)
+            self._primary[kb_id] = index
+        return index
+
+    def primary(self, kb_id: str) -> Optional[KnowledgeBaseIndex]:
+        return self._primary.get(kb_id)
+
+    def bundles(self) -> List[BundleInfo]:
+        with self._lock:
+            indexes = list(self._indexes.values())
+            primary = {id(index) for index in self._primary.values()}
+        return [
+            BundleInfo(
+                knowledge_base_id=index.kb_version.knowledge_base_id,
+                knowledge_base_version_id=index.kb_version.id,
+                version_number=index.kb_version.version_number,
+                embedding_model=index.bundle.embedding_model,
+                document_count=len(index.bundle.documents),
+                chunk_count=index.bundle.manifest["chunk_count"],
+                size=index.bundle.path.stat().st_size,
+                checksum=index.bundle.checksum,
+                is_primary=id(index) in primary,
+            )
+            for index in indexes
+        ]
+
+
+def create_app(node: QueryNode) -> FastAPI:
+    app = FastAPI(title="Knowledge base query node")
+
+    @app.get("/api/bundles", response_model=BundleList, tags=["Bundles"])
+    def get_bundles():
+        return BundleList(bundles=node.bundles())
+
+    @app.post("/api/bundles", response_model=BundleList, tags=["Bundles"])
+    def scan_bundles():
+        """Load bundles added to the directory since the last scan."""
+        loaded = set(node.scan())
+        return BundleList(bundles=[b for b in node.bundles() if b.knowledge_base_version_id in loaded])
+
+    @app.put("/api/knowledge-bases/{kb_id}/primary/{version_id}", response_model=BundleInfo, tags=["Bundles"])
+    def set_primary(kb_id: str, version_id: str):
+        try:
+            index = node.set_primary(kb_id, version_id)
+        except KeyError:
+            raise HTTPException(status_code=404, detail="Bundle not found")
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except BundleError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        return next(b for b in node.bundles() if b.knowledge_base_version_id == index.kb_version.id)
+
+    @app.post("/api/knowledge-bases/{kb_id}/search", response_model=SearchResponse, tags=["Search"])
+    def search(kb_id: str, request: SearchRequest):
+        # Taken once, so a primary swap during the search does not affect it
+        index = node.primary(kb_id)
+        if index is None:
+            raise HTTPException(status_code=404, detail="No bundle loaded for this Knowledge Base")
+        if request.rerank and request.rerank.cross_scorer and request.rerank.cross_scorer not in CROSS_SCORERS:
+            raise HTTPException(status_code=400, detail=f"Unknown cross scorer {request.rerank.cross_scorer}")
+        start = time.perf_counter()
+        allowed = access_allowed(index.kb_version, request.filters)
+        results, strategy, rerank_stats = [], None, None
+        if allowed:
+            results, strategy, rerank_stats, _ = search_index(
+                index, request.query, request.top_k, request.collapse_duplicates, request.filters, request.rerank
+            )
+        duration_ms = (time.perf_counter() - start) * 1000
+        status = KnowledgeBaseSearchStatus(
+            knowledge_base_id=kb_id, knowledge_base_version_id=index.kb_version.id,
+            status="ok" if allowed else "excluded",
+            filter_strategy=strategy, result_count=len(results), duration_ms=duration_ms,
+        )
+        return SearchResponse(
+            query=request.query, results=results, knowledge_bases=[status], rerank=rerank_stats, duration_ms=duration_ms
+        )
+
+    return app
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bundles", default=DEFAULT_BUNDLES_DIR, help="Directory of the bundles to serve")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--skip-verify", action="store_true",
+                        help="Check only the manifests' checksums when loading bundles, not every section's")
+    args = parser.parse_args(argv)
+    node = QueryNode(Path(args.bundles), verify=not args.skip_verify)
+    loaded = node.scan()
+    print(f"Loaded {len(loaded)} bundles from {args.bundles}")
+    uvicorn.run(create_app(node), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""
+Re-ranking of search candidates
+
+Search takes more candidates than it returns and re-ranks them in up to two
+steps, both within a latency budget:
+
+1. An optional cross-scorer, chosen by name from a registry, scores the
+   query against each candidate's text in batches. Its score is blended
+   with the vector score. Candidates left when the budget runs out keep
+   their vector score. Term statistics of the whole knowledge base (the
+   lexicon of a bundle, see backend/bundles.py) can be passed as the
+   ``corpus``; without them the lexical scorer weighs terms by the
+   candidates.
+2. Maximal marginal relevance picks results one at a time, trading relevance
+   against similarity to the results already picked. It works on a
+   similarity matrix of the candidates computed once with NumPy, and skips
+   documents that have reached the per-document cap. If the budget runs out,
+   the remaining places are filled by relevance.
+
+Candidates embedded with different models have no meaningful similarity,
+so MMR treats them as unrelated.
+"""
+
+import math
+import re
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .models import EmbeddingModel, RerankOptions, RerankStats, SearchResult
+from .embeddings import tokenize
+
+# Candidates passed to a cross-scorer per call
+CROSS_SCORER_BATCH_SIZE = 32
+
+
+class Candidate:
+    """A search result with the vector it was found by."""
+
+    __slots__ = ("result", "vector", "model")
+
+    def __init__(self, result: SearchResult, vector: np.ndarray, model: EmbeddingModel):
+        self.result = result
+        self.vector = vector
+        self.model = model
+
+
+class CrossScorer:
+    """Scores a query against candidate texts; higher is more relevant, in [0, 1]."""
+
+    name = ""
+
+    def prepare(self, query: str, texts: List[str], corpus: Any = None, deadline: float = math.inf) -> Any:
+        """Per-query state passed to ``score``, computed from the candidate texts before the batches.
+
+        ``corpus``, when given, has the ``size`` (chunks) and
+        ``document_frequencies(terms)`` of the knowledge base searched.
+        Texts left unprepared at the ``deadline`` are scored NaN.
+        """
+        return None
+
+    def score(self, query: str, texts: List[str], state: Any) -> np.ndarray:
+        raise NotImplementedError
+
+
+CROSS_SCORERS: Dict[str, CrossScorer] = {}
+
+
+def register_cross_scorer(scorer: CrossScorer) -> CrossScorer:
+    CROSS_SCORERS[scorer.name] = scorer
+    return scorer
+
+
+def _has_term(pattern: "re.Pattern", text: str) -> bool:
+    """Whether ``text`` has the term of ``pattern`` as a whole token (see embeddings.tokenize)."""
+    match = pattern.search(text)
+    while match is not None:
+        start = match.start()
+        # Checked here rather than with a lookbehind, which keeps the regex
+        # engine from skipping ahead to the term's first character
+        if start == 0 or not (text[start - 1].isalnum() or text[start - 1] == "_"):
+            return True
+        match = pattern.search(text, start + 1)
+    return False
+
+
+class LexicalCrossScorer(CrossScorer):
+    """Share of the query's terms found in the text, weighted by their rarity in the corpus or the candidates."""
+
+    name = "lexical"
+
+    def prepare(self, query: str, texts: List[str], corpus: Any = None,
+                deadline: float = math.inf) -> Tuple[Dict[str, float], Dict[str, set]]:
+        terms = set(tokenize(query))
+        # Only the query's terms matter, so texts are searched for them instead of tokenized
+        patterns = {term: re.compile(re.escape(term) + r"(?!\w)") for term in terms}
+        found: Dict[str, set] = {}
+        prepared = 0
+        for text in texts:
+            if time.perf_counter() >= deadline:
+                break
+            lowered = text.lower()
+            found[text] = {term for term, pattern in patterns.items() if _has_term(pattern, lowered)}
+            prepared += 1
+        if corpus is not None:
+            frequency, size = corpus.document_frequencies(terms), corpus.size
+        else:
+            frequency, size = dict.fromkeys(terms, 0), prepared
+            for matched in found.values():
+                for term in matched:
+                    frequency[term] += 1
+        weights = {term: math.log(1 + (size + 1) / (count + 1)) for term, count in frequency.items()}
+        return weights, found
+
+    def score(self, query: str, texts: List[str], state: Tuple[Dict[str, float], Dict[str, set]]) -> np.ndarray:
+        weights, found = state
+        total = sum(weights.values()) or 1.0
+        return np.array([
+            sum(weights[term] for term in found[text]) / total if text in found else np.nan for text in texts
+        ], dtype=np.float32)
+
+
+register_cross_scorer(LexicalCrossScorer())
+
+
+def _cross_scores(query: str, candidates: List[Candidate], scorer: CrossScorer, deadline: float,
+                  corpus: Any = None) -> Tuple[np.ndarray, int]:
+    """Cross scores of the candidates scored before the deadline (NaN for the rest) and their number."""
+    texts = [c.result.text for c in candidates]
+    scores = np.full(len(candidates), np.nan, dtype=np.float32)
+    state = scorer.prepare(query, texts, corpus, deadline)
+    for start in range(0, len(texts), CROSS_SCORER_BATCH_SIZE):
+        if time.perf_counter() >= deadline:
+            break
+        batch = texts[start:start + CROSS_SCORER_BATCH_SIZE]
+        scores[start:start + len(batch)] = scorer.score(query, batch, state)
+    return scores, int(np.count_nonzero(~np.isnan(scores)))
+
+
+def similarity_matrix(candidates: List[Candidate]) -> np.ndarray:
+    """Cosine similarities between candidates; zero between different embedding models."""
+    vectors = np.stack([c.vector for c in candidates])
+    similarities = vectors @ vectors.T
+    models = [c.model for c in candidates]
+    if len(set(models)) > 1:
+        codes = np.unique(np.array([m.value for m in models]), return_inverse=True)[1]
+        similarities[codes[:, None] != codes[None, :]] = 0.0
+    return similarities
+
+
+def mmr(relevance: np.ndarray, similarities: np.ndarray, k: int, lambda_: float,
+        groups: Optional[np.ndarray] = None, max_per_group: Optional[int] = None,
+        deadline: float = math.inf) -> Tuple[List[int], bool]:
+    """Indexes picked by maximal marginal relevance, and whether the deadline cut it short.
+
+    ``groups`` (one integer per candidate) with ``max_per_group`` caps the
+    picks per group. Past the deadline the rest is filled by relevance.
+    """
+    n = len(relevance)
+    available = np.ones(n, dtype=bool)
+    # Highest similarity of each candidate to anything picked so far
+    redundancy = np.zeros(n, dtype=np.float32)
+    picked: List[int] = []
+    counts = np.zeros(int(groups.max()) + 1 if groups is not None and n else 0, dtype=np.int64)
+    cut_short = False
+    while len(picked) < k and available.any():
+        if time.perf_counter() >= deadline:
+            cut_short = True
+            break
+        marginal = lambda_ * relevance - (1 - lambda_) * redundancy
+        best = int(np.argmax(np.where(available, marginal, -np.inf)))
+        picked.append(best)
+        available[best] = False
+        np.maximum(redundancy, similarities[best], out=redundancy)
+        if groups is not None and max_per_group is not None:
+            counts[groups[best]] += 1
+            if counts[groups[best]] >= max_per_group:
+                available &= groups != groups[best]
+    if cut_short:
+        for index in np.argsort(-relevance, kind="stable"):
+            if len(picked) >= k:
+                break
+            if available[index]:
+                picked.append(int(index))
+                available[index] = False
+                if groups is not None and max_per_group is not None:
+                    counts[groups[index]] += 1
+                    if counts[groups[index]] >= max_per_group:
+                        available &= groups != groups[index]
+    return picked, cut_short
+
+
+def rerank(query: str, candidates: List[Candidate], top_k: int, options: RerankOptions, corpus: Any = None
+           ) -> Tuple[List[Candidate], RerankStats]:
+    """The best ``top_k`` candidates after cross-scoring, MMR and per-document caps."""
+    start = time.perf_counter()
+    deadline = start + options.budget_ms / 1000
+    stats = RerankStats(candidates=len(candidates))
+    if not candidates:
+        return [], stats
+
+    relevance = np.array([c.result.score for c in candidates], dtype=np.float32)
+    if options.cross_scorer:
+        scorer = CROSS_SCORERS.get(options.cross_scorer)
+        if scorer is None:
+            raise ValueError(f"Unknown cross scorer {options.cross_scorer}")
+        cross, stats.cross_scored = _cross_scores(query, candidates, scorer, deadline, corpus)
+        scored = ~np.isnan(cross)
+        relevance = np.where(
+            scored, (1 - options.cross_weight) * relevance + options.cross_weight * np.nan_to_num(cross), relevance
+        )
+        for candidate, value, has_score in zip(candidates, cross, scored):
+            if has_score:
+                candidate.result.cross_score = float(value)
+        stats.budget_exhausted = stats.cross_scored < len(candidates)
+
+    document_ids = [c.result.document_id for c in candidates]
+    groups = np.unique(np.array(document_ids), return_inverse=True)[1]
+    picked, cut_short = mmr(
+        relevance, similarity_matrix(candidates), top_k, options.mmr_lambda, groups, options.max_per_document,
+        deadline,
+    )
+    stats.budget_exhausted = stats.budget_exhausted or cut_short
+    stats.duration_ms = (time.perf_counter() - start) * 1000
+    return [candidates[i] for i in picked], stats
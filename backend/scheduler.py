@@ -0,0 +1,234 @@
+"""
+Scheduling of document processing jobs
+
+Documents are processed on a fixed pool of PROCESSING_WORKERS threads. Each
+job has a priority class: interactive uploads start before bulk imports,
+which start before re-index jobs. INTERACTIVE_RESERVED_WORKERS of the
+workers only take interactive jobs, so a single upload never waits behind a
+pool full of bulk work.
+
+Within a class, projects share the workers by weighted fair queuing. Every
+project has a virtual time that advances by 1 / weight for every job it
+starts, and the next job comes from the project with the earliest virtual
+time among those below their concurrency cap. A project that was idle
+resumes at the current virtual time, so it cannot save up a burst. A
+project's weight and cap come from its ``processing_weight`` and
+``max_concurrent_jobs`` (PROJECT_CONCURRENCY by default).
+
+The queue position of a pending job follows from the same virtual times:
+the jobs of higher classes, the jobs ahead of it in its project, and the
+jobs of other projects whose virtual start time comes earlier. The
+estimated wait turns the position into seconds with the mean duration of
+recent jobs.
+"""
+
+import logging
+import math
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Callable, Deque, Dict, List, Optional
+
+from .metrics import registry
+from .models import JobPriority, ProcessingQueueStats, ProjectQueueStats, QueueStatus
+
+logger = logging.getLogger(__name__)
+
+PROCESSING_WORKERS = 8
+INTERACTIVE_RESERVED_WORKERS = 1
+# Jobs of one project running at the same time, unless the project sets its own cap
+PROJECT_CONCURRENCY = 4
+# Weight of the latest job in the mean job duration
+DURATION_SMOOTHING = 0.2
+
+PRIORITIES = list(JobPriority)
+
+SCHEDULER_PENDING = registry.gauge(
+    "kb_processing_jobs_pending", "Processing jobs waiting for a worker", ("priority",))
+
+
+@dataclass(eq=False)
+class Job:
+    version_id: str
+    project_id: str
+    priority: JobPriority
+    run: Callable[[], None]
+    enqueued_at: float = field(default_factory=time.time)
+
+
+class _ProjectState:
+    __slots__ = ("queues", "running", "vtime", "weight", "cap")
+
+    def __init__(self, weight: float, cap: int):
+        self.queues: Dict[JobPriority, Deque[Job]] = {priority: deque() for priority in PRIORITIES}
+        self.running = 0
+        self.vtime = 0.0
+        self.weight = weight
+        self.cap = cap
+
+    def idle(self) -> bool:
+        return self.running == 0 and not any(self.queues.values())
+
+
+class ProcessingScheduler:
+    def __init__(self, workers: int = PROCESSING_WORKERS, reserved: int = INTERACTIVE_RESERVED_WORKERS,
+                 project_concurrency: int = PROJECT_CONCURRENCY):
+        self.workers = workers
+        self.reserved = min(reserved, workers - 1)
+        self.project_concurrency = project_concurrency
+        self._cond = threading.Condition()
+        self._projects: Dict[str, _ProjectState] = {}
+        self._pending: Dict[str, Job] = {}
+        self._running: Dict[str, Job] = {}
+        self._background_running = 0
+        # Virtual time of the latest job started; idle projects resume from here
+        self._vclock = 0.0
+        self._mean_duration: Optional[float] = None
+        self._threads: List[threading.Thread] = []
+        self._pending_gauges = {priority: SCHEDULER_PENDING.labels(priority.value) for priority in PRIORITIES}
+
+    def _start_workers(self):
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._work, name=f"processing-{len(self._threads)}", daemon=True)
+            self._threads.append(thread)
+            thread.start()
+
+    def _project(self, project_id: str) -> _ProjectState:
+        state = self._projects.get(project_id)
+        if state is None:
+            state = self._projects[project_id] = _ProjectState(1.0, self.project_concurrency)
+        return state
+
+    def configure_project(self, project_id: str, weight: float = 1.0, max_concurrent_jobs: Optional[int] = None):
+        """Apply changed project settings to its queued jobs."""
+        with self._cond:
+            state = self._projects.get(project_id)
+            if state is None:
+                return
+            state.weight = weight
+            state.cap = max_concurrent_jobs or self.project_concurrency
+            self._cond.notify_all()
+
+    def submit(self, job: Job, weight: float = 1.0, max_concurrent_jobs: Optional[int] = None) -> bool:
+        """Queue a job; False if its version is already queued or running."""
+        with self._cond:
+            if job.version_id in self._pending or job.version_id in self._running:
+                return False
+            self._start_workers()
+            state = self._project(job.project_id)
+            state.weight = weight
+            state.cap = max_concurrent_jobs or self.project_concurrency
+            if state.idle():
+                state.vtime = max(state.vtime, self._vclock)
+            state.queues[job.priority].append(job)
+            self._pending[job.version_id] = job
+            self._pending_gauges[job.priority].inc()
+            self._cond.notify()
+            return True
+
+    def _next_job(self) -> Optional[Job]:
+        for priority in PRIORITIES:
+            if priority != JobPriority.INTERACTIVE and self._background_running >= self.workers - self.reserved:
+                return None
+            best = None
+            for state in self._projects.values():
+                if state.queues[priority] and state.running < state.cap and (best is None or state.vtime < best.vtime):
+                    best = state
+            if best is not None:
+                job = best.queues[priority].popleft()
+                self._vclock = max(self._vclock, best.vtime)
+                best.vtime += 1 / best.weight
+                best.running += 1
+                if priority != JobPriority.INTERACTIVE:
+                    self._background_running += 1
+                del self._pending[job.version_id]
+                self._running[job.version_id] = job
+                self._pending_gauges[priority].dec()
+                return job
+        return None
+
+    def _work(self):
+        while True:
+            with self._cond:
+                job = self._next_job()
+                while job is None:
+                    self._cond.wait()
+                    job = self._next_job()
+            start = time.perf_counter()
+            try:
+                job.run()
+            except Exception:
+                logger.exception("Processing job for version %s failed", job.version_id)
+            duration = time.perf_counter() - start
+            with self._cond:
+                del self._running[job.version_id]
+                state = self._projects[job.project_id]
+                state.running -= 1
+                if job.priority != JobPriority.INTERACTIVE:
+                    self._background_running -= 1
+                if self._mean_duration is None:
+                    self._mean_duration = duration
+                else:
+                    self._mean_duration += DURATION_SMOOTHING * (duration - self._mean_duration)
+                if state.idle():
+                    del self._projects[job.project_id]
+                self._cond.notify_all()
+
+    def queue_status(self, version_id: str) -> Optional[QueueStatus]:
+        """Position and estimated wait of a pending job; None unless it is pending."""
+        with self._cond:
+            job = self._pending.get(version_id)
+            if job is None:
+                return None
+            own = self._projects[job.project_id]
+            queue = own.queues[job.priority]
+            ahead_in_project = queue.index(job)
+            position = ahead_in_project
+            start_vtime = own.vtime + ahead_in_project / own.weight
+            for state in self._projects.values():
+                for priority in PRIORITIES[:PRIORITIES.index(job.priority)]:
+                    position += len(state.queues[priority])
+                if state is not own:
+                    earlier = math.ceil((start_vtime - state.vtime) * state.weight)
+                    position += min(max(earlier, 0), len(state.queues[job.priority]))
+            wait = None
+            if self._mean_duration is not None:
+                workers = self.workers if job.priority == JobPriority.INTERACTIVE else self.workers - self.reserved
+                # Bounded by the workers overall and by the project's own cap
+                rounds = max((position + 1) / workers, (ahead_in_project + 1) / own.cap)
+                wait = rounds * self._mean_duration
+            return QueueStatus(
+                document_version_id=version_id,
+                project_id=job.project_id,
+                priority=job.priority,
+                queue_position=position,
+                estimated_wait_seconds=wait,
+                enqueued_at=datetime.fromtimestamp(job.enqueued_at),
+            )
+
+    def stats(self) -> ProcessingQueueStats:
+        with self._cond:
+            return ProcessingQueueStats(
+                workers=self.workers,
+                interactive_reserved_workers=self.reserved,
+                busy_workers=len(self._running),
+                pending={priority: sum(len(s.queues[priority]) for s in self._projects.values())
+                         for priority in PRIORITIES},
+                mean_job_seconds=self._mean_duration,
+                projects=[
+                    ProjectQueueStats(
+                        project_id=project_id,
+                        pending={priority: len(queue) for priority, queue in state.queues.items()},
+                        running=state.running,
+                        weight=state.weight,
+                        max_concurrent_jobs=state.cap,
+                    )
+                    for project_id, state in self._projects.items()
+                ],
+            )
+
+
+# Create a global processing scheduler instance
+processing_scheduler = ProcessingScheduler()
@@ -0,0 +1,387 @@
+"""
+Vector search over knowledge bases
+
+A knowledge base is searched through its primary version. The version's
+index (backend/search_index.py) is cached by knowledge base version and
+model, with the document versions that had finished processing when it was
+built: a version published before its documents are processed is indexed
+again as they complete, and once all of them have, its index no longer
+changes until an embedding migration switches it to another model.
+
+Published versions are exported as bundles (backend/bundles.py): one
+immutable, checksummed file with the version's chunk tables, embeddings,
+text and lexical index. A bundle is current while it was exported for the
+version's model and for the document versions that have completed since;
+a version with a current bundle is loaded by mapping that one file instead
+of reading the artifacts of each document version, the others are loaded
+from their artifacts. When a document version completes, the bundles of the
+published versions referencing it are exported again. Bundles are also what
+query nodes (backend/query_node.py) serve.
+
+Results can be re-ranked for diversity and with a cross-scorer; see
+backend/rerank.py.
+
+While an embedding migration waits for its cutover, searches of its
+knowledge base version are repeated in the background on the new
+embeddings (dual reads) and the overlap of the two result lists is reported
+to the migration; see backend/embedding_migrations.py. The answer always
+comes from the current embeddings.
+
+Project search runs the search of every knowledge base of the project on a
+bounded pool and merges their top-k lists with a heap. Knowledge bases that
+have not answered when the timeout expires are reported and left out, so a
+slow index costs at most the timeout instead of holding up the request.
+"""
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .models import (
+    DocumentStatus, DocumentVersion, EmbeddingModel, KnowledgeBase, KnowledgeBaseSearchStatus,
+    KnowledgeBaseVersion, RerankOptions, RerankStats, SearchFilter, SearchResult, VersionStatus,
+)
+from .storage import storage
+from .artifacts import artifact_store
+from .bundles import Bundle, BundleEntry, BundleError, BundleStore, write_bundle
+from .search_index import KnowledgeBaseIndex, access_allowed, finish, search_index
+from .rerank import Candidate
+from .embeddings import DEFAULT_EMBEDDING_MODEL
+from .metrics import registry
+
+# Knowledge bases searched at the same time, across all requests
+SEARCH_WORKERS = 8
+
+# Knowledge base version indexes kept in memory
+SEARCH_INDEX_CACHE_SIZE = 32
+
+DEFAULT_TOP_K = 10
+KB_SEARCH_TIMEOUT_SECONDS = 2.0
+
+# Dual reads waiting to run; further ones are dropped rather than queued
+DUAL_READ_BACKLOG = 4
+
+SEARCH_DURATION = registry.histogram("kb_search_duration_seconds", "Search latency", ("scope",))
+SEARCH_KB_TIMEOUTS = registry.counter(
+    "kb_search_kb_timeouts_total", "Knowledge bases left out of project searches for not answering in time")
+SEARCH_INDEX_LOADS = registry.counter(
+    "kb_search_index_loads_total", "Knowledge base version indexes loaded from artifacts or bundles")
+SEARCH_DUAL_READS = registry.counter(
+    "kb_search_dual_reads_total", "Background searches on migrated embeddings (compared, dropped, failed)",
+    ("outcome",))
+BUNDLE_EXPORT_DURATION = registry.histogram(
+    "kb_bundle_export_duration_seconds", "Time spent writing knowledge base version bundles")
+
+logger = logging.getLogger(__name__)
+
+# Create a global bundle store instance
+bundle_store = BundleStore(storage.data_dir / "bundles")
+
+
+def completed_version_ids(kb_version: KnowledgeBaseVersion) -> List[str]:
+    """Ids of the version's document versions that have finished processing, in order."""
+    completed = []
+    for version_id in kb_version.document_version_ids:
+        version = storage.get_document_version_by_id(version_id)
+        if version is not None and version.status == DocumentStatus.COMPLETED:
+            completed.append(version_id)
+    return completed
+
+
+def indexed_entries(kb_version: KnowledgeBaseVersion,
+                    embedding_model: Optional[EmbeddingModel] = None) -> List[BundleEntry]:
+    """The version's completed document versions with their chunk tables and embeddings.
+
+    Document versions that have embeddings of ``embedding_model`` (the
+    version's ``embedding_model`` by default) come with those, the others
+    with the model they were processed with.
+    """
+    target = embedding_model or kb_version.embedding_model
+    entries = []
+    for version_id in kb_version.document_version_ids:
+        version = storage.get_document_version_by_id(version_id)
+        if version is None or version.status != DocumentStatus.COMPLETED:
+            continue
+        model = version.embedding_model or DEFAULT_EMBEDDING_MODEL
+        table = artifact_store.chunk_table(version_id)
+        vectors = None
+        if target is not None and target != model:
+            vectors = artifact_store.read_embeddings(version_id, target)
+            if vectors is not None:
+                model = target
+        if vectors is None:
+            vectors = artifact_store.read_embeddings(version_id, model)
+        if not table or vectors is None or len(vectors) != len(table):
+            continue
+        document = storage.get_document_by_id(version.document_id)
+        entries.append(BundleEntry(version, document.name if document else None, model, table, vectors))
+    return entries
+
+
+def _open_bundle(kb_version: KnowledgeBaseVersion, embedding_model: Optional[EmbeddingModel]) -> Optional[Bundle]:
+    """The version's bundle if it was exported for the same model and completed document versions."""
+    try:
+        bundle = bundle_store.open(kb_version.id)
+    except BundleError as e:
+        logger.warning("Failed to open bundle of version %s: %s", kb_version.id, e)
+        return None
+    if bundle is None:
+        return None
+    if (bundle.embedding_model != (embedding_model or kb_version.embedding_model)
+            or bundle.document_version_ids != completed_version_ids(kb_version)):
+        return None
+    return bundle
+
+
+def load_index(kb_version: KnowledgeBaseVersion,
+               embedding_model: Optional[EmbeddingModel] = None) -> KnowledgeBaseIndex:
+    """Index of the version, from its bundle when it has a current one; see indexed_entries."""
+    SEARCH_INDEX_LOADS.inc()
+    bundle = _open_bundle(kb_version, embedding_model)
+    if bundle is not None:
+        index = KnowledgeBaseIndex.from_bundle(bundle)
+        # The stored record, which may have changed since the export
+        index.kb_version = kb_version
+        return index
+    return KnowledgeBaseIndex.build(kb_version, indexed_entries(kb_version, embedding_model),
+                                    artifact_store.chunk_table)
+
+
+# Exports run one at a time, so the checksum recorded last is the bundle's on disk
+_export_lock = threading.Lock()
+
+
+def export_bundle(kb_version: KnowledgeBaseVersion) -> KnowledgeBaseVersion:
+    """Write the version's bundle and record its checksum and size."""
+    with _export_lock:
+        start = time.perf_counter()
+        # Taken before the entries, so a version completing meanwhile leaves the bundle stale rather than current
+        completed = completed_version_ids(kb_version)
+        size, checksum = write_bundle(bundle_store.path(kb_version.id), kb_version, kb_version.embedding_model,
+                                      indexed_entries(kb_version), completed)
+        BUNDLE_EXPORT_DURATION.observe(time.perf_counter() - start)
+        return storage.set_kb_version_bundle(kb_version.id, checksum, size)
+
+
+def export_bundle_in_background(kb_version: KnowledgeBaseVersion):
+    def run():
+        try:
+            export_bundle(kb_version)
+        except Exception:
+            logger.exception("Failed to export bundle of version %s", kb_version.id)
+
+    threading.Thread(target=run, name=f"bundle-export-{kb_version.id}", daemon=True).start()
+
+
+def refresh_bundles(version: DocumentVersion):
+    """Export again the bundles of the published versions referencing a document version that just completed."""
+    document = storage.get_document_by_id(version.document_id)
+    if document is None:
+        return
+    for kb_version in storage.get_versions_by_kb(document.knowledge_base_id):
+        if kb_version.status == VersionStatus.PUBLISHED and version.id in kb_version.document_version_ids:
+            export_bundle_in_background(kb_version)
+
+
+def _index_key(kb_version: KnowledgeBaseVersion, embedding_model: Optional[EmbeddingModel]) -> str:
+    model = embedding_model or kb_version.embedding_model
+    return f"{kb_version.id}:{model.value if model else ''}"
+
+
+class SearchIndexCache:
+    """Indexes by knowledge base version and model, least recently used evicted first.
+
+    Each index is kept with the completed document versions it was built
+    from. An index built before all of the version's document versions had
+    completed is checked against the completed ones on every lookup, and
+    loaded again when more have.
+    """
+
+    def __init__(self, size: int = SEARCH_INDEX_CACHE_SIZE):
+        self.size = size
+        self._indexes: "OrderedDict[str, Tuple[List[str], KnowledgeBaseIndex]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # One loader per version; concurrent searches wait for it
+        self._loading: Dict[str, threading.Lock] = {}
+
+    def _cached(self, key: str, kb_version: KnowledgeBaseVersion) -> Optional[KnowledgeBaseIndex]:
+        with self._lock:
+            cached = self._indexes.get(key)
+            if cached is not None:
+                self._indexes.move_to_end(key)
+        if cached is None:
+            return None
+        completed, index = cached
+        if len(completed) != len(kb_version.document_version_ids) and completed != completed_version_ids(kb_version):
+            return None
+        return index
+
+    def get(self, kb_version: KnowledgeBaseVersion,
+            embedding_model: Optional[EmbeddingModel] = None) -> KnowledgeBaseIndex:
+        """Index of the version; see indexed_entries for ``embedding_model``."""
+        key = _index_key(kb_version, embedding_model)
+        index = self._cached(key, kb_version)
+        if index is not None:
+            return index
+        with self._lock:
+            loading = self._loading.setdefault(key, threading.Lock())
+        with loading:
+            index = self._cached(key, kb_version)
+            if index is not None:
+                return index
+            # Taken before loading, so a version completing meanwhile triggers another load
+            completed = completed_version_ids(kb_version)
+            index = load_index(kb_version, embedding_model)
+            with self._lock:
+                self._indexes[key] = (completed, index)
+                self._indexes.move_to_end(key)
+                while len(self._indexes) > self.size:
+                    self._indexes.popitem(last=False)
+                self._loading.pop(key, None)
+        return index
+
+
+def primary_version(kb_id: str) -> Optional[KnowledgeBaseVersion]:
+    return next((v for v in storage.get_versions_by_kb(kb_id) if v.is_primary), None)
+
+
+class SearchService:
+    def __init__(self, workers: int = SEARCH_WORKERS):
+        self.indexes = SearchIndexCache()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="search")
+        # Model and overlap callback of the knowledge base versions with dual reads
+        self._dual_reads: Dict[str, Tuple[EmbeddingModel, Callable[[float], None]]] = {}
+        self._dual_read_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="search-dual-read")
+        self._dual_read_lock = threading.Lock()
+        self._dual_reads_pending = 0
+
+    def warm(self, kb_version: KnowledgeBaseVersion):
+        """Load the version's index in the background."""
+        def run():
+            try:
+                self.indexes.get(kb_version)
+            except Exception:
+                logger.exception("Failed to load index of version %s", kb_version.id)
+
+        self._executor.submit(run)
+
+    def set_dual_read(self, kb_version_id: str, embedding_model: EmbeddingModel, record: Callable[[float], None]):
+        """Repeat searches of a knowledge base version on ``embedding_model`` and pass ``record`` the overlap."""
+        self._dual_reads[kb_version_id] = (embedding_model, record)
+
+    def clear_dual_read(self, kb_version_id: str):
+        self._dual_reads.pop(kb_version_id, None)
+
+    def _dual_read(self, kb_version: KnowledgeBaseVersion, query: str, count: int, collapse_duplicates: bool,
+                   filters: Optional[SearchFilter], candidates: List[Candidate]):
+        dual = self._dual_reads.get(kb_version.id)
+        if dual is None:
+            return
+        with self._dual_read_lock:
+            if self._dual_reads_pending >= DUAL_READ_BACKLOG:
+                SEARCH_DUAL_READS.labels("dropped").inc()
+                return
+            self._dual_reads_pending += 1
+        served = {(c.result.document_version_id, c.result.chunk_index) for c in candidates}
+
+        def run():
+            model, record = dual
+            try:
+                shadow, _ = self.indexes.get(kb_version, model).candidates(query, count, collapse_duplicates, filters)
+                shared = sum(1 for c in shadow if (c.result.document_version_id, c.result.chunk_index) in served)
+                record(shared / len(served) if served else 1.0)
+                SEARCH_DUAL_READS.labels("compared").inc()
+            except Exception:
+                SEARCH_DUAL_READS.labels("failed").inc()
+                logger.exception("Failed dual read for version %s", kb_version.id)
+            finally:
+                with self._dual_read_lock:
+                    self._dual_reads_pending -= 1
+
+        self._dual_read_executor.submit(run)
+
+    def search_knowledge_base(self, kb_version: KnowledgeBaseVersion, query: str, top_k: int = DEFAULT_TOP_K,
+                              collapse_duplicates: bool = True, filters: Optional[SearchFilter] = None,
+                              rerank_options: Optional[RerankOptions] = None
+                              ) -> Tuple[List[SearchResult], Optional[str], Optional[RerankStats]]:
+        """Results, the filter strategy used and re-ranking statistics; see KnowledgeBaseIndex.candidates."""
+        start = time.perf_counter()
+        results, strategy, stats, candidates = search_index(
+            self.indexes.get(kb_version), query, top_k, collapse_duplicates, filters, rerank_options)
+        count = max(top_k, rerank_options.candidates) if rerank_options else top_k
+        self._dual_read(kb_version, query, count, collapse_duplicates, filters, candidates)
+        SEARCH_DURATION.labels("knowledge_base").observe(time.perf_counter() - start)
+        return results, strategy, stats
+
+    def search_project(self, kbs: List[KnowledgeBase], query: str, top_k: int = DEFAULT_TOP_K,
+                       collapse_duplicates: bool = True, timeout: float = KB_SEARCH_TIMEOUT_SECONDS,
+                       filters: Optional[SearchFilter] = None, rerank_options: Optional[RerankOptions] = None
+                       ) -> Tuple[List[SearchResult], List[KnowledgeBaseSearchStatus], Optional[RerankStats]]:
+        """Search the primary version of every knowledge base and merge the results.
+
+        Knowledge bases still searching after ``timeout`` seconds are left
+        out and reported with status ``timeout``. Knowledge bases whose
+        primary version's access level the filters exclude are not searched.
+        Re-ranking runs once over the merged candidates.
+        """
+        start = time.perf_counter()
+        statuses: Dict[str, KnowledgeBaseSearchStatus] = {}
+        futures = {}
+        count = max(top_k, rerank_options.candidates) if rerank_options else top_k
+
+        def run(kb_version: KnowledgeBaseVersion):
+            began = time.perf_counter()
+            candidates, strategy = self.indexes.get(kb_version).candidates(
+                query, count, collapse_duplicates, filters
+            )
+            self._dual_read(kb_version, query, count, collapse_duplicates, filters, candidates)
+            return candidates, strategy, time.perf_counter() - began
+
+        for kb in kbs:
+            kb_version = primary_version(kb.id)
+            status = statuses[kb.id] = KnowledgeBaseSearchStatus(
+                knowledge_base_id=kb.id,
+                knowledge_base_version_id=kb_version.id if kb_version else None,
+                status="ok" if kb_version else "no_primary_version",
+            )
+            if kb_version and not access_allowed(kb_version, filters):
+                status.status = "excluded"
+            elif kb_version:
+                futures[self._executor.submit(run, kb_version)] = status
+        done, not_done = wait(futures, timeout=timeout)
+
+        per_kb: List[List[Candidate]] = []
+        for future, status in futures.items():
+            if future not in done:
+                # A running search finishes in the background and warms the index cache
+                future.cancel()
+                status.status = "timeout"
+                status.duration_ms = timeout * 1000
+                SEARCH_KB_TIMEOUTS.inc()
+                continue
+            try:
+                candidates, status.filter_strategy, seconds = future.result()
+            except Exception as e:
+                status.status = "error"
+                status.error_message = str(e)
+                continue
+            status.result_count = len(candidates)
+            status.duration_ms = seconds * 1000
+            per_kb.append(candidates)
+        # Every list is sorted best first, so a heap merge yields the global order
+        merged = list(itertools.islice(heapq.merge(*per_kb, key=lambda c: c.result.score, reverse=True), count))
+        results, stats = finish(query, merged, top_k, rerank_options)
+        SEARCH_DURATION.labels("project").observe(time.perf_counter() - start)
+        return results, [statuses[kb.id] for kb in kbs], stats
+
+
+# Create a global search service instance
+search_service = SearchService()
+
+def get_search_service() -> SearchService:
+    return search_service
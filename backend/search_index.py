@@ -0,0 +1,297 @@
+"""
+Search index of a knowledge base version
+
+The embeddings of a knowledge base version's document versions are held in
+one matrix per embedding model; a query is a matrix-vector product and a
+partial sort. Only the results' text is read, from the versions' chunk
+tables (backend/chunk_store.py).
+
+Each matrix has precomputed row sets (backend/bitmaps.py) per document,
+document name and chunking method, and its rows ordered by creation time, so
+metadata filters are applied inside the scan. A selective filter gathers
+only the matching rows before scoring (pre-filter); a broad one scores every
+row and drops non-matching rows from an enlarged top-k (post-filter), falling
+back to masking the scores when too few survive. The choice follows the
+selectivity estimated from the sizes of the row sets.
+
+An index is built either from the artifacts of the document versions (see
+search.load_index) or from a bundle (backend/bundles.py), whose matrices and
+chunk tables it uses in place. Nothing here reads storage, so query nodes
+(backend/query_node.py) search bundles without it.
+"""
+
+import functools
+import math
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .models import EmbeddingModel, KnowledgeBaseVersion, RerankOptions, RerankStats, SearchFilter, SearchResult
+from .bitmaps import RowSet
+from .bundles import Bundle, BundleEntry, Lexicon
+from .chunk_store import ChunkTable
+from .rerank import Candidate, rerank
+from .embedding_dispatch import embedding_dispatcher
+from .metrics import registry
+
+# Extra candidates taken per result when near-duplicates are collapsed
+COLLAPSE_OVERFETCH = 4
+
+# Filters estimated to keep less than this fraction of the rows are applied
+# before scoring; broader ones after
+PREFILTER_SELECTIVITY = 0.25
+# Margin on the candidates a post-filter takes over k / selectivity
+POSTFILTER_OVERFETCH = 1.5
+
+SEARCH_RERANK_DURATION = registry.histogram(
+    "kb_search_rerank_duration_seconds", "Time spent re-ranking search candidates",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0))
+SEARCH_FILTER_STRATEGY = registry.counter(
+    "kb_search_filter_strategy_total", "Filtered scans by strategy (prefilter, postfilter, masked)", ("strategy",))
+
+# Document id, document name, chunking method, creation timestamp and first
+# and last row (exclusive) of one document version in a model group
+Span = Tuple[str, Optional[str], Optional[str], float, int, int]
+
+
+class MetadataIndex:
+    """Row sets of one model group by document, name and chunking method, and rows by creation time."""
+
+    def __init__(self, size: int, spans: List[Span]):
+        self.size = size
+        documents: Dict[str, List[RowSet]] = {}
+        names: Dict[str, List[RowSet]] = {}
+        methods: Dict[str, List[RowSet]] = {}
+        created = np.empty(size, dtype=np.float64)
+        for document_id, name, method, created_at, start, end in spans:
+            rows = RowSet.from_range(size, start, end)
+            documents.setdefault(document_id, []).append(rows)
+            if name is not None:
+                names.setdefault(name, []).append(rows)
+            if method is not None:
+                methods.setdefault(method, []).append(rows)
+            created[start:end] = created_at
+        self.documents = {key: RowSet.union_all(size, sets) for key, sets in documents.items()}
+        self.names = {key: RowSet.union_all(size, sets) for key, sets in names.items()}
+        self.chunking_methods = {key: RowSet.union_all(size, sets) for key, sets in methods.items()}
+        self.created_order = np.argsort(created, kind="stable").astype(np.uint32)
+        self.created_sorted = created[self.created_order]
+
+    def _any_of(self, sets: Dict[str, RowSet], keys: List[str]) -> RowSet:
+        return RowSet.union_all(self.size, (sets[key] for key in set(keys) if key in sets))
+
+    def select(self, filters: SearchFilter) -> List[RowSet]:
+        """One row set per filtered field; a row matches when it is in all of them."""
+        parts = []
+        if filters.document_ids is not None:
+            parts.append(self._any_of(self.documents, filters.document_ids))
+        if filters.document_names is not None:
+            parts.append(self._any_of(self.names, filters.document_names))
+        if filters.chunking_methods is not None:
+            parts.append(self._any_of(self.chunking_methods, [m.value for m in filters.chunking_methods]))
+        if filters.created_after is not None or filters.created_before is not None:
+            low = 0 if filters.created_after is None else int(
+                np.searchsorted(self.created_sorted, filters.created_after.timestamp(), side="left"))
+            high = self.size if filters.created_before is None else int(
+                np.searchsorted(self.created_sorted, filters.created_before.timestamp(), side="right"))
+            parts.append(RowSet.from_rows(self.size, np.sort(self.created_order[low:max(low, high)])))
+        return parts
+
+
+class _ModelGroup:
+    """Embeddings of the chunks embedded with one model, one row per chunk."""
+
+    def __init__(self, vectors: np.ndarray, chunk_indexes: np.ndarray, duplicates: Dict[int, str],
+                 version_ids: List[str], document_ids: List[str], metadata: MetadataIndex):
+        self.vectors = vectors
+        self.chunk_indexes = chunk_indexes
+        # ``duplicate_of`` of the rows whose chunk has one
+        self.duplicates = duplicates
+        self.version_ids = version_ids
+        self.document_ids = document_ids
+        self.metadata = metadata
+
+    @classmethod
+    def build(cls, vectors: np.ndarray, documents: List[Tuple[str, str, Optional[str], Optional[str], float, ChunkTable]]
+              ) -> "_ModelGroup":
+        """Group of ``vectors`` and the document versions they are the rows of, in order.
+
+        Each document version is given by its id, document id, document
+        name, chunking method, creation timestamp and chunk table.
+        """
+        duplicates: Dict[int, str] = {}
+        version_ids: List[str] = []
+        document_ids: List[str] = []
+        spans: List[Span] = []
+        for version_id, document_id, name, method, created_at, table in documents:
+            offset = len(version_ids)
+            spans.append((document_id, name, method, created_at, offset, offset + len(table)))
+            duplicates.update((offset + index, duplicate_of) for index, duplicate_of in table.duplicates().items())
+            version_ids.extend([version_id] * len(table))
+            document_ids.extend([document_id] * len(table))
+        # Row of each chunk within its version
+        indexes = np.concatenate([np.arange(end - start, dtype=np.int32) for *_, start, end in spans])
+        return cls(vectors, indexes, duplicates, version_ids, document_ids, MetadataIndex(len(version_ids), spans))
+
+    def candidates(self, query: np.ndarray, wanted: int, filters: Optional[SearchFilter]
+                   ) -> Tuple[np.ndarray, np.ndarray, Optional[str]]:
+        """Rows of the best ``wanted`` matching chunks, their scores and the filter strategy used."""
+        parts = self.metadata.select(filters) if filters is not None else []
+        if not parts:
+            scores = self.vectors @ query
+            rows = _top_rows(scores, wanted)
+            return rows, scores[rows], None
+        estimate = math.prod(part.fraction for part in parts)
+        if estimate == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32), "prefilter"
+        if estimate < PREFILTER_SELECTIVITY:
+            selected = functools.reduce(lambda a, b: a & b, parts).to_rows()
+            scores = self.vectors[selected] @ query
+            top = _top_rows(scores, wanted)
+            return selected[top].astype(np.int64), scores[top], "prefilter"
+        scores = self.vectors @ query
+        fetch = min(len(scores), math.ceil(wanted / estimate * POSTFILTER_OVERFETCH))
+        rows = _top_rows(scores, fetch)
+        keep = np.ones(len(rows), dtype=bool)
+        for part in parts:
+            keep &= part.contains(rows)
+        if keep.sum() >= wanted or fetch == len(scores):
+            rows = rows[keep]
+            return rows, scores[rows], "postfilter"
+        # Too few candidates survived: mask the scores of every non-matching row
+        mask = functools.reduce(lambda a, b: a & b, parts).mask()
+        scores = np.where(mask, scores, -np.inf)
+        rows = _top_rows(scores, min(wanted, int(mask.sum())))
+        return rows, scores[rows], "masked"
+
+
+def _top_rows(scores: np.ndarray, k: int) -> np.ndarray:
+    """Rows of the ``k`` highest scores, unordered."""
+    if len(scores) <= k:
+        return np.arange(len(scores))
+    return np.argpartition(-scores, k - 1)[:k]
+
+
+class KnowledgeBaseIndex:
+    """Model groups of a knowledge base version and where the text of their chunks comes from.
+
+    ``lexicon``, known for indexes of bundles, gives the re-ranking's
+    lexical scorer term frequencies over the whole version.
+    """
+
+    def __init__(self, kb_version: KnowledgeBaseVersion, groups: Dict[EmbeddingModel, _ModelGroup],
+                 chunk_table: Callable[[str], Optional[ChunkTable]], lexicon: Optional[Lexicon] = None,
+                 bundle: Optional[Bundle] = None):
+        self.kb_version = kb_version
+        self.groups = groups
+        self.chunk_table = chunk_table
+        self.lexicon = lexicon
+        # Kept so the mapping the arrays are views of stays open
+        self.bundle = bundle
+
+    @classmethod
+    def build(cls, kb_version: KnowledgeBaseVersion, entries: List[BundleEntry],
+              chunk_table: Callable[[str], Optional[ChunkTable]]) -> "KnowledgeBaseIndex":
+        documents: Dict[EmbeddingModel, list] = {}
+        matrices: Dict[EmbeddingModel, List[np.ndarray]] = {}
+        for entry in entries:
+            version = entry.version
+            documents.setdefault(entry.model, []).append((
+                version.id, version.document_id, entry.document_name,
+                version.chunking_method.value if version.chunking_method else None,
+                version.created_at.timestamp(), entry.table,
+            ))
+            matrices.setdefault(entry.model, []).append(entry.vectors)
+        groups = {model: _ModelGroup.build(np.concatenate(matrices[model]), group)
+                  for model, group in documents.items()}
+        return cls(kb_version, groups, chunk_table)
+
+    @classmethod
+    def from_bundle(cls, bundle: Bundle) -> "KnowledgeBaseIndex":
+        """Index over the bundle's arrays and text, without copying them."""
+        tables = {document["id"]: bundle.chunk_table(document) for document in bundle.documents}
+        groups = {}
+        for model in bundle.models:
+            documents = [
+                (d["id"], d["document_id"], d["document_name"], d["chunking_method"], d["created_at"], tables[d["id"]])
+                for d in bundle.documents if d["model"] == model.value
+            ]
+            groups[model] = _ModelGroup.build(bundle.vectors(model), documents)
+        return cls(bundle.kb_version, groups, tables.get, bundle.lexicon, bundle)
+
+    def candidates(self, query: str, count: int, collapse_duplicates: bool = True,
+                   filters: Optional[SearchFilter] = None) -> Tuple[List[Candidate], Optional[str]]:
+        """Best ``count`` matching chunks by cosine similarity, best first.
+
+        Also returns the filter strategy of the largest model group, or None
+        without filters.
+        """
+        wanted = count * COLLAPSE_OVERFETCH if collapse_duplicates else count
+        scored: List[Tuple[float, EmbeddingModel, _ModelGroup, int]] = []
+        strategy = None
+        for model, group in sorted(self.groups.items(), key=lambda item: len(item[1].version_ids)):
+            rows, scores, strategy = group.candidates(embedding_dispatcher.embed([query], model)[0], wanted, filters)
+            if strategy:
+                SEARCH_FILTER_STRATEGY.labels(strategy).inc()
+            scored.extend((float(score), model, group, int(row)) for row, score in zip(rows, scores))
+        scored.sort(key=lambda candidate: candidate[0], reverse=True)
+
+        candidates = []
+        kept = set()
+        kept_duplicates = set()
+        for score, model, group, row in scored:
+            version_id = group.version_ids[row]
+            index = int(group.chunk_indexes[row])
+            key = f"{version_id}:{index}"
+            duplicate_of = group.duplicates.get(row)
+            if collapse_duplicates:
+                # A near-duplicate of a better result, or the other way round
+                if duplicate_of in kept or key in kept_duplicates:
+                    continue
+                kept.add(key)
+                if duplicate_of:
+                    kept_duplicates.add(duplicate_of)
+            table = self.chunk_table(version_id)
+            if table is None:
+                # The version's artifacts were removed after the index was loaded
+                continue
+            start, end = table.span(index)
+            result = SearchResult(
+                knowledge_base_id=self.kb_version.knowledge_base_id,
+                knowledge_base_version_id=self.kb_version.id,
+                document_id=group.document_ids[row],
+                document_version_id=version_id,
+                chunk_index=index,
+                score=score,
+                text=table.text(index),
+                start=start,
+                end=end,
+            )
+            candidates.append(Candidate(result, group.vectors[row], model))
+            if len(candidates) == count:
+                break
+        return candidates, strategy
+
+
+def access_allowed(kb_version: KnowledgeBaseVersion, filters: Optional[SearchFilter]) -> bool:
+    return filters is None or filters.access_levels is None or kb_version.access_level in filters.access_levels
+
+
+def finish(query: str, candidates: List[Candidate], top_k: int, options: Optional[RerankOptions],
+           corpus: Optional[Lexicon] = None) -> Tuple[List[SearchResult], Optional[RerankStats]]:
+    """The first ``top_k`` candidates' results, re-ranked first when ``options`` are given."""
+    if options is None:
+        return [c.result for c in candidates[:top_k]], None
+    picked, stats = rerank(query, candidates, top_k, options, corpus)
+    SEARCH_RERANK_DURATION.observe(stats.duration_ms / 1000)
+    return [c.result for c in picked], stats
+
+
+def search_index(index: KnowledgeBaseIndex, query: str, top_k: int, collapse_duplicates: bool = True,
+                 filters: Optional[SearchFilter] = None, rerank_options: Optional[RerankOptions] = None
+                 ) -> Tuple[List[SearchResult], Optional[str], Optional[RerankStats], List[Candidate]]:
+    """Results, filter strategy and re-ranking statistics of one index, and the candidates they came from."""
+    count = max(top_k, rerank_options.candidates) if rerank_options else top_k
+    candidates, strategy = index.candidates(query, count, collapse_duplicates, filters)
+    results, stats = finish(query, candidates, top_k, rerank_options, index.lexicon)
+    return results, strategy, stats, candidates
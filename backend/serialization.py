@@ -0,0 +1,70 @@
+"""
+Cached JSON encoding of storage records for hot read endpoints.
+
+Each record is encoded once with pydantic-core's serializer and the bytes are
+kept until the record changes, for at most ENCODED_RECORD_CACHE_SIZE records
+at a time, the least recently served dropped first. List responses are then assembled by joining
+the cached fragments, which skips both ``response_model`` validation and
+re-encoding of records that have not changed.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Iterable, List, Tuple
+
+from pydantic_core import to_json
+
+# Records whose encoded JSON is kept
+ENCODED_RECORD_CACHE_SIZE = 50_000
+
+
+class EncodedRecordCache:
+    def __init__(self, revision_of: Callable[[str, str], int], max_size: int = ENCODED_RECORD_CACHE_SIZE):
+        # revision_of(collection, record_id) returns the record's current
+        # revision; fragments encoded at an older revision are stale.
+        self._revision_of = revision_of
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._fragments: "OrderedDict[Tuple[str, str], Tuple[int, bytes]]" = OrderedDict()
+
+    def encode(self, collection: str, record: Any) -> bytes:
+        key = (collection, record.id)
+        # Read the revision before encoding: a concurrent change moves the
+        # revision past it, so a fragment of mixed state is never reused.
+        revision = self._revision_of(collection, record.id)
+        with self._lock:
+            cached = self._fragments.get(key)
+            if cached is not None and cached[0] == revision:
+                self._fragments.move_to_end(key)
+                return cached[1]
+        fragment = to_json(record)
+        with self._lock:
+            self._fragments[key] = (revision, fragment)
+            self._fragments.move_to_end(key)
+            while len(self._fragments) > self.max_size:
+                self._fragments.popitem(last=False)
+        return fragment
+
+    def encode_many(self, collection: str, records: Iterable[Any]) -> List[bytes]:
+        return [self.encode(collection, record) for record in records]
+
+    def invalidate(self, collection: str, record_id: str):
+        with self._lock:
+            self._fragments.pop((collection, record_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._fragments.clear()
+
+    def __len__(self) -> int:
+        return len(self._fragments)
+
+
+def encode_list(fragments: List[bytes]) -> bytes:
+    """Join encoded records into a JSON array."""
+    return b"[" + b",".join(fragments) + b"]"
+
+
+def encode_object_with_list(field: str, fragments: List[bytes]) -> bytes:
+    """Wrap encoded records as ``{"<field>": [...]}``, the shape of the *List models."""
+    return b'{"' + field.encode() + b'":' + encode_list(fragments) + b"}"
@@ -0,0 +1,85 @@
+"""
+Record files of the storage catalog and of each project
+
+Storage persists users and projects in a small catalog at the root of the
+data directory, and every project's knowledge bases, knowledge base
+versions, documents, document versions and embedding migrations in a
+shard of its own under ``<data_dir>/projects/<project_id>/``, one JSON file
+per collection.
+
+Each shard has its own lock and is saved on its own, so a write in one
+project never rewrites or waits for another project's files. Storage loads
+a shard on first access and unloads it after it has been idle.
+"""
+
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict
+
+
+def load_records(path: Path, model: Any) -> Dict[str, Any]:
+    if not path.exists():
+        return {}
+    with open(path, 'r') as f:
+        data = json.load(f)
+    return {item['id']: model(**item) for item in data}
+
+
+def save_records(path: Path, records: Dict[str, Any]) -> int:
+    content = json.dumps([item.dict() for item in list(records.values())], indent=2, default=str).encode("utf-8")
+    # Replace the file atomically so readers never see a partial write
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, 'wb') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+    return len(content)
+
+
+class Shard:
+    def __init__(self, directory: Path, models: Dict[str, Any], project_id: str = None):
+        self.directory = Path(directory)
+        self.models = models
+        self.project_id = project_id
+        self.records: Dict[str, Dict[str, Any]] = {collection: {} for collection in models}
+        self.loaded = False
+        self.last_access = time.monotonic()
+
+        # Writers hold the lock while saving; a transaction holds it for its
+        # whole duration and defers saving until the outermost block exits.
+        self.lock = threading.RLock()
+        self.depth = 0
+        # A committed write waits for the end of its transaction to be saved
+        self.dirty = False
+        # Changes were made in memory that are not in the files yet
+        self.unsaved = False
+
+    def path(self, collection: str) -> Path:
+        return self.directory / f"{collection}.json"
+
+    def load(self):
+        for collection, model in self.models.items():
+            self.records[collection] = load_records(self.path(collection), model)
+        self.loaded = True
+
+    def merge(self):
+        """Reload the files, updating records in place so held objects see the changes."""
+        for collection, model in self.models.items():
+            records = self.records[collection]
+            for record_id, item in load_records(self.path(collection), model).items():
+                existing = records.get(record_id)
+                if existing is not None:
+                    existing.__dict__.update(item.__dict__)
+                else:
+                    records[record_id] = item
+
+    def save(self) -> int:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        written = sum(save_records(self.path(collection), records) for collection, records in self.records.items())
+        self.dirty = self.unsaved = False
+        return written
+
+    def size(self) -> int:
+        return sum(len(records) for records in self.records.values())
@@ -3,6 +3,7 @@
 Start the backend server with improved shutdown handling
 """
 
+import argparse
 import uvicorn
 import sys
 import os
@@ -52,8 +53,23 @@ def signal_handler(signum, frame):
     print("\n🛑 Shutting down server gracefully...")
     sys.exit(0)
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Start the Knowledge Base backend")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Worker processes; more than one implies --production")
+    parser.add_argument("--production", action="store_true",
+                        help="Run without auto-reload, sharing storage between the worker processes")
+    return parser.parse_args()
+
 if __name__ == "__main__":
-    PORT = 8000
+    args = parse_args()
+    PORT = args.port
+    production = args.production or args.workers > 1
+    if production:
+        # Workers inherit the environment and coordinate storage writes through the change log
+        os.environ["KB_STORAGE_COORDINATION"] = "1"
     
     # Set up signal handlers for graceful shutdown
     signal.signal(signal.SIGINT, signal_handler)
@@ -82,21 +98,33 @@ if __name__ == "__main__":
     print("Press Ctrl+C to stop the server")
     
     try:
-        uvicorn.run(
-            "backend.main:app",
-            host="0.0.0.0",
-            port=PORT,
-            reload=True,
-            log_level="info",
-            access_log=True,
-            # Improved shutdown handling
-            loop="asyncio",
-            # Faster reload
-            reload_dirs=["backend"],
-            reload_excludes=["*.pyc", "__pycache__", "*.log"],
-        )
+        if production:
+            print(f"🏭 Production mode with {args.workers} worker(s)")
+            uvicorn.run(
+                "backend.main:app",
+                host=args.host,
+                port=PORT,
+                workers=args.workers,
+                log_level="info",
+                access_log=False,
+                loop="asyncio",
+            )
+        else:
+            uvicorn.run(
+                "backend.main:app",
+                host=args.host,
+                port=PORT,
+                reload=True,
+                log_level="info",
+                access_log=True,
+                # Improved shutdown handling
+                loop="asyncio",
+                # Faster reload
+                reload_dirs=["backend"],
+                reload_excludes=["*.pyc", "__pycache__", "*.log"],
+            )
     except KeyboardInterrupt:
         print("\n👋 Server stopped by user")
     except Exception as e:
         print(f"\n❌ Server error: {e}")
-        sys.exit(1) 
\ No newline at end of file
+        sys.exit(1) 
\ No newline at end of file
@@ -1,45 +1,278 @@
+import fcntl
+import functools
+import inspect
 import json
+import logging
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Dict, List, Optional, Any
+from typing import Callable, Dict, List, Optional, Any, BinaryIO, Set, Tuple
 from datetime import datetime
 import uuid
 
+from .changelog import ChangeLog
+from .shards import Shard, load_records
+from .tiering import ColdStore
+from .metrics import (
+    instrument_methods, registry, STORAGE_FLUSH_BYTES, STORAGE_FLUSH_DURATION,
+    STORAGE_CHANGES_APPLIED, STORAGE_REPLICATION_LAG, STORAGE_SHARD_LOADS, STORAGE_SHARD_UNLOADS,
+)
+from .serialization import EncodedRecordCache
 from .models import (
     Project, KnowledgeBase, KnowledgeBaseVersion, Document, DocumentVersion,
-    User, ProjectUser, UserRole, VersionStatus, CreateProjectRequest, DocumentStatus
+    User, ProjectUser, UserRole, VersionStatus, CreateProjectRequest, DocumentStatus,
+    IngestionBatch, BatchStatus, EmbeddingMigration, MigrationStatus
 )
 
+logger = logging.getLogger(__name__)
+
+# Collection names used for revision tracking
+USERS = "users"
+PROJECTS = "projects"
+KNOWLEDGE_BASES = "knowledge_bases"
+KB_VERSIONS = "kb_versions"
+DOCUMENTS = "documents"
+DOCUMENT_VERSIONS = "document_versions"
+INGESTION_BATCHES = "ingestion_batches"
+EMBEDDING_MIGRATIONS = "embedding_migrations"
+# Revision key covering a whole collection
+ALL = "*"
+
+# Model of each collection, for applying change log entries
+COLLECTIONS = {
+    USERS: User,
+    PROJECTS: Project,
+    KNOWLEDGE_BASES: KnowledgeBase,
+    KB_VERSIONS: KnowledgeBaseVersion,
+    DOCUMENTS: Document,
+    DOCUMENT_VERSIONS: DocumentVersion,
+    INGESTION_BATCHES: IngestionBatch,
+    EMBEDDING_MIGRATIONS: EmbeddingMigration,
+}
+
+# Collections of the global catalog, stored at the root of the data directory
+CATALOG_COLLECTIONS = (USERS, PROJECTS)
+# Collections partitioned by project, stored in the project's shard
+SHARD_COLLECTIONS = (KNOWLEDGE_BASES, KB_VERSIONS, DOCUMENTS, DOCUMENT_VERSIONS, EMBEDDING_MIGRATIONS)
+# Collections of records tied to a running job, kept in memory only
+TRANSIENT_COLLECTIONS = (INGESTION_BATCHES,)
+
+# Collections whose archived records move to the cold store, with the
+# attribute naming the parent their segment is grouped by
+COLD_COLLECTIONS = {
+    KB_VERSIONS: "knowledge_base_id",
+    DOCUMENT_VERSIONS: "document_id",
+}
+
+# Set to "1" to share the data directory between processes (see backend/start.py)
+COORDINATION_ENV = "KB_STORAGE_COORDINATION"
+
+# Seconds between polls of the change log, which bounds how stale reads can be
+CHANGE_LOG_POLL_INTERVAL = 0.05
+
+# Log size at which a writer snapshots the data files and starts a new log
+CHANGE_LOG_COMPACT_BYTES = 16 * 1024 * 1024
+
+# Seconds without access after which a project's shard is dropped from memory
+SHARD_IDLE_SECONDS = 600
+SHARD_SWEEP_INTERVAL = 60
+
+
+def _write(ref: Optional[str] = None):
+    """Run a storage write inside a transaction.
+
+    ``ref`` names the argument identifying the project the method writes to:
+    a project id, the id of one of its records or the record itself. Without
+    it the method writes to the global catalog.
+    """
+    def decorate(method):
+        signature = inspect.signature(method)
+
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            project_id = None
+            if ref is not None:
+                value = signature.bind_partial(self, *args, **kwargs).arguments.get(ref)
+                project_id = self._project_for(value)
+                if project_id is None:
+                    raise ValueError(f"No project found for {ref}")
+            with self.transaction(project_id):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorate
+
+
 class Storage:
-    def __init__(self, data_dir: str = "backend/data"):
+    def __init__(self, data_dir: str = "backend/data", coordinated: Optional[bool] = None):
         self.data_dir = Path(data_dir)
         self.data_dir.mkdir(exist_ok=True)
-        
-        self._users: Dict[str, User] = {}
-        self._projects: Dict[str, Project] = {}
-        self._knowledge_bases: Dict[str, KnowledgeBase] = {}
-        self._kb_versions: Dict[str, KnowledgeBaseVersion] = {}
-        self._documents: Dict[str, Document] = {}
-        self._document_versions: Dict[str, DocumentVersion] = {}
-        
-        self.users_file = self.data_dir / "users.json"
-        self.projects_file = self.data_dir / "projects.json"
-        self.knowledge_bases_file = self.data_dir / "knowledge_bases.json"
-        self.kb_versions_file = self.data_dir / "kb_versions.json"
-        self.documents_file = self.data_dir / "documents.json"
-        self.document_versions_file = self.data_dir / "document_versions.json"
-        
-        self._load_data()
+        if coordinated is None:
+            coordinated = os.environ.get(COORDINATION_ENV) == "1"
+
+        # Users and projects live in the catalog, which is always loaded.
+        # Everything else lives in the shard of its project (see
+        # backend/shards.py); shards are loaded on first access.
+        self._catalog = Shard(self.data_dir, {collection: COLLECTIONS[collection] for collection in CATALOG_COLLECTIONS})
+        self._shards: Dict[str, Shard] = {}
+        self._shards_lock = threading.Lock()
+        self.projects_dir = self.data_dir / "projects"
+        # Project of every sharded record, so lookups by id find their shard
+        self._routes: Dict[str, str] = {}
+        self._routes_lock = threading.Lock()
+        self.routes_file = self.data_dir / "routes.log"
+        # Ingestion batches only live as long as the jobs that drive them, so
+        # they are never written to the data files. They are still shared
+        # through the change log.
+        self._transient: Dict[str, Dict[str, Any]] = {collection: {} for collection in TRANSIENT_COLLECTIONS}
+        self._ingestion_batches: Dict[str, IngestionBatch] = self._transient[INGESTION_BATCHES]
+        # Open transactions of the current thread, innermost last
+        self._local = threading.local()
+
+        # Revision counters keyed by (collection, parent or record id). Every
+        # change stamps its keys with the next value of one sequence, so the
+        # highest revision among a set of keys grows whenever any of them
+        # changes. The epoch keeps validators from one process run distinct
+        # from the next, since counters restart at zero.
+        self._revision_seq = 0
+        self._revisions: Dict[Tuple[str, str], int] = {}
+        self._revision_lock = threading.Lock()
+        self._epoch = uuid.uuid4().hex[:8]
+        # JSON fragments of records served by the hot list endpoints
+        self.encoded = EncodedRecordCache(self.revision)
+
+        self.files_dir = self.data_dir / "files"
+        self.users_file = self._catalog.path(USERS)
+        self.projects_file = self._catalog.path(PROJECTS)
+        self.change_log_file = self.data_dir / "changes.log"
+        # Archived versions, read lazily (see backend/tiering.py)
+        self.cold = ColdStore(
+            self.data_dir / "cold", {collection: COLLECTIONS[collection] for collection in COLD_COLLECTIONS}
+        )
+        self.lock_file = self.data_dir / "storage.lock"
+        # Lock files of the background roles this process holds (see claim)
+        self._claims: Dict[str, int] = {}
+
+        # With coordination, writes are serialized across processes by the
+        # change log's file lock and published as log entries; records
+        # changed in this process wait in _pending until the write commits.
+        # Writers of every project share the log, so _log_lock serializes
+        # them within the process as well.
+        self._change_log: Optional[ChangeLog] = None
+        self._log_lock = threading.RLock()
+        self._log_depth = 0
+        self._pending: Dict[Tuple[str, str], Tuple[int, Any, Optional[str], bool]] = {}
+        # Projects with entries in the current log, whose shards compaction saves
+        self._touched: Set[str] = set()
+        self._change_listeners: List[Callable[[str, Any], None]] = []
+        # Document versions referenced by knowledge base versions written
+        # while a garbage collection runs (see backend/collector.py)
+        self._shaded: Optional[Set[str]] = None
+
+        self._load_data(coordinated)
+        if self._change_log is not None:
+            threading.Thread(target=self._follow_change_log, name="storage-change-log", daemon=True).start()
 
-    def _load_data(self):
+    @property
+    def _users(self) -> Dict[str, User]:
+        return self._catalog.records[USERS]
+
+    @property
+    def _projects(self) -> Dict[str, Project]:
+        return self._catalog.records[PROJECTS]
+
+    def _load_data(self, coordinated: bool = False):
+        if not coordinated:
+            self._load_catalog()
+            if self.change_log_file.exists():
+                self._absorb_change_log()
+            return
+        self._change_log = ChangeLog(self.change_log_file, self.lock_file)
+        with self._log_lock, self._change_log.locked():
+            self._load_catalog()
+            self._change_log.open()
+            self._reset_revisions(self._change_log.generation, self._change_log.base_seq)
+            self._catch_up()
+
+    def _load_catalog(self):
         if not self.users_file.exists():
             self._initialize_default_data()
         else:
-            self._load_from_files()
+            self._catalog.load()
+        self._load_routes()
+        self._migrate_flat_layout()
+
+    def _load_routes(self):
+        if not self.routes_file.exists():
+            return
+        with open(self.routes_file, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                entry = json.loads(line)
+                self._routes[entry["id"]] = entry["p"]
+
+    def _route(self, record_id: str, project_id: str, write: bool = True):
+        if self._routes.get(record_id) == project_id:
+            return
+        with self._routes_lock:
+            if write:
+                with open(self.routes_file, "ab") as f:
+                    f.write(json.dumps({"id": record_id, "p": project_id}).encode() + b"\n")
+            self._routes[record_id] = project_id
+
+    def _migrate_flat_layout(self):
+        """Split the data files of the unsharded layout into project shards."""
+        flat_files = {
+            collection: self.data_dir / f"{collection}.json"
+            for collection in (KNOWLEDGE_BASES, KB_VERSIONS, DOCUMENTS, DOCUMENT_VERSIONS)
+        }
+        if not any(path.exists() for path in flat_files.values()):
+            return
+        flat = {collection: load_records(path, COLLECTIONS[collection]) for collection, path in flat_files.items()}
+        shards: Dict[str, Shard] = {}
+        kb_projects = {kb.id: kb.project_id for kb in flat[KNOWLEDGE_BASES].values()}
+        doc_projects = {doc.id: kb_projects.get(doc.knowledge_base_id) for doc in flat[DOCUMENTS].values()}
+        parents = {
+            KNOWLEDGE_BASES: lambda item: item.project_id,
+            KB_VERSIONS: lambda item: kb_projects.get(item.knowledge_base_id),
+            DOCUMENTS: lambda item: doc_projects.get(item.id),
+            DOCUMENT_VERSIONS: lambda item: doc_projects.get(item.document_id),
+        }
+        for collection, records in flat.items():
+            for item in records.values():
+                project_id = parents[collection](item)
+                # Records of deleted projects stay behind in the renamed files
+                if project_id not in self._projects:
+                    continue
+                shard = shards.get(project_id)
+                if shard is None:
+                    shard = shards[project_id] = Shard(self.projects_dir / project_id, self._shard_models(), project_id)
+                shard.records[collection][item.id] = item
+                self._route(item.id, project_id)
+        for shard in shards.values():
+            shard.save()
+        for path in flat_files.values():
+            if path.exists():
+                os.replace(path, path.with_name(path.name + ".migrated"))
+
+    def _absorb_change_log(self):
+        """Fold a log left by a multi-process run into the data files."""
+        change_log = ChangeLog(self.change_log_file, self.lock_file)
+        with change_log.locked():
+            change_log.open()
+            for entry in change_log.read_new():
+                self._apply_entry(entry, load_shards=True)
+            self._save_all()
+            change_log.close()
+            self.change_log_file.unlink()
 
     def _initialize_default_data(self):
         admin_user = User(id=str(uuid.uuid4()), username="admin", email="admin@example.com", full_name="Administrator")
         self._users[admin_user.id] = admin_user
-        
+
         default_project = Project(
             id=str(uuid.uuid4()),
             name="Default Project",
@@ -48,39 +281,503 @@ class Storage:
             users={admin_user.id: ProjectUser(user_id=admin_user.id, role=UserRole.ADMIN)}
         )
         self._projects[default_project.id] = default_project
-        self._save_all()
+        self._catalog.loaded = True
+        self._catalog.save()
+
+    # Shards
+
+    @staticmethod
+    def _shard_models() -> Dict[str, Any]:
+        return {collection: COLLECTIONS[collection] for collection in SHARD_COLLECTIONS}
+
+    def _project_for(self, ref: Any) -> Optional[str]:
+        """Project of a project id, a sharded record's id or a record."""
+        if ref is None:
+            return None
+        if isinstance(ref, str):
+            return ref if ref in self._projects else self._routes.get(ref)
+        if isinstance(ref, KnowledgeBase):
+            return ref.project_id
+        if isinstance(ref, (KnowledgeBaseVersion, Document, IngestionBatch, EmbeddingMigration)):
+            return self._routes.get(ref.knowledge_base_id)
+        if isinstance(ref, DocumentVersion):
+            return self._routes.get(ref.document_id)
+        return None
+
+    def _shard(self, project_id: str) -> Shard:
+        """The project's shard, loading it on first access."""
+        with self._shards_lock:
+            shard = self._shards.get(project_id)
+            if shard is None:
+                if project_id not in self._projects:
+                    raise ValueError(f"Project {project_id} not found")
+                shard = self._shards[project_id] = Shard(self.projects_dir / project_id, self._shard_models(), project_id)
+            shard.last_access = time.monotonic()
+        if not shard.loaded:
+            self._load_shard(shard)
+        return shard
+
+    def _load_shard(self, shard: Shard):
+        if self._change_log is None:
+            with shard.lock:
+                if shard.loaded:
+                    return
+                shard.load()
+                if self._demote_archived(shard):
+                    self._save_scope(shard)
+            STORAGE_SHARD_LOADS.inc()
+            return
+        # The files hold the shard as of the last compaction; the rest of
+        # its history is in the part of the log this process already read
+        with self._log_lock, self._change_log.locked(), shard.lock:
+            if shard.loaded:
+                return
+            self._catch_up()
+            shard.load()
+            for entry in self._change_log.read_consumed():
+                if entry.get("p") == shard.project_id:
+                    self._apply_entry(entry)
+            self._demote_archived(shard)
+        STORAGE_SHARD_LOADS.inc()
+
+    def _loaded_shard(self, ref: Any) -> Optional[Shard]:
+        shard = self._shards.get(self._project_for(ref))
+        return shard if shard is not None and shard.loaded else None
+
+    def _lookup(self, collection: str, record_id: str) -> Optional[Any]:
+        project_id = self._routes.get(record_id)
+        if project_id is None:
+            return None
+        return self._shard(project_id).records[collection].get(record_id)
+
+    def _scan(self, collection: str, ref: str) -> List[Any]:
+        project_id = self._project_for(ref)
+        if project_id is None:
+            return []
+        # Scans copy the values first: writers and the change log follower
+        # insert from other threads while reads run unlocked
+        return list(self._shard(project_id).records[collection].values())
+
+    def _demote_archived(self, shard: Shard) -> int:
+        """Move archived records loaded from a shard's files to the cold store."""
+        moved = 0
+        for collection in COLD_COLLECTIONS:
+            records = shard.records[collection]
+            for item in list(records.values()):
+                if self._is_cold(collection, item):
+                    self._place(collection, item, records, write=True)
+                    moved += 1
+        return moved
+
+    def unload_idle_shards(self, idle_seconds: float = SHARD_IDLE_SECONDS) -> int:
+        """Drop shards not accessed for ``idle_seconds``. Returns how many were dropped.
+
+        Shards with an open transaction or a version being processed stay
+        loaded, since jobs hold on to their records.
+        """
+        if self._change_log is None:
+            return self._unload_idle(idle_seconds)
+        # Followers apply entries to loaded shards under the log lock
+        if not self._log_lock.acquire(blocking=False):
+            return 0
+        try:
+            return self._unload_idle(idle_seconds)
+        finally:
+            self._log_lock.release()
 
-    def _load_from_files(self):
-        self._users = self._load_generic(self.users_file, User)
-        self._projects = self._load_generic(self.projects_file, Project)
-        self._knowledge_bases = self._load_generic(self.knowledge_bases_file, KnowledgeBase)
-        self._kb_versions = self._load_generic(self.kb_versions_file, KnowledgeBaseVersion)
-        self._documents = self._load_generic(self.documents_file, Document)
-        self._document_versions = self._load_generic(self.document_versions_file, DocumentVersion)
-
-    def _load_generic(self, file_path: Path, model: Any) -> Dict[str, Any]:
-        if not file_path.exists():
-            return {}
-        with open(file_path, 'r') as f:
-            data = json.load(f)
-        return {item['id']: model(**item) for item in data}
+    def _unload_idle(self, idle_seconds: float) -> int:
+        unloaded = 0
+        now = time.monotonic()
+        for shard in list(self._shards.values()):
+            if now - shard.last_access < idle_seconds or not shard.lock.acquire(blocking=False):
+                continue
+            try:
+                if shard.depth or any(v.status == DocumentStatus.PROCESSING
+                                      for v in list(shard.records[DOCUMENT_VERSIONS].values())):
+                    continue
+                if any(m.status == MigrationStatus.RUNNING
+                       for m in list(shard.records[EMBEDDING_MIGRATIONS].values())):
+                    continue
+                if shard.unsaved and self._change_log is None:
+                    self._save_scope(shard)
+                with self._shards_lock:
+                    if time.monotonic() - shard.last_access < idle_seconds:
+                        continue
+                    self._shards.pop(shard.project_id, None)
+                    shard.loaded = False
+                for collection, records in shard.records.items():
+                    for record_id in list(records):
+                        self.encoded.invalidate(collection, record_id)
+                unloaded += 1
+            finally:
+                shard.lock.release()
+        STORAGE_SHARD_UNLOADS.inc(unloaded)
+        return unloaded
+
+    def loaded_shard_count(self) -> int:
+        return len(self._shards)
+
+    def _sweep_shards(self):
+        while True:
+            time.sleep(SHARD_SWEEP_INTERVAL)
+            try:
+                self.unload_idle_shards()
+            except Exception:
+                logger.exception("Failed to unload idle shards")
+
+    # Transactions
+
+    @contextmanager
+    def transaction(self, project_id: Optional[str] = None):
+        """Group several writes into a single save of the data files.
+
+        Without ``project_id`` the transaction covers the catalog, otherwise
+        the project's shard; transactions in different projects run in
+        parallel. Scopes opened inside another transaction are saved when the
+        outermost one exits.
+
+        With coordination the outermost transaction also holds the
+        cross-process lock, starts from the latest logged state and appends
+        its changes to the log on exit.
+        """
+        if self._change_log is None:
+            with self._scope(project_id):
+                yield self
+            return
+        with self._coordinated(), self._scope(project_id):
+            yield self
+
+    @contextmanager
+    def _scope(self, project_id: Optional[str]):
+        while True:
+            scope = self._shard(project_id) if project_id is not None else self._catalog
+            scope.lock.acquire()
+            # The janitor may have dropped the shard before the lock was taken
+            if scope.loaded or scope is self._catalog:
+                break
+            scope.lock.release()
+        stack = self._local.__dict__.setdefault("stack", [])
+        deferred = self._local.__dict__.setdefault("deferred", set())
+        stack.append(scope)
+        scope.depth += 1
+        try:
+            yield scope
+        finally:
+            scope.depth -= 1
+            stack.pop()
+            try:
+                if scope.dirty:
+                    deferred.add(scope)
+                if not stack:
+                    saving = list(deferred)
+                    deferred.clear()
+                    if self._change_log is None:
+                        for dirty in saving:
+                            self._save_scope(dirty)
+            finally:
+                scope.lock.release()
+
+    @contextmanager
+    def _coordinated(self):
+        with self._log_lock:
+            if self._log_depth == 0:
+                self._change_log.lock()
+                try:
+                    self._catch_up()
+                except Exception:
+                    self._change_log.unlock()
+                    raise
+            self._log_depth += 1
+            try:
+                yield
+            finally:
+                self._log_depth -= 1
+                if self._log_depth == 0:
+                    try:
+                        self._flush_pending()
+                    finally:
+                        self._change_log.unlock()
+
+    def _save_scope(self, scope: Shard):
+        with scope.lock:
+            start = time.perf_counter()
+            written = scope.save()
+            STORAGE_FLUSH_DURATION.observe(time.perf_counter() - start)
+            STORAGE_FLUSH_BYTES.inc(written)
 
     def _save_all(self):
-        self._save_generic(self.users_file, self._users)
-        self._save_generic(self.projects_file, self._projects)
-        self._save_generic(self.knowledge_bases_file, self._knowledge_bases)
-        self._save_generic(self.kb_versions_file, self._kb_versions)
-        self._save_generic(self.documents_file, self._documents)
-        self._save_generic(self.document_versions_file, self._document_versions)
+        stack = getattr(self._local, "stack", None)
+        if stack:
+            # With coordination the change log makes the transaction durable
+            if self._change_log is None:
+                stack[-1].dirty = True
+            return
+        self._save_scope(self._catalog)
+        for shard in list(self._shards.values()):
+            if shard.loaded:
+                self._save_scope(shard)
+
+    def _flush_pending(self):
+        """Append the records changed by the committed transaction to the change log."""
+        if not self._pending:
+            return
+        entries = sorted(self._pending.items(), key=lambda entry: entry[1][0])
+        self._pending.clear()
+        self._change_log.append([
+            ChangeLog.entry(seq, collection, item, project_id, removed)
+            for (collection, _), (seq, item, project_id, removed) in entries
+        ])
+        if self._change_log.size > CHANGE_LOG_COMPACT_BYTES:
+            self._compact()
+
+    def _compact(self):
+        # Every shard with entries in the log is written before the log goes
+        for project_id in list(self._touched):
+            if project_id in self._projects:
+                self._save_scope(self._shard(project_id))
+        self._save_scope(self._catalog)
+        self._touched.clear()
+        self._reset_revisions(self._change_log.rotate(self._revision_seq), self._revision_seq)
+
+    def _reset_revisions(self, epoch: str, seq: int):
+        # A new log generation restarts validators in every process alike
+        with self._revision_lock:
+            self._epoch = epoch
+            self._revision_seq = seq
+            self._revisions.clear()
+        self.encoded.clear()
+
+    def _catch_up(self):
+        """Apply the entries peers appended to the change log. Call with the log lock held."""
+        change_log = self._change_log
+        if change_log.rotated():
+            with change_log.locked():
+                self._merge_snapshot()
+                change_log.open()
+                self._reset_revisions(change_log.generation, change_log.base_seq)
+        entries = change_log.read_new()
+        if not entries:
+            return
+        applied = [(entry["c"], self._apply_entry(entry)) for entry in entries]
+        STORAGE_CHANGES_APPLIED.inc(len(entries))
+        STORAGE_REPLICATION_LAG.observe(max(0.0, time.time() - entries[-1]["t"]))
+        for listener in self._change_listeners:
+            for collection, item in applied:
+                if item is not None:
+                    listener(collection, item)
+
+    def _apply_entry(self, entry: Dict[str, Any], load_shards: bool = False) -> Any:
+        """Apply a logged change. Sharded records only reach shards that are loaded,
+        or every shard with ``load_shards``."""
+        collection = entry["c"]
+        item = COLLECTIONS[collection](**entry["r"])
+        project_id = entry.get("p") or self._project_for(item)
+        if entry.get("d"):
+            # The writer already dropped the record from the cold store
+            with self._revision_lock:
+                self._revision_seq = max(self._revision_seq, entry["seq"])
+                self._stamp(collection, item, entry["seq"], project_id)
+            self.cold.forget(collection, item.id)
+            return None
+        records = None
+        if collection in CATALOG_COLLECTIONS:
+            records = self._catalog.records[collection]
+        elif collection in TRANSIENT_COLLECTIONS:
+            records = self._transient[collection]
+        elif project_id is not None:
+            self._route(item.id, project_id, write=False)
+            self._touched.add(project_id)
+            shard = self._shards.get(project_id)
+            if load_shards and project_id in self._projects:
+                shard = self._shard(project_id)
+            if shard is not None and shard.loaded:
+                records = shard.records[collection]
+        if records is not None:
+            existing = records.get(item.id)
+            if existing is not None:
+                # Update in place so objects held by running jobs see the change
+                existing.__dict__.update(item.__dict__)
+                item = existing
+            else:
+                records[item.id] = item
+        with self._revision_lock:
+            self._revision_seq = max(self._revision_seq, entry["seq"])
+            self._stamp(collection, item, entry["seq"], project_id)
+        # The writer already updated the cold store
+        self._place(collection, item, records, write=False)
+        return item
+
+    def _merge_snapshot(self):
+        """Reload the data files written before the log was rotated, keeping object identity."""
+        self._catalog.merge()
+        for shard in list(self._shards.values()):
+            if shard.loaded:
+                shard.merge()
+        self._touched.clear()
 
-    def _save_generic(self, file_path: Path, data: Dict[str, Any]):
-        with open(file_path, 'w') as f:
-            json.dump([item.dict() for item in data.values()], f, indent=2, default=str)
+    def _follow_change_log(self):
+        while True:
+            time.sleep(CHANGE_LOG_POLL_INTERVAL)
+            try:
+                with self._log_lock:
+                    self._catch_up()
+            except Exception:
+                logger.exception("Failed to apply storage changes")
+
+    def claim(self, role: str) -> bool:
+        """Whether this process runs ``role``, taking it if no other process
+        sharing the data directory has. A role is kept until the process exits."""
+        if role in self._claims:
+            return True
+        fd = os.open(self.data_dir / f"{role}.lock", os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self._claims[role] = fd
+        return True
+
+    def add_change_listener(self, listener: Callable[[str, Any], None]):
+        """Call ``listener(collection, record)`` for every record changed by another process."""
+        self._change_listeners.append(listener)
+
+    def _records(self, collection: str, project_id: Optional[str] = None) -> Dict[str, Any]:
+        if collection in CATALOG_COLLECTIONS:
+            return self._catalog.records[collection]
+        if collection in TRANSIENT_COLLECTIONS:
+            return self._transient[collection]
+        return self._shard(project_id).records[collection]
+
+    def _put(self, collection: str, item: Any, publish: bool = True):
+        """Store a new or replaced record and record the change."""
+        project_id = self._project_for(item) if collection in SHARD_COLLECTIONS else None
+        self._records(collection, project_id)[item.id] = item
+        self._changed(collection, item, publish)
+
+    def _changed(self, collection: str, item: Any, publish: bool = True):
+        """Bump the revisions of a record, its parents and its collection.
+
+        Without ``publish`` the change stays in this process: it is not
+        appended to the change log.
+        """
+        project_id = None
+        records = None
+        if collection in SHARD_COLLECTIONS:
+            project_id = self._project_for(item)
+            self._route(item.id, project_id)
+            shard = self._shard(project_id)
+            shard.unsaved = True
+            records = shard.records[collection]
+        elif collection in CATALOG_COLLECTIONS:
+            self._catalog.unsaved = True
+        elif collection in TRANSIENT_COLLECTIONS:
+            project_id = self._project_for(item)
+        with self._revision_lock:
+            self._revision_seq += 1
+            seq = self._revision_seq
+            if self._change_log is not None and publish:
+                self._pending[(collection, item.id)] = (seq, item, project_id, False)
+                if project_id is not None:
+                    self._touched.add(project_id)
+            self._stamp(collection, item, seq, project_id)
+        self._place(collection, item, records, write=True)
+
+    def _remove_cold(self, collection: str, item: Any):
+        """Drop an archived record from the cold store for good and record the removal."""
+        project_id = self._project_for(item)
+        with self._revision_lock:
+            self._revision_seq += 1
+            seq = self._revision_seq
+            if self._change_log is not None:
+                self._pending[(collection, item.id)] = (seq, item, project_id, True)
+                if project_id is not None:
+                    self._touched.add(project_id)
+            self._stamp(collection, item, seq, project_id)
+        self.cold.remove(collection, item.id)
+
+    @staticmethod
+    def _is_cold(collection: str, item: Any) -> bool:
+        if collection == DOCUMENT_VERSIONS:
+            return item.is_archived
+        if collection == KB_VERSIONS:
+            return item.status == VersionStatus.ARCHIVED
+        return False
+
+    def _place(self, collection: str, item: Any, records: Optional[Dict[str, Any]], write: bool):
+        """Keep an archived record in the cold store and anything else in its shard.
+
+        ``write`` is false when applying another process's change, which has
+        already written the cold store.
+        """
+        if collection not in COLD_COLLECTIONS:
+            return
+        if self._is_cold(collection, item):
+            if records is not None:
+                records.pop(item.id, None)
+            parent = getattr(item, COLD_COLLECTIONS[collection])
+            if write:
+                self.cold.put(collection, parent, item)
+            else:
+                self.cold.note(collection, parent, item.id)
+        elif self.cold.contains(collection, item.id):
+            if write:
+                self.cold.remove(collection, item.id)
+            else:
+                self.cold.forget(collection, item.id)
+
+    def _stamp(self, collection: str, item: Any, seq: int, project_id: Optional[str] = None):
+        # Called with the revision lock held, so a key's revision never goes backwards
+        keys = [ALL, item.id]
+        if collection == KNOWLEDGE_BASES:
+            keys.append(item.project_id)
+        elif collection == KB_VERSIONS:
+            keys.append(item.knowledge_base_id)
+            if self._shaded is not None:
+                # Write barrier: a collection in progress must keep what this version references
+                self._shaded.update(item.document_version_ids)
+        elif collection == DOCUMENTS:
+            keys.append(item.knowledge_base_id)
+            if project_id:
+                keys.append(project_id)
+        elif collection == DOCUMENT_VERSIONS:
+            keys.append(item.document_id)
+            shard = self._shards.get(project_id)
+            doc = shard.records[DOCUMENTS].get(item.document_id) if shard is not None else None
+            if doc:
+                keys.append(doc.knowledge_base_id)
+            if project_id:
+                keys.append(project_id)
+        for key in keys:
+            self._revisions[(collection, key)] = seq
+        self.encoded.invalidate(collection, item.id)
+
+    def revision(self, collection: str, key: str = ALL) -> int:
+        return self._revisions.get((collection, key), 0)
+
+    def etag(self, *keys: Tuple[str, str]) -> str:
+        """Entity tag for a response built from the given (collection, key) pairs."""
+        revision = max(self._revisions.get(key, 0) for key in keys)
+        return f'"{self._epoch}-{revision}"'
+
+    def collection_sizes(self) -> Dict[str, int]:
+        """Records held in memory: the catalog and the loaded shards."""
+        sizes = {collection: len(self._catalog.records[collection]) for collection in CATALOG_COLLECTIONS}
+        sizes.update({collection: 0 for collection in SHARD_COLLECTIONS})
+        for shard in list(self._shards.values()):
+            for collection in SHARD_COLLECTIONS:
+                sizes[collection] += len(shard.records[collection])
+        return sizes
 
     # User methods
     def get_all_users(self) -> List[User]:
         return list(self._users.values())
 
+    @_write()
+    def add_user(self, user: User):
+        self._put(USERS, user)
+        self._save_all()
+
     # Project methods
     def get_all_projects(self) -> List[Project]:
         return list(self._projects.values())
@@ -88,10 +785,17 @@ class Storage:
     def get_project_by_id(self, project_id: str) -> Optional[Project]:
         return self._projects.get(project_id)
     
+    @_write()
     def add_project(self, project: Project):
-        self._projects[project.id] = project
+        self._put(PROJECTS, project)
+        self._save_all()
+
+    @_write()
+    def update_project(self, project: Project):
+        self._put(PROJECTS, project)
         self._save_all()
 
+    @_write()
     def create_project(self, project_data: CreateProjectRequest, created_by: str) -> Project:
         project = Project(
             id=str(uuid.uuid4()),
@@ -99,52 +803,65 @@ class Storage:
             description=project_data.description,
             created_by=created_by
         )
-        self._projects[project.id] = project
+        self._put(PROJECTS, project)
         self._save_all()
         return project
 
     # KnowledgeBase methods
     def get_knowledge_bases_by_project(self, project_id: str) -> List[KnowledgeBase]:
-        return [kb for kb in self._knowledge_bases.values() if kb.project_id == project_id]
+        if project_id not in self._projects:
+            return []
+        return self._scan(KNOWLEDGE_BASES, project_id)
 
     def get_knowledge_base_by_id(self, kb_id: str) -> Optional[KnowledgeBase]:
-        return self._knowledge_bases.get(kb_id)
+        return self._lookup(KNOWLEDGE_BASES, kb_id)
 
+    @_write("kb")
     def add_knowledge_base(self, kb: KnowledgeBase):
-        self._knowledge_bases[kb.id] = kb
+        self._put(KNOWLEDGE_BASES, kb)
         self._save_all()
 
-    def create_kb(self, project_id: str, name: str, description: str, created_by: str) -> KnowledgeBase:
+    @_write("project_id")
+    def create_kb(self, project_id: str, name: str, description: str, created_by: str,
+                  skip_duplicate_embeddings: bool = False) -> KnowledgeBase:
         kb = KnowledgeBase(
             id=str(uuid.uuid4()),
             name=name,
             description=description,
             project_id=project_id,
+            skip_duplicate_embeddings=skip_duplicate_embeddings,
             created_by=created_by
         )
-        self._knowledge_bases[kb.id] = kb
+        self._put(KNOWLEDGE_BASES, kb)
         self._save_all()
         return kb
 
+    @_write("kb")
     def update_knowledge_base(self, kb: KnowledgeBase):
-        self._knowledge_bases[kb.id] = kb
+        self._put(KNOWLEDGE_BASES, kb)
         self._save_all()
 
     # KnowledgeBaseVersion methods
-    def get_versions_by_kb(self, kb_id: str) -> List[KnowledgeBaseVersion]:
-        return [v for v in self._kb_versions.values() if v.knowledge_base_id == kb_id]
+    def get_versions_by_kb(self, kb_id: str, include_archived: bool = False) -> List[KnowledgeBaseVersion]:
+        versions = [v for v in self._scan(KB_VERSIONS, kb_id) if v.knowledge_base_id == kb_id]
+        if include_archived:
+            versions.extend(self.cold.list(KB_VERSIONS, kb_id))
+        return versions
 
     def get_version_by_id(self, version_id: str) -> Optional[KnowledgeBaseVersion]:
-        return self._kb_versions.get(version_id)
+        return self._lookup(KB_VERSIONS, version_id) or self.cold.get(KB_VERSIONS, version_id)
 
+    @_write("version")
     def add_kb_version(self, version: KnowledgeBaseVersion):
-        self._kb_versions[version.id] = version
+        self._put(KB_VERSIONS, version)
         self._save_all()
 
+    @_write("version")
     def update_kb_version(self, version: KnowledgeBaseVersion):
-        self._kb_versions[version.id] = version
+        self._put(KB_VERSIONS, version)
         self._save_all()
 
+    @_write("kb_id")
     def create_kb_version(
         self,
         kb_id: str,
@@ -156,7 +873,7 @@ class Storage:
         access_level: str = "private"
     ) -> KnowledgeBaseVersion:
         # Get the latest version to determine the new version number
-        existing_versions = self.get_versions_by_kb(kb_id)
+        existing_versions = self.get_versions_by_kb(kb_id, include_archived=True)
         
         if not existing_versions:
             # First version
@@ -193,10 +910,11 @@ class Storage:
         }
         
         new_version = KnowledgeBaseVersion(**new_version_data)
-        self._kb_versions[new_version.id] = new_version
+        self._put(KB_VERSIONS, new_version)
         self._save_all()
         return new_version
 
+    @_write("kb_id")
     def publish_kb_version(self, kb_id: str, version_id: str, user_id: str) -> KnowledgeBaseVersion:
         version = self.get_version_by_id(version_id)
         if not version or version.knowledge_base_id != kb_id:
@@ -209,10 +927,12 @@ class Storage:
         version.published_at = datetime.now()
         version.published_by = user_id
         version.updated_at = datetime.now()
+        self._changed(KB_VERSIONS, version)
 
         self._save_all()
         return version
 
+    @_write("kb_id")
     def archive_kb_version(self, kb_id: str, version_id: str, user_id: str) -> KnowledgeBaseVersion:
         version = self.get_version_by_id(version_id)
         if not version or version.knowledge_base_id != kb_id:
@@ -228,10 +948,12 @@ class Storage:
         version.archived_at = datetime.now()
         version.archived_by = user_id
         version.updated_at = datetime.now()
+        self._changed(KB_VERSIONS, version)
         
         self._save_all()
         return version
 
+    @_write("kb_id")
     def set_primary_kb_version(self, kb_id: str, version_id: str, user_id: str) -> KnowledgeBaseVersion:
         target_version = self.get_version_by_id(version_id)
         
@@ -242,14 +964,16 @@ class Storage:
             raise ValueError("Only published versions can be set as primary")
 
         # Find current primary for this KB and unset it
-        for version in self._kb_versions.values():
+        for version in self._scan(KB_VERSIONS, kb_id):
             if version.knowledge_base_id == kb_id and version.is_primary:
                 version.is_primary = False
                 version.updated_at = datetime.now()
+                self._changed(KB_VERSIONS, version)
 
         # Set the new primary
         target_version.is_primary = True
         target_version.updated_at = datetime.now()
+        self._changed(KB_VERSIONS, target_version)
         
         self._save_all()
         return target_version
@@ -270,25 +994,53 @@ class Storage:
         return docs
 
     def get_documents_by_kb(self, kb_id: str) -> List[Document]:
-        return [doc for doc in self._documents.values() if doc.knowledge_base_id == kb_id]
+        return [doc for doc in self._scan(DOCUMENTS, kb_id) if doc.knowledge_base_id == kb_id]
         
     def get_documents_by_project(self, project_id: str) -> List[Document]:
-        kbs = self.get_knowledge_bases_by_project(project_id)
-        kb_ids = [kb.id for kb in kbs]
-        return [doc for doc in self._documents.values() if doc.knowledge_base_id in kb_ids]
+        # The project's shard holds the documents of its knowledge bases only
+        if project_id not in self._projects:
+            return []
+        return self._scan(DOCUMENTS, project_id)
 
     def get_document_by_id(self, doc_id: str) -> Optional[Document]:
-        return self._documents.get(doc_id)
+        return self._lookup(DOCUMENTS, doc_id)
 
+    @_write("doc")
     def add_document(self, doc: Document):
-        self._documents[doc.id] = doc
+        self._put(DOCUMENTS, doc)
         self._save_all()
 
+    @_write("doc")
     def update_document(self, doc: Document):
-        self._documents[doc.id] = doc
+        self._put(DOCUMENTS, doc)
         self._save_all()
 
+    @_write("kb_id")
     def create_document(self, kb_id: str, name: str, description: str, created_by: str) -> Document:
+        doc, _ = self._new_document(kb_id, name, description, created_by)
+        self._save_all()
+        return doc
+
+    @_write("kb_id")
+    def create_documents_bulk(self, kb_id: str, items: List[Dict[str, Any]], created_by: str) -> List[Tuple[Document, DocumentVersion]]:
+        """Create a document with its initial version for every item in one save.
+
+        Each item holds ``name`` and optionally ``description``, ``source_url``
+        and ``file_name``.
+        """
+        created = []
+        for item in items:
+            doc, version = self._new_document(kb_id, item["name"], item.get("description") or "", created_by)
+            version.source_url = item.get("source_url")
+            version.file_name = item.get("file_name")
+            doc.source_url = version.source_url
+            self._changed(DOCUMENTS, doc)
+            self._changed(DOCUMENT_VERSIONS, version)
+            created.append((doc, version))
+        self._save_all()
+        return created
+
+    def _new_document(self, kb_id: str, name: str, description: str, created_by: str) -> Tuple[Document, DocumentVersion]:
         doc = Document(
             id=str(uuid.uuid4()),
             name=name,
@@ -299,7 +1051,8 @@ class Storage:
             created_at=datetime.now(),
             updated_at=datetime.now()
         )
-        self._documents[doc.id] = doc
+        records = self._shard(self._project_for(kb_id)).records
+        records[DOCUMENTS][doc.id] = doc
         # Create initial version with version_number='1'
         version = DocumentVersion(
             id=str(uuid.uuid4()),
@@ -311,30 +1064,40 @@ class Storage:
             created_at=datetime.now(),
             updated_at=datetime.now()
         )
-        self._document_versions[version.id] = version
-        self._save_all()
-        return doc
+        records[DOCUMENT_VERSIONS][version.id] = version
+        self._changed(DOCUMENTS, doc)
+        self._changed(DOCUMENT_VERSIONS, version)
+        return doc, version
 
-    def get_document_versions_by_document(self, doc_id: str) -> List[DocumentVersion]:
-        return [v for v in self._document_versions.values() if v.document_id == doc_id]
+    def get_document_versions_by_document(self, doc_id: str, include_archived: bool = False) -> List[DocumentVersion]:
+        versions = [v for v in self._scan(DOCUMENT_VERSIONS, doc_id) if v.document_id == doc_id]
+        if include_archived:
+            versions.extend(self.cold.list(DOCUMENT_VERSIONS, doc_id))
+        return versions
 
     def get_document_version_by_id(self, version_id: str) -> Optional[DocumentVersion]:
-        return self._document_versions.get(version_id)
+        return self._lookup(DOCUMENT_VERSIONS, version_id) or self.cold.get(DOCUMENT_VERSIONS, version_id)
 
+    @_write("version")
     def add_document_version(self, version: DocumentVersion):
-        self._document_versions[version.id] = version
+        self._put(DOCUMENT_VERSIONS, version)
         self._save_all()
 
-    def update_document_version(self, version: DocumentVersion):
-        self._document_versions[version.id] = version
-        self._save_all()
+    @_write("version")
+    def update_document_version(self, version: DocumentVersion, persist: bool = True):
+        """Record a change to a version; ``persist=False`` keeps it in memory only,
+        out of the data files and the change log."""
+        self._put(DOCUMENT_VERSIONS, version, publish=persist)
+        if persist:
+            self._save_all()
     
     def get_document(self, doc_id: str) -> Optional[Document]:
-        return self._documents.get(doc_id)
+        return self._lookup(DOCUMENTS, doc_id)
 
+    @_write("doc_id")
     def create_document_version(self, doc_id: str, version_name: str = None, change_description: str = None, created_by: str = None, source_url: str = None) -> DocumentVersion:
         # Get the latest version number as integer
-        existing_versions = self.get_document_versions_by_document(doc_id)
+        existing_versions = self.get_document_versions_by_document(doc_id, include_archived=True)
         if not existing_versions:
             new_version_number = "1"
         else:
@@ -353,12 +1116,164 @@ class Storage:
             created_by=created_by,
             source_url=source_url
         )
-        self._document_versions[version.id] = version
+        self._put(DOCUMENT_VERSIONS, version)
         self._save_all()
         return version
 
+    @_write("version")
+    def save_version_file(self, version: DocumentVersion, file_name: str, source: BinaryIO) -> DocumentVersion:
+        """Copy an uploaded file next to the other files of its version."""
+        target_dir = self.files_dir / version.id
+        target_dir.mkdir(parents=True, exist_ok=True)
+        target = target_dir / Path(file_name).name
+        with open(target, 'wb') as f:
+            shutil.copyfileobj(source, f)
+        version.file_name = file_name
+        version.file_path = str(target)
+        version.file_size = target.stat().st_size
+        self._changed(DOCUMENT_VERSIONS, version)
+        return version
+
+    # Ingestion batch methods
+    @_write("batch")
+    def add_ingestion_batch(self, batch: IngestionBatch):
+        self._put(INGESTION_BATCHES, batch)
+
+    def get_ingestion_batch(self, batch_id: str) -> Optional[IngestionBatch]:
+        batch = self._ingestion_batches.get(batch_id)
+        if not batch:
+            return None
+        # Progress is derived from the versions on every read so it never lags
+        # behind the processing threads.
+        versions = [self.get_document_version_by_id(v_id) for v_id in batch.document_version_ids]
+        versions = [v for v in versions if v]
+        batch.total = len(batch.document_version_ids)
+        batch.completed = sum(1 for v in versions if v.status == DocumentStatus.COMPLETED)
+        batch.failed = sum(1 for v in versions if v.status == DocumentStatus.FAILED)
+        batch.progress = sum(v.processing_progress for v in versions) / batch.total if batch.total else 100.0
+        if batch.completed + batch.failed < batch.total:
+            if any(v.status != DocumentStatus.PENDING for v in versions):
+                batch.status = BatchStatus.PROCESSING
+        elif batch.failed == 0:
+            batch.status = BatchStatus.COMPLETED
+        elif batch.completed == 0:
+            batch.status = BatchStatus.FAILED
+        else:
+            batch.status = BatchStatus.PARTIALLY_FAILED
+        batch.updated_at = datetime.now()
+        return batch
+
+    # Embedding migration methods
+    @_write("migration")
+    def put_embedding_migration(self, migration: EmbeddingMigration):
+        self._put(EMBEDDING_MIGRATIONS, migration)
+        self._save_all()
+
+    def get_embedding_migration(self, migration_id: str) -> Optional[EmbeddingMigration]:
+        return self._lookup(EMBEDDING_MIGRATIONS, migration_id)
+
+    def get_embedding_migrations_by_kb(self, kb_id: str) -> List[EmbeddingMigration]:
+        return [m for m in self._scan(EMBEDDING_MIGRATIONS, kb_id) if m.knowledge_base_id == kb_id]
+
+    def get_embedding_migrations_by_project(self, project_id: str) -> List[EmbeddingMigration]:
+        return self._scan(EMBEDDING_MIGRATIONS, project_id)
+
+    @_write("migration")
+    def cut_over_embedding_migration(self, migration: EmbeddingMigration):
+        """Switch the migration's knowledge base version and knowledge base to its model in one transaction."""
+        version = self.get_version_by_id(migration.knowledge_base_version_id)
+        kb = self.get_knowledge_base_by_id(migration.knowledge_base_id)
+        if not version or not kb:
+            raise ValueError("Knowledge base version not found")
+        now = datetime.now()
+        version.embedding_model = migration.target_model
+        version.updated_at = now
+        self._changed(KB_VERSIONS, version)
+        kb.embedding_model = migration.target_model
+        kb.embedding_provider = migration.target_provider
+        kb.updated_at = now
+        self._changed(KNOWLEDGE_BASES, kb)
+        self._put(EMBEDDING_MIGRATIONS, migration)
+        self._save_all()
+
+    # Garbage collection
+
+    def begin_collection(self):
+        """Start recording the document versions knowledge base versions reference from now on."""
+        self._shaded = set()
+
+    def end_collection(self):
+        self._shaded = None
+
+    @_write("version_id")
+    def purge_document_version(self, version_id: str) -> Optional[DocumentVersion]:
+        """Remove an archived document version's record for good.
+
+        Returns None, removing nothing, unless the version is archived and no
+        knowledge base version written since begin_collection references it.
+        """
+        version = self.cold.get(DOCUMENT_VERSIONS, version_id)
+        if version is None or (self._shaded is not None and version_id in self._shaded):
+            return None
+        self._remove_cold(DOCUMENT_VERSIONS, version)
+        self._save_all()
+        return version
+
+    @_write("version_id")
+    def set_kb_version_bundle(self, version_id: str, checksum: Optional[str], size: Optional[int]) -> KnowledgeBaseVersion:
+        """Record the checksum and size of a knowledge base version's exported bundle."""
+        version = self.get_version_by_id(version_id)
+        if not version:
+            raise ValueError("Version not found")
+        version.bundle_checksum = checksum
+        version.bundle_size = size
+        self._changed(KB_VERSIONS, version)
+        self._save_all()
+        return version
+
+def _shard_rows(*collections: str) -> Callable:
+    """Rows a call scans: the given collections of the shard of its first argument."""
+    def rows(storage: Storage, args: tuple, kwargs: dict) -> int:
+        ref = args[0] if args else next(iter(kwargs.values()), None)
+        shard = storage._loaded_shard(ref)
+        return sum(len(shard.records[collection]) for collection in collections) if shard else 0
+    return rows
+
+
+# Collections each scanning method iterates over, for the rows-scanned metric
+SCANNED_COLLECTIONS = {
+    "get_knowledge_bases_by_project": _shard_rows(KNOWLEDGE_BASES),
+    "get_versions_by_kb": _shard_rows(KB_VERSIONS),
+    "create_kb_version": _shard_rows(KB_VERSIONS),
+    "set_primary_kb_version": _shard_rows(KB_VERSIONS),
+    "get_documents_by_kb": _shard_rows(DOCUMENTS),
+    "get_documents_by_project": _shard_rows(DOCUMENTS),
+    "get_document_versions_by_document": _shard_rows(DOCUMENT_VERSIONS),
+    "create_document_version": _shard_rows(DOCUMENT_VERSIONS),
+}
+# Bookkeeping helpers that do not access records
+UNINSTRUMENTED_METHODS = {
+    "transaction", "revision", "etag", "collection_sizes", "add_change_listener",
+    "unload_idle_shards", "loaded_shard_count",
+}
+instrument_methods(Storage, SCANNED_COLLECTIONS, exclude=UNINSTRUMENTED_METHODS)
+
 # Create a global storage instance
 storage = Storage()
+threading.Thread(target=storage._sweep_shards, name="storage-shards", daemon=True).start()
+
+registry.gauge(
+    "kb_storage_records", "Records held in memory per collection, across loaded shards", ("collection",),
+    callback=lambda: {(name,): size for name, size in storage.collection_sizes().items()}
+)
+registry.gauge(
+    "kb_storage_loaded_shards", "Project shards held in memory",
+    callback=lambda: {(): storage.loaded_shard_count()}
+)
+registry.gauge(
+    "kb_storage_cold_records", "Archived records kept in the cold store per collection", ("collection",),
+    callback=lambda: {(name,): size for name, size in storage.cold.sizes().items()}
+)
 
 def get_storage() -> Storage:
     return storage 
\ No newline at end of file
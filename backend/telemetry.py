@@ -0,0 +1,222 @@
+"""
+Per-stage processing telemetry
+
+Every stage ``process_document`` runs is recorded as a StageEvent with its
+duration, bytes in/out and chunk and embedding counts. Events, queue waits
+and completed documents are kept for a rolling window and summarised on
+request into per-stage latency distributions and per-KB throughput, so the
+slowest stage and the queueing in front of the workers are visible. Stage
+latencies and queue waits are also exported as Prometheus histograms.
+"""
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Deque, Dict, Iterator, List, Optional, Tuple
+
+from .metrics import registry
+from .models import (
+    DocumentVersion, KnowledgeBaseThroughput, PipelineTelemetry, ProcessingStage, QueueWaitSummary,
+    StageEvent, StageSummary,
+)
+
+# How far back summaries look by default
+TELEMETRY_WINDOW_SECONDS = 15 * 60
+
+# Upper bound on the records kept for the window, whatever its length
+MAX_TELEMETRY_RECORDS = 20000
+
+# Stage latency buckets in seconds, from a cached lookup to a slow embed
+STAGE_DURATION_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+PIPELINE_STAGE_DURATION = registry.histogram(
+    "kb_pipeline_stage_duration_seconds", "Processing stage latency; _count is the number of executions",
+    ("stage",), STAGE_DURATION_BUCKETS)
+PIPELINE_STAGE_FAILURES = registry.counter(
+    "kb_pipeline_stage_failures_total", "Processing stage executions that raised", ("stage",))
+PIPELINE_STAGE_BYTES = registry.counter(
+    "kb_pipeline_stage_bytes_total", "Bytes read and written by processing stages", ("stage", "direction"))
+PIPELINE_QUEUE_WAIT = registry.histogram(
+    "kb_pipeline_queue_wait_seconds", "Time documents waited between being queued and processing starting",
+    buckets=STAGE_DURATION_BUCKETS)
+PIPELINE_CHUNKS = registry.counter("kb_pipeline_chunks_total", "Chunks produced by completed documents")
+
+
+class StageSpan:
+    """Counters a running stage fills in; recorded when the stage exits."""
+
+    __slots__ = ("bytes_in", "bytes_out", "chunk_count", "embedding_count", "duration_seconds")
+
+    def __init__(self):
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.chunk_count = 0
+        self.embedding_count = 0
+        # Set by stages streamed into another, to record only their own share of the time
+        self.duration_seconds: Optional[float] = None
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of values sorted in ascending order."""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def _queue_wait_summary(waits: List[float]) -> QueueWaitSummary:
+    if not waits:
+        return QueueWaitSummary()
+    waits = sorted(waits)
+    return QueueWaitSummary(
+        jobs=len(waits),
+        mean_seconds=sum(waits) / len(waits),
+        p50_seconds=percentile(waits, 0.50),
+        p95_seconds=percentile(waits, 0.95),
+        max_seconds=waits[-1],
+    )
+
+
+class PipelineTelemetryRecorder:
+    def __init__(self, window_seconds: float = TELEMETRY_WINDOW_SECONDS, max_records: int = MAX_TELEMETRY_RECORDS):
+        self.window_seconds = window_seconds
+        self._lock = threading.Lock()
+        self._started = time.time()
+        # (unix time, record) pairs, oldest first
+        self._events: Deque[Tuple[float, StageEvent]] = deque(maxlen=max_records)
+        self._queue_waits: Deque[Tuple[float, Optional[str], float]] = deque(maxlen=max_records)
+        self._completions: Deque[Tuple[float, Optional[str], int]] = deque(maxlen=max_records)
+
+    @contextmanager
+    def stage(self, version: DocumentVersion, kb_id: Optional[str], stage: ProcessingStage) -> Iterator[StageSpan]:
+        """Time one stage execution; failures are recorded and re-raised."""
+        span = StageSpan()
+        started_at = datetime.now()
+        start = time.perf_counter()
+        error_message = None
+        try:
+            yield span
+        except Exception as e:
+            error_message = str(e) or type(e).__name__
+            raise
+        finally:
+            self.record_stage(StageEvent(
+                document_id=version.document_id,
+                document_version_id=version.id,
+                knowledge_base_id=kb_id,
+                stage=stage,
+                started_at=started_at,
+                duration_seconds=(span.duration_seconds if span.duration_seconds is not None
+                                  else time.perf_counter() - start),
+                bytes_in=span.bytes_in,
+                bytes_out=span.bytes_out,
+                chunk_count=span.chunk_count,
+                embedding_count=span.embedding_count,
+                succeeded=error_message is None,
+                error_message=error_message,
+            ))
+
+    def record_stage(self, event: StageEvent):
+        stage = event.stage.value
+        PIPELINE_STAGE_DURATION.labels(stage).observe(event.duration_seconds)
+        PIPELINE_STAGE_BYTES.labels(stage, "in").inc(event.bytes_in)
+        PIPELINE_STAGE_BYTES.labels(stage, "out").inc(event.bytes_out)
+        if not event.succeeded:
+            PIPELINE_STAGE_FAILURES.labels(stage).inc()
+        with self._lock:
+            self._events.append((time.time(), event))
+
+    def record_queue_wait(self, kb_id: Optional[str], seconds: float):
+        PIPELINE_QUEUE_WAIT.observe(seconds)
+        with self._lock:
+            self._queue_waits.append((time.time(), kb_id, seconds))
+
+    def record_completion(self, kb_id: Optional[str], chunk_count: int):
+        PIPELINE_CHUNKS.inc(chunk_count)
+        with self._lock:
+            self._completions.append((time.time(), kb_id, chunk_count))
+
+    def recent_events(self, kb_id: Optional[str] = None, stage: Optional[ProcessingStage] = None,
+                      limit: int = 100) -> List[StageEvent]:
+        """Most recent stage events first, optionally for one KB or stage."""
+        with self._lock:
+            events = list(self._events)
+        matching = []
+        for _, event in reversed(events):
+            if (kb_id is None or event.knowledge_base_id == kb_id) and (stage is None or event.stage == stage):
+                matching.append(event)
+                if len(matching) >= limit:
+                    break
+        return matching
+
+    def summary(self, kb_id: Optional[str] = None, window_seconds: Optional[float] = None) -> PipelineTelemetry:
+        window = window_seconds or self.window_seconds
+        now = time.time()
+        cutoff = now - window
+        # Rates are per observed time, so a freshly started server is not diluted
+        elapsed = max(1.0, min(window, now - self._started))
+        with self._lock:
+            events = [e for ts, e in self._events if ts >= cutoff and (kb_id is None or e.knowledge_base_id == kb_id)]
+            waits = [(k, s) for ts, k, s in self._queue_waits if ts >= cutoff and (kb_id is None or k == kb_id)]
+            completions = [(k, c) for ts, k, c in self._completions if ts >= cutoff and (kb_id is None or k == kb_id)]
+
+        stages = [self._stage_summary(stage, [e for e in events if e.stage == stage]) for stage in ProcessingStage]
+        executed = [s for s in stages if s.executions]
+        bottleneck = max(executed, key=lambda s: s.total_seconds).stage if executed else None
+
+        kb_ids = [kb_id] if kb_id else sorted({k for k, _ in waits + completions if k})
+        throughput = []
+        for k in kb_ids:
+            done = [c for ck, c in completions if ck == k]
+            throughput.append(KnowledgeBaseThroughput(
+                knowledge_base_id=k,
+                window_seconds=elapsed,
+                documents_completed=len(done),
+                chunks_produced=sum(done),
+                documents_per_minute=len(done) * 60 / elapsed,
+                chunks_per_second=sum(done) / elapsed,
+                queue_wait=_queue_wait_summary([s for wk, s in waits if wk == k]),
+            ))
+
+        return PipelineTelemetry(
+            window_seconds=elapsed,
+            stages=stages,
+            queue_wait=_queue_wait_summary([s for _, s in waits]),
+            throughput=throughput,
+            bottleneck_stage=bottleneck,
+        )
+
+    @staticmethod
+    def _stage_summary(stage: ProcessingStage, events: List[StageEvent]) -> StageSummary:
+        summary = StageSummary(stage=stage)
+        if not events:
+            return summary
+        durations = sorted(e.duration_seconds for e in events)
+        histogram: Dict[str, int] = {f"le_{bound}s": 0 for bound in STAGE_DURATION_BUCKETS}
+        histogram["le_inf"] = 0
+        for duration in durations:
+            bound = next((b for b in STAGE_DURATION_BUCKETS if duration <= b), None)
+            histogram[f"le_{bound}s" if bound is not None else "le_inf"] += 1
+        summary.executions = len(events)
+        summary.failures = sum(1 for e in events if not e.succeeded)
+        summary.total_seconds = sum(durations)
+        summary.mean_seconds = summary.total_seconds / len(durations)
+        summary.p50_seconds = percentile(durations, 0.50)
+        summary.p95_seconds = percentile(durations, 0.95)
+        summary.p99_seconds = percentile(durations, 0.99)
+        summary.max_seconds = durations[-1]
+        summary.bytes_in = sum(e.bytes_in for e in events)
+        summary.bytes_out = sum(e.bytes_out for e in events)
+        summary.chunk_count = sum(e.chunk_count for e in events)
+        summary.embedding_count = sum(e.embedding_count for e in events)
+        summary.histogram = histogram
+        return summary
+
+
+# Create a global telemetry instance
+pipeline_telemetry = PipelineTelemetryRecorder()
+
+def get_pipeline_telemetry() -> PipelineTelemetryRecorder:
+    return pipeline_telemetry
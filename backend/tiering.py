@@ -0,0 +1,157 @@
+"""
+Cold store for archived records
+
+Archived document versions and knowledge base versions are rarely read, so
+Storage keeps them out of memory and out of the data files. They live in
+gzip-compressed JSON segments, one per parent (document or knowledge base),
+so archiving a record rewrites only its siblings. An append-only index maps
+record ids to their parent for direct lookups; recently read segments are
+cached.
+
+Writes happen under the Storage lock (and, with several workers, the change
+log lock). Other processes learn about cold records from the change log and
+only update their index and cache.
+"""
+
+import gzip
+import json
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from .metrics import registry
+
+# Decoded segments kept in memory
+COLD_SEGMENT_CACHE_SIZE = 64
+
+COLD_READS = registry.counter(
+    "kb_storage_cold_reads_total", "Archived records served from the cold store", ("collection",)
+)
+COLD_SEGMENT_LOADS = registry.counter(
+    "kb_storage_cold_segment_loads_total", "Cold store segments read from disk", ("collection",)
+)
+
+
+class ColdStore:
+    def __init__(self, root: Path, models: Dict[str, Any]):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.models = models
+        self.index_file = self.root / "index.log"
+        # (collection, record id) -> parent id
+        self._index: Dict[Tuple[str, str], str] = {}
+        self._segments: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._load_index()
+
+    def _load_index(self):
+        if not self.index_file.exists():
+            return
+        with open(self.index_file, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                entry = json.loads(line)
+                key = (entry["c"], entry["id"])
+                if entry.get("p") is None:
+                    self._index.pop(key, None)
+                else:
+                    self._index[key] = entry["p"]
+
+    def _append_index(self, collection: str, record_id: str, parent: Optional[str]):
+        with open(self.index_file, "ab") as f:
+            f.write(json.dumps({"c": collection, "id": record_id, "p": parent}).encode() + b"\n")
+
+    def _segment_path(self, collection: str, parent: str) -> Path:
+        return self.root / collection / f"{parent}.json.gz"
+
+    def _segment(self, collection: str, parent: str) -> Dict[str, Any]:
+        key = (collection, parent)
+        segment = self._segments.get(key)
+        if segment is not None:
+            self._segments.move_to_end(key)
+            return segment
+        model = self.models[collection]
+        try:
+            with gzip.open(self._segment_path(collection, parent), "rb") as f:
+                segment = {item["id"]: model(**item) for item in json.load(f)}
+        except FileNotFoundError:
+            segment = {}
+        COLD_SEGMENT_LOADS.labels(collection).inc()
+        self._segments[key] = segment
+        if len(self._segments) > COLD_SEGMENT_CACHE_SIZE:
+            self._segments.popitem(last=False)
+        return segment
+
+    def _write_segment(self, collection: str, parent: str, segment: Dict[str, Any]):
+        path = self._segment_path(collection, parent)
+        if not segment:
+            path.unlink(missing_ok=True)
+            return
+        path.parent.mkdir(exist_ok=True)
+        content = json.dumps([item.model_dump(mode="json") for item in segment.values()]).encode()
+        tmp = path.with_name(path.name + ".tmp")
+        with gzip.open(tmp, "wb") as f:
+            f.write(content)
+        os.replace(tmp, path)
+
+    def contains(self, collection: str, record_id: str) -> bool:
+        return (collection, record_id) in self._index
+
+    def get(self, collection: str, record_id: str) -> Optional[Any]:
+        parent = self._index.get((collection, record_id))
+        if parent is None:
+            return None
+        with self._lock:
+            item = self._segment(collection, parent).get(record_id)
+        if item is not None:
+            COLD_READS.labels(collection).inc()
+        return item
+
+    def list(self, collection: str, parent: str) -> List[Any]:
+        with self._lock:
+            items = list(self._segment(collection, parent).values())
+        COLD_READS.labels(collection).inc(len(items))
+        return items
+
+    def put(self, collection: str, parent: str, item: Any):
+        """Write a record into its parent's segment."""
+        with self._lock:
+            segment = self._segment(collection, parent)
+            segment[item.id] = item
+            self._write_segment(collection, parent, segment)
+            if self._index.get((collection, item.id)) != parent:
+                self._append_index(collection, item.id, parent)
+            self._index[(collection, item.id)] = parent
+
+    def remove(self, collection: str, record_id: str):
+        """Drop a record that is no longer archived."""
+        with self._lock:
+            parent = self._index.pop((collection, record_id), None)
+            if parent is None:
+                return
+            segment = self._segment(collection, parent)
+            segment.pop(record_id, None)
+            self._write_segment(collection, parent, segment)
+            self._append_index(collection, record_id, None)
+
+    def note(self, collection: str, parent: str, record_id: str):
+        """Record a cold write made by another process."""
+        with self._lock:
+            self._index[(collection, record_id)] = parent
+            self._segments.pop((collection, parent), None)
+
+    def forget(self, collection: str, record_id: str):
+        """Record a cold removal made by another process."""
+        with self._lock:
+            parent = self._index.pop((collection, record_id), None)
+            if parent is not None:
+                self._segments.pop((collection, parent), None)
+
+    def sizes(self) -> Dict[str, int]:
+        sizes = {collection: 0 for collection in self.models}
+        for collection, _ in list(self._index):
+            sizes[collection] += 1
+        return sizes
@@ -124,7 +124,7 @@ class ApiClient {
 
   // KB Versions
   async getKnowledgeBaseVersions(kbId: string): Promise<KnowledgeBaseVersion[]> {
-    const response = await this.axiosInstance.get(`/knowledge-bases/${kbId}/versions`)
+    const response = await this.axiosInstance.get(`/knowledge-bases/${kbId}/versions`, { params: { include_archived: true } })
     return response.data.versions
   }
 
@@ -157,12 +157,12 @@ class ApiClient {
   }
 
   async getAllDocumentVersions(projectId: string): Promise<DocumentVersion[]> {
-    const response = await this.axiosInstance.get(`/projects/${projectId}/document-versions`)
+    const response = await this.axiosInstance.get(`/projects/${projectId}/document-versions`, { params: { include_archived: true } })
     return response.data.document_versions
   }
 
   async getDocumentVersions(docId: string): Promise<DocumentVersion[]> {
-    const response = await this.axiosInstance.get(`/documents/${docId}/versions`)
+    const response = await this.axiosInstance.get(`/documents/${docId}/versions`, { params: { include_archived: true } })
     return response.data.document_versions
   }
 
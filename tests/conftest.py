@@ -0,0 +1,36 @@
+import os
+import tempfile
+from pathlib import Path
+
+import pytest
+
+
+def pytest_sessionstart(session):
+    # The storage and artifact singletons keep their files under
+    # backend/data, relative to the working directory, from the moment
+    # backend.storage is imported; run the tests from a scratch directory so
+    # they never touch the checkout's data.
+    workdir = Path(tempfile.mkdtemp(prefix="kb-tests-"))
+    (workdir / "backend").mkdir()
+    os.chdir(workdir)
+
+
+@pytest.fixture
+def client():
+    from fastapi.testclient import TestClient
+    from backend.main import app
+
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def project(client):
+    return client.post("/api/projects", json={"name": "Tests", "description": ""}).json()
+
+
+@pytest.fixture
+def knowledge_base(client, project):
+    return client.post(
+        f"/api/projects/{project['id']}/knowledge-bases", json={"name": "Tests", "description": ""}
+    ).json()
@@ -0,0 +1,40 @@
+import asyncio
+
+import httpx
+
+from backend.api.async_client import AsyncAPIClient
+from backend.api.client import APIClient
+from backend.main import app
+
+
+def _document_with_kb_version(client, knowledge_base):
+    doc = client.post(f"/api/knowledge-bases/{knowledge_base['id']}/documents", json={"name": "guide"}).json()
+    versions = client.get(f"/api/documents/{doc['id']}/versions").json()["document_versions"]
+    kb_version = client.post(
+        f"/api/knowledge-bases/{knowledge_base['id']}/versions",
+        json={"version_bump": "minor", "document_version_ids": [versions[0]["id"]]},
+    ).json()
+    return doc, kb_version
+
+
+def test_sync_client_lists_project_documents(client, project, knowledge_base):
+    doc, _ = _document_with_kb_version(client, knowledge_base)
+    api = APIClient("http://testserver")
+    api.session = client
+
+    documents = api.get_documents(project["id"])
+
+    assert [d.id for d in documents] == [doc["id"]]
+
+
+def test_async_client_lists_documents(client, project, knowledge_base):
+    doc, kb_version = _document_with_kb_version(client, knowledge_base)
+
+    async def fetch():
+        async with AsyncAPIClient("http://testserver", transport=httpx.ASGITransport(app=app)) as api:
+            return await api.get_documents(project["id"]), await api.get_kb_version_documents(kb_version["id"])
+
+    project_documents, kb_version_documents = asyncio.run(fetch())
+
+    assert [d.id for d in project_documents] == [doc["id"]]
+    assert [d.id for d in kb_version_documents] == [doc["id"]]
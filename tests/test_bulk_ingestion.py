@@ -0,0 +1,52 @@
+import json
+
+# Refused at once, so the batch's processing never waits on the network
+UNREACHABLE = "http://127.0.0.1:9"
+
+
+def _bulk(client, kb_id, **kwargs):
+    return client.post(f"/api/knowledge-bases/{kb_id}/documents/bulk", **kwargs)
+
+
+def test_multipart_batch(client, knowledge_base):
+    kb_id = knowledge_base["id"]
+    files = [("files", (f"guide-{i}.txt", f"Guide {i}".encode(), "text/plain")) for i in range(3)]
+
+    response = _bulk(client, kb_id, files=files, data={"description": "Guides"})
+
+    assert response.status_code == 202
+    batch = response.json()
+    assert batch["knowledge_base_id"] == kb_id
+    assert batch["total"] == len(batch["document_ids"]) == len(batch["document_version_ids"]) == 3
+    assert client.get(f"/api/ingestion-batches/{batch['id']}").json()["id"] == batch["id"]
+    names = {doc["name"] for doc in client.get(f"/api/knowledge-bases/{kb_id}/documents").json()["documents"]}
+    assert {"guide-0.txt", "guide-1.txt", "guide-2.txt"} <= names
+
+
+def test_ndjson_batch_with_lines_split_across_chunks(client, knowledge_base):
+    kb_id = knowledge_base["id"]
+    manifest = b"".join(
+        json.dumps({"url": f"{UNREACHABLE}/{i}.txt", "name": f"remote-{i}"}).encode() + b"\n" for i in range(4)
+    )
+    # Chunk boundaries fall inside lines, and the last line has no newline
+    manifest = manifest.rstrip(b"\n")
+    chunks = [manifest[i:i + 7] for i in range(0, len(manifest), 7)]
+
+    response = _bulk(client, kb_id, content=iter(chunks), headers={"content-type": "application/x-ndjson"})
+
+    assert response.status_code == 202
+    batch = response.json()
+    assert batch["total"] == 4
+    documents = {doc["id"]: doc["name"] for doc in client.get(f"/api/knowledge-bases/{kb_id}/documents").json()["documents"]}
+    assert [documents[doc_id] for doc_id in batch["document_ids"]] == [f"remote-{i}" for i in range(4)]
+
+
+def test_rejected_batches(client, knowledge_base):
+    kb_id = knowledge_base["id"]
+    ndjson = {"content-type": "application/x-ndjson"}
+
+    assert _bulk(client, kb_id, content=b"not json\n", headers=ndjson).status_code == 400
+    assert _bulk(client, kb_id, content=b'{"url": "file:///etc/passwd"}\n', headers=ndjson).status_code == 400
+    assert _bulk(client, kb_id, content=b"\n\n", headers=ndjson).status_code == 400
+    assert _bulk(client, kb_id, content=b"[]", headers={"content-type": "application/json"}).status_code == 415
+    assert _bulk(client, "missing", content=b"", headers=ndjson).status_code == 404
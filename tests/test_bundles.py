@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from backend.bundles import TEXT_SECTION, Bundle, BundleEntry, BundleError, write_bundle
+from backend.chunk_store import ChunkTable, encode_table
+from backend.chunking import chunk_hash
+from backend.models import Chunk, DocumentVersion, EmbeddingModel, KnowledgeBaseVersion
+
+MODEL = EmbeddingModel.SENTENCE_TRANSFORMERS
+
+
+def _entry(text: bytes, dimensions: int = 4) -> BundleEntry:
+    version = DocumentVersion(document_id="doc", version_number="v1", created_by="user1", embedding_model=MODEL)
+    middle = len(text) // 2
+    chunks = [
+        Chunk(index=index, hash=chunk_hash(text[start:end]), start=start, end=end, text=text[start:end].decode())
+        for index, (start, end) in enumerate([(0, middle), (middle, len(text))])
+    ]
+    vectors = np.random.default_rng(len(text)).random((len(chunks), dimensions), dtype=np.float32)
+    return BundleEntry(version, "guide.txt", MODEL, ChunkTable(version.id, encode_table(chunks), text), vectors)
+
+
+@pytest.fixture
+def bundle_path(tmp_path):
+    entries = [_entry(b"The first document, in two chunks."), _entry(b"And a second one with other words.")]
+    kb_version = KnowledgeBaseVersion(
+        knowledge_base_id="kb", version_number="1.0.0", status="published", access_level="private",
+        created_by="user1", document_version_ids=[entry.version.id for entry in entries] + ["processing"],
+    )
+    path = tmp_path / f"{kb_version.id}.kbv"
+    size, checksum = write_bundle(path, kb_version, MODEL, entries)
+    assert size == path.stat().st_size
+    return path, kb_version, entries, checksum
+
+
+def test_bundle_round_trip(bundle_path):
+    path, kb_version, entries, checksum = bundle_path
+
+    bundle = Bundle(path)
+
+    assert bundle.checksum == checksum
+    assert bundle.kb_version == kb_version
+    assert bundle.embedding_model == MODEL
+    assert bundle.document_version_ids == [entry.version.id for entry in entries]
+    assert [document["id"] for document in bundle.documents] == bundle.document_version_ids
+    np.testing.assert_array_equal(bundle.vectors(MODEL), np.concatenate([entry.vectors for entry in entries]))
+    for document, entry in zip(bundle.documents, entries):
+        assert bundle.chunk_table(document).chunks() == entry.table.chunks()
+    assert not list(path.parent.glob("*.tmp"))
+
+
+def test_corrupted_section_fails_verification(bundle_path):
+    path, *_ = bundle_path
+    offset = Bundle(path).manifest["sections"][TEXT_SECTION]["offset"]
+    data = bytearray(path.read_bytes())
+    data[offset] ^= 0xFF
+    path.write_bytes(bytes(data))
+
+    with pytest.raises(BundleError, match="section text checksum mismatch"):
+        Bundle(path)
+    # Only the manifest is checked without verification
+    Bundle(path, verify=False)
+
+
+def test_corrupted_manifest_is_rejected(bundle_path):
+    path, *_ = bundle_path
+    data = bytearray(path.read_bytes())
+    data[-2] ^= 0xFF
+    path.write_bytes(bytes(data))
+
+    with pytest.raises(BundleError, match="manifest checksum mismatch"):
+        Bundle(path, verify=False)
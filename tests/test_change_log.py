@@ -0,0 +1,27 @@
+from backend.models import CreateProjectRequest, DocumentStatus, ProcessingStage
+from backend.storage import Storage
+
+
+def test_progress_kept_in_memory_is_not_logged(tmp_path):
+    storage = Storage(data_dir=str(tmp_path), coordinated=True)
+    user_id = storage.get_all_users()[0].id
+    project = storage.create_project(CreateProjectRequest(name="Tests", description=""), user_id)
+    kb = storage.create_kb(project.id, "Tests", "", user_id)
+    doc = storage.create_document(kb.id, "guide", "", user_id)
+    version = storage.create_document_version(doc.id, created_by=user_id)
+    log_size = storage.change_log_file.stat().st_size
+
+    version.status = DocumentStatus.PROCESSING
+    for progress in (10.0, 20.0, 30.0):
+        version.processing_progress = progress
+        storage.update_document_version(version, persist=False)
+
+    assert storage.change_log_file.stat().st_size == log_size
+    assert storage.get_document_version_by_id(version.id).processing_progress == 30.0
+
+    version.processing_stage = ProcessingStage.EMBED
+    storage.update_document_version(version)
+
+    assert storage.change_log_file.stat().st_size > log_size
+    other = Storage(data_dir=str(tmp_path), coordinated=True)
+    assert other.get_document_version_by_id(version.id).processing_stage == ProcessingStage.EMBED
@@ -0,0 +1,51 @@
+import json
+
+import pytest
+
+from backend.artifacts import CHUNK_TABLE_FILE, LEGACY_CHUNKS_FILE, ArtifactStore
+from backend.chunking import chunk_hash
+from backend.models import Chunk
+
+TEXT = "Größen und Maße.\nThe second chunk overlaps the first one.\n".encode()
+
+
+def _chunks():
+    spans = [(0, 18), (10, 50), (40, len(TEXT))]
+    return [
+        Chunk(index=index, hash=chunk_hash(TEXT[start:end]), start=start, end=end,
+              text=TEXT[start:end].decode(), duplicate_of="other-version:3" if index == 1 else None)
+        for index, (start, end) in enumerate(spans)
+    ]
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ArtifactStore(tmp_path / "artifacts", tmp_path / "cold")
+
+
+def test_chunk_table_reads_like_the_legacy_chunks_file(store):
+    chunks = _chunks()
+    store.write_text("legacy", TEXT)
+    path = store.version_dir("legacy") / LEGACY_CHUNKS_FILE
+    path.write_text(json.dumps([chunk.model_dump() for chunk in chunks]))
+    store.write_text("table", TEXT)
+    store.write_chunks("table", chunks)
+
+    assert store.read_chunks("legacy") == chunks
+    assert store.read_chunks("table") == chunks
+    assert (store.version_dir("table") / CHUNK_TABLE_FILE).exists()
+    assert store.get_chunk("table:1") == store.get_chunk("legacy:1") == chunks[1]
+    assert store.get_chunk("table:3") is None
+
+
+def test_writing_the_chunk_table_replaces_the_legacy_file(store):
+    chunks = _chunks()
+    store.write_text("version", TEXT)
+    path = store.version_dir("version") / LEGACY_CHUNKS_FILE
+    path.write_text(json.dumps([chunk.model_dump() for chunk in chunks]))
+    assert store.read_chunks("version") == chunks
+
+    store.write_chunks("version", chunks[:2])
+
+    assert not path.exists()
+    assert store.read_chunks("version") == chunks[:2]
@@ -0,0 +1,56 @@
+import time
+from datetime import datetime, timedelta
+
+from backend.artifacts import artifact_store
+from backend.collector import garbage_collector
+from backend.models import CollectionStatus, DocumentStatus
+from backend.storage import storage
+
+
+def _archived_version(doc_id: str, days_ago: float):
+    version = storage.create_document_version(doc_id, created_by="user1")
+    artifact_store.write_text(version.id, b"Text of an archived version")
+    (storage.files_dir / version.id).mkdir(parents=True)
+    (storage.files_dir / version.id / "guide.txt").write_bytes(b"Uploaded file")
+    version.status = DocumentStatus.COMPLETED
+    version.is_archived = True
+    version.archived_at = datetime.now() - timedelta(days=days_ago)
+    storage.update_document_version(version)
+    return version
+
+
+def _collect(dry_run: bool):
+    run = garbage_collector.start(dry_run=dry_run, retention_days=30)
+    deadline = time.monotonic() + 10
+    while run.status == CollectionStatus.RUNNING and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert run.status == CollectionStatus.COMPLETED
+    return run
+
+
+def test_dry_run_lists_what_a_collection_removes(knowledge_base):
+    kb_id = knowledge_base["id"]
+    doc = storage.create_document(kb_id, "guide", "", "user1")
+    expired = _archived_version(doc.id, days_ago=60)
+    recent = _archived_version(doc.id, days_ago=1)
+    referenced = _archived_version(doc.id, days_ago=60)
+    storage.create_kb_version(kb_id, "user1", "minor", document_version_ids=[referenced.id])
+
+    dry_run = _collect(dry_run=True)
+
+    assert [item.id for item in dry_run.collected if item.kind == "document_version"] == [expired.id]
+    assert dry_run.retained_versions == 1
+    assert storage.get_document_version_by_id(expired.id) is not None
+    assert artifact_store.version_dir(expired.id).exists()
+
+    collection = _collect(dry_run=False)
+
+    assert [item.model_dump() for item in collection.collected] == [item.model_dump() for item in dry_run.collected]
+    assert collection.reclaimed_bytes == dry_run.reclaimed_bytes > 0
+    assert storage.get_document_version_by_id(expired.id) is None
+    assert not artifact_store.version_dir(expired.id).exists()
+    assert not (storage.files_dir / expired.id).exists()
+    for kept in (recent, referenced):
+        assert storage.get_document_version_by_id(kept.id) is not None
+        assert artifact_store.version_dir(kept.id).exists()
+        assert (storage.files_dir / kept.id).exists()
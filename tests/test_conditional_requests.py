@@ -0,0 +1,35 @@
+def test_matching_if_none_match_is_not_modified(client, knowledge_base):
+    path = f"/api/knowledge-bases/{knowledge_base['id']}/documents"
+    response = client.get(path)
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+    assert response.headers["cache-control"] == "no-cache"
+
+    response = client.get(path, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+
+    # Weak and listed validators match too
+    assert client.get(path, headers={"If-None-Match": f'"other", W/{etag}'}).status_code == 304
+    assert client.get(path, headers={"If-None-Match": '"other"'}).status_code == 200
+
+
+def test_writes_change_the_validator(client, knowledge_base):
+    path = f"/api/knowledge-bases/{knowledge_base['id']}/documents"
+    etag = client.get(path).headers["etag"]
+
+    client.post(path, json={"name": "guide"})
+
+    response = client.get(path, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+    assert [doc["name"] for doc in response.json()["documents"]] == ["guide"]
+
+
+def test_unknown_ids_are_not_found_whatever_the_validator(client, knowledge_base):
+    etag = client.get(f"/api/knowledge-bases/{knowledge_base['id']}").headers["etag"]
+    for path in ("/api/projects/missing", "/api/knowledge-bases/missing", "/api/documents/missing",
+                 "/api/document-versions/missing", "/api/kb-versions/missing/documents"):
+        assert client.get(path, headers={"If-None-Match": etag}).status_code == 404
+        assert client.get(path, headers={"If-None-Match": "*"}).status_code == 404
@@ -0,0 +1,19 @@
+def test_create_document_version_from_json_and_form(client, knowledge_base):
+    doc = client.post(f"/api/knowledge-bases/{knowledge_base['id']}/documents", json={"name": "guide"}).json()
+
+    response = client.post(f"/api/documents/{doc['id']}/versions", json={"version_name": "Draft"})
+    assert response.status_code == 201
+    assert response.json()["version_name"] == "Draft"
+
+    response = client.post(
+        f"/api/documents/{doc['id']}/versions",
+        data={"version_name": "Upload", "change_description": "New text"},
+        files={"file": ("guide.txt", b"Updated guide", "text/plain")},
+    )
+    assert response.status_code == 201
+    version = response.json()
+    assert version["change_description"] == "New text"
+    assert version["mime_type"] == "text/plain"
+    assert version["file_name"] == "guide.txt"
+
+    assert client.post("/api/documents/missing/versions", json={}).status_code == 404
@@ -0,0 +1,65 @@
+import asyncio
+import json
+
+from backend.events import DOCUMENT_SCOPE, event_bus
+from backend.main import _progress_event_stream, _sse_response
+from backend.models import DocumentStatus, ProcessingStage, ProgressEvent
+
+
+class _Request:
+    """Stands in for the request of a stream that disconnects after ``checks`` polls."""
+
+    def __init__(self, checks: int):
+        self.checks = checks
+
+    async def is_disconnected(self) -> bool:
+        self.checks -= 1
+        return self.checks < 0
+
+
+def _data(message: str) -> dict:
+    event, data = message.strip().split("\n")
+    assert event == "event: progress"
+    return json.loads(data.removeprefix("data: "))
+
+
+def test_stream_sends_the_snapshot_then_published_events(client, knowledge_base):
+    doc = client.post(f"/api/knowledge-bases/{knowledge_base['id']}/documents", json={"name": "guide"}).json()
+    pending = [v for v in client.get(f"/api/documents/{doc['id']}/versions").json()["document_versions"]
+               if v["status"] in ("pending", "processing")]
+
+    assert pending
+
+    async def read():
+        stream = _progress_event_stream(_Request(checks=1), DOCUMENT_SCOPE, doc["id"])
+        messages = [await stream.__anext__() for _ in pending]
+        subscribers = event_bus.subscriber_count()
+        event_bus.publish(ProgressEvent(document_id=doc["id"], document_version_id="version",
+                                        status=DocumentStatus.PROCESSING, processing_stage=ProcessingStage.EMBED,
+                                        processing_progress=50.0))
+        messages.append(await asyncio.wait_for(stream.__anext__(), 5))
+        # The client is gone at the next poll, which ends the stream
+        messages.extend([message async for message in stream])
+        return messages, subscribers
+
+    messages, subscribers = asyncio.run(read())
+
+    assert subscribers >= 1
+    assert [_data(m)["document_version_id"] for m in messages[:len(pending)]] == [v["id"] for v in pending]
+    published = _data(messages[len(pending)])
+    assert published["processing_stage"] == "embed" and published["processing_progress"] == 50.0
+    assert len(messages) == len(pending) + 1
+    assert event_bus.subscriber_count() == subscribers - 1
+
+
+def test_stream_headers():
+    response = _sse_response(_Request(checks=0), DOCUMENT_SCOPE, "doc")
+    assert response.media_type == "text/event-stream"
+    assert response.headers["cache-control"] == "no-cache"
+    assert response.headers["x-accel-buffering"] == "no"
+
+
+def test_streams_of_unknown_scopes_are_not_found(client):
+    for path in ("/api/documents/missing/events", "/api/knowledge-bases/missing/events",
+                 "/api/projects/missing/events"):
+        assert client.get(path).status_code == 404
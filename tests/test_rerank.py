@@ -0,0 +1,52 @@
+import time
+
+import numpy as np
+
+from backend.embeddings import tokenize
+from backend.models import EmbeddingModel, RerankOptions, SearchResult
+from backend.rerank import Candidate, LexicalCrossScorer, rerank
+
+TEXTS = [
+    "Indexing the search index",
+    "reindex_search: indexes, not an index",
+    "Über die Suche, über-Index",
+    "nothing relevant here",
+]
+
+
+def _candidates():
+    vectors = np.eye(len(TEXTS), dtype=np.float32)
+    return [
+        Candidate(SearchResult(knowledge_base_id="kb", knowledge_base_version_id="kbv", document_id=f"doc-{i}",
+                               document_version_id="dv", chunk_index=i, score=1.0 - i / 10, text=text,
+                               start=0, end=0),
+                  vectors[i], EmbeddingModel.TEXT_EMBEDDING_3_SMALL)
+        for i, text in enumerate(TEXTS)
+    ]
+
+
+def test_lexical_scorer_matches_whole_tokens():
+    scorer = LexicalCrossScorer()
+    query = "search index über"
+    _, found = scorer.prepare(query, TEXTS)
+
+    terms = set(tokenize(query))
+    assert found == {text: terms.intersection(tokenize(text)) for text in TEXTS}
+
+
+def test_lexical_scorer_stops_preparing_at_the_deadline():
+    scorer = LexicalCrossScorer()
+    state = scorer.prepare("search index", TEXTS, deadline=time.perf_counter())
+
+    assert np.isnan(scorer.score("search index", TEXTS, state)).all()
+
+
+def test_rerank_reports_an_exhausted_budget():
+    options = RerankOptions(candidates=len(TEXTS), cross_scorer="lexical", budget_ms=10000)
+    _, stats = rerank("search index", _candidates(), 2, options)
+    assert stats.cross_scored == len(TEXTS) and not stats.budget_exhausted
+
+    options.budget_ms = 1e-6
+    picked, stats = rerank("search index", _candidates(), 2, options)
+    assert len(picked) == 2
+    assert stats.cross_scored < len(TEXTS) and stats.budget_exhausted
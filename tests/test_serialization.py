@@ -0,0 +1,47 @@
+from pydantic import BaseModel
+
+from backend.serialization import EncodedRecordCache
+
+
+class Record(BaseModel):
+    id: str
+    name: str = ""
+
+
+def test_encoded_records_are_evicted_least_recently_served_first():
+    revisions = {}
+    cache = EncodedRecordCache(lambda collection, record_id: revisions.get(record_id, 0), max_size=2)
+    first, second, third = (Record(id=name) for name in ("first", "second", "third"))
+
+    cache.encode("records", first)
+    cache.encode("records", second)
+    cache.encode("records", first)
+    cache.encode("records", third)
+
+    assert len(cache) == 2
+    assert ("records", "second") not in cache._fragments
+    assert ("records", "first") in cache._fragments
+
+
+def test_changed_records_are_encoded_again():
+    revisions = {"record": 1}
+    cache = EncodedRecordCache(lambda collection, record_id: revisions[record_id])
+    record = Record(id="record", name="before")
+    assert b"before" in cache.encode("records", record)
+
+    record.name = "after"
+    assert b"before" in cache.encode("records", record)
+    revisions["record"] = 2
+    assert b"after" in cache.encode("records", record)
+
+
+def test_list_endpoint_serves_records_changed_since_they_were_cached(client, knowledge_base):
+    kb_id = knowledge_base["id"]
+    version = client.post(f"/api/knowledge-bases/{kb_id}/versions", json={"version_bump": "minor"}).json()
+    listed = client.get(f"/api/knowledge-bases/{kb_id}/versions").json()["versions"]
+    assert next(v for v in listed if v["id"] == version["id"])["status"] == "draft"
+
+    client.put(f"/api/knowledge-bases/{kb_id}/versions/{version['id']}/publish")
+
+    listed = client.get(f"/api/knowledge-bases/{kb_id}/versions").json()["versions"]
+    assert next(v for v in listed if v["id"] == version["id"])["status"] == "published"
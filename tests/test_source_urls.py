@@ -0,0 +1,37 @@
+import pytest
+
+from backend import pipeline
+from backend.models import DocumentVersion
+
+
+@pytest.mark.parametrize("url", ["file:///etc/passwd", "ftp://example.com/a.txt", "http:///etc/passwd"])
+def test_check_source_url_rejects_other_schemes(url):
+    with pytest.raises(ValueError):
+        pipeline.check_source_url(url)
+
+
+def test_download_does_not_read_file_urls():
+    version = DocumentVersion(
+        document_id="doc", version_number="v1", created_by="user1", source_url="file:///etc/passwd"
+    )
+
+    with pytest.raises(pipeline.ProcessingError):
+        pipeline.download(version)
+
+
+def test_file_urls_are_rejected_by_the_api(client, knowledge_base):
+    kb_id = knowledge_base["id"]
+    response = client.post(f"/api/knowledge-bases/{kb_id}/documents/from-url", json={"url": "file:///etc/passwd"})
+    assert response.status_code == 400
+
+    doc = client.post(f"/api/knowledge-bases/{kb_id}/documents", json={"name": "guide"}).json()
+    response = client.post(f"/api/documents/{doc['id']}/versions/from-url", json={"url": "file:///etc/passwd"})
+    assert response.status_code == 400
+
+    response = client.post(
+        f"/api/knowledge-bases/{kb_id}/documents/bulk",
+        content=b'{"url": "https://example.com/a.txt"}\n{"url": "file:///etc/passwd"}\n',
+        headers={"content-type": "application/x-ndjson"},
+    )
+    assert response.status_code == 400
+    assert client.get(f"/api/knowledge-bases/{kb_id}/documents").json()["documents"] == [doc]
@@ -0,0 +1,42 @@
+from datetime import datetime
+
+from backend.models import ProcessingStage, StageEvent
+from backend.telemetry import PipelineTelemetryRecorder, percentile, pipeline_telemetry
+
+
+def _event(kb_id: str, stage: ProcessingStage, duration: float) -> StageEvent:
+    return StageEvent(document_id="doc", document_version_id="version", knowledge_base_id=kb_id, stage=stage,
+                      started_at=datetime.now(), duration_seconds=duration, chunk_count=2)
+
+
+def test_percentile_is_nearest_rank():
+    values = [float(n) for n in range(1, 11)]
+    assert percentile(values, 0.50) == 5.0
+    assert percentile(values, 0.95) == 10.0
+    assert percentile([], 0.50) == 0.0
+
+
+def test_summary_of_recorded_stages():
+    recorder = PipelineTelemetryRecorder()
+    for n in range(1, 11):
+        recorder.record_stage(_event("kb", ProcessingStage.EMBED, n / 10))
+    recorder.record_stage(_event("kb", ProcessingStage.CHUNK, 0.05))
+
+    summary = recorder.summary()
+
+    embed = next(stage for stage in summary.stages if stage.stage == ProcessingStage.EMBED)
+    assert embed.executions == 10
+    assert embed.p50_seconds == 0.5
+    assert embed.p95_seconds == embed.p99_seconds == embed.max_seconds == 1.0
+    assert embed.chunk_count == 20
+    assert summary.bottleneck_stage == ProcessingStage.EMBED
+
+
+def test_pipeline_telemetry_endpoints_after_a_stage(client, knowledge_base):
+    pipeline_telemetry.record_stage(_event(knowledge_base["id"], ProcessingStage.EXTRACT, 0.2))
+
+    for path in ("/api/telemetry/pipeline", f"/api/knowledge-bases/{knowledge_base['id']}/telemetry/pipeline"):
+        response = client.get(path)
+        assert response.status_code == 200
+        extract = next(stage for stage in response.json()["stages"] if stage["stage"] == "extract")
+        assert extract["executions"] >= 1